@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Adds composite indexes of jobs table used by keyset paginated job list."""
+
+import sys
+import yaml
+import argparse
+import logging
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+# index name -> columns
+INDEXES = [
+    ("user_status_time", "userName, jobStatus, jobTime"),
+    ("vc_status_time", "vcName, jobStatus, jobTime"),
+    ("vc_user_time", "vcName, userName, jobTime"),
+    ("vc_time", "vcName, jobTime"),
+]
+
+
+def build_mysql_connection(rest_config_path):
+    with open(rest_config_path) as f:
+        cluster_config = yaml.load(f)
+
+    host = cluster_config["mysql"]["hostname"]
+    port = cluster_config["mysql"]["port"]
+    username = cluster_config["mysql"]["username"]
+    password = cluster_config["mysql"]["password"]
+    db_name = "DLWSCluster-%s" % cluster_config["clusterId"]
+    return mysql.connector.connect(user=username,
+                                   password=password,
+                                   host=host,
+                                   port=port,
+                                   database=db_name)
+
+
+def existing_indexes(cursor):
+    cursor.execute("SHOW INDEX FROM jobs")
+    names = cursor.column_names
+    return set(dict(zip(names, row))["Key_name"] for row in cursor.fetchall())
+
+
+def alter_table(rest_config_path):
+    """Adds indexes not added yet, so that indexes added later are added on
+    clusters which ran it before"""
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    existing = existing_indexes(cursor)
+    clauses = [
+        "ADD INDEX %s (%s)" % (name, columns)
+        for name, columns in INDEXES
+        if name not in existing
+    ]
+    if clauses:
+        cursor.execute("ALTER TABLE jobs " + ", ".join(clauses))
+        conn.commit()
+    logger.info("added %d indexes", len(clauses))
+    cursor.close()
+    conn.close()
+
+
+def roll_back(rest_config_path):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    existing = existing_indexes(cursor)
+    clauses = [
+        "DROP INDEX %s" % name for name, _ in INDEXES if name in existing
+    ]
+    if clauses:
+        cursor.execute("ALTER TABLE jobs " + ", ".join(clauses))
+        conn.commit()
+    logger.info("dropped %d indexes", len(clauses))
+    cursor.close()
+    conn.close()
+
+
+def main(action, rest_config_path):
+    if action == "alter":
+        alter_table(rest_config_path)
+    elif action == "rollback":
+        roll_back(rest_config_path)
+    else:
+        logger.error("unknown action %s", action)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format=
+        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)s - %(message)s",
+        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["alter", "rollback"])
+    parser.add_argument("--rest_path",
+                        help="path to restfulapi config file",
+                        default="/etc/RestfulAPI/config.yaml")
+    args = parser.parse_args()
+    main(args.action, args.rest_path)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import sys
+import yaml
+import argparse
+import logging
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+
+def build_mysql_connection(rest_config_path):
+    with open(rest_config_path) as f:
+        cluster_config = yaml.load(f)
+
+    host = cluster_config["mysql"]["hostname"]
+    port = cluster_config["mysql"]["port"]
+    username = cluster_config["mysql"]["username"]
+    password = cluster_config["mysql"]["password"]
+    db_name = "DLWSCluster-%s" % cluster_config["clusterId"]
+    return mysql.connector.connect(user=username,
+                                   password=password,
+                                   host=host,
+                                   port=port,
+                                   database=db_name)
+
+
+def alter_table(rest_config_path):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    cursor.execute("""ALTER TABLE jobs
+        ADD COLUMN modifiedTime DATETIME(3)
+            DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3)
+            NOT NULL,
+        ADD INDEX (modifiedTime)""")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def roll_back(rest_config_path):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    cursor.execute("ALTER TABLE jobs DROP COLUMN modifiedTime")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def main(action, rest_config_path):
+    if action == "alter":
+        alter_table(rest_config_path)
+    elif action == "rollback":
+        roll_back(rest_config_path)
+    else:
+        logger.error("unknown action %s", action)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format=
+        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)s - %(message)s",
+        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["alter", "rollback"])
+    parser.add_argument("--rest_path",
+                        help="path to restfulapi config file",
+                        default="/etc/RestfulAPI/config.yaml")
+    args = parser.parse_args()
+    main(args.action, args.rest_path)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Adds typed resource columns extracted from jobParams to jobs table, so
+that quota and usage checks can be done by SQL instead of decoding jobParams.
+
+    ./add_job_resource_columns.py alter
+    ./add_job_resource_columns.py backfill
+
+Restart restfulapi and job manager after alter, they check for the columns
+once at start. Columns of jobs added before that stay NULL until backfill,
+and readers fall back to decoding jobParams meanwhile.
+"""
+
+import os
+import sys
+import json
+import base64
+import yaml
+import argparse
+import logging
+
+import mysql.connector
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../utils"))
+
+from job_params_util import get_job_resource_columns
+
+logger = logging.getLogger(__name__)
+
+
+def build_mysql_connection(rest_config_path):
+    with open(rest_config_path) as f:
+        cluster_config = yaml.load(f)
+
+    host = cluster_config["mysql"]["hostname"]
+    port = cluster_config["mysql"]["port"]
+    username = cluster_config["mysql"]["username"]
+    password = cluster_config["mysql"]["password"]
+    db_name = "DLWSCluster-%s" % cluster_config["clusterId"]
+    return mysql.connector.connect(user=username,
+                                   password=password,
+                                   host=host,
+                                   port=port,
+                                   database=db_name)
+
+
+def alter_table(rest_config_path):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    cursor.execute("""ALTER TABLE jobs
+        ADD COLUMN sku varchar(255) NULL,
+        ADD COLUMN gpuRequest INT NULL,
+        ADD COLUMN cpuRequest DOUBLE NULL,
+        ADD COLUMN memoryRequest BIGINT NULL,
+        ADD COLUMN preemptible TINYINT NULL,
+        ADD INDEX vc_user_status (vcName, userName, jobStatus, preemptible),
+        ADD INDEX status_vc_sku (jobStatus, vcName, sku)""")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def get_columns(job_id, job_params):
+    try:
+        params = json.loads(
+            base64.b64decode(job_params.encode("utf-8")).decode("utf-8"))
+        return get_job_resource_columns(params)
+    except Exception:
+        logger.warning("failed to parse jobParams of %s, set to 0", job_id)
+        return {
+            "sku": "",
+            "gpuRequest": 0,
+            "cpuRequest": 0,
+            "memoryRequest": 0,
+            "preemptible": 0,
+        }
+
+
+def backfill(rest_config_path, batch_size):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    last_id = 0
+    total = 0
+    while True:
+        cursor.execute(
+            """SELECT id, jobId, jobParams FROM jobs
+            WHERE id > %s AND gpuRequest IS NULL ORDER BY id LIMIT %s""",
+            (last_id, batch_size))
+        rows = cursor.fetchall()
+        if len(rows) == 0:
+            break
+
+        updates = []
+        for id, job_id, job_params in rows:
+            columns = get_columns(job_id, job_params)
+            updates.append((columns["sku"], columns["gpuRequest"],
+                            columns["cpuRequest"], columns["memoryRequest"],
+                            columns["preemptible"], id))
+        # gpuRequest IS NULL makes it safe against concurrent AddJob and
+        # update_job_params, which already set the columns
+        cursor.executemany(
+            """UPDATE jobs SET sku = %s, gpuRequest = %s, cpuRequest = %s,
+            memoryRequest = %s, preemptible = %s
+            WHERE id = %s AND gpuRequest IS NULL""", updates)
+        conn.commit()
+
+        last_id = rows[-1][0]
+        total += len(rows)
+        logger.info("backfilled %d jobs, last id %s", total, last_id)
+    cursor.close()
+    conn.close()
+
+
+def roll_back(rest_config_path):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    cursor.execute("""ALTER TABLE jobs
+        DROP INDEX vc_user_status,
+        DROP INDEX status_vc_sku,
+        DROP COLUMN sku,
+        DROP COLUMN gpuRequest,
+        DROP COLUMN cpuRequest,
+        DROP COLUMN memoryRequest,
+        DROP COLUMN preemptible""")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def main(action, rest_config_path, batch_size):
+    if action == "alter":
+        alter_table(rest_config_path)
+    elif action == "backfill":
+        backfill(rest_config_path, batch_size)
+    elif action == "rollback":
+        roll_back(rest_config_path)
+    else:
+        logger.error("unknown action %s", action)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format=
+        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)s - %(message)s",
+        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["alter", "backfill", "rollback"])
+    parser.add_argument("--rest_path",
+                        help="path to restfulapi config file",
+                        default="/etc/RestfulAPI/config.yaml")
+    parser.add_argument("--batch_size",
+                        type=int,
+                        help="number of jobs updated in a transaction",
+                        default=1000)
+    args = parser.parse_args()
+    main(args.action, args.rest_path, args.batch_size)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Copies endpoints in endpoints column of jobs table into endpoints table.
+
+    ./migrate_job_endpoints.py migrate
+
+Restfulapi and cluster manager with endpoints table read and write
+endpoints in the table. Until migrate has run, endpoints in the legacy
+column are merged under rows of the table when read, so endpoint manager
+still sets up and tears them down. Rows already in the table are newer and
+are kept. The column of migrated jobs is cleared, data handlers stop
+reading it once it is empty.
+
+    ./migrate_job_endpoints.py rollback
+
+Writes endpoints in the table back into endpoints column of jobs and drops
+the table. Roll back restfulapi and cluster manager first.
+"""
+
+import sys
+import json
+import yaml
+import argparse
+import logging
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS endpoints
+    (
+        id          INT          NOT NULL AUTO_INCREMENT,
+        jobId       varchar(50)  NOT NULL,
+        endpointId  varchar(255) NOT NULL,
+        status      varchar(255) NOT NULL,
+        endpoint    LONGTEXT     NOT NULL,
+        lastUpdated DATETIME(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3) NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT job_endpoint UNIQUE(jobId, endpointId),
+        INDEX status_job (status, jobId)
+    )"""
+
+
+def build_mysql_connection(rest_config_path):
+    with open(rest_config_path) as f:
+        cluster_config = yaml.load(f)
+
+    host = cluster_config["mysql"]["hostname"]
+    port = cluster_config["mysql"]["port"]
+    username = cluster_config["mysql"]["username"]
+    password = cluster_config["mysql"]["password"]
+    db_name = "DLWSCluster-%s" % cluster_config["clusterId"]
+    return mysql.connector.connect(user=username,
+                                   password=password,
+                                   host=host,
+                                   port=port,
+                                   database=db_name)
+
+
+def load_json(raw_str):
+    try:
+        ret = json.loads(raw_str)
+        if isinstance(ret, dict):
+            return ret
+    except Exception:
+        pass
+    return {}
+
+
+def migrate(rest_config_path, batch_size):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    cursor.execute(CREATE_TABLE_SQL)
+    conn.commit()
+
+    last_id = 0
+    jobs = 0
+    endpoints = 0
+    while True:
+        cursor.execute(
+            """SELECT id, jobId, endpoints FROM jobs
+            WHERE id > %s AND endpoints IS NOT NULL ORDER BY id LIMIT %s""",
+            (last_id, batch_size))
+        rows = cursor.fetchall()
+        if len(rows) == 0:
+            break
+
+        values = []
+        for _, job_id, job_endpoints in rows:
+            for endpoint_id, endpoint in load_json(job_endpoints).items():
+                status = endpoint.get("status", "pending")
+                values.append(
+                    (job_id, endpoint_id, status, json.dumps(endpoint)))
+        if len(values) > 0:
+            cursor.executemany(
+                """INSERT IGNORE INTO endpoints
+                (jobId, endpointId, status, endpoint)
+                VALUES (%s, %s, %s, %s)""", values)
+        ids = [row[0] for row in rows]
+        cursor.execute(
+            "UPDATE jobs SET endpoints = NULL WHERE id IN (%s)" %
+            ",".join(["%s"] * len(ids)), ids)
+        conn.commit()
+
+        last_id = rows[-1][0]
+        jobs += len(rows)
+        endpoints += len(values)
+        logger.info("migrated %d endpoints of %d jobs, last id %s", endpoints,
+                    jobs, last_id)
+    cursor.close()
+    conn.close()
+
+
+def roll_back(rest_config_path):
+    conn = build_mysql_connection(rest_config_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT jobId, endpointId, endpoint FROM endpoints")
+    endpoints_by_job = {}
+    for job_id, endpoint_id, endpoint in cursor.fetchall():
+        endpoints_by_job.setdefault(job_id, {})[endpoint_id] = \
+            load_json(endpoint)
+
+    for job_id, endpoints in endpoints_by_job.items():
+        cursor.execute("SELECT endpoints FROM jobs WHERE jobId = %s",
+                       (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            continue
+        job_endpoints = load_json(row[0])
+        job_endpoints.update(endpoints)
+        cursor.execute("UPDATE jobs SET endpoints = %s WHERE jobId = %s",
+                       (json.dumps(job_endpoints), job_id))
+        conn.commit()
+    logger.info("rolled back endpoints of %d jobs", len(endpoints_by_job))
+
+    cursor.execute("DROP TABLE endpoints")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def main(action, rest_config_path, batch_size):
+    if action == "migrate":
+        migrate(rest_config_path, batch_size)
+    elif action == "rollback":
+        roll_back(rest_config_path)
+    else:
+        logger.error("unknown action %s", action)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format=
+        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)s - %(message)s",
+        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["migrate", "rollback"])
+    parser.add_argument("--rest_path",
+                        help="path to restfulapi config file",
+                        default="/etc/RestfulAPI/config.yaml")
+    parser.add_argument("--batch_size",
+                        type=int,
+                        help="number of jobs migrated in a transaction",
+                        default=1000)
+    args = parser.parse_args()
+    main(args.action, args.rest_path, args.batch_size)
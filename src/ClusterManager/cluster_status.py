@@ -1,16 +1,19 @@
 #!/usr/bin/env python3
 
 import copy
+import hashlib
 import sys
 import os
 import json
 import logging
+import threading
+import time
 import requests
 
 sys.path.append(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
 
-from resource_stat import dictionarize, Gpu, Cpu, Memory
+from resource_stat import dictionarize, Gpu, Cpu, Memory, ResourceStat
 from cluster_resource import ClusterResource
 from job_params_util import get_resource_params_from_job_params
 from common import base64decode
@@ -26,6 +29,50 @@ def str2bool(s):
     return s.lower() in ["true", "1", "t", "y", "yes"]
 
 
+def canonical_default(obj):
+    if isinstance(obj, ResourceStat):
+        # absent and zero are equal for ResourceStat
+        return {k: v for k, v in obj.to_dict().items() if v != 0}
+    return str(obj)
+
+
+def canonical_item(item):
+    """Lists of strings in a status, e.g. pods of a node, are unordered"""
+    if not isinstance(item, dict):
+        return item
+    return {
+        k: sorted(v) if isinstance(v, list) and
+        all(isinstance(x, str) for x in v) else v for k, v in item.items()
+    }
+
+
+def hash_text(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def item_digest(item):
+    return hash_text(
+        json.dumps(canonical_item(item),
+                   sort_keys=True,
+                   separators=(",", ":"),
+                   default=canonical_default))
+
+
+def merkle_root(digests):
+    """Combines {key: digest} into one digest independent of order"""
+    return hash_text("\n".join(
+        sorted(["%s:%s" % (k, v) for k, v in digests.items()])))
+
+
+# list fields digested per item, mapped to the field keying an item
+DIGEST_ITEM_KEYS = {
+    "node_status": "name",
+    "pod_status": "name",
+    "user_status": "userName",
+    "user_status_preemptable": "userName",
+}
+
+
 def get_jobs(job_list):
     jobs = []
     for job in job_list:
@@ -102,8 +149,15 @@ class ClusterStatus(object):
         self.user_statuses = None
         self.user_statuses_preemptable = None
 
+        # Computed on first use of digest, statuses must not be modified
+        # after that
+        self.section_digests = None
+        self.item_digests = None
+
         self.exclusion = [
             "exclusion", # exclude self
+            "section_digests",
+            "item_digests",
             "jobs",
             "jobs_without_pods",
             "pods_without_node_assignment",
@@ -116,11 +170,12 @@ class ClusterStatus(object):
         self.compute()
 
     def to_dict(self):
-        return dictionarize({
-            k: v
-            for k, v in copy.deepcopy(self.__dict__).items()
-            if k not in self.exclusion
-        })
+        return dictionarize(
+            copy.deepcopy({
+                k: v
+                for k, v in self.__dict__.items()
+                if k not in self.exclusion
+            }))
 
     def compute(self):
         # Generate jobs without k8s pods
@@ -145,36 +200,84 @@ class ClusterStatus(object):
         # Generate active job count
         self.gen_available_job_num()
 
+    def gen_digests(self):
+        """Digests every field returned by to_dict. Items of list fields
+        in DIGEST_ITEM_KEYS are digested one by one and combined into a
+        Merkle root, so that list order does not matter and changed items
+        can be found by item_digests."""
+        section_digests = {}
+        item_digests = {}
+        for k, v in self.__dict__.items():
+            if k in self.exclusion:
+                continue
+            item_key = DIGEST_ITEM_KEYS.get(k)
+            if item_key is not None and isinstance(v, list):
+                digests = {}
+                for item in v:
+                    digest = item_digest(item)
+                    key = item.get(item_key) if isinstance(item, dict) \
+                        else None
+                    if key is None or key in digests:
+                        key = digest
+                    digests[key] = digest
+                item_digests[k] = digests
+                section_digests[k] = merkle_root(digests)
+            else:
+                section_digests[k] = item_digest(v)
+        self.item_digests = item_digests
+        self.section_digests = section_digests
+
+    @property
+    def digests(self):
+        """{field name: digest} of fields returned by to_dict"""
+        if self.section_digests is None:
+            self.gen_digests()
+        return self.section_digests
+
+    def get_item_digests(self):
+        """{list field name: {item key: digest}}"""
+        if self.item_digests is None:
+            self.gen_digests()
+        return self.item_digests
+
+    @property
+    def digest(self):
+        return merkle_root(self.digests)
+
+    def changed_sections(self, digests):
+        """Returns fields whose digest differs from digests, which is
+        digests of another ClusterStatus or None"""
+        if digests is None:
+            digests = {}
+        return sorted([
+            k for k in set(self.digests.keys()) | set(digests.keys())
+            if self.digests.get(k) != digests.get(k)
+        ])
+
+    def changed_items(self, other, section):
+        """Returns keys of items in a list field that are added, changed or
+        removed compared to other ClusterStatus"""
+        mine = self.get_item_digests().get(section, {})
+        theirs = other.get_item_digests().get(section, {})
+        return sorted([
+            k for k in set(mine.keys()) | set(theirs.keys())
+            if mine.get(k) != theirs.get(k)
+        ])
+
     def __eq__(self, other):
         if self.__class__ != other.__class__:
             logger.debug("self class %s, other class %s", self.__class__,
                          other.__class__)
             return False
 
-        for k in self.__dict__:
-            if k in self.exclusion:
-                continue
-
-            self_val = self.__dict__[k]
-            other_val = other.__dict__[k]
-            if isinstance(self_val, list) and isinstance(other_val, list):
-                for item in self_val:
-                    if item not in other_val:
-                        logger.debug("For %s: self %s, other %s", k,
-                                     self.__dict__[k], other.__dict__[k])
-                        return False
-                for item in other_val:
-                    if item not in self_val:
-                        logger.debug("For %s: self %s, other %s", k,
-                                     self.__dict__[k], other.__dict__[k])
-                        return False
-            elif self_val != other_val:
-                logger.debug("For %s: self %s, other %s", k, self.__dict__[k],
-                             other.__dict__[k])
-                return False
-
+        if self.digest != other.digest:
+            logger.debug("changed: %s", self.changed_sections(other.digests))
+            return False
         return True
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
     def gen_jobs_without_pods(self):
         self.jobs_without_pods = get_jobs_without_pods(self.jobs,
                                                        self.pod_statuses)
@@ -399,15 +502,367 @@ class ClusterStatus(object):
         self.__gen_r_type_status(Gpu)
 
 
-class ClusterStatusFactory(object):
-    def __init__(self, prometheus_node, nodes, pods, jobs):
+def gen_node_status(node):
+    """Returns status of a V1Node, or None if node is incomplete"""
+    gpu_str = "nvidia.com/gpu"
+    cpu_str = "cpu"
+    mem_str = "memory"
+
+    # node is of class 'kubernetes.client.models.v1_node.V1Node'
+    if node.metadata is None:
+        return None
+
+    if node.spec is None:
+        return None
+
+    if node.status is None:
+        return None
+
+    name = node.metadata.name
+    labels = node.metadata.labels
+
+    gpu_type = ""
+    sku = ""
+    scheduled_service = []
+    if labels is not None:
+        for label, status in labels.items():
+            if status == "active" and label not in ["all", "default"]:
+                scheduled_service.append(label)
+            if label == "gpuType":
+                scheduled_service.append(status)
+                gpu_type = status
+            if label == "sku":
+                scheduled_service.append(status)
+                sku = status
+
+    if node.status is None:
+        return None
+
+    allocatable = node.status.allocatable
+    gpu_allocatable = Gpu()
+    cpu_allocatable = Cpu()
+    mem_allocatable = Memory()
+    if allocatable is not None:
+        if gpu_str in allocatable:
+            gpu_num = int(allocatable[gpu_str])
+            gpu_allocatable = Gpu({sku: gpu_num})
+        if cpu_str in allocatable:
+            cpu_num = allocatable[cpu_str]
+            cpu_allocatable = Cpu({sku: cpu_num})
+        if mem_str in allocatable:
+            mem_num = allocatable[mem_str]
+            mem_allocatable = Memory({sku: mem_num})
+
+    capacity = node.status.capacity
+    gpu_capacity = Gpu()
+    cpu_capacity = Cpu()
+    mem_capacity = Memory()
+    if capacity is not None:
+        if gpu_str in capacity:
+            gpu_num = int(capacity[gpu_str])
+            gpu_capacity = Gpu({sku: gpu_num})
+        if cpu_str in capacity:
+            cpu_num = capacity[cpu_str]
+            cpu_capacity = Cpu({sku: cpu_num})
+        if mem_str in capacity:
+            mem_num = capacity[mem_str]
+            mem_capacity = Memory({sku: mem_num})
+
+    internal_ip = "unknown"
+
+    addresses = node.status.addresses
+    if addresses is not None:
+        for addr in addresses:
+            # addr is of class
+            # 'kubernetes.client.models.v1_node_address.V1NodeAddress'
+            if addr.type == "InternalIP":
+                internal_ip = addr.address
+
+    unschedulable = node.spec.unschedulable
+    if unschedulable is not None and unschedulable is True:
+        unschedulable = True
+    else:
+        unschedulable = False
+
+    conditions = node.status.conditions
+    if conditions is not None:
+        for cond in conditions:
+            # cond is of class
+            # 'kubernetes.client.models.v1_node_condition
+            # .V1NodeCondition'
+            if cond.type == "Ready" and cond.status != "True":
+                unschedulable = True
+
+    node_status = {
+        "name": name,
+        "labels": labels,
+        "gpuType": gpu_type,
+        "scheduled_service": scheduled_service,
+        "gpu_allocatable": gpu_allocatable,
+        "gpu_capacity": gpu_capacity,
+        "gpu_used": Gpu(),
+        "gpu_preemptable_used": Gpu(),
+        "cpu_allocatable": cpu_allocatable,
+        "cpu_capacity": cpu_capacity,
+        "cpu_used": Cpu(),
+        "cpu_preemptable_used": Cpu(),
+        "memory_allocatable": mem_allocatable,
+        "memory_capacity": mem_capacity,
+        "memory_used": Memory(),
+        "memory_preemptable_used": Memory(),
+        "InternalIP": internal_ip,
+        "pods": [],
+        "unschedulable": unschedulable
+    }
+    return node_status
+
+
+def is_active_pod(pod):
+    # pod is of class 'kubernetes.client.models.v1_pod.V1Pod'
+    if pod.metadata is None or pod.status is None or pod.spec is None:
+        return False
+    return pod.status.phase not in ["Succeeded", "Failed"]
+
+
+def gen_pod_status(pod, node_statuses, gpu_usage):
+    """Returns status of an active V1Pod. node_statuses is used to look up
+    sku of the pod, gpu_usage is usage in percentage or None"""
+    gpu_str = "nvidia.com/gpu"
+    cpu_str = "cpu"
+    mem_str = "memory"
+
+    name = pod.metadata.name
+    namespace = pod.metadata.namespace
+    labels = pod.metadata.labels
+    node_selector = pod.spec.node_selector
+    node_name = pod.spec.node_name
+
+    gpu_type = ""
+    job_id = None
+    vc_name = None
+    if labels is not None:
+        gpu_type = labels.get("gpuType", "")
+        job_id = labels.get("jobId")
+        vc_name = labels.get("vcName")
+
+    sku = ""
+    if node_selector is not None:
+        sku = node_selector.get("sku", "")
+
+    if sku == "" and node_name is not None:
+        node = node_statuses.get(node_name, {})
+        node_labels = node.get("labels")
+        if node_labels is not None:
+            sku = node_labels.get("sku", "")
+
+    username = None
+    if labels is not None and "userName" in labels:
+        username = labels.get("userName")
+
+    preemption_allowed = False
+    if labels is not None and "preemptionAllowed" in labels:
+        preemption_allowed = str2bool(labels["preemptionAllowed"])
+
+    pod_name = name
+    if username is not None:
+        pod_name += " : " + username
+
+    if gpu_usage is not None:
+        pod_name += " (gpu usage:%s%%)" % gpu_usage
+        if gpu_usage <= 25:
+            pod_name += "!!!!!!"
+
+    gpu = Gpu()
+    preemptable_gpu = Gpu()
+    cpu = Cpu()
+    preemptable_cpu = Cpu()
+    memory = Memory()
+    preemptable_memory = Memory()
+
+    containers = pod.spec.containers
+    if containers is not None:
+        for container in containers:
+            # container is of class
+            # 'kubernetes.client.models.v1_container.V1Container'
+            curr_container_gpu = 0
+            container_gpu = Gpu()
+            container_cpu = Cpu()
+            container_memory = Memory()
+            # resources is of class
+            # 'kubernetes.client.models.v1_resource_requirements
+            # .V1ResourceRequirements'
+            resources = container.resources
+            r_requests = {}
+            if resources.requests is not None:
+                r_requests = resources.requests
+
+            if gpu_str in r_requests:
+                curr_container_gpu = int(r_requests[gpu_str])
+                container_gpu = Gpu({sku: curr_container_gpu})
+
+            if cpu_str in r_requests:
+                container_cpu = Cpu({sku: r_requests[cpu_str]})
+
+            if mem_str in r_requests:
+                container_memory = Memory({sku: r_requests[mem_str]})
+
+            if preemption_allowed:
+                preemptable_gpu += container_gpu
+                preemptable_cpu += container_cpu
+                preemptable_memory += container_memory
+            else:
+                gpu += container_gpu
+                cpu += container_cpu
+                memory += container_memory
+
+            pod_name += " (gpu #:%s)" % curr_container_gpu
+
+    pod_status = {
+        "name": name,
+        "pod_name": pod_name,
+        "job_id": job_id,
+        "vc_name": vc_name,
+        "namespace": namespace,
+        "node_name": node_name,
+        "username": username,
+        "preemption_allowed": preemption_allowed,
+        "gpu": gpu,
+        "preemptable_gpu": preemptable_gpu,
+        "cpu": cpu,
+        "preemptable_cpu": preemptable_cpu,
+        "memory": memory,
+        "preemptable_memory": preemptable_memory,
+        "gpuType": gpu_type,
+        "gpu_usage": gpu_usage,
+    }
+    return pod_status
+
+
+def update_node_usage(node_status, pod_status, sign=1):
+    """Adds (sign=1) or removes (sign=-1) usage of pod_status to
+    node_status. Values are replaced instead of updated in place, so that
+    shallow copies of node_status made before are not affected."""
+    for r_name in ["gpu", "cpu", "memory"]:
+        for used, pod_used in [(r_name + "_used", r_name),
+                               (r_name + "_preemptable_used",
+                                "preemptable_" + r_name)]:
+            if sign > 0:
+                node_status[used] = node_status[used] + pod_status[pod_used]
+            else:
+                node_status[used] = node_status[used] - pod_status[pod_used]
+
+    # Only append a list pods in default namespace
+    if pod_status["namespace"] == "default":
+        if sign > 0:
+            node_status["pods"] = node_status["pods"] + \
+                [pod_status["pod_name"]]
+        else:
+            node_status["pods"] = [
+                pod_name for pod_name in node_status["pods"]
+                if pod_name != pod_status["pod_name"]
+            ]
+
+
+# pod_name matcher and value to fill in
+GPU_USAGE_QUERY = 'avg(avg_over_time(task_gpu_percent{pod_name%s"%s"}[4h])) ' \
+                  'by (pod_name, instance, username)'
+
+
+class GpuUsageClient(object):
+    """Queries gpu usage of pods from prometheus.
+
+    Pods are queried with regex on pod names in chunks. If a chunk fails, at
+    most fallback_limit pods in total are queried one by one.
+    """
+    def __init__(self,
+                 prometheus_node,
+                 port=9091,
+                 chunk_size=200,
+                 timeout=10,
+                 fallback_limit=20):
         self.prometheus_node = prometheus_node
+        self.port = port
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.fallback_limit = fallback_limit
+
+    def query(self, query):
+        url = "http://%s:%s/prometheus/api/v1/query" % (self.prometheus_node,
+                                                        self.port)
+        resp = requests.get(url, params={"query": query}, timeout=self.timeout)
+        return json.loads(resp.text)["data"]["result"]
+
+    def job_gpu_usage(self, job_id):
+        try:
+            result = self.query(GPU_USAGE_QUERY % ("=", job_id))
+            gpu_usage = int(float(result[0]["value"][1]))
+
+        except Exception:
+            logger.debug("Failed to get gpu usage for job id %s", job_id)
+            gpu_usage = None
+
+        return gpu_usage
+
+    def jobs_gpu_usage(self, pod_names):
+        """Returns {pod name: gpu usage} with a query per chunk of pods"""
+        gpu_usages = {}
+        if not self.prometheus_node:
+            return gpu_usages
+
+        failed = []
+        chunk_size = self.chunk_size
+        for i in range(0, len(pod_names), chunk_size):
+            chunk = pod_names[i:i + chunk_size]
+            # pod names are DNS subdomains, "." is the only regex special
+            # character in them
+            regex = "|".join([name.replace(".", "\\\\.") for name in chunk])
+            try:
+                result = self.query(GPU_USAGE_QUERY % ("=~", regex))
+            except Exception:
+                logger.warning("Failed to get gpu usage for %d pods",
+                               len(chunk),
+                               exc_info=True)
+                failed.extend(chunk)
+                continue
+
+            for series in result:
+                try:
+                    pod_name = series["metric"]["pod_name"]
+                    # same as per pod query, first series of a pod wins
+                    if pod_name not in gpu_usages:
+                        gpu_usages[pod_name] = int(float(series["value"][1]))
+                except Exception:
+                    logger.debug("Bad gpu usage series %s", series)
+
+        if len(failed) > self.fallback_limit:
+            logger.warning("Skip gpu usage of %d pods",
+                           len(failed) - self.fallback_limit)
+        for pod_name in failed[:self.fallback_limit]:
+            gpu_usage = self.job_gpu_usage(pod_name)
+            if gpu_usage is not None:
+                gpu_usages[pod_name] = gpu_usage
+
+        return gpu_usages
+
+
+class ClusterStatusFactory(object):
+    def __init__(self,
+                 prometheus_node,
+                 nodes,
+                 pods,
+                 jobs,
+                 gpu_usage_client=None):
         self.nodes = nodes
         self.pods = pods
         self.jobs = jobs
 
+        if gpu_usage_client is None:
+            gpu_usage_client = GpuUsageClient(prometheus_node)
+        self.gpu_usage_client = gpu_usage_client
+
         self.node_statuses = None
         self.pod_statuses = None
+        self.gpu_usages = None
 
         self.__gen_node_statuses()
         self.__gen_pod_statuses()
@@ -424,291 +879,251 @@ class ClusterStatusFactory(object):
         return cluster_status
 
     def __gen_node_statuses(self):
-        gpu_str = "nvidia.com/gpu"
-        cpu_str = "cpu"
-        mem_str = "memory"
-
         self.node_statuses = {}
-
         for node in self.nodes:
-            # node is of class 'kubernetes.client.models.v1_node.V1Node'
-            if node.metadata is None:
-                continue
-
-            if node.spec is None:
-                continue
-
-            if node.status is None:
-                continue
-
-            name = node.metadata.name
-            labels = node.metadata.labels
-
-            gpu_type = ""
-            sku = ""
-            scheduled_service = []
-            if labels is not None:
-                for label, status in labels.items():
-                    if status == "active" and label not in ["all", "default"]:
-                        scheduled_service.append(label)
-                    if label == "gpuType":
-                        scheduled_service.append(status)
-                        gpu_type = status
-                    if label == "sku":
-                        scheduled_service.append(status)
-                        sku = status
-
-            if node.status is None:
-                continue
-
-            allocatable = node.status.allocatable
-            gpu_allocatable = Gpu()
-            cpu_allocatable = Cpu()
-            mem_allocatable = Memory()
-            if allocatable is not None:
-                if gpu_str in allocatable:
-                    gpu_num = int(allocatable[gpu_str])
-                    gpu_allocatable = Gpu({sku: gpu_num})
-                if cpu_str in allocatable:
-                    cpu_num = allocatable[cpu_str]
-                    cpu_allocatable = Cpu({sku: cpu_num})
-                if mem_str in allocatable:
-                    mem_num = allocatable[mem_str]
-                    mem_allocatable = Memory({sku: mem_num})
-
-            capacity = node.status.capacity
-            gpu_capacity = Gpu()
-            cpu_capacity = Cpu()
-            mem_capacity = Memory()
-            if capacity is not None:
-                if gpu_str in capacity:
-                    gpu_num = int(capacity[gpu_str])
-                    gpu_capacity = Gpu({sku: gpu_num})
-                if cpu_str in capacity:
-                    cpu_num = capacity[cpu_str]
-                    cpu_capacity = Cpu({sku: cpu_num})
-                if mem_str in capacity:
-                    mem_num = capacity[mem_str]
-                    mem_capacity = Memory({sku: mem_num})
-
-            internal_ip = "unknown"
-
-            addresses = node.status.addresses
-            if addresses is not None:
-                for addr in addresses:
-                    # addr is of class
-                    # 'kubernetes.client.models.v1_node_address.V1NodeAddress'
-                    if addr.type == "InternalIP":
-                        internal_ip = addr.address
-
-            unschedulable = node.spec.unschedulable
-            if unschedulable is not None and unschedulable is True:
-                unschedulable = True
-            else:
-                unschedulable = False
-
-            conditions = node.status.conditions
-            if conditions is not None:
-                for cond in conditions:
-                    # cond is of class
-                    # 'kubernetes.client.models.v1_node_condition
-                    # .V1NodeCondition'
-                    if cond.type == "Ready" and cond.status != "True":
-                        unschedulable = True
-
-            node_status = {
-                "name": name,
-                "labels": labels,
-                "gpuType": gpu_type,
-                "scheduled_service": scheduled_service,
-                "gpu_allocatable": gpu_allocatable,
-                "gpu_capacity": gpu_capacity,
-                "gpu_used": Gpu(),
-                "gpu_preemptable_used": Gpu(),
-                "cpu_allocatable": cpu_allocatable,
-                "cpu_capacity": cpu_capacity,
-                "cpu_used": Cpu(),
-                "cpu_preemptable_used": Cpu(),
-                "memory_allocatable": mem_allocatable,
-                "memory_capacity": mem_capacity,
-                "memory_used": Memory(),
-                "memory_preemptable_used": Memory(),
-                "InternalIP": internal_ip,
-                "pods": [],
-                "unschedulable": unschedulable
-            }
-
-            self.node_statuses[name] = node_status
+            node_status = gen_node_status(node)
+            if node_status is not None:
+                self.node_statuses[node_status["name"]] = node_status
 
     def __gen_pod_statuses(self):
-        gpu_str = "nvidia.com/gpu"
-        cpu_str = "cpu"
-        mem_str = "memory"
-
-        self.pod_statuses = {}
-        for pod in self.pods:
-            # pod is of class 'kubernetes.client.models.v1_pod.V1Pod'
-            if pod.metadata is None:
-                continue
-
-            if pod.status is None:
-                continue
-
-            phase = pod.status.phase
-            if phase in ["Succeeded", "Failed"]:
-                continue
+        active_pods = [pod for pod in self.pods if is_active_pod(pod)]
 
-            if pod.spec is None:
-                continue
+        self.gpu_usages = self.gpu_usage_client.jobs_gpu_usage(
+            [pod.metadata.name for pod in active_pods])
 
+        self.pod_statuses = {}
+        for pod in active_pods:
             name = pod.metadata.name
-            namespace = pod.metadata.namespace
-            labels = pod.metadata.labels
-            node_selector = pod.spec.node_selector
-            node_name = pod.spec.node_name
-
-            gpu_type = ""
-            job_id = None
-            vc_name = None
-            if labels is not None:
-                gpu_type = labels.get("gpuType", "")
-                job_id = labels.get("jobId")
-                vc_name = labels.get("vcName")
-
-            sku = ""
-            if node_selector is not None:
-                sku = node_selector.get("sku", "")
-
-            if sku == "" and node_name is not None:
-                node = self.node_statuses.get(node_name, {})
-                node_labels = node.get("labels")
-                if node_labels is not None:
-                    sku = node_labels.get("sku", "")
-
-            username = None
-            if labels is not None and "userName" in labels:
-                username = labels.get("userName")
-
-            preemption_allowed = False
-            if labels is not None and "preemptionAllowed" in labels:
-                preemption_allowed = str2bool(labels["preemptionAllowed"])
-
-            pod_name = name
-            if username is not None:
-                pod_name += " : " + username
-
-            gpu_usage = self.__job_gpu_usage(name)
-            if gpu_usage is not None:
-                pod_name += " (gpu usage:%s%%)" % gpu_usage
-                if gpu_usage <= 25:
-                    pod_name += "!!!!!!"
-
-            gpu = Gpu()
-            preemptable_gpu = Gpu()
-            cpu = Cpu()
-            preemptable_cpu = Cpu()
-            memory = Memory()
-            preemptable_memory = Memory()
-
-            containers = pod.spec.containers
-            if containers is not None:
-                for container in containers:
-                    # container is of class
-                    # 'kubernetes.client.models.v1_container.V1Container'
-                    curr_container_gpu = 0
-                    container_gpu = Gpu()
-                    container_cpu = Cpu()
-                    container_memory = Memory()
-                    # resources is of class
-                    # 'kubernetes.client.models.v1_resource_requirements
-                    # .V1ResourceRequirements'
-                    resources = container.resources
-                    r_requests = {}
-                    if resources.requests is not None:
-                        r_requests = resources.requests
-
-                    if gpu_str in r_requests:
-                        curr_container_gpu = int(r_requests[gpu_str])
-                        container_gpu = Gpu({sku: curr_container_gpu})
-
-                    if cpu_str in r_requests:
-                        container_cpu = Cpu({sku: r_requests[cpu_str]})
-
-                    if mem_str in r_requests:
-                        container_memory = Memory({sku: r_requests[mem_str]})
-
-                    if preemption_allowed:
-                        preemptable_gpu += container_gpu
-                        preemptable_cpu += container_cpu
-                        preemptable_memory += container_memory
-                    else:
-                        gpu += container_gpu
-                        cpu += container_cpu
-                        memory += container_memory
-
-                    pod_name += " (gpu #:%s)" % curr_container_gpu
-
-            pod_status = {
-                "name": name,
-                "pod_name": pod_name,
-                "job_id": job_id,
-                "vc_name": vc_name,
-                "namespace": namespace,
-                "node_name": node_name,
-                "username": username,
-                "preemption_allowed": preemption_allowed,
-                "gpu": gpu,
-                "preemptable_gpu": preemptable_gpu,
-                "cpu": cpu,
-                "preemptable_cpu": preemptable_cpu,
-                "memory": memory,
-                "preemptable_memory": preemptable_memory,
-                "gpuType": gpu_type,
-                "gpu_usage": gpu_usage,
-            }
-            self.pod_statuses[name] = pod_status
+            self.pod_statuses[name] = gen_pod_status(
+                pod, self.node_statuses, self.gpu_usages.get(name))
 
     def __update_node_statuses(self):
         for _, pod_status in self.pod_statuses.items():
-            pod_name = pod_status["pod_name"]
-            namespace = pod_status["namespace"]
-            node_name = pod_status["node_name"]
-            pod_gpu = pod_status["gpu"]
-            pod_preemptable_gpu = pod_status["preemptable_gpu"]
-            pod_cpu = pod_status["cpu"]
-            pod_preemptable_cpu = pod_status["preemptable_cpu"]
-            pod_memory = pod_status["memory"]
-            pod_preemptable_memory = pod_status["preemptable_memory"]
-
-            if node_name not in self.node_statuses:
-                continue
-
             # NOTE gpu_used may include those unallocatable gpu
-            node_status = self.node_statuses[node_name]
-            node_status["gpu_used"] += pod_gpu
-            node_status["gpu_preemptable_used"] += pod_preemptable_gpu
-            node_status["cpu_used"] += pod_cpu
-            node_status["cpu_preemptable_used"] += pod_preemptable_cpu
-            node_status["memory_used"] += pod_memory
-            node_status["memory_preemptable_used"] += pod_preemptable_memory
-
-            # Only append a list pods in default namespace
-            if namespace == "default":
-                node_status["pods"].append(pod_name)
-
-    def __job_gpu_usage(self, job_id):
-        try:
-            hostaddress = self.prometheus_node
+            node_status = self.node_statuses.get(pod_status["node_name"])
+            if node_status is not None:
+                update_node_usage(node_status, pod_status)
 
-            url = """http://"""+hostaddress+""":9091/prometheus/api/v1/query?query=avg%28avg_over_time%28task_gpu_percent%7Bpod_name%3D%22""" + \
-                  job_id + """%22%7D%5B4h%5D%29%29+by+%28pod_name%2C+instance%2C+username%29"""
 
-            resp = requests.get(url)
-            result = json.loads(resp.text)
-            gpu_usage = int(float(result["data"]["result"][0]["value"][1]))
+def pod_key(pod):
+    return "%s/%s" % (pod.metadata.namespace, pod.metadata.name)
 
-        except Exception:
-            logger.debug("Failed to get gpu usage for job id %s", job_id)
-            gpu_usage = None
 
-        return gpu_usage
+class ClusterStatusModel(object):
+    """Keeps node and pod statuses up to date from node and pod informers.
+
+    Watch events are applied as deltas to per node running totals of
+    capacity, allocatable, used and preemptable used. version is bumped
+    whenever a status changes. Every resync_period seconds all statuses are
+    rebuilt from informer caches to correct drift, and gpu usage of pods is
+    refreshed every gpu_usage_period seconds.
+
+    Node statuses are replaced instead of updated in place, so make only
+    needs shallow copies to hand them to ClusterStatus.
+    """
+    def __init__(self,
+                 node_informer,
+                 pod_informer,
+                 gpu_usage_client,
+                 resync_period=600,
+                 gpu_usage_period=60):
+        self.node_informer = node_informer
+        self.pod_informer = pod_informer
+        self.gpu_usage_client = gpu_usage_client
+        self.resync_period = resync_period
+        self.gpu_usage_period = gpu_usage_period
+
+        self.lock = threading.RLock()
+        self.node_statuses = {}
+        # pods are keyed by pod_key, names are only unique in a namespace
+        self.pods = {} # pod key -> V1Pod of active pods
+        self.pod_statuses = {} # pod key -> pod status
+        self.gpu_usages = {} # pod name -> gpu usage
+        self.version = 0
+
+        self.last_resync = 0
+        self.last_gpu_usage_refresh = 0
+        self.last_made = None
+
+        node_informer.add_event_handler(self.on_node_event)
+        pod_informer.add_event_handler(self.on_pod_event)
+
+    def start(self):
+        self.node_informer.start()
+        self.pod_informer.start()
+
+    def has_synced(self):
+        return self.node_informer.has_synced() and \
+            self.pod_informer.has_synced()
+
+    # _add_pod, _remove_pod and _set_node must be called with self.lock held
+    def _add_pod(self, pod):
+        key = pod_key(pod)
+        self._remove_pod(key)
+        pod_status = gen_pod_status(pod, self.node_statuses,
+                                    self.gpu_usages.get(pod.metadata.name))
+        self.pods[key] = pod
+        self.pod_statuses[key] = pod_status
+        node_status = self.node_statuses.get(pod_status["node_name"])
+        if node_status is not None:
+            update_node_usage(node_status, pod_status)
+
+    def _remove_pod(self, key):
+        self.pods.pop(key, None)
+        pod_status = self.pod_statuses.pop(key, None)
+        if pod_status is None:
+            return
+        node_status = self.node_statuses.get(pod_status["node_name"])
+        if node_status is not None:
+            update_node_usage(node_status, pod_status, sign=-1)
+
+    def on_pod_event(self, event_type, old, new):
+        with self.lock:
+            pod = old or new
+            key = pod_key(pod)
+            active = new is not None and is_active_pod(new)
+            if old is not None and key in self.pods:
+                if active:
+                    pod_status = gen_pod_status(
+                        new, self.node_statuses,
+                        self.gpu_usages.get(pod.metadata.name))
+                    if pod_status == self.pod_statuses[key]:
+                        self.pods[key] = new
+                        return
+                self._remove_pod(key)
+                self.version += 1
+            if active:
+                self._add_pod(new)
+                self.version += 1
+
+    def on_node_event(self, event_type, old, new):
+        with self.lock:
+            name = (old or new).metadata.name
+            node_status = None if new is None else gen_node_status(new)
+            current = self.node_statuses.pop(name, None)
+
+            if node_status is None:
+                if current is not None:
+                    self.version += 1
+                return
+
+            if current is None:
+                for pod_status in self.pod_statuses.values():
+                    if pod_status["node_name"] == name:
+                        update_node_usage(node_status, pod_status)
+                self.node_statuses[name] = node_status
+                self.version += 1
+                return
+
+            # kubelet updates node status frequently, usage is kept and
+            # version stays if nothing in the status changes
+            for key in [
+                    "gpu_used", "gpu_preemptable_used", "cpu_used",
+                    "cpu_preemptable_used", "memory_used",
+                    "memory_preemptable_used", "pods"
+            ]:
+                node_status[key] = current[key]
+            self.node_statuses[name] = node_status
+            if node_status != current:
+                self.version += 1
+
+    def refresh_gpu_usage(self):
+        with self.lock:
+            pod_names = list(
+                set(pod.metadata.name for pod in self.pods.values()))
+        # prometheus is queried without lock, events keep being applied
+        gpu_usages = self.gpu_usage_client.jobs_gpu_usage(pod_names)
+
+        with self.lock:
+            self.gpu_usages = gpu_usages
+            for key, pod in list(self.pods.items()):
+                pod_status = self.pod_statuses[key]
+                if pod_status["gpu_usage"] != gpu_usages.get(
+                        pod.metadata.name):
+                    self._remove_pod(key)
+                    self._add_pod(pod)
+                    self.version += 1
+        self.last_gpu_usage_refresh = time.time()
+
+    def resync(self):
+        """Rebuilds all statuses from informer caches, returns number of
+        node and pod statuses that drifted"""
+        gpu_usages = self.gpu_usage_client.jobs_gpu_usage(
+            list(set(pod.metadata.name for pod in self.pod_informer.list())))
+
+        # take informer locks first, same order as in event handlers
+        with self.node_informer.lock, self.pod_informer.lock, self.lock:
+            node_statuses = {}
+            for node in self.node_informer.list():
+                node_status = gen_node_status(node)
+                if node_status is not None:
+                    node_statuses[node_status["name"]] = node_status
+
+            pods = {}
+            pod_statuses = {}
+            for pod in self.pod_informer.list():
+                if not is_active_pod(pod):
+                    continue
+                key = pod_key(pod)
+                pods[key] = pod
+                pod_statuses[key] = gen_pod_status(
+                    pod, node_statuses, gpu_usages.get(pod.metadata.name))
+            for pod_status in pod_statuses.values():
+                node_status = node_statuses.get(pod_status["node_name"])
+                if node_status is not None:
+                    update_node_usage(node_status, pod_status)
+
+            drifted = 0
+            for old, new in [(self.node_statuses, node_statuses),
+                             (self.pod_statuses, pod_statuses)]:
+                for key in set(old.keys()) | set(new.keys()):
+                    if old.get(key) != new.get(key):
+                        drifted += 1
+
+            self.node_statuses = node_statuses
+            self.pods = pods
+            self.pod_statuses = pod_statuses
+            self.gpu_usages = gpu_usages
+            if drifted > 0:
+                self.version += 1
+
+        if drifted > 0:
+            logger.info("cluster status model drifted by %d statuses",
+                        drifted)
+        now = time.time()
+        self.last_resync = self.last_gpu_usage_refresh = now
+        return drifted
+
+    def invalidate(self):
+        """Makes next make return ClusterStatus even if nothing changed"""
+        with self.lock:
+            self.last_made = None
+
+    def make(self, jobs, force=False):
+        """Returns ClusterStatus of current statuses and jobs, or None if
+        nothing changed since last call unless force is True"""
+        now = time.time()
+        if now - self.last_resync >= self.resync_period:
+            self.resync()
+        elif now - self.last_gpu_usage_refresh >= self.gpu_usage_period:
+            self.refresh_gpu_usage()
+
+        jobs_key = tuple(
+            sorted([(job.get("jobId"), job.get("jobStatus")) for job in jobs]))
+        with self.lock:
+            made = (self.version, jobs_key)
+            if not force and made == self.last_made:
+                return None
+            node_statuses = {
+                name: dict(node_status)
+                for name, node_status in self.node_statuses.items()
+            }
+            pod_statuses = dict(self.pod_statuses)
+
+        try:
+            cluster_status = ClusterStatus(node_statuses, pod_statuses, jobs)
+        except:
+            logger.exception("Failed to create cluster_status")
+            return None
+        self.last_made = made
+        return cluster_status
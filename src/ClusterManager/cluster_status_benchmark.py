@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Microbenchmark for cluster status generation and ResourceStat arithmetic.
+
+Builds a synthetic cluster with scheduler_simulator.SimNode/SimJob, every
+job having one running pod, plus some scheduling jobs without pods. Times
+ClusterStatusFactory(...).make() plus to_dict(), then
+VirtualClusterStatusesFactory(...).make() plus to_dict() of every vc, the
+same way node_manager does. Kubernetes objects are built once before
+timing.
+
+Examples:
+    ./cluster_status_benchmark.py
+    ./cluster_status_benchmark.py --nodes 200 --pods 2000 --repeat 5
+    ./cluster_status_benchmark.py --vcs 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
+
+from cluster_status import ClusterStatusFactory
+from virtual_cluster_status import VirtualClusterStatusesFactory
+from scheduler_simulator import SimNode, SimJob, percentile, make_vc_list
+from resource_stat import Gpu, Cpu, Memory
+
+logger = logging.getLogger(__name__)
+
+
+class NoGpuUsageClient(object):
+    """No prometheus in benchmark"""
+    def jobs_gpu_usage(self, pod_names):
+        return {}
+
+
+def make_cluster(num_nodes,
+                 num_pods,
+                 num_skus=4,
+                 num_vcs=10,
+                 num_users=100,
+                 num_jobs_without_pods=0):
+    nodes = [
+        SimNode("node%d" % i, "sku%d" % (i % num_skus), 8, 64, 512 * 1024)
+        for i in range(num_nodes)
+    ]
+    pods_per_node = max(1, num_pods // max(1, num_nodes))
+
+    jobs = []
+    for i in range(num_pods):
+        node = nodes[(i // pods_per_node) % num_nodes]
+        gpu = 1 if i % pods_per_node < node.gpu else 0
+        job = SimJob("job%d" % i,
+                     arrival=0,
+                     duration=0,
+                     vc_name="vc%d" % (i % num_vcs),
+                     user_name="user%d" % (i % num_users),
+                     sku=node.sku,
+                     gpu=gpu,
+                     cpu=4,
+                     memory=8 * 1024,
+                     preemption_allowed=(i % 5 == 0))
+        job.node = node
+        job.status = "running"
+        jobs.append(job)
+
+    k8s_nodes = [node.to_k8s() for node in nodes]
+    k8s_pods = [job.to_k8s() for job in jobs]
+
+    # approved by job manager, pods not created yet
+    for i in range(num_jobs_without_pods):
+        job = SimJob("pending%d" % i,
+                     arrival=0,
+                     duration=0,
+                     vc_name="vc%d" % (i % num_vcs),
+                     user_name="user%d" % (i % num_users),
+                     sku=nodes[i % num_nodes].sku,
+                     gpu=1,
+                     cpu=4,
+                     memory=8 * 1024,
+                     preemption_allowed=(i % 5 == 0))
+        job.status = "scheduling"
+        jobs.append(job)
+
+    status_jobs = [{
+        "jobId": job.job_id,
+        "userName": job.user_name,
+        "vcName": job.vc_name,
+        "jobParams": job.job_params,
+        "jobStatus": job.status,
+    } for job in jobs]
+    vc_list = make_vc_list(["vc%d" % i for i in range(num_vcs)], nodes)
+    return k8s_nodes, k8s_pods, status_jobs, vc_list
+
+
+def bench_cluster_status(k8s_nodes, k8s_pods, status_jobs, vc_list, repeat):
+    """Returns latencies of cluster status and vc statuses"""
+    latencies = []
+    vc_latencies = []
+    for _ in range(repeat):
+        # ClusterStatus decodes jobParams in place
+        jobs = [dict(job) for job in status_jobs]
+        start = time.time()
+        cs = ClusterStatusFactory(None,
+                                  k8s_nodes,
+                                  k8s_pods,
+                                  jobs,
+                                  gpu_usage_client=NoGpuUsageClient()).make()
+        cs.to_dict()
+        latencies.append(time.time() - start)
+
+        start = time.time()
+        vc_statuses = VirtualClusterStatusesFactory(cs, vc_list).make()
+        for vc_status in vc_statuses.values():
+            vc_status.to_dict()
+        vc_latencies.append(time.time() - start)
+    return latencies, vc_latencies
+
+
+def bench_resource_stat(num_ops, num_skus=4):
+    skus = ["sku%d" % i for i in range(num_skus)]
+    stats = [(Gpu({sku: 8 for sku in skus}), Cpu({sku: "64" for sku in skus}),
+              Memory({sku: "512Gi" for sku in skus}))]
+    request = (Gpu({skus[0]: 1}), Cpu({skus[0]: "4000m"}),
+               Memory({skus[0]: "8Gi"}))
+
+    start = time.time()
+    for i in range(num_ops):
+        total = stats[0]
+        free = [t - r for t, r in zip(total, request)]
+        fits = all(f >= r for f, r in zip(free, request))
+        if not fits:
+            logger.warning("Unexpected, request does not fit")
+        Cpu({skus[i % num_skus]: "%dm" % (i % 64000)})
+    elapsed = time.time() - start
+    return num_ops / elapsed
+
+
+def main(args):
+    start = time.time()
+    k8s_nodes, k8s_pods, status_jobs, vc_list = make_cluster(
+        args.nodes,
+        args.pods,
+        num_vcs=args.vcs,
+        num_jobs_without_pods=args.jobs_without_pods)
+    setup = time.time() - start
+
+    latencies, vc_latencies = bench_cluster_status(k8s_nodes, k8s_pods,
+                                                   status_jobs, vc_list,
+                                                   args.repeat)
+    report = {
+        "nodes": args.nodes,
+        "pods": args.pods,
+        "vcs": args.vcs,
+        "jobs_without_pods": args.jobs_without_pods,
+        "setup_seconds": setup,
+        "cluster_status_p50_seconds": percentile(sorted(latencies), 50),
+        "cluster_status_max_seconds": max(latencies),
+        "vc_statuses_p50_seconds": percentile(sorted(vc_latencies), 50),
+        "vc_statuses_max_seconds": max(vc_latencies),
+        "resource_stat_ops_per_second": bench_resource_stat(args.ops),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--pods", type=int, default=20000)
+    parser.add_argument("--vcs", type=int, default=10)
+    parser.add_argument("--jobs_without_pods", type=int, default=1000)
+    parser.add_argument("--repeat",
+                        help="times to generate cluster status",
+                        type=int,
+                        default=3)
+    parser.add_argument("--ops",
+                        help="ResourceStat iterations to run",
+                        type=int,
+                        default=100000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    main(args)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import time
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+archiver_rows_counter = Counter("db_archiver_rows_total",
+                                "rows archived from a table",
+                                labelnames=("name", "mode"))
+
+archiver_chunks_counter = Counter("db_archiver_chunks_total",
+                                  "chunks archived from a table",
+                                  labelnames=("name", "mode"))
+
+archiver_checkpoint_gauge = Gauge("db_archiver_checkpoint_id",
+                                  "last id archived in current pass",
+                                  labelnames=("name",))
+
+ARCHIVE_MODES = ["delete", "table", "file"]
+
+
+class RateLimiter(object):
+    """Paces work to at most rate units per second, no limit if rate is
+    None or not positive"""
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.next_time = None
+
+    def acquire(self, units):
+        if self.rate is None or self.rate <= 0:
+            return
+        now = self.clock()
+        if self.next_time is None or self.next_time < now:
+            self.next_time = now
+        wait = self.next_time - now
+        self.next_time += float(units) / self.rate
+        if wait > 0:
+            self.sleep(wait)
+
+
+class Checkpoint(object):
+    """State of an archive pass persisted in a json file, so that a pass
+    interrupted by restart resumes where it stopped.
+
+    last_id is the last id of rows handled in current pass. pending are ids
+    already exported to file but maybe not deleted yet.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.last_id = 0
+        self.pending = []
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self.last_id = int(state.get("last_id", 0))
+            self.pending = list(state.get("pending", []))
+        except Exception:
+            logger.exception("failed to load checkpoint %s, start over",
+                             self.path)
+            self.last_id = 0
+            self.pending = []
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"last_id": self.last_id, "pending": self.pending}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class Archiver(object):
+    """Archives rows older than days_ago of a table in id ordered chunks.
+
+    mode is one of
+        delete: rows are deleted.
+        table: rows are moved into table archive_table, in the same
+            transaction as the delete.
+        file: rows are appended to a gzipped jsonl file per day in
+            archive_dir, then deleted.
+
+    Rows of dependents referring to archived rows are deleted in the same
+    transaction, dependents are (dependent table, column of dependent table,
+    column of table) tuples.
+
+    Each chunk is at most chunk_size rows and at most rows_per_second rows
+    are archived per second, so that row locks are short and replicas keep
+    up. Progress is checkpointed after every chunk. A pass ends when no more
+    rows are found, and the next pass scans from the beginning again, since
+    rows with small ids may become old enough later.
+    """
+    def __init__(self,
+                 name,
+                 table,
+                 days_ago,
+                 col="time",
+                 cond=None,
+                 mode="delete",
+                 chunk_size=1000,
+                 rows_per_second=None,
+                 archive_dir=None,
+                 archive_table=None,
+                 rate_limiter=None,
+                 dependents=()):
+        if mode not in ARCHIVE_MODES:
+            raise ValueError("unknown archive mode %s" % mode)
+        if mode == "file" and archive_dir is None:
+            raise ValueError("archive_dir is required in file mode")
+
+        self.name = name
+        self.table = table
+        self.days_ago = days_ago
+        self.col = col
+        self.cond = cond
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.archive_dir = archive_dir
+        self.archive_table = archive_table or "%s_archive" % table
+        self.dependents = list(dependents)
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(rows_per_second)
+        self.rate_limiter = rate_limiter
+
+        checkpoint_path = None
+        if archive_dir is not None:
+            checkpoint_path = os.path.join(archive_dir,
+                                           "%s.checkpoint" % name)
+        self.checkpoint = Checkpoint(checkpoint_path)
+
+    def archive_file_path(self):
+        return os.path.join(
+            self.archive_dir, "%s-%s.jsonl.gz" %
+            (self.table, datetime.date.today().strftime("%Y%m%d")))
+
+    def export(self, rows):
+        # gzip members appended to the same file read back as one stream
+        with gzip.open(self.archive_file_path(), "at") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str))
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def archive_chunk(self, data_handler):
+        """Archives next chunk. Returns number of rows found, 0 if the pass
+        is done."""
+        checkpoint = self.checkpoint
+        fields = "*" if self.mode == "file" else ("id",)
+        rows = data_handler.get_rows_older_than_days(
+            self.table,
+            self.days_ago,
+            col=self.col,
+            cond=self.cond,
+            after_id=checkpoint.last_id,
+            limit=self.chunk_size,
+            fields=fields)
+        if len(rows) == 0:
+            return 0
+
+        self.rate_limiter.acquire(len(rows))
+
+        ids = [row["id"] for row in rows]
+        if self.mode == "table":
+            data_handler.move_rows_by_ids(self.table,
+                                          self.archive_table,
+                                          ids,
+                                          dependents=self.dependents)
+        else:
+            if self.mode == "file":
+                self.export(rows)
+                checkpoint.pending = ids
+                checkpoint.last_id = ids[-1]
+                checkpoint.save()
+            data_handler.delete_rows_by_ids(self.table,
+                                            ids,
+                                            dependents=self.dependents)
+
+        checkpoint.pending = []
+        checkpoint.last_id = ids[-1]
+        checkpoint.save()
+
+        archiver_rows_counter.labels(self.name, self.mode).inc(len(rows))
+        archiver_chunks_counter.labels(self.name, self.mode).inc()
+        archiver_checkpoint_gauge.labels(self.name).set(checkpoint.last_id)
+        return len(rows)
+
+    def run(self, data_handler, max_chunks=None, on_chunk=None):
+        """Archives chunks until the pass is done or max_chunks chunks are
+        archived, calling on_chunk after each chunk. Returns number of rows
+        archived."""
+        if self.mode == "table":
+            data_handler.create_archive_table(self.table, self.archive_table)
+        if self.archive_dir is not None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+
+        # exported to file by an interrupted chunk but not deleted
+        if len(self.checkpoint.pending) > 0:
+            data_handler.delete_rows_by_ids(self.table,
+                                            self.checkpoint.pending,
+                                            dependents=self.dependents)
+            self.checkpoint.pending = []
+            self.checkpoint.save()
+
+        total = 0
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            archived = self.archive_chunk(data_handler)
+            if archived == 0:
+                logger.info("archiver %s finished pass at id %s",
+                            self.name, self.checkpoint.last_id)
+                self.checkpoint.last_id = 0
+                self.checkpoint.save()
+                archiver_checkpoint_gauge.labels(self.name).set(0)
+                break
+            total += archived
+            chunks += 1
+            if on_chunk is not None:
+                on_chunk()
+        logger.info("archiver %s archived %d rows of %s in %d chunks",
+                    self.name, total, self.table, chunks)
+        return total
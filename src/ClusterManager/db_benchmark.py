@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""Benchmark for hot DataHandler queries on a SQLite database.
+
+Seeds jobs table with jobs of many users and vcs, most of them finished
+like on a long running cluster, with jobParams of realistic size, and
+stores a cluster status made by ClusterStatusFactory for a synthetic
+cluster. Then times
+    GetJobList of active jobs of all users, with default fields and with
+        fields job manager reads, and of a single user
+    get_union_job_list of a user, as restfulapi ListJobs does
+    GetClusterStatus, without the cluster status cache of the process
+    UpdateJobTextFields of jobStatusDetail of active jobs
+Seeding is not timed. Rows and bytes read are reported for job lists, to
+compare default fields with the projection.
+
+Examples:
+    ./db_benchmark.py
+    ./db_benchmark.py --jobs 500000 --active 5000 --repeat 10
+    ./db_benchmark.py --database /tmp/dlws.db
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
+
+from config import config
+# DataHandler imported by job_manager is chosen by datasource
+config.setdefault("datasource", "SQLite")
+import MySQLDataHandler
+from MySQLDataHandler import base64encode
+from SQLiteDataHandler import DataHandler
+from cluster_status import ClusterStatusFactory
+from cluster_status_benchmark import make_cluster, NoGpuUsageClient
+from scheduler_simulator import percentile
+from job_manager import JobChangeFeed
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = [
+    "running", "queued", "scheduling", "unapproved", "pausing", "paused"
+]
+ACTIVE_STATUS = ",".join(ACTIVE_STATUSES)
+INACTIVE_STATUSES = ["finished", "failed", "killed", "error"]
+
+
+def make_job_params(job_id, user_name, vc_name, gpu):
+    return {
+        "jobId": job_id,
+        "familyToken": job_id,
+        "isParent": 1,
+        "jobName": "benchmark job %s" % job_id,
+        "userName": user_name,
+        "vcName": vc_name,
+        "jobType": "training",
+        "jobtrainingtype": "RegularJob",
+        "image": "indexserveregistry.azurecr.io/deepscale:1.0.post0",
+        "cmd": "cd /data/%s && python train.py --epochs 90 " % user_name +
+               " ".join(["--arg%d value%d" % (i, i) for i in range(20)]),
+        "resourcegpu": gpu,
+        "gpuType": "P40",
+        "sku": "sku%d" % (gpu % 4),
+        "cpurequest": 4,
+        "memoryrequest": "8Gi",
+        "preemptionAllowed": False,
+        "workPath": "./",
+        "dataPath": "./",
+        "jobPath": "./",
+        "envs": [{
+            "name": "ENV%d" % i,
+            "value": "value%d" % i
+        } for i in range(10)],
+        "mountpoints": [{
+            "name": "mount%d" % i,
+            "containerPath": "/data/mount%d" % i,
+            "hostPath": "/dlwsdata/storage/mount%d" % i,
+            "enabled": True
+        } for i in range(5)],
+        "plugins": {
+            "blobfuse": []
+        },
+    }
+
+
+def make_job_description(job_id):
+    """Returns base64 encoded k8s spec of a size like launcher writes"""
+    spec = "\n".join([
+        "  - name: %s-field%d\n    value: %s" % (job_id, i, "x" * 40)
+        for i in range(50)
+    ])
+    return base64encode("kind: Pod\nmetadata:\n  name: %s\nspec:\n%s" %
+                        (job_id, spec))
+
+
+def seed_jobs(data_handler, num_jobs, num_active, num_users, num_vcs, days):
+    """Adds num_jobs jobs with jobTime spread over last days days, of which
+    num_active latest jobs are in active status"""
+    rand = random.Random(0)
+    now = datetime.datetime.now().replace(microsecond=0)
+    step = datetime.timedelta(days=days) / max(1, num_jobs)
+
+    updates = []
+    with data_handler.transaction():
+        for i in range(num_jobs):
+            job_id = "job-%08d" % i
+            params = make_job_params(job_id, "user%d" % (i % num_users),
+                                     "vc%d" % (i % num_vcs), rand.choice(
+                                         [0, 1, 1, 2, 4, 8]))
+            if not data_handler.AddJob(params):
+                raise RuntimeError("failed to add job %s" % job_id)
+            if i >= num_jobs - num_active:
+                status = rand.choice(ACTIVE_STATUSES)
+            else:
+                status = rand.choice(INACTIVE_STATUSES)
+            updates.append((status, now - (num_jobs - i) * step,
+                            make_job_description(job_id), job_id))
+    data_handler.execute_batch(
+        "UPDATE `jobs` SET `jobStatus` = %s, `jobTime` = %s, "
+        "`jobDescription` = %s WHERE `jobId` = %s", updates)
+    return ["job-%08d" % i for i in range(num_jobs - num_active, num_jobs)]
+
+
+def make_cluster_status(num_nodes, num_pods):
+    k8s_nodes, k8s_pods, status_jobs, _ = make_cluster(num_nodes, num_pods)
+    cs = ClusterStatusFactory(None,
+                              k8s_nodes,
+                              k8s_pods,
+                              status_jobs,
+                              gpu_usage_client=NoGpuUsageClient()).make()
+    return cs.to_dict()
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def summary(latencies):
+    return {
+        "p50_seconds": percentile(latencies, 50),
+        "p99_seconds": percentile(latencies, 99),
+        "max_seconds": max(latencies),
+    }
+
+
+def size_of(jobs):
+    """Returns (rows, bytes) of jobs, counting str and bytes values by
+    length and others by length of their str"""
+    size = 0
+    for job in jobs:
+        for value in job.values():
+            if value is None:
+                continue
+            if not isinstance(value, (str, bytes)):
+                value = str(value)
+            size += len(value)
+    return len(jobs), size
+
+
+def job_list_summary(data_handler, repeat, *args, **kwargs):
+    latencies = timed(lambda: data_handler.GetJobList(*args, **kwargs),
+                      repeat)
+    ret = summary(latencies)
+    ret["rows"], ret["bytes"] = size_of(
+        data_handler.GetJobList(*args, **kwargs))
+    return ret
+
+
+def run_benchmark(data_handler, args, active_job_ids):
+    report = {}
+
+    report["get_job_list_active"] = job_list_summary(data_handler,
+                                                     args.repeat, "all",
+                                                     "all", None,
+                                                     ACTIVE_STATUS)
+    report["get_job_list_active_projected"] = job_list_summary(
+        data_handler,
+        args.repeat,
+        "all",
+        "all",
+        None,
+        ACTIVE_STATUS,
+        fields=JobChangeFeed.fields)
+
+    latencies = timed(
+        lambda: data_handler.GetJobList("user0", "all", None, ACTIVE_STATUS),
+        args.repeat)
+    report["get_job_list_active_of_user"] = summary(latencies)
+
+    latencies = timed(
+        lambda: data_handler.get_union_job_list("user0", "vc0", args.num,
+                                                ACTIVE_STATUS), args.repeat)
+    report["get_union_job_list"] = summary(latencies)
+
+    def get_cluster_status():
+        MySQLDataHandler.cluster_status_cache = None
+        status, _ = data_handler.GetClusterStatus()
+        if status is None:
+            logger.warning("Unexpected, no cluster status")
+
+    report["get_cluster_status"] = summary(
+        timed(get_cluster_status, args.repeat))
+
+    rand = random.Random(1)
+
+    def update_job():
+        job_id = rand.choice(active_job_ids)
+        detail = base64encode(
+            json.dumps([{
+                "message": "updated at %s" % time.time()
+            }]))
+        data_handler.UpdateJobTextFields({"jobId": job_id},
+                                         {"jobStatusDetail": detail})
+
+    report["update_job_text_fields"] = summary(timed(update_job, args.updates))
+    return report
+
+
+def main(args):
+    config.setdefault("clusterId", "benchmark")
+    config.setdefault("defalt_virtual_cluster_name", "platform")
+
+    tmp_dir = None
+    database = args.database
+    if database is None:
+        tmp_dir = tempfile.mkdtemp()
+        database = os.path.join(tmp_dir, "benchmark.db")
+
+    try:
+        with DataHandler(database=database) as data_handler:
+            start = time.time()
+            active_job_ids = seed_jobs(data_handler, args.jobs, args.active,
+                                       args.users, args.vcs, args.days)
+            cluster_status = make_cluster_status(args.nodes, args.pods)
+            data_handler.UpdateClusterStatus(cluster_status)
+            setup = time.time() - start
+
+            report = {
+                "database": database,
+                "jobs": args.jobs,
+                "active": args.active,
+                "users": args.users,
+                "vcs": args.vcs,
+                "nodes": args.nodes,
+                "pods": args.pods,
+                "cluster_status_bytes":
+                    len(json.dumps(cluster_status, separators=(",", ":"))),
+                "setup_seconds": setup,
+            }
+            report.update(run_benchmark(data_handler, args, active_job_ids))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database",
+                        help="sqlite database file, a temporary one if "
+                        "not given, or :memory:")
+    parser.add_argument("--jobs", type=int, default=100000)
+    parser.add_argument("--active",
+                        help="number of jobs in active status",
+                        type=int,
+                        default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--vcs", type=int, default=10)
+    parser.add_argument("--days",
+                        help="days jobTime of jobs spreads over",
+                        type=int,
+                        default=180)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--pods", type=int, default=5000)
+    parser.add_argument("--num",
+                        help="number of inactive jobs get_union_job_list "
+                        "returns",
+                        type=int,
+                        default=20)
+    parser.add_argument("--repeat",
+                        help="times to run each query",
+                        type=int,
+                        default=20)
+    parser.add_argument("--updates",
+                        help="number of UpdateJobTextFields to run",
+                        type=int,
+                        default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    main(args)
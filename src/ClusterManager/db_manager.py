@@ -17,9 +17,12 @@ sys.path.append(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
 
 from DataHandler import DataHandler
+from config import config
+from db_archiver import Archiver
 
 CLUSTER_STATUS_EXPIRY = 1
 JOBS_EXPIRY = 180
+INACTIVE_JOB_STATUS = ["finished", "failed", "killed", "error"]
 logger = logging.getLogger(__name__)
 
 
@@ -35,36 +38,63 @@ def create_log(logdir='/var/log/dlworkspace'):
     logging.config.dictConfig(logging_config)
 
 
-def delete_old_cluster_status(days_ago):
+def get_archive_config():
+    """Archive settings in db-manager section of config"""
+    db_config = config.get("db-manager", {})
+    return {
+        "mode": db_config.get("archive-mode", "delete"),
+        "chunk_size": int(db_config.get("archive-chunk-size", 1000)),
+        "rows_per_second": float(
+            db_config.get("archive-rows-per-second", 500)),
+        "archive_dir": db_config.get("archive-dir",
+                                     "/var/log/dlworkspace/archive"),
+    }
+
+
+def archive_jobs_enabled():
+    """Old inactive jobs are kept unless enabled in config"""
+    return bool(config.get("db-manager", {}).get("archive-jobs", False))
+
+
+def make_cluster_status_archiver(days_ago):
+    return Archiver("clusterstatus", "clusterstatus", days_ago,
+                    **get_archive_config())
+
+
+def make_inactive_jobs_archiver(days_ago):
+    return Archiver("jobs",
+                    "jobs",
+                    days_ago,
+                    col="lastUpdated",
+                    cond={"jobStatus": ("IN", INACTIVE_JOB_STATUS)},
+                    dependents=[("endpoints", "jobId", "jobId")],
+                    **get_archive_config())
+
+
+def delete_old_cluster_status(archiver, on_chunk=None):
     table = "clusterstatus"
     with DataHandler() as data_handler:
         num_rows = data_handler.count_rows(table)
         if num_rows <= 10: # Retain 10 rows for safety
             return
 
-        logger.info("Deleting rows from table %s older than %s day(s)", table,
-                    days_ago)
-        ret = data_handler.delete_rows_from_table_older_than_days(
-            table, days_ago)
-        ret_status = "succeeded" if ret is True else "failed"
-        logger.info("Deleting rows from table %s older than %s day(s) %s",
-                    table, days_ago, ret_status)
+        logger.info("Archiving rows from table %s older than %s day(s)",
+                    table, archiver.days_ago)
+        archived = archiver.run(data_handler, on_chunk=on_chunk)
+        logger.info("Archived %s rows from table %s older than %s day(s)",
+                    archived, table, archiver.days_ago)
 
 
-def delete_old_inactive_jobs(days_ago):
+def delete_old_inactive_jobs(archiver, on_chunk=None):
     table = "jobs"
     with DataHandler() as data_handler:
         logger.info(
-            "Deleting inactive job records from table %s older than %s "
-            "day(s)", table, days_ago)
-
-        cond = {"jobStatus": ("IN", ["finished", "failed", "killed", "error"])}
-        ret = data_handler.delete_rows_from_table_older_than_days(
-            table, days_ago, col="lastUpdated", cond=cond)
-        ret_status = "succeeded" if ret is True else "failed"
+            "Archiving inactive job records from table %s older than %s "
+            "day(s)", table, archiver.days_ago)
+        archived = archiver.run(data_handler, on_chunk=on_chunk)
         logger.info(
-            "Deleting inactive job records from table %s older than %s "
-            "day(s) %s", table, days_ago, ret_status)
+            "Archived %s inactive job records from table %s older than %s "
+            "day(s)", archived, table, archiver.days_ago)
 
 
 def sleep_with_update(time_to_sleep, fn):
@@ -78,16 +108,22 @@ def run():
     create_log()
 
     update = lambda: update_file_modification_time("db_manager")
+    cluster_status_archiver = make_cluster_status_archiver(
+        CLUSTER_STATUS_EXPIRY)
+    jobs_archiver = make_inactive_jobs_archiver(JOBS_EXPIRY)
     while True:
         update()
 
         with manager_iteration_histogram.labels("db_manager").time():
             try:
-                delete_old_cluster_status(CLUSTER_STATUS_EXPIRY)
-                # query below is too time consuming since lastUpdated in job table is not indexed
-                # delete_old_inactive_jobs(JOBS_EXPIRY)
+                delete_old_cluster_status(cluster_status_archiver, update)
             except:
                 logger.exception("Deleting old cluster status failed")
+            if archive_jobs_enabled():
+                try:
+                    delete_old_inactive_jobs(jobs_archiver, update)
+                except:
+                    logger.exception("Deleting old inactive jobs failed")
 
         sleep_with_update(86400, update)
 
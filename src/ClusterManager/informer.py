@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import threading
+import time
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+informer_relist_counter = Counter("informer_relist_total",
+                                  "times an informer relisted from api server",
+                                  labelnames=("name",))
+
+informer_event_counter = Counter("informer_event_total",
+                                 "watch events processed by an informer",
+                                 labelnames=("name", "type"))
+
+
+def name_of(obj):
+    return obj.metadata.name
+
+
+def label_of(label):
+    """Returns an index function that indexes objects by label value"""
+
+    def index_fn(obj):
+        labels = obj.metadata.labels
+        if labels is None or label not in labels:
+            return []
+        return [labels[label]]
+
+    return index_fn
+
+
+def is_gone(exception):
+    return isinstance(exception, ApiException) and exception.status == 410
+
+
+class Informer(object):
+    """Keeps an in-process cache of k8s objects in sync with api server.
+
+    The informer LISTs all objects once and then WATCHes from the returned
+    resourceVersion. If api server answers 410 Gone, i.e. the
+    resourceVersion is too old, the informer relists. It also relists every
+    resync_period seconds to correct anything missed.
+
+    Objects are indexed by key_fn (name by default) and by every index
+    function in indexers, which maps an object to a list of index values.
+    Readers must check has_synced() before trusting the cache. Cache is bound
+    to the process that started it, a forked child will see has_synced()
+    returning False and should fall back to api server.
+    """
+    def __init__(self,
+                 list_fn,
+                 list_kwargs=None,
+                 indexers=None,
+                 key_fn=name_of,
+                 name="informer",
+                 watch_timeout=300,
+                 resync_period=1800):
+        self.list_fn = list_fn
+        self.list_kwargs = list_kwargs or {}
+        self.indexers = indexers or {}
+        self.key_fn = key_fn
+        self.name = name
+        self.watch_timeout = watch_timeout
+        self.resync_period = resync_period
+
+        self.lock = threading.RLock()
+        self.objects = {}
+        self.indices = {index_name: {} for index_name in self.indexers}
+        self.handlers = []
+
+        self.synced = False
+        self.pid = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.run,
+                                       name="%s-informer" % self.name,
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def has_synced(self):
+        return self.synced and self.pid == os.getpid() and \
+            self.thread is not None and self.thread.is_alive()
+
+    def wait_for_sync(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.has_synced():
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def add_event_handler(self, handler):
+        """handler is called as handler(event_type, old_obj, new_obj) for
+        every change applied to the cache, event_type is one of ADDED,
+        MODIFIED and DELETED. It is called from informer thread with cache
+        locked, so it should be fast and must not block."""
+        with self.lock:
+            self.handlers.append(handler)
+
+    def get(self, key):
+        with self.lock:
+            return self.objects.get(key)
+
+    def list(self):
+        with self.lock:
+            return list(self.objects.values())
+
+    def by_index(self, index_name, index_value):
+        with self.lock:
+            keys = self.indices[index_name].get(index_value, set())
+            return [self.objects[key] for key in keys]
+
+    def run(self):
+        backoff = 1
+        while not self.stop_event.is_set():
+            try:
+                resource_version = self.relist()
+                backoff = 1
+                self.watch(resource_version)
+            except Exception:
+                logger.exception("informer %s failed, relist in %ds",
+                                 self.name, backoff)
+                self.synced = False
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def relist(self):
+        informer_relist_counter.labels(self.name).inc()
+        resp = self.list_fn(**self.list_kwargs)
+        objects = {self.key_fn(obj): obj for obj in resp.items}
+
+        with self.lock:
+            for key in list(self.objects.keys()):
+                if key not in objects:
+                    self.delete(key)
+            for obj in objects.values():
+                self.upsert(obj)
+            self.synced = True
+
+        logger.info("informer %s listed %d objects at version %s", self.name,
+                    len(objects), resp.metadata.resource_version)
+        return resp.metadata.resource_version
+
+    def watch(self, resource_version):
+        resync_at = time.time() + self.resync_period
+        while not self.stop_event.is_set() and time.time() < resync_at:
+            w = watch.Watch()
+            try:
+                for event in w.stream(self.list_fn,
+                                      resource_version=resource_version,
+                                      timeout_seconds=self.watch_timeout,
+                                      **self.list_kwargs):
+                    event_type = event["type"]
+                    if event_type == "ERROR":
+                        raw = event.get("raw_object") or {}
+                        logger.info("informer %s watch error %s", self.name,
+                                    raw)
+                        if raw.get("code") == 410:
+                            return
+                        raise RuntimeError("watch error %s" % raw)
+
+                    informer_event_counter.labels(self.name, event_type).inc()
+                    obj = event["object"]
+                    resource_version = obj.metadata.resource_version
+                    with self.lock:
+                        if event_type == "DELETED":
+                            self.delete(self.key_fn(obj))
+                        else:
+                            self.upsert(obj)
+
+                    if self.stop_event.is_set() or time.time() >= resync_at:
+                        w.stop()
+            except ApiException as e:
+                if is_gone(e):
+                    logger.info("informer %s resource version %s is gone",
+                                self.name, resource_version)
+                    return
+                raise
+
+    # upsert and delete must be called with self.lock held
+    def upsert(self, obj):
+        key = self.key_fn(obj)
+        old = self.objects.get(key)
+        if old is not None:
+            if old.metadata.resource_version == obj.metadata.resource_version:
+                return
+            self.unindex(key, old)
+        self.objects[key] = obj
+        self.index(key, obj)
+        self.notify("ADDED" if old is None else "MODIFIED", old, obj)
+
+    def delete(self, key):
+        old = self.objects.pop(key, None)
+        if old is None:
+            return
+        self.unindex(key, old)
+        self.notify("DELETED", old, None)
+
+    def index(self, key, obj):
+        for index_name, index_fn in self.indexers.items():
+            index = self.indices[index_name]
+            for value in index_fn(obj):
+                index.setdefault(value, set()).add(key)
+
+    def unindex(self, key, obj):
+        for index_name, index_fn in self.indexers.items():
+            index = self.indices[index_name]
+            for value in index_fn(obj):
+                keys = index.get(value)
+                if keys is None:
+                    continue
+                keys.discard(key)
+                if len(keys) == 0:
+                    del index[value]
+
+    def notify(self, event_type, old, new):
+        for handler in self.handlers:
+            try:
+                handler(event_type, old, new)
+            except Exception:
+                logger.exception("informer %s handler failed", self.name)
@@ -11,8 +11,12 @@ import datetime
 import base64
 import multiprocessing
 import hashlib
+import threading
+import queue
+import concurrent.futures
 
 from kubernetes import client, config as k8s_config
+from prometheus_client import Histogram
 from kubernetes.client.rest import ApiException
 from kubernetes.stream import stream
 from kubernetes.stream.ws_client import ERROR_CHANNEL, STDERR_CHANNEL, STDOUT_CHANNEL
@@ -23,12 +27,19 @@ from cluster_manager import record
 from config import config
 from pod_template import RegularJobTemplate, DistributeJobTemplate, InferenceJobTemplate
 from job import Job, JobSchema
+from informer import Informer, label_of
 from DataHandler import DataHandler
 import k8sUtils
 import framework
 
 logger = logging.getLogger(__name__)
 
+job_teardown_histogram = Histogram(
+    "job_teardown_latency_seconds",
+    "latency for launcher to delete k8s resources of a job (seconds)",
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0, 128.0,
+             float("inf")))
+
 
 def walk_json_field_safe(obj, *fields):
     """ for example a=[{"a": {"b": 2}}]
@@ -70,14 +81,12 @@ class JobRole(object):
         # pod-phase: https://kubernetes.io/docs/concepts/workloads/pods/pod-lifecycle/#pod-phase
         # node condition: https://kubernetes.io/docs/concepts/architecture/nodes/#condition
         if refresh:
-            pods = self.launcher.get_pods(
-                field_selector="metadata.name={}".format(self.pod_name))
-            logger.debug("Pods: {}".format(pods))
-            if len(pods) < 1:
+            pod = self.launcher.get_pod(self.pod_name)
+            logger.debug("Pod: {}".format(pod))
+            if pod is None:
                 return "NotFound"
 
-            assert (len(pods) == 1)
-            self.pod = pods[0]
+            self.pod = pod
 
         phase = self.pod.status.phase
 
@@ -129,8 +138,130 @@ class JobRole(object):
                                      self.pod_name)
                         return status.ready
         # no readiness_probe defined, fallback to old way
+        if self.launcher.readiness_tracker is not None:
+            return self.launcher.readiness_tracker.is_ready(self)
         return self._is_file_exist(JobRole.MARK_ROLE_READY_FILE)
 
+    def has_readiness_probe(self):
+        for container in self.pod.spec.containers:
+            if container.name == self.pod_name and container.readiness_probe is not None:
+                return True
+        return False
+
+
+def pod_restart_count(pod):
+    statuses = pod.status.container_statuses or []
+    return sum([status.restart_count or 0 for status in statuses])
+
+
+class RoleReadinessTracker(object):
+    """Remembers pods already seen READY so READY file is checked by
+    pod_exec at most once per pod incarnation.
+
+    A pod is identified by (uid, restart count), a restarted container will
+    have to touch READY file again, so it is checked again. Checks still
+    needed are run concurrently in a bounded thread pool by check_roles,
+    their results, ready or not, are reused by is_ready in the same pass.
+    """
+    def __init__(self, pool_size=8):
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.ready = {} # pod name -> ((uid, restart count), job id)
+        self.checked = {} # pod name -> ((uid, restart count), ready)
+        self.executor = None
+
+    @staticmethod
+    def key_of(pod):
+        return pod.metadata.uid, pod_restart_count(pod)
+
+    @staticmethod
+    def job_id_of(pod):
+        return (pod.metadata.labels or {}).get("run")
+
+    def is_known_ready(self, pod):
+        with self.lock:
+            entry = self.ready.get(pod.metadata.name)
+        return entry is not None and entry[0] == self.key_of(pod)
+
+    def mark_ready(self, pod):
+        with self.lock:
+            self.ready[pod.metadata.name] = (self.key_of(pod),
+                                             self.job_id_of(pod))
+
+    def forget(self, pod_name):
+        with self.lock:
+            self.ready.pop(pod_name, None)
+
+    def on_pod_event(self, event_type, old, new):
+        if event_type == "DELETED":
+            self.forget(old.metadata.name)
+
+    def start_pass(self, job_ids):
+        """Drops results checked in previous pass, and forgets ready pods of
+        jobs not in job_ids, so that pods of finished jobs do not pile up
+        when no informer tells their deletion"""
+        job_ids = set(job_ids)
+        with self.lock:
+            self.checked = {}
+            for pod_name, (_, job_id) in list(self.ready.items()):
+                if job_id not in job_ids:
+                    del self.ready[pod_name]
+
+    def is_ready(self, job_role):
+        pod = job_role.pod
+        if self.is_known_ready(pod):
+            return True
+        with self.lock:
+            checked = self.checked.get(pod.metadata.name)
+        if checked is not None and checked[0] == self.key_of(pod):
+            return checked[1]
+        ready = job_role._is_file_exist(JobRole.MARK_ROLE_READY_FILE)
+        if ready:
+            self.mark_ready(pod)
+        return ready
+
+    def _need_check(self, job_role):
+        pod = job_role.pod
+        return pod.status.phase == "Running" and \
+            pod.metadata.deletion_timestamp is None and \
+            not job_role.has_readiness_probe() and \
+            not self.is_known_ready(pod)
+
+    def check_roles(self, job_roles):
+        """Checks READY file of all roles not known to be ready concurrently,
+        roles found ready are remembered, results are kept for is_ready till
+        next start_pass. Returns number of pod_exec issued"""
+        to_check = [
+            job_role for job_role in job_roles if self._need_check(job_role)
+        ]
+        if len(to_check) == 0:
+            return 0
+
+        # lazily created since launcher may fork after construction
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.pool_size)
+
+        futures = {
+            self.executor.submit(job_role._is_file_exist,
+                                 JobRole.MARK_ROLE_READY_FILE): job_role
+            for job_role in to_check
+        }
+        for future in concurrent.futures.as_completed(futures):
+            job_role = futures[future]
+            try:
+                ready = future.result()
+            except Exception:
+                logger.exception("checking readiness of %s failed",
+                                 job_role.pod_name)
+                continue
+            if ready:
+                self.mark_ready(job_role.pod)
+            with self.lock:
+                self.checked[job_role.pod.metadata.name] = (self.key_of(
+                    job_role.pod), ready)
+        return len(to_check)
+
 
 def get_job_status_detail(job):
     if "jobStatusDetail" not in job:
@@ -197,11 +328,38 @@ def get_pod_priority_class(is_support_pod_priority, job_type, is_preemptible):
 class Launcher(object):
     def __init__(self):
         k8s_config.load_kube_config()
-        self.k8s_CoreAPI = client.CoreV1Api()
-        self.k8s_AppsAPI = client.AppsV1Api()
-        self.k8s_custom_obj_api = client.CustomObjectsApi()
+        self.init_k8s_clients()
         self.namespace = "default"
         self.pretty = "pretty_example"
+        self.readiness_tracker = None
+        # max number of k8s calls of a job issued concurrently by _map
+        self.concurrency = 1
+        self.executor = None
+        self.executor_pid = None
+
+    def init_k8s_clients(self):
+        api_client = client.ApiClient()
+        self.k8s_CoreAPI = client.CoreV1Api(api_client)
+        self.k8s_AppsAPI = client.AppsV1Api(api_client)
+        self.k8s_custom_obj_api = client.CustomObjectsApi(api_client)
+
+    def _get_executor(self):
+        # threads do not survive fork, each process needs its own executor
+        if self.executor is None or self.executor_pid != os.getpid():
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.concurrency)
+            self.executor_pid = os.getpid()
+        return self.executor
+
+    def _map(self, fn, items):
+        """Returns [fn(item) for item in items], calls are concurrent if
+        concurrency > 1. Raises the first exception in order. fn should not
+        call _map itself, or it may wait for a thread that never frees up."""
+        if self.concurrency <= 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        executor = self._get_executor()
+        futures = [executor.submit(fn, item) for item in items]
+        return [future.result() for future in futures]
 
     @record
     def _create_pod(self, body):
@@ -213,13 +371,14 @@ class Launcher(object):
         return api_response
 
     @record
-    def _cleanup_pods_with_labels(self, label_selector):
+    def _cleanup_pods_with_labels(self, label_selector, force=False):
         errors = []
         try:
             self.k8s_CoreAPI.delete_collection_namespaced_pod(
                 self.namespace,
                 pretty=self.pretty,
                 label_selector=label_selector,
+                grace_period_seconds=0 if force else None,
             )
         except ApiException as e:
             message = "Delete pods failed: {}".format(label_selector)
@@ -243,13 +402,14 @@ class Launcher(object):
         return errors
 
     @record
-    def _cleanup_pods_with_labels(self, label_selector):
+    def _cleanup_pods_with_labels(self, label_selector, force=False):
         errors = []
         try:
             self.k8s_CoreAPI.delete_collection_namespaced_pod(
                 self.namespace,
                 pretty=self.pretty,
                 label_selector=label_selector,
+                grace_period_seconds=0 if force else None,
                 )
         except ApiException as e:
             message = "Delete pods failed: {}".format(label_selector)
@@ -294,6 +454,22 @@ class Launcher(object):
         )
         return api_response
 
+    @record
+    def _cleanup_deployment_with_labels(self, label_selector, force=False):
+        errors = []
+        try:
+            self.k8s_AppsAPI.delete_collection_namespaced_deployment(
+                self.namespace,
+                pretty=self.pretty,
+                label_selector=label_selector,
+                grace_period_seconds=0 if force else None,
+            )
+        except ApiException as e:
+            message = "Delete deployments failed: {}".format(label_selector)
+            logger.warning(message, exc_info=True)
+            errors.append({"message": message, "exception": e})
+        return errors
+
     @record
     def _get_deployment(self, name):
         api_response = self.k8s_AppsAPI.read_namespaced_deployment_scale(
@@ -362,62 +538,75 @@ class Launcher(object):
 
     @record
     def _cleanup_pods(self, pod_names, force=False):
-        errors = []
         grace_period_seconds = 0 if force else None
-        for pod_name in pod_names:
+
+        def delete(pod_name):
             try:
                 self._delete_pod(pod_name, grace_period_seconds)
             except Exception as e:
                 if isinstance(e, ApiException) and 404 == e.status:
-                    return []
+                    return None
                 message = "Delete pod failed: {}".format(pod_name)
                 logger.warning(message, exc_info=True)
-                errors.append({"message": message, "exception": e})
+                return {"message": message, "exception": e}
+            return None
+
+        return [e for e in self._map(delete, pod_names) if e is not None]
+
+    def _cleanup_service(self, service):
+        assert (isinstance(service, client.V1Service))
+        errors = []
+        try:
+            service_name = service.metadata.name
+            self._delete_service(service_name)
+        except ApiException as e:
+            if 404 == e.status:
+                return errors
+            message = "Delete service failed: {}".format(service_name)
+            logger.warning(message, exc_info=True)
+            errors.append({"message": message, "exception": e})
         return errors
 
     @record
     def _cleanup_services(self, services):
         errors = []
-        for service in services:
-            assert (isinstance(service, client.V1Service))
-            try:
-                service_name = service.metadata.name
-                self._delete_service(service_name)
-            except ApiException as e:
-                message = "Delete service failed: {}".format(service_name)
-                logger.warning(message, exc_info=True)
-                errors.append({"message": message, "exception": e})
+        for service_errors in self._map(self._cleanup_service, services):
+            errors.extend(service_errors)
         return errors
 
     @record
     def _cleanup_deployment(self, deployment_names, force=False):
-        errors = []
         grace_period_seconds = 0 if force else None
-        for deployment_name in deployment_names:
+
+        def delete(deployment_name):
             try:
                 self._delete_deployment(deployment_name, grace_period_seconds)
             except Exception as e:
                 if isinstance(e, ApiException) and 404 == e.status:
-                    return []
+                    return None
                 message = "Delete pod failed: {}".format(deployment_name)
                 logger.warning(message, exc_info=True)
-                errors.append({"message": message, "exception": e})
-        return errors
+                return {"message": message, "exception": e}
+            return None
+
+        return [e for e in self._map(delete, deployment_names) if e is not None]
 
     @record
     def _cleanup_secrets(self, secret_names, force=False):
-        errors = []
         grace_period_seconds = 0 if force else None
-        for secret_name in secret_names:
+
+        def delete(secret_name):
             try:
                 self._delete_secret(secret_name, grace_period_seconds)
             except Exception as e:
                 if isinstance(e, ApiException) and 404 == e.status:
-                    return []
+                    return None
                 message = "Deleting secret failed: {}".format(secret_name)
                 logger.warning(message, exc_info=True)
-                errors.append({"message": message, "exception": e})
-        return errors
+                return {"message": message, "exception": e}
+            return None
+
+        return [e for e in self._map(delete, secret_names) if e is not None]
 
     @record
     def _cleanup_secrets_with_labels(self, label_selector):
@@ -444,13 +633,13 @@ class Launcher(object):
         logger.debug("Trying to delete secrets %s" % secret_names)
         self._cleanup_secrets(secret_names)
 
-        created = []
-        for secret in secrets:
+        def create(secret):
             created_secret = self._create_secret(secret)
-            created.append(created_secret)
             logger.debug("Creating secret succeeded: %s" %
                          created_secret.metadata.name)
-        return created
+            return created_secret
+
+        return self._map(create, secrets)
 
     @record
     def get_pods(self, field_selector="", label_selector=""):
@@ -463,6 +652,19 @@ class Launcher(object):
         logger.debug("Get pods: {}".format(api_response))
         return api_response.items
 
+    def refresh_role_readiness(self, job_ids):
+        """Hint that status of job_ids is about to be queried, launcher may
+        prefetch role readiness of them in batch"""
+        pass
+
+    def get_pod(self, pod_name):
+        """Returns pod named pod_name or None if not found"""
+        pods = self.get_pods(field_selector="metadata.name={}".format(pod_name))
+        if len(pods) < 1:
+            return None
+        assert (len(pods) == 1)
+        return pods[0]
+
     @record
     def _get_deployments(self, field_selector="", label_selector=""):
         api_response = self.k8s_AppsAPI.list_namespaced_deployment(
@@ -544,6 +746,9 @@ class LauncherStub(Launcher):
     def wait_tasks_done(self):
         pass
 
+    def collect_done_tasks(self):
+        pass
+
     def transform_state(self, framework_state, completion_status):
         # https://github.com/microsoft/frameworkcontroller/blob/master/pkg/apis/frameworkcontroller/v1/types.go#L441
         if framework_state in {
@@ -851,24 +1056,157 @@ class LauncherStub(Launcher):
 
 
 class PythonLauncher(Launcher):
-    def __init__(self, pool_size=3):
+    def __init__(self,
+                 pool_size=3,
+                 use_pod_informer=False,
+                 readiness_pool_size=8,
+                 concurrency=4,
+                 task_timeout=600):
         super(PythonLauncher, self).__init__()
 
         self.processes = []
         self.queue = None
+        self.done_queue = None
         self.pool_size = pool_size
-        # items in queue should be tuple of 3 elements: (function name, args, kwargs)
+        # items in queue should be tuple of 4 elements:
+        # (function name, job id, args, kwargs)
+        # worker puts (worker index, job id, done) into done_queue when
+        # taking the task and after finishing it
+
+        # job id -> (time, function name) of the task of the job enqueued.
+        # At most one task is in flight for a job, so that submission does
+        # not need to wait for all tasks of previous pass to finish
+        self.in_flight = {}
+        self.task_timeout = task_timeout
+        # worker index -> job id of the task the worker is running
+        self.worker_tasks = {}
+        # job id -> (function name, args, kwargs) of kill task waiting for
+        # the task in flight of the job, enqueued once that is done
+        self.deferred = {}
+
+        self.concurrency = concurrency
+
+        # watch based cache of pods, only usable in the process calling start
+        self.use_pod_informer = use_pod_informer
+        self.pod_informer = None
+
+        self.readiness_tracker = RoleReadinessTracker(readiness_pool_size)
 
     def start(self):
         if len(self.processes) == 0:
             self.queue = multiprocessing.JoinableQueue()
+            self.done_queue = multiprocessing.Queue()
 
             for i in range(self.pool_size):
-                p = multiprocessing.Process(target=self.run,
-                                            args=(self.queue,),
-                                            name="py-launcher-" + str(i))
-                self.processes.append(p)
-                p.start()
+                self.processes.append(None)
+                self._start_worker(i)
+
+        # start informer after forking workers, so they do not inherit the
+        # watch thread
+        if self.use_pod_informer and self.pod_informer is None:
+            self.pod_informer = Informer(
+                self.k8s_CoreAPI.list_namespaced_pod,
+                list_kwargs={"namespace": self.namespace},
+                indexers={"run": label_of("run")},
+                name="pod")
+            self.pod_informer.add_event_handler(
+                self.readiness_tracker.on_pod_event)
+            self.pod_informer.start()
+
+    def _start_worker(self, i):
+        p = multiprocessing.Process(target=self.run,
+                                    args=(self.queue, self.done_queue, i),
+                                    name="py-launcher-" + str(i))
+        self.processes[i] = p
+        p.start()
+
+    def _enqueue(self, job_id, func_name, args, kwargs):
+        """Returns True if the task is enqueued or deferred till the task in
+        flight of the job is done, False if it is skipped"""
+        if job_id in self.in_flight:
+            _, in_flight_func_name = self.in_flight[job_id]
+            # a kill must not be lost behind a submission
+            if func_name == "kill_job" and in_flight_func_name != "kill_job":
+                logger.info("previous task of job %s is in flight, defer %s",
+                            job_id, func_name)
+                self.deferred[job_id] = (func_name, args, kwargs)
+                return True
+            logger.info("previous task of job %s is in flight, skip %s",
+                        job_id, func_name)
+            return False
+        self.in_flight[job_id] = (time.time(), func_name)
+        self.queue.put((func_name, job_id, args, kwargs))
+        return True
+
+    def _task_done(self, job_id):
+        self.in_flight.pop(job_id, None)
+        task = self.deferred.pop(job_id, None)
+        if task is not None:
+            func_name, args, kwargs = task
+            self._enqueue(job_id, func_name, args, kwargs)
+
+    def collect_done_tasks(self):
+        """Forgets tasks done by workers. Call it before reading jobs from DB,
+        so that jobs whose tasks finish later are still seen as in flight
+        even if DB is updated in between."""
+        while True:
+            try:
+                worker, job_id, done = self.done_queue.get_nowait()
+            except queue.Empty:
+                break
+            if done:
+                if self.worker_tasks.get(worker) == job_id:
+                    del self.worker_tasks[worker]
+                self._task_done(job_id)
+            else:
+                self.worker_tasks[worker] = job_id
+
+        now = time.time()
+        for job_id, (enqueue_time, _) in list(self.in_flight.items()):
+            if now - enqueue_time > self.task_timeout:
+                logger.warning("task of job %s not done in %ds, forget it",
+                               job_id, self.task_timeout)
+                self._task_done(job_id)
+
+        for i, p in enumerate(self.processes):
+            if not p.is_alive():
+                logger.warning("launcher worker %s exited with %s, restart",
+                               p.name, p.exitcode)
+                # the task it was running will never be done
+                job_id = self.worker_tasks.pop(i, None)
+                if job_id is not None:
+                    self._task_done(job_id)
+                self._start_worker(i)
+
+    def _is_pod_cache_synced(self):
+        return self.pod_informer is not None and \
+            self.pod_informer.has_synced()
+
+    def get_pod(self, pod_name):
+        if self._is_pod_cache_synced():
+            return self.pod_informer.get(pod_name)
+        return super(PythonLauncher, self).get_pod(pod_name)
+
+    def get_job_pods(self, job_id):
+        if self._is_pod_cache_synced():
+            return self.pod_informer.by_index("run", job_id)
+        return self.get_pods(label_selector="run={}".format(job_id))
+
+    def refresh_role_readiness(self, job_ids):
+        self.readiness_tracker.start_pass(job_ids)
+
+        # listing pods of every job from api server just to prefetch would
+        # double the cost, only do it from cache
+        if not self._is_pod_cache_synced():
+            return
+
+        job_roles = []
+        for job_id in job_ids:
+            job_roles.extend(self.get_job_roles(job_id))
+
+        checked = self.readiness_tracker.check_roles(job_roles)
+        logger.info("checked readiness of %d out of %d roles", checked,
+                    len(job_roles))
 
     def get_job_status(self, job_id):
         job_roles = self.get_job_roles(job_id)
@@ -921,58 +1259,67 @@ class PythonLauncher(Launcher):
         pod_names = [
             pod["metadata"]["name"] for pod in pods if pod["kind"] == "Pod"
         ]
-        self._cleanup_pods(pod_names)
         deployment_names = [
             pod["metadata"]["name"]
             for pod in pods
             if pod["kind"] == "Deployment"
         ]
+        self._cleanup_pods(pod_names)
         self._cleanup_deployment(deployment_names)
-        created = []
-        for pod in pods:
+
+        def create(pod):
             if pod["kind"] == "Pod":
                 created_pod = self._create_pod(pod)
             elif pod["kind"] == "Deployment":
                 created_pod = self._create_deployment(pod)
             else:
                 logger.error("unknown kind %s, with body %s", pod["kind"], pod)
-            created.append(created_pod)
             logger.debug("Create pod succeed: %s" % created_pod.metadata.name)
-        return created
+            return created_pod
+
+        return self._map(create, pods)
 
     @record
     def delete_job(self, job_id, force=False):
-        label_selector = "run={}".format(job_id)
-
-        # query pods then delete
-        pod_errors = self._cleanup_pods_with_labels(label_selector)
-        logger.debug("deleting pods %s" % label_selector)
-        # query services then delete
-        services = self._get_services_by_label(label_selector)
-        service_errors = self._cleanup_services(services)
+        with job_teardown_histogram.time():
+            return self._delete_job(job_id, force)
 
-        deployments = self._get_deployments(label_selector=label_selector)
-        deployment_names = [
-            deployment.metadata.name for deployment in deployments
+    def _delete_job(self, job_id, force):
+        label_selector = "run={}".format(job_id)
+        logger.debug("deleting resources of %s", label_selector)
+
+        # everything except services can be deleted by label in one call,
+        # services need to be listed and deleted one by one
+        cleanups = [
+            lambda: self._cleanup_deployment_with_labels(label_selector,
+                                                         force),
+            lambda: self._cleanup_secrets_with_labels(label_selector),
+            lambda: self._cleanup_configmap(label_selector),
+            # always delete pods by label even if cache shows none, cache may
+            # not have seen a just created pod yet
+            lambda: self._cleanup_pods_with_labels(label_selector, force),
         ]
-        deployment_errors = self._cleanup_deployment(deployment_names, force)
-
-        logger.debug("deleting deployments %s" % ",".join(deployment_names))
-
-        # query and delete secrets
-        secrets = self.get_secrets(label_selector=label_selector)
-        secret_names = [secret.metadata.name for secret in secrets]
-        secret_errors = self._cleanup_secrets_with_labels(label_selector)
-        logger.debug("deleting secrets for %s" % label_selector)
-
-        configmap_errors = self._cleanup_configmap(label_selector)
 
-        errors = pod_errors + service_errors + deployment_errors + secret_errors + \
-            configmap_errors
+        try:
+            services = self._get_services_by_label(label_selector)
+        except ApiException as e:
+            message = "List services failed: {}".format(label_selector)
+            logger.warning(message, exc_info=True)
+            services = []
+            errors = [{"message": message, "exception": e}]
+        else:
+            errors = []
+        cleanups.extend([
+            lambda service=service: self._cleanup_service(service)
+            for service in services
+        ])
+
+        for cleanup_errors in self._map(lambda cleanup: cleanup(), cleanups):
+            errors.extend(cleanup_errors)
         return errors
 
     def get_job_roles(self, job_id):
-        pods = self.get_pods(label_selector="run={}".format(job_id))
+        pods = self.get_job_pods(job_id)
 
         job_roles = []
         for pod in pods:
@@ -992,9 +1339,9 @@ class PythonLauncher(Launcher):
         return all([status == "NotFound" for status in statuses])
 
     def submit_job(self, job):
-        self.queue.put(("submit_job", (job,), {}))
+        return self._enqueue(job["jobId"], "submit_job", (job,), {})
 
-    def submit_job_impl(self, job):
+    def submit_job_impl(self, job, dataHandler=None):
         # check if existing any pod with label: run=job_id
         assert ("jobId" in job)
         job_id = job["jobId"]
@@ -1007,8 +1354,14 @@ class PythonLauncher(Launcher):
                 logger.warning("Force delete job {}: {}".format(job_id, errors))
             return
 
+        if dataHandler is None:
+            with DataHandler() as dataHandler:
+                return self._submit_job(job, dataHandler)
+        return self._submit_job(job, dataHandler)
+
+    def _submit_job(self, job, dataHandler):
+        job_id = job["jobId"]
         ret = {}
-        dataHandler = DataHandler()
 
         try:
             # TODO refine later
@@ -1084,7 +1437,6 @@ class PythonLauncher(Launcher):
                 dataHandler.SetJobError(
                     job_object.job_id, "ERROR: invalid jobtrainingtype: %s" %
                     job_object.params["jobtrainingtype"])
-                dataHandler.Close()
                 return False
 
             job_object.params["priority_class"] = get_pod_priority_class(
@@ -1094,7 +1446,6 @@ class PythonLauncher(Launcher):
             pods, error = pod_template.generate_pods(job_object)
             if error:
                 dataHandler.SetJobError(job_object.job_id, "ERROR: %s" % error)
-                dataHandler.Close()
                 return False
 
             job_description = "\n---\n".join([yaml.dump(pod) for pod in pods])
@@ -1157,40 +1508,43 @@ class PythonLauncher(Launcher):
                         "Cleaning up job %s failed after %d retries of job submission"
                         % (job["jobId"], retries))
 
-        dataHandler.Close()
         return ret
 
     def kill_job(self, job_id, desired_state="killed"):
-        self.queue.put(("kill_job", (job_id,), {
-            "desired_state": desired_state
-        }))
-
-    def kill_job_impl(self, job_id, desired_state="killed"):
-        with DataHandler() as dataHandler:
-            result, detail = k8sUtils.GetJobStatus(job_id)
-            detail = job_status_detail_with_finished_time(detail, desired_state)
-            dataHandler.UpdateJobTextFields(
-                {"jobId": job_id},
-                {"jobStatusDetail": b64encode(json.dumps(detail))})
-            logger.info("Killing job %s, with status %s, %s" %
-                        (job_id, result, detail))
+        return self._enqueue(job_id, "kill_job", (job_id,),
+                             {"desired_state": desired_state})
 
-            errors = self.delete_job(job_id, force=True)
+    def kill_job_impl(self, job_id, desired_state="killed", dataHandler=None):
+        if dataHandler is None:
+            with DataHandler() as dataHandler:
+                return self._kill_job(job_id, desired_state, dataHandler)
+        return self._kill_job(job_id, desired_state, dataHandler)
 
-            dataFields = {
-                "jobStatusDetail": b64encode(json.dumps(detail)),
-                "lastUpdated": datetime.datetime.now().isoformat()
-            }
-            conditionFields = {"jobId": job_id}
-            if len(errors) == 0:
-                dataFields["jobStatus"] = desired_state
-                dataHandler.UpdateJobTextFields(conditionFields, dataFields)
-                return True
-            else:
-                dataFields["jobStatus"] = "error"
-                dataHandler.UpdateJobTextFields(conditionFields, dataFields)
-                logger.error("Kill job failed with errors: {}".format(errors))
-                return False
+    def _kill_job(self, job_id, desired_state, dataHandler):
+        result, detail = k8sUtils.GetJobStatus(job_id)
+        detail = job_status_detail_with_finished_time(detail, desired_state)
+        dataHandler.UpdateJobTextFields(
+            {"jobId": job_id},
+            {"jobStatusDetail": b64encode(json.dumps(detail))})
+        logger.info("Killing job %s, with status %s, %s" %
+                    (job_id, result, detail))
+
+        errors = self.delete_job(job_id, force=True)
+
+        dataFields = {
+            "jobStatusDetail": b64encode(json.dumps(detail)),
+            "lastUpdated": datetime.datetime.now().isoformat()
+        }
+        conditionFields = {"jobId": job_id}
+        if len(errors) == 0:
+            dataFields["jobStatus"] = desired_state
+            dataHandler.UpdateJobTextFields(conditionFields, dataFields)
+            return True
+        else:
+            dataFields["jobStatus"] = "error"
+            dataHandler.UpdateJobTextFields(conditionFields, dataFields)
+            logger.error("Kill job failed with errors: {}".format(errors))
+            return False
 
     def scale_job(self, job):
         assert ("jobId" in job)
@@ -1212,20 +1566,41 @@ class PythonLauncher(Launcher):
         logger.debug("Scale inference job %s from %d to %d." %
                      (job_object.job_id, replicas, new_replicas))
 
-    def run(self, queue):
-        # TODO maintain a data_handler so do not need to init it every time
+    def run(self, task_queue, done_queue, worker=0):
+        # k8s clients inherited from parent share connections with it, every
+        # worker needs its own
+        self.init_k8s_clients()
+        # a worker restarted after start inherits the pod informer without
+        # its watch thread, and maybe with its lock held
+        self.pod_informer = None
+
+        data_handler = None
         while True:
-            func_name, args, kwargs = queue.get(True)
+            func_name, job_id, args, kwargs = task_queue.get(True)
+            done_queue.put((worker, job_id, False))
 
             try:
+                if data_handler is None:
+                    data_handler = DataHandler()
+
                 if func_name == "submit_job":
-                    self.submit_job_impl(*args, **kwargs)
+                    self.submit_job_impl(*args,
+                                         dataHandler=data_handler,
+                                         **kwargs)
                 elif func_name == "kill_job":
-                    self.kill_job_impl(*args, **kwargs)
+                    self.kill_job_impl(*args, dataHandler=data_handler, **kwargs)
                 else:
                     logger.error("unknown func_name %s, with args %s %s",
                                  func_name, args, kwargs)
             except Exception:
                 logger.exception("processing job failed")
+                # connection may be broken, use a new one for next task
+                if data_handler is not None:
+                    try:
+                        data_handler.Close()
+                    except Exception:
+                        pass
+                    data_handler = None
             finally:
-                queue.task_done()
+                done_queue.put((worker, job_id, True))
+                task_queue.task_done()
@@ -9,6 +9,7 @@ import datetime
 import collections
 import yaml
 import base64
+import bisect
 import logging
 import logging.config
 
@@ -29,7 +30,8 @@ from config import config, GetStoragePath
 import notify
 import k8sUtils
 from cluster_resource import ClusterResource
-from job_params_util import get_resource_params_from_job_params
+from job_params_util import get_resource_params_from_job_params, \
+    get_resource_params_from_job_columns
 from common import base64decode, base64encode
 
 logger = logging.getLogger(__name__)
@@ -48,8 +50,23 @@ job_state_change_histogram = Histogram(
              float("inf")),
     labelnames=("current_state",))
 
+job_detail_rows_written_histogram = Histogram(
+    "job_status_detail_rows_written",
+    "number of jobStatusDetail rows written by scheduler per pass",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048,
+             float("inf")))
+
 
 class JobTimeRecord(object):
+    # short field names used in redis hash
+    HASH_FIELDS = {
+        "create_time": "c",
+        "approve_time": "a",
+        "submit_time": "s",
+        "running_time": "r",
+    }
+    HASH_NAMES = {field: name for name, field in HASH_FIELDS.items()}
+
     def __init__(self,
                  create_time=None,
                  approve_time=None,
@@ -80,6 +97,24 @@ class JobTimeRecord(object):
         r_time = JobTimeRecord.parse_time(m.get("running_time"))
         return JobTimeRecord(c_time, a_time, s_time, r_time)
 
+    @staticmethod
+    def parse_hash(h):
+        m = {}
+        for field, val in h.items():
+            if isinstance(field, bytes):
+                field = field.decode("utf-8")
+            name = JobTimeRecord.HASH_NAMES.get(field)
+            if name is not None:
+                m[name] = float(val)
+        return JobTimeRecord.parse(m)
+
+    def to_hash(self):
+        h = {}
+        for name, val in self.to_map().items():
+            if val is not None:
+                h[JobTimeRecord.HASH_FIELDS[name]] = "%d" % val
+        return h
+
     def to_map(self):
         return {
             "create_time": JobTimeRecord.to_timestamp(self.create_time),
@@ -101,34 +136,40 @@ def to_job_status_key(job_id):
     return "job_status_" + job_id
 
 
-def load_job_status(redis_conn, job_id):
-    try:
-        val = redis_conn.get(to_job_status_key(job_id))
-        if val is not None:
-            val = val.decode("utf-8")
-            return JobTimeRecord.parse(json.loads(val))
-    except Exception:
-        logger.exception("load job status failed")
-    return JobTimeRecord()
+def to_job_time_key(job_id):
+    return "job_time_" + job_id
 
 
-def set_job_status(redis_conn, job_id, job_status):
+def expire_legacy_job_status(redis_conn, ttl):
+    """Sets ttl on json encoded job_status_* records written by old versions,
+    they would otherwise stay in redis forever"""
     try:
-        val = json.dumps(job_status.to_map())
-        redis_conn.set(to_job_status_key(job_id), val)
+        keys = list(redis_conn.scan_iter(match=to_job_status_key("*"),
+                                         count=1000))
+        pipeline = redis_conn.pipeline(transaction=False)
+        for key in keys:
+            pipeline.expire(key, ttl)
+        pipeline.execute()
+        logger.info("set ttl on %d legacy job status records", len(keys))
     except Exception:
-        logger.exception("set job status failed")
-
-
-# If previous state has no record, which means the job_manager get restarted
-# or previous entry is expired, we ignore this entry.
-
+        logger.exception("expire legacy job status failed")
+
+
+def parse_job_time_record(h, legacy_val):
+    """Parses hash of job_time_* record, or json encoded job_status_* record
+    written by old versions if the job has no hash yet"""
+    if h:
+        return JobTimeRecord.parse_hash(h)
+    if legacy_val is not None:
+        if isinstance(legacy_val, bytes):
+            legacy_val = legacy_val.decode("utf-8")
+        return JobTimeRecord.parse(json.loads(legacy_val))
+    return JobTimeRecord()
 
-def update_job_state_latency(redis_conn, job_id, state, event_time=None):
-    if event_time is None:
-        event_time = datetime.datetime.utcnow()
 
-    job_status = load_job_status(redis_conn, job_id)
+def apply_job_state(job_status, state, event_time):
+    """Records event_time of state into job_status and observes latency
+    from previous state. Returns True if job_status is changed."""
     changed = False
 
     if state == "created":
@@ -162,8 +203,92 @@ def update_job_state_latency(redis_conn, job_id, state, event_time=None):
             elapsed = (event_time - job_status.submit_time).seconds
             job_state_change_histogram.labels(state).observe(elapsed)
 
-    if changed:
-        set_job_status(redis_conn, job_id, job_status)
+    return changed
+
+
+class JobStateLatencyRecorder(object):
+    """Keeps job state time records in redis hashes with ttl, and batches
+    redis calls of a pass: load reads records of all given jobs in one
+    pipeline, flush writes all changed records back in one pipeline.
+
+    Records are only cached within a pass, since other job manager
+    processes update them too. Jobs without a hash fall back to json
+    job_status_* records of old versions.
+    """
+    def __init__(self, redis_conn, ttl=7 * 24 * 3600):
+        self.redis_conn = redis_conn
+        self.ttl = ttl
+        self.records = {} # job id -> JobTimeRecord
+        self.dirty = set()
+
+    def load(self, job_ids):
+        self.records = {}
+        self.dirty = set()
+        job_ids = list(set(job_ids))
+        if len(job_ids) == 0:
+            return
+        try:
+            pipeline = self.redis_conn.pipeline(transaction=False)
+            for job_id in job_ids:
+                pipeline.hgetall(to_job_time_key(job_id))
+                pipeline.get(to_job_status_key(job_id))
+            values = pipeline.execute()
+            for i, job_id in enumerate(job_ids):
+                self.records[job_id] = parse_job_time_record(
+                    values[2 * i], values[2 * i + 1])
+        except Exception:
+            logger.exception("load job status failed")
+
+    def get(self, job_id):
+        if job_id not in self.records:
+            try:
+                val = self.redis_conn.hgetall(to_job_time_key(job_id))
+                legacy_val = None
+                if not val:
+                    legacy_val = self.redis_conn.get(
+                        to_job_status_key(job_id))
+                self.records[job_id] = parse_job_time_record(val, legacy_val)
+            except Exception:
+                logger.exception("load job status failed")
+                return JobTimeRecord()
+        return self.records[job_id]
+
+    def update(self, job_id, state, event_time=None):
+        if event_time is None:
+            event_time = datetime.datetime.utcnow()
+
+        job_status = self.get(job_id)
+        if apply_job_state(job_status, state, event_time):
+            self.records[job_id] = job_status
+            self.dirty.add(job_id)
+
+    def flush(self):
+        if len(self.dirty) == 0:
+            return
+        try:
+            pipeline = self.redis_conn.pipeline(transaction=False)
+            for job_id in self.dirty:
+                key = to_job_time_key(job_id)
+                # hmset is deprecated, and hset with mapping needs redis-py
+                # 3.5, set fields one by one in the pipeline instead
+                for field, val in self.records[job_id].to_hash().items():
+                    pipeline.hset(key, field, val)
+                pipeline.expire(key, self.ttl)
+            pipeline.execute()
+        except Exception:
+            logger.exception("set job status failed")
+        self.dirty = set()
+
+
+# If previous state has no record, which means the job_manager get restarted
+# or previous entry is expired, we ignore this entry.
+
+
+def update_job_state_latency(latency_recorder,
+                             job_id,
+                             state,
+                             event_time=None):
+    latency_recorder.update(job_id, state, event_time)
 
 
 def GetJobTotalGpu(jobParams):
@@ -173,27 +298,64 @@ def GetJobTotalGpu(jobParams):
     return int(jobParams["resourcegpu"]) * numWorkers
 
 
+def has_resource_columns(job):
+    """Whether typed resource columns of job are read and backfilled"""
+    return job.get("gpuRequest") is not None
+
+
+def get_user_running_gpus(dataHandler, userName, vcName):
+    """Non-preemptible GPUs used by running, queued and scheduling jobs of
+    user in vc"""
+    statuses = ["running", "queued", "scheduling"]
+    usage = dataHandler.get_job_resource_usage(statuses,
+                                               vcName=vcName,
+                                               userName=userName)
+    if usage is not None:
+        return sum(row["gpu"] for row in usage if not row["preemptible"])
+
+    # jobs table not migrated or backfilled yet
+    user_running_jobs = dataHandler.GetJobList(userName,
+                                               vcName,
+                                               status=",".join(statuses),
+                                               op=("=", "or"),
+                                               fields=["jobId", "jobParams"])
+    running_gpus = 0
+    for running_job in user_running_jobs:
+        running_jobParams = json.loads(b64decode(running_job["jobParams"]))
+        # ignore preemptible GPUs
+        if "preemptionAllowed" in running_jobParams and running_jobParams[
+                "preemptionAllowed"] is True:
+            continue
+        running_job_total_gpus = GetJobTotalGpu(running_jobParams)
+        running_gpus += running_job_total_gpus
+    return running_gpus
+
+
 @record
-def ApproveJob(redis_conn, job, dataHandlerOri=None):
+def ApproveJob(latency_recorder, job, dataHandlerOri=None):
     try:
         job_id = job["jobId"]
         vcName = job["vcName"]
 
-        update_job_state_latency(redis_conn,
+        update_job_state_latency(latency_recorder,
                                  job_id,
                                  "created",
                                  event_time=job["jobTime"])
 
-        jobParams = json.loads(b64decode(job["jobParams"]))
-        job_total_gpus = GetJobTotalGpu(jobParams)
+        if has_resource_columns(job):
+            job_total_gpus = job["gpuRequest"]
+            preemption_allowed = job["preemptible"] == 1
+        else:
+            jobParams = json.loads(b64decode(job["jobParams"]))
+            job_total_gpus = GetJobTotalGpu(jobParams)
+            preemption_allowed = jobParams.get("preemptionAllowed") is True
 
         if dataHandlerOri is None:
             dataHandler = DataHandler()
         else:
             dataHandler = dataHandlerOri
 
-        if "preemptionAllowed" in jobParams and jobParams[
-                "preemptionAllowed"] is True:
+        if preemption_allowed:
             logger.info("Job %s preemptible, approve!", job_id)
             detail = [{
                 "message": "waiting for available preemptible resource."
@@ -206,7 +368,7 @@ def ApproveJob(redis_conn, job, dataHandlerOri=None):
             }
             conditionFields = {"jobId": job_id}
             dataHandler.UpdateJobTextFields(conditionFields, dataFields)
-            update_job_state_latency(redis_conn, job_id, "approved")
+            update_job_state_latency(latency_recorder, job_id, "approved")
             if dataHandlerOri is None:
                 dataHandler.Close()
             return True
@@ -226,21 +388,8 @@ def ApproveJob(redis_conn, job, dataHandlerOri=None):
         metadata = json.loads(vc["metadata"])
 
         if "user_quota" in metadata:
-            user_running_jobs = dataHandler.GetJobList(
-                job["userName"],
-                vcName,
-                status="running,queued,scheduling",
-                op=("=", "or"))
-            running_gpus = 0
-            for running_job in user_running_jobs:
-                running_jobParams = json.loads(
-                    b64decode(running_job["jobParams"]))
-                # ignore preemptible GPUs
-                if "preemptionAllowed" in running_jobParams and running_jobParams[
-                        "preemptionAllowed"] is True:
-                    continue
-                running_job_total_gpus = GetJobTotalGpu(running_jobParams)
-                running_gpus += running_job_total_gpus
+            running_gpus = get_user_running_gpus(dataHandler, job["userName"],
+                                                 vcName)
 
             logger.info(
                 "Job %s require %s, used quota (exclude preemptible GPUs) %s, with user quota of %s.",
@@ -273,7 +422,7 @@ def ApproveJob(redis_conn, job, dataHandlerOri=None):
         }
         conditionFields = {"jobId": job_id}
         dataHandler.UpdateJobTextFields(conditionFields, dataFields)
-        update_job_state_latency(redis_conn, job_id, "approved")
+        update_job_state_latency(latency_recorder, job_id, "approved")
         if dataHandlerOri is None:
             dataHandler.Close()
         return True
@@ -288,7 +437,7 @@ UnusualJobs = {}
 
 
 @record
-def UpdateJobStatus(redis_conn,
+def UpdateJobStatus(latency_recorder,
                     launcher,
                     job,
                     notifier=None,
@@ -335,7 +484,7 @@ def UpdateJobStatus(redis_conn,
                                                     job["jobId"],
                                                     result.strip()))
     elif result == "Running":
-        update_job_state_latency(redis_conn, job["jobId"], "running")
+        update_job_state_latency(latency_recorder, job["jobId"], "running")
         launcher.scale_job(job)
         if job["jobStatus"] != "running":
             started_at = k8sUtils.localize_time(datetime.datetime.now())
@@ -455,10 +604,16 @@ def get_priority_dict():
         dataHandler.Close()
 
 
+def get_jobs_priority_dict(jobs):
+    """Priorities of jobs read along with jobs if possible, otherwise of all
+    active jobs from DB"""
+    if len(jobs) > 0 and all("priority" in job for job in jobs):
+        return {job["jobId"]: job["priority"] for job in jobs}
+    return get_priority_dict()
+
+
 def get_job_priority(priority_dict, job_id):
-    if job_id in list(priority_dict.keys()):
-        return priority_dict[job_id]
-    return 100
+    return priority_dict.get(job_id, 100)
 
 
 def discount_cluster_resource(cluster_resource):
@@ -515,63 +670,222 @@ def get_vc_schedulables(cluster_status):
     return vc_schedulables
 
 
-def get_jobs_info(jobs):
-    priority_dict = get_priority_dict()
+def get_node_frees(cluster_status):
+    """Returns {node name: (free resource, allocatable resource)} of
+    schedulable nodes in cluster_status"""
+    node_frees = {}
+    for node_status in cluster_status.get("node_status", []):
+        if node_status.get("unschedulable", False):
+            continue
+        allocatable = ClusterResource(
+            params={
+                r_type: node_status.get(r_type + "_allocatable")
+                for r_type in ["cpu", "memory", "gpu"]
+            })
+        used = ClusterResource(
+            params={
+                r_type: node_status.get(r_type + "_used")
+                for r_type in ["cpu", "memory", "gpu"]
+            })
+        node_frees[node_status["name"]] = (allocatable - used, allocatable)
+    return node_frees
+
+
+def reserve_nodes(job_resource, node_frees, reserved_nodes):
+    """Picks nodes for a job that does not fit yet, preferring nodes that
+    have most free resource of the job's sku, until their allocatable adds
+    up to the job's request. Returns (resource free on the picked nodes now,
+    picked node names), or (None, []) if the job cannot fit into nodes not
+    reserved by others even when they are all idle."""
+    skus = set()
+    for r_type in ["gpu", "cpu", "memory"]:
+        res = job_resource.__dict__[r_type].res
+        skus.update([sku for sku, v in res.items() if v > 0])
+
+    def free_of_skus(resource):
+        return (sum([resource.gpu.get(sku, 0) for sku in skus]),
+                sum([resource.cpu.get(sku, 0) for sku in skus]))
+
+    candidates = [(free_of_skus(free), name)
+                  for name, (free, allocatable) in node_frees.items()
+                  if name not in reserved_nodes and
+                  free_of_skus(allocatable) > (0, 0)]
+    candidates.sort(key=lambda x: (x[0], x[1]), reverse=True)
+
+    held = ClusterResource()
+    allocatable_sum = ClusterResource()
+    picked = []
+    for _, name in candidates:
+        free, allocatable = node_frees[name]
+        held += free
+        allocatable_sum += allocatable
+        picked.append(name)
+        if allocatable_sum >= job_resource:
+            return held, picked
+    return None, []
+
+
+def make_job_info(job, priority_dict):
+    if has_resource_columns(job):
+        preemption_allowed = job["preemptible"] == 1
+        job_id = job["jobId"]
+        job_res = get_resource_params_from_job_columns(job)
+    else:
+        job_params = json.loads(base64decode(job["jobParams"]))
+        preemption_allowed = job_params.get("preemptionAllowed", False)
+        job_id = job_params["jobId"]
+        job_res = get_resource_params_from_job_params(job_params)
+    job_resource = ClusterResource(params=job_res)
+
+    # Job lists will be sorted based on and in the order of below
+    # 1. non-preemptible precedes preemptible
+    # 2. running precedes scheduling, precedes queued
+    # 3. larger priority value precedes lower priority value
+    # 4. early job time precedes later job time
+
+    # Non-Preemptible jobs first
+    preemptible = 1 if preemption_allowed else 0
+
+    # Job status
+    job_status_key = 0
+    if job["jobStatus"] == "scheduling":
+        job_status_key = 1
+    elif job["jobStatus"] == "queued":
+        job_status_key = 2
+
+    # Priority value
+    reverse_priority = get_job_priority(priority_dict, job_id)
+
+    # Job time
+    queue_time = int(datetime.datetime.timestamp(job["lastUpdated"]))
+
+    job_info = {
+        "job": job,
+        "preemptionAllowed": preemption_allowed,
+        "jobId": job_id,
+        "job_resource": job_resource,
+        "allowed": False,
+        "reserved": None,
+        "sort_key_prefix": (preemptible, job_status_key),
+        "queue_time": queue_time,
+    }
+    set_job_info_priority(job_info, reverse_priority)
+    return job_info
+
+
+def set_job_info_priority(job_info, reverse_priority):
+    priority = 999999 - reverse_priority
+    preemptible, job_status_key = job_info["sort_key_prefix"]
+    job_info["priority"] = reverse_priority
+    job_info["sort_key"] = "{}_{}_{:06d}_{}".format(preemptible,
+                                                   job_status_key, priority,
+                                                   job_info["queue_time"])
+
+
+def get_jobs_info(jobs, priority_dict=None):
+    if priority_dict is None:
+        priority_dict = get_jobs_priority_dict(jobs)
 
     jobs_info = []
     for job in jobs:
         job_status = job.get("jobStatus")
         if job_status in ["queued", "scheduling", "running"]:
-            job_params = json.loads(base64decode(job["jobParams"]))
-            preemption_allowed = job_params.get("preemptionAllowed", False)
-            job_id = job_params["jobId"]
-
-            job_res = get_resource_params_from_job_params(job_params)
-            job_resource = ClusterResource(params=job_res)
-
-            # Job lists will be sorted based on and in the order of below
-            # 1. non-preemptible precedes preemptible
-            # 2. running precedes scheduling, precedes queued
-            # 3. larger priority value precedes lower priority value
-            # 4. early job time precedes later job time
-
-            # Non-Preemptible jobs first
-            preemptible = 1 if preemption_allowed else 0
-
-            # Job status
-            job_status_key = 0
-            if job["jobStatus"] == "scheduling":
-                job_status_key = 1
-            elif job["jobStatus"] == "queued":
-                job_status_key = 2
-
-            # Priority value
-            reverse_priority = get_job_priority(priority_dict, job_id)
-            priority = 999999 - reverse_priority
-
-            # Job time
-            queue_time = int(datetime.datetime.timestamp(job["lastUpdated"]))
-
-            sort_key = "{}_{}_{:06d}_{}".format(preemptible, job_status_key,
-                                                priority, queue_time)
-
-            single_job_info = {
-                "job": job,
-                "preemptionAllowed": preemption_allowed,
-                "jobId": job_id,
-                "job_resource": job_resource,
-                "sort_key": sort_key,
-                "allowed": False,
-            }
-
-            jobs_info.append(single_job_info)
+            jobs_info.append(make_job_info(job, priority_dict))
 
     jobs_info.sort(key=lambda x: x["sort_key"])
     return jobs_info
 
 
-def mark_schedulable_non_preemptable_jobs(jobs_info, cluster_schedulable,
-                                          vc_schedulables):
+class JobsInfoCache(object):
+    """Keeps parsed jobs info of active jobs across scheduling passes.
+
+    jobParams of a job is decoded only when the job is new or its lastUpdated,
+    jobStatus, jobParams or resource columns changed since previous pass, e.g.
+    scaling rewrites only jobParams and resource columns. Jobs are kept
+    ordered by sort_key with bisect, so a pass costs O(changed jobs * log n)
+    parsing and sorting work on top of walking the list.
+    """
+    def __init__(self):
+        self.infos = {} # job id -> (version, job_info)
+        self.sorted_keys = [] # [(sort_key, job_id)]
+
+    version_fields = [
+        "lastUpdated", "jobStatus", "jobParams", "sku", "gpuRequest",
+        "cpuRequest", "memoryRequest", "preemptible"
+    ]
+
+    @classmethod
+    def version_of(cls, job):
+        return tuple(job.get(field) for field in cls.version_fields)
+
+    def _insert(self, job_id, version, job_info):
+        self.infos[job_id] = (version, job_info)
+        bisect.insort(self.sorted_keys, (job_info["sort_key"], job_id))
+
+    def _remove(self, job_id):
+        _, job_info = self.infos.pop(job_id)
+        key = (job_info["sort_key"], job_id)
+        i = bisect.bisect_left(self.sorted_keys, key)
+        if i < len(self.sorted_keys) and self.sorted_keys[i] == key:
+            del self.sorted_keys[i]
+        return job_info
+
+    def update(self, jobs, priority_dict):
+        """Applies jobs from DB, returns sorted jobs info like get_jobs_info"""
+        seen = set()
+        parsed = 0
+        for job in jobs:
+            if job.get("jobStatus") not in ["queued", "scheduling", "running"]:
+                continue
+            job_id = job["jobId"]
+            seen.add(job_id)
+            version = self.version_of(job)
+
+            cached = self.infos.get(job_id)
+            if cached is not None and cached[0] == version:
+                job_info = cached[1]
+                job_info["job"] = job
+                job_info["allowed"] = False
+                job_info["reserved"] = None
+                reverse_priority = get_job_priority(priority_dict, job_id)
+                if reverse_priority != job_info["priority"]:
+                    self._remove(job_id)
+                    set_job_info_priority(job_info, reverse_priority)
+                    self._insert(job_id, version, job_info)
+                continue
+
+            if cached is not None:
+                self._remove(job_id)
+            try:
+                job_info = make_job_info(job, priority_dict)
+            except Exception:
+                logger.exception("failed to parse job %s", job_id)
+                continue
+            parsed += 1
+            self._insert(job_id, version, job_info)
+
+        for job_id in [job_id for job_id in self.infos if job_id not in seen]:
+            self._remove(job_id)
+
+        logger.info("jobs info cache parsed %d out of %d jobs", parsed,
+                    len(self.infos))
+        return [self.infos[job_id][1] for _, job_id in self.sorted_keys]
+
+
+def mark_schedulable_non_preemptable_jobs(jobs_info,
+                                          cluster_schedulable,
+                                          vc_schedulables,
+                                          node_frees=None):
+    """Marks non-preemptable jobs allowed to run in order of jobs_info.
+
+    Without node_frees, any job fitting into what is left is allowed. With
+    node_frees, the first queued job not fitting in each vc gets nodes
+    reserved: resource free on those nodes is held for it, so that later
+    jobs are only backfilled into the rest and the head job is not starved
+    by a stream of smaller jobs.
+    """
+    reserved_vcs = set()
+    reserved_nodes = set()
     for job_info in jobs_info:
         job_resource = job_info["job_resource"]
         job_id = job_info["jobId"]
@@ -604,6 +918,23 @@ def mark_schedulable_non_preemptable_jobs(jobs_info, cluster_schedulable,
                 "resource not enough, required job resource %s. "
                 "cluster schedulable %s, vc schedulables %s", job_id, vc_name,
                 job_resource, cluster_schedulable, vc_schedulable)
+            if node_frees is None or vc_name in reserved_vcs or \
+                    job_info["job"].get("jobStatus") != "queued":
+                continue
+
+            held, nodes = reserve_nodes(job_resource, node_frees,
+                                        reserved_nodes)
+            if held is None:
+                logger.info("job %s cannot fit into unreserved nodes",
+                            job_id)
+                continue
+            reserved_vcs.add(vc_name)
+            reserved_nodes.update(nodes)
+            vc_schedulable -= held
+            cluster_schedulable -= held
+            job_info["reserved"] = held
+            logger.info("Reserve nodes %s for job %s, holding %s", nodes,
+                        job_id, held)
 
 
 def mark_schedulable_preemptable_jobs(jobs_info, cluster_schedulable):
@@ -631,8 +962,65 @@ def mark_schedulable_preemptable_jobs(jobs_info, cluster_schedulable):
                     job_resource)
 
 
-def schedule_jobs(jobs_info, data_handler, redis_conn, launcher,
-                  cluster_schedulable, vc_schedulables):
+class JobStatusDetailWriter(object):
+    """Buffers jobStatusDetail written by scheduler in a pass.
+
+    Remembers what was last written for each job, details that did not
+    change are not written again, and the rest are flushed in batch. What was
+    written is only trusted while the job's lastUpdated and jobStatus stay
+    the same, since other managers may rewrite the detail on a status change.
+    """
+    def __init__(self):
+        self.last_written = {} # job id -> (version, encoded detail)
+        self.pending = {} # job id -> (version, encoded detail)
+
+    @staticmethod
+    def version_of(job):
+        return job.get("lastUpdated"), job.get("jobStatus")
+
+    def set_detail(self, job, detail):
+        job_id = job["jobId"]
+        written = (self.version_of(job), base64encode(json.dumps(detail)))
+        if self.last_written.get(job_id) == written:
+            return
+        self.pending[job_id] = written
+
+    def flush(self, data_handler, active_job_ids=None):
+        written = 0
+        if len(self.pending) > 0:
+            fields_by_job = {
+                job_id: {
+                    "jobStatusDetail": detail
+                } for job_id, (_, detail) in self.pending.items()
+            }
+            if data_handler.batch_update_text_fields_for_jobs(fields_by_job):
+                self.last_written.update(self.pending)
+                written = len(self.pending)
+            else:
+                logger.warning("failed to write status detail of %d jobs",
+                               len(self.pending))
+            self.pending = {}
+
+        if active_job_ids is not None:
+            for job_id in list(self.last_written.keys()):
+                if job_id not in active_job_ids:
+                    del self.last_written[job_id]
+
+        job_detail_rows_written_histogram.observe(written)
+        logger.info("wrote status detail of %d jobs", written)
+        return written
+
+
+def schedule_jobs(jobs_info,
+                  data_handler,
+                  latency_recorder,
+                  launcher,
+                  cluster_schedulable,
+                  vc_schedulables,
+                  detail_writer=None):
+    if detail_writer is None:
+        detail_writer = JobStatusDetailWriter()
+
     for job_info in jobs_info:
         try:
             job = job_info["job"]
@@ -646,7 +1034,7 @@ def schedule_jobs(jobs_info, data_handler, redis_conn, launcher,
 
             if job_status == "queued" and allowed:
                 launcher.submit_job(job)
-                update_job_state_latency(redis_conn, job_id, "scheduling")
+                update_job_state_latency(latency_recorder, job_id, "scheduling")
                 logger.info("Submitting job %s : %s", job_id, sort_key)
             elif preemption_allowed and \
                     (job_status in ["scheduling", "running"]) and (not allowed):
@@ -657,29 +1045,66 @@ def schedule_jobs(jobs_info, data_handler, redis_conn, launcher,
                 message = "Waiting for resource. Job request %s. " \
                           "VC schedulable %s. Cluster schedulable %s" % \
                           (job_resource, vc_schedulable, cluster_schedulable)
+                if job_info.get("reserved") is not None:
+                    message += ". Reserved %s" % job_info["reserved"]
                 detail = [{"message": message}]
-                data_handler.UpdateJobTextFields(
-                    {"jobId": job_id},
-                    {"jobStatusDetail": base64encode(json.dumps(detail))})
+                detail_writer.set_detail(job, detail)
         except:
             logger.error("Process job failed: %s", job_info, exc_info=True)
 
+    detail_writer.flush(
+        data_handler,
+        active_job_ids=set([job_info["jobId"] for job_info in jobs_info]))
+
+
+class ClusterStatusReader(object):
+    """Keeps latest cluster status read from DB, it is fetched and decoded
+    only when its version in DB changes. Callers must not modify it."""
+    def __init__(self):
+        self.version = None
+        self.cluster_status = None
+
+    def get(self, data_handler):
+        cluster_status, _, version = data_handler.GetLatestClusterStatus(
+            self.version)
+        if cluster_status is not None or version is None:
+            self.cluster_status = cluster_status
+        self.version = version
+        return self.cluster_status
+
 
 @record
-def take_job_actions(data_handler, redis_conn, launcher, jobs):
+def take_job_actions(data_handler,
+                     latency_recorder,
+                     launcher,
+                     jobs,
+                     jobs_info_cache=None,
+                     detail_writer=None,
+                     cluster_status_reader=None):
     # Compute from the latest ClusterStatus in DB:
     # 1. cluster_schedulable
     # 2. vc_schedulables
-    cluster_status, _ = data_handler.GetClusterStatus()
+    if cluster_status_reader is None:
+        cluster_status, _ = data_handler.GetClusterStatus()
+    else:
+        cluster_status = cluster_status_reader.get(data_handler)
     cluster_schedulable = get_cluster_schedulable(cluster_status)
     vc_schedulables = get_vc_schedulables(cluster_status)
 
     # Parse and sort jobs based on priority and submission time
-    jobs_info = get_jobs_info(jobs)
-
-    # Mark schedulable non-preemptable jobs
+    if jobs_info_cache is None:
+        jobs_info = get_jobs_info(jobs)
+    else:
+        jobs_info = jobs_info_cache.update(jobs, get_jobs_priority_dict(jobs))
+
+    # Mark schedulable non-preemptable jobs, reserving nodes for head of
+    # queue jobs in backfill mode
+    policy = config.get("job-manager", {}).get("scheduling-policy", "fifo")
+    node_frees = None
+    if policy == "backfill":
+        node_frees = get_node_frees(cluster_status)
     mark_schedulable_non_preemptable_jobs(jobs_info, cluster_schedulable,
-                                          vc_schedulables)
+                                          vc_schedulables, node_frees)
 
     # Mark schedulable preemptable jobs
     mark_schedulable_preemptable_jobs(jobs_info, cluster_schedulable)
@@ -688,8 +1113,107 @@ def take_job_actions(data_handler, redis_conn, launcher, jobs):
                 cluster_schedulable)
 
     # Submit/kill jobs based on schedulable marking
-    schedule_jobs(jobs_info, data_handler, redis_conn, launcher,
-                  cluster_schedulable, vc_schedulables)
+    schedule_jobs(jobs_info, data_handler, latency_recorder, launcher,
+                  cluster_schedulable, vc_schedulables, detail_writer)
+
+
+class JobChangeFeed(object):
+    """Local view of jobs in given statuses, kept up to date by fetching only
+    jobs modified since last pass.
+
+    A full listing is done at start, every resync_period seconds, and
+    whenever change feed is not available. Jobs modified within overlap
+    seconds before watermark are fetched again, since a transaction may
+    commit after a later one was already read. A failed listing keeps
+    previous jobs and watermark, and is retried in next pass.
+
+    Only fields of jobs are read, large columns like jobDescription are
+    skipped by default.
+    """
+    # columns of job used by job manager and launcher
+    fields = [
+        "jobId", "jobName", "userName", "vcName", "jobStatus",
+        "jobStatusDetail", "jobType", "jobTime", "jobParams", "lastUpdated",
+        "priority", "sku", "gpuRequest", "cpuRequest", "memoryRequest",
+        "preemptible"
+    ]
+
+    def __init__(self, statuses, resync_period=300, overlap=5, fields=None):
+        self.statuses = set(statuses)
+        self.resync_period = resync_period
+        self.overlap = datetime.timedelta(seconds=overlap)
+        if fields is not None:
+            self.fields = fields
+
+        self.jobs = {} # job id -> job
+        self.watermark = None
+        self.last_resync = 0
+        self.warned_no_modified_time = False
+
+    def has_modified_time(self, data_handler):
+        if data_handler.has_job_modified_time():
+            return True
+        if not self.warned_no_modified_time:
+            logger.warning("jobs table has no modifiedTime column, "
+                           "listing all jobs every pass")
+            self.warned_no_modified_time = True
+        return False
+
+    def resync(self, data_handler):
+        """Lists all jobs in statuses. Returns False and keeps previous jobs
+        and watermark on failure."""
+        watermark = None
+        if self.has_modified_time(data_handler):
+            watermark = data_handler.get_job_modified_watermark()
+            if watermark is None:
+                logger.warning("failed to get job modified watermark, "
+                               "keep previous %d jobs", len(self.jobs))
+                return False
+        jobs = data_handler.GetJobList("all",
+                                       "all",
+                                       num=None,
+                                       status=",".join(sorted(self.statuses)),
+                                       fields=self.fields,
+                                       none_on_failure=True)
+        if jobs is None:
+            logger.warning("failed to list jobs, keep previous %d jobs",
+                           len(self.jobs))
+            return False
+        self.jobs = {job["jobId"]: job for job in jobs}
+        self.watermark = watermark
+        self.last_resync = time.time()
+        logger.info("resynced %d jobs, watermark %s", len(self.jobs),
+                    watermark)
+        return True
+
+    def apply_changes(self, data_handler):
+        changed = data_handler.get_jobs_modified_since(
+            self.watermark - self.overlap, fields=self.fields)
+        if changed is None:
+            return False
+
+        for job in changed:
+            job_id = job["jobId"]
+            if job["jobStatus"] in self.statuses:
+                self.jobs[job_id] = job
+            else:
+                self.jobs.pop(job_id, None)
+            if job["modifiedTime"] > self.watermark:
+                self.watermark = job["modifiedTime"]
+        logger.info("applied %d changed jobs, watermark %s", len(changed),
+                    self.watermark)
+        return True
+
+    def get_jobs(self, data_handler):
+        """Returns jobs in statuses ordered by jobTime desc like GetJobList"""
+        if self.watermark is None or \
+                time.time() - self.last_resync > self.resync_period or \
+                not self.apply_changes(data_handler):
+            self.resync(data_handler)
+
+        return sorted(self.jobs.values(),
+                      key=lambda job: job["jobTime"],
+                      reverse=True)
 
 
 def is_version_satisified(actual, base):
@@ -723,7 +1247,14 @@ def Run(redis_port, target_status):
 
     launcher_type = config.get("job-manager", {}).get("launcher", "python")
     if launcher_type == "python":
-        launcher = PythonLauncher()
+        # only status checking processes read pods frequently enough to pay
+        # for keeping a watch open
+        job_manager_config = config.get("job-manager", {})
+        launcher = PythonLauncher(
+            pool_size=job_manager_config.get("launcher-pool-size", 3),
+            use_pod_informer=target_status in ["running", "scheduling"],
+            concurrency=job_manager_config.get("launcher-concurrency", 4),
+            task_timeout=job_manager_config.get("launcher-task-timeout", 600))
     elif launcher_type == "controller":
         launcher = LauncherStub()
     else:
@@ -732,6 +1263,17 @@ def Run(redis_port, target_status):
     launcher.start()
 
     redis_conn = redis.StrictRedis(host="localhost", port=redis_port, db=0)
+    latency_recorder = JobStateLatencyRecorder(redis_conn)
+    if target_status == "queued":
+        expire_legacy_job_status(redis_conn, latency_recorder.ttl)
+
+    if target_status == "queued":
+        job_feed = JobChangeFeed(["queued", "scheduling", "running"])
+    else:
+        job_feed = JobChangeFeed(target_status.split(","))
+    jobs_info_cache = JobsInfoCache()
+    detail_writer = JobStatusDetailWriter()
+    cluster_status_reader = ClusterStatusReader()
 
     while True:
         update_file_modification_time(process_name)
@@ -744,26 +1286,30 @@ def Run(redis_port, target_status):
                 logger.exception("get node labels failed")
 
             try:
-                launcher.wait_tasks_done(
-                ) # wait for tasks from previous batch done
+                # tasks of previous passes keep running in workers, only
+                # forget finished ones. Collect before reading jobs so that
+                # changes made by a finished task are visible in this pass
+                launcher.collect_done_tasks()
 
                 data_handler = DataHandler()
 
+                jobs = job_feed.get_jobs(data_handler)
+                latency_recorder.load([job["jobId"] for job in jobs])
+
                 if target_status == "queued":
-                    jobs = data_handler.GetJobList(
-                        "all",
-                        "all",
-                        num=None,
-                        status="queued,scheduling,running")
-                    take_job_actions(data_handler, redis_conn, launcher, jobs)
+                    take_job_actions(data_handler, latency_recorder, launcher,
+                                     jobs, jobs_info_cache, detail_writer,
+                                     cluster_status_reader)
                 else:
-                    jobs = data_handler.GetJobList("all",
-                                                   "all",
-                                                   num=None,
-                                                   status=target_status)
                     logger.info("Updating status for %d %s jobs", len(jobs),
                                 target_status)
 
+                    launcher.refresh_role_readiness([
+                        job["jobId"]
+                        for job in jobs
+                        if job["jobStatus"] in ["running", "scheduling"]
+                    ])
+
                     for job in jobs:
                         logger.info("Processing job: %s, status: %s" %
                                     (job["jobId"], job["jobStatus"]))
@@ -772,19 +1318,19 @@ def Run(redis_port, target_status):
                         elif job["jobStatus"] == "pausing":
                             launcher.kill_job(job["jobId"], "paused")
                         elif job["jobStatus"] == "running":
-                            UpdateJobStatus(redis_conn,
+                            UpdateJobStatus(latency_recorder,
                                             launcher,
                                             job,
                                             notifier,
                                             dataHandlerOri=data_handler)
                         elif job["jobStatus"] == "scheduling":
-                            UpdateJobStatus(redis_conn,
+                            UpdateJobStatus(latency_recorder,
                                             launcher,
                                             job,
                                             notifier,
                                             dataHandlerOri=data_handler)
                         elif job["jobStatus"] == "unapproved":
-                            ApproveJob(redis_conn,
+                            ApproveJob(latency_recorder,
                                        job,
                                        dataHandlerOri=data_handler)
                         else:
@@ -793,6 +1339,7 @@ def Run(redis_port, target_status):
             except Exception as e:
                 logger.exception("Process jobs failed!")
             finally:
+                latency_recorder.flush()
                 try:
                     data_handler.Close()
                 except:
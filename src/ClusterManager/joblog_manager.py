@@ -179,7 +179,12 @@ def update_job_logs():
     while True:
         try:
             dataHandler = DataHandler()
-            pendingJobs = dataHandler.GetPendingJobs()
+            # logs are only extracted for running jobs
+            pendingJobs = dataHandler.GetJobList(
+                "all",
+                "all",
+                status="running",
+                fields=["jobId", "jobStatus", "jobParams"])
             dataHandler.Close()
             for job in pendingJobs:
                 update_file_modification_time("joblog_manager")
@@ -21,7 +21,9 @@ from config import config
 
 import k8s_utils
 
-from cluster_status import ClusterStatusFactory
+from cluster_status import ClusterStatusFactory, ClusterStatusModel, \
+    GpuUsageClient, pod_key, item_digest, merkle_root
+from informer import Informer
 from virtual_cluster_status import VirtualClusterStatusesFactory
 
 k8s = k8s_utils.K8sUtil()
@@ -52,13 +54,44 @@ def check_cluster_status_change(o_cluster_status, cluster_status):
     return False
 
 
-def get_cluster_status():
+def create_status_model():
+    node_informer = Informer(k8s.core_api.list_node, name="node")
+    pod_informer = Informer(k8s.core_api.list_pod_for_all_namespaces,
+                            key_fn=pod_key,
+                            name="pod")
+    prometheus_node = config.get("prometheus_node", "127.0.0.1")
+    status_model = ClusterStatusModel(node_informer, pod_informer,
+                                      GpuUsageClient(prometheus_node))
+    status_model.start()
+    return status_model
+
+
+def get_publish_digest(cs, vc_list):
+    """Digest of everything published by get_cluster_status. vc statuses
+    are derived from cs, vc quotas and vc of jobs without pods."""
+    vcs = sorted([(vc["vcName"], vc.get("resourceQuota")) for vc in vc_list])
+    jobs = sorted([(job.get("jobId"), job.get("vcName"))
+                   for job in cs.jobs_without_pods])
+    return merkle_root({
+        "cluster_status": cs.digest,
+        "vc_list": item_digest(vcs),
+        "jobs_without_pods": item_digest(jobs),
+    })
+
+
+def get_cluster_status(status_model=None):
     """Update in DB and returns cluster status.
 
+    Args:
+        status_model: ClusterStatusModel fed by watch events. Nodes and pods
+            are listed from k8s if it is None or not synced yet.
+
     Returns:
         A dictionary representing cluster status.
     """
     cluster_status = {}
+    digest = None
+    digests = None
 
     try:
         with DataHandler() as data_handler:
@@ -66,11 +99,30 @@ def get_cluster_status():
             jobs = data_handler.GetActiveJobList()
 
         # Set up cluster status
-        nodes = k8s.get_all_nodes()
-        pods = k8s.get_all_pods()
-        prometheus_node = config.get("prometheus_node", "127.0.0.1")
-        cs_factory = ClusterStatusFactory(prometheus_node, nodes, pods, jobs)
-        cs = cs_factory.make()
+        if status_model is not None and status_model.has_synced():
+            cs = status_model.make(jobs,
+                                   force=config["cluster_status"] is None)
+            if cs is None:
+                logger.info("No change in cluster status model, skipping...")
+                return config["cluster_status"]
+        else:
+            nodes = k8s.get_all_nodes()
+            pods = k8s.get_all_pods()
+            prometheus_node = config.get("prometheus_node", "127.0.0.1")
+            cs_factory = ClusterStatusFactory(prometheus_node, nodes, pods,
+                                              jobs)
+            cs = cs_factory.make()
+
+        digest = get_publish_digest(cs, vc_list)
+        if config.get("cluster_status") is not None and \
+                digest == config.get("cluster_status_digest"):
+            logger.info("No diff in cluster status digest %s, skipping...",
+                        digest)
+            return config["cluster_status"]
+        digests = cs.digests
+        logger.info("Changed cluster status sections: %s",
+                    cs.changed_sections(config.get("cluster_status_digests")))
+
         cluster_status = cs.to_dict()
 
         # TODO: Deprecate typo "gpu_avaliable" in legacy code
@@ -91,10 +143,15 @@ def get_cluster_status():
     except:
         logger.exception("Exception in setting up cluster status",
                          exc_info=True)
+        digest = digests = None
+        if status_model is not None:
+            status_model.invalidate()
 
     try:
-        if "cluster_status" in config and \
-                config["cluster_status"] != cluster_status:
+        # digest was checked above, only a failed status is compared
+        if "cluster_status" in config and (
+                digest is not None or
+                config["cluster_status"] != cluster_status):
             size = len(json.dumps(cluster_status, separators=(",", ":")))
             logger.info("updating the cluster status (of len %s)...", size)
             with DataHandler() as data_handler:
@@ -105,6 +162,8 @@ def get_cluster_status():
         logger.warning("Error in updating cluster status", exc_info=True)
 
     config["cluster_status"] = copy.deepcopy(cluster_status)
+    config["cluster_status_digest"] = digest
+    config["cluster_status_digests"] = digests
     return cluster_status
 
 
@@ -113,13 +172,17 @@ def run():
     create_log()
     logger.info("start to update nodes usage information ...")
     config["cluster_status"] = None
+    config["cluster_status_digest"] = None
+    config["cluster_status_digests"] = None
+
+    status_model = create_status_model()
 
     while True:
         update_file_modification_time("node_manager")
 
         with manager_iteration_histogram.labels("node_manager").time():
             try:
-                get_cluster_status()
+                get_cluster_status(status_model)
             except:
                 logger.exception("get cluster status failed", exc_info=True)
         time.sleep(10)
@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""Offline simulator for scheduling passes of the queued job_manager.
+
+It replays a job arrival trace on a mock cluster built with
+cluster_test_utils.mock_k8s_node/mock_k8s_pod. Each simulated pass builds
+cluster status the same way node_manager does, then runs get_jobs_info (or
+JobsInfoCache), mark_schedulable_non_preemptable_jobs,
+mark_schedulable_preemptable_jobs and schedule_jobs against a fake launcher.
+A job's pods are placed first fit when the job is submitted, and they stay
+Pending until a node has room.
+
+Reports decisions/s, per pass scheduling latency percentiles, GPU
+utilization and queueing delay (arrival to all pods placed).
+
+Examples:
+    ./scheduler_simulator.py --nodes 100 --vcs 4 --jobs 5000
+    ./scheduler_simulator.py --cluster cluster.json --trace trace.jsonl
+    ./scheduler_simulator.py --policy backfill
+
+cluster.json is {"nodes": [{"name", "sku", "gpu", "cpu", "memory"}],
+"vcs": [{"vcName", "resourceQuota"}]}, memory in Mi. Each line of
+trace.jsonl is {"jobId", "arrival", "duration", "vcName", "userName", "gpu",
+"cpu", "memory", "preemptionAllowed"}, with arrival/duration in seconds.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
+
+from config import config
+config.setdefault("datasource", "MySQL")
+
+from cluster_status import ClusterStatusFactory
+from virtual_cluster_status import VirtualClusterStatusesFactory
+from cluster_test_utils import MockK8sNodeConfig, MockK8sPodConfig, \
+    mock_k8s_node, mock_k8s_pod
+from job_manager import get_cluster_schedulable, get_vc_schedulables, \
+    get_jobs_info, mark_schedulable_non_preemptable_jobs, \
+    mark_schedulable_preemptable_jobs, schedule_jobs, JobsInfoCache, \
+    JobStatusDetailWriter, get_node_frees
+from common import base64encode
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime.datetime(2020, 1, 1)
+
+
+def percentile(values, p):
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    rank = int(round(p / 100.0 * len(values)))
+    index = min(len(values) - 1, max(0, rank - 1))
+    return values[index]
+
+
+class SimNode(object):
+    def __init__(self, name, sku, gpu, cpu, memory, gpu_type="P40"):
+        self.name = name
+        self.sku = sku
+        self.gpu = gpu
+        self.cpu = cpu
+        self.memory = memory # in Mi
+        self.gpu_type = gpu_type
+        self.gpu_free = gpu
+        self.cpu_free = cpu
+        self.memory_free = memory
+
+    def fits(self, job):
+        return self.sku == job.sku and self.gpu_free >= job.gpu and \
+            self.cpu_free >= job.cpu and self.memory_free >= job.memory
+
+    def allocate(self, job, sign=1):
+        self.gpu_free -= sign * job.gpu
+        self.cpu_free -= sign * job.cpu
+        self.memory_free -= sign * job.memory
+
+    def to_k8s(self):
+        node_config = MockK8sNodeConfig()
+        node_config.name = self.name
+        node_config.labels = {
+            "gpuType": self.gpu_type,
+            "sku": self.sku,
+            "worker": "active"
+        }
+        resources = {
+            "nvidia.com/gpu": str(self.gpu),
+            "cpu": str(self.cpu),
+            "memory": "%dMi" % self.memory
+        }
+        node_config.capacity = resources
+        node_config.allocatable = resources
+        node_config.internal_ip = "127.0.0.1"
+        node_config.unschedulable = False
+        node_config.ready = "True"
+        return mock_k8s_node(node_config)
+
+
+class SimJob(object):
+    def __init__(self, job_id, arrival, duration, vc_name, user_name, sku,
+                 gpu, cpu, memory, preemption_allowed):
+        self.job_id = job_id
+        self.arrival = arrival
+        self.duration = duration
+        self.vc_name = vc_name
+        self.user_name = user_name
+        self.sku = sku
+        self.gpu = gpu
+        self.cpu = cpu
+        self.memory = memory
+        self.preemption_allowed = preemption_allowed
+
+        self.status = "queued"
+        self.last_updated = arrival
+        self.node = None # node the pod is placed on, None if pending
+        self.start_time = None
+        self.remaining = duration
+
+        self.job_params = base64encode(
+            json.dumps({
+                "jobId": job_id,
+                "userName": user_name,
+                "vcName": vc_name,
+                "jobtrainingtype": "RegularJob",
+                "sku": sku,
+                "resourcegpu": gpu,
+                "cpurequest": cpu,
+                "memoryrequest": "%dMi" % memory,
+                "preemptionAllowed": preemption_allowed,
+            }))
+
+    def to_row(self):
+        """Returns the job the way GetJobList would"""
+        return {
+            "jobId": self.job_id,
+            "userName": self.user_name,
+            "vcName": self.vc_name,
+            "jobStatus": self.status,
+            "jobParams": self.job_params,
+            "jobTime": EPOCH + datetime.timedelta(seconds=self.arrival),
+            "lastUpdated":
+                EPOCH + datetime.timedelta(seconds=self.last_updated),
+        }
+
+    def to_k8s(self):
+        pod_config = MockK8sPodConfig()
+        pod_config.name = self.job_id
+        pod_config.labels = {
+            "jobId": self.job_id,
+            "vcName": self.vc_name,
+            "userName": self.user_name,
+            "preemptionAllowed": str(self.preemption_allowed),
+            "gpuType": "P40",
+        }
+        pod_config.node_selector = {"sku": self.sku}
+        pod_config.namespace = "default"
+        pod_config.phase = "Running" if self.node is not None else "Pending"
+        pod_config.node_name = None if self.node is None else self.node.name
+        pod_config.container_requests = [{
+            "nvidia.com/gpu": str(self.gpu),
+            "cpu": str(self.cpu),
+            "memory": "%dMi" % self.memory
+        }]
+        return mock_k8s_pod(pod_config)
+
+
+class FakeLauncher(object):
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.submitted = 0
+        self.killed = 0
+
+    def submit_job(self, job):
+        self.submitted += 1
+        self.simulator.submit(job["jobId"])
+
+    def kill_job(self, job_id, desired_state="killed"):
+        self.killed += 1
+        self.simulator.kill(job_id, desired_state)
+
+
+class FakeDataHandler(object):
+    def __init__(self):
+        self.rows_written = 0
+
+    def batch_update_text_fields_for_jobs(self, fields_by_job):
+        self.rows_written += len(fields_by_job)
+        return True
+
+
+class FakeLatencyRecorder(object):
+    def update(self, job_id, state, event_time=None):
+        pass
+
+
+class Simulator(object):
+    def __init__(self,
+                 nodes,
+                 vc_list,
+                 jobs,
+                 interval=10,
+                 incremental=True,
+                 policy="fifo"):
+        self.nodes = nodes
+        self.vc_list = vc_list
+        self.pending_arrivals = sorted(jobs, key=lambda job: job.arrival)
+        self.interval = interval
+        self.incremental = incremental
+        self.policy = policy
+
+        self.jobs = {} # job id -> SimJob of arrived jobs
+        self.now = 0
+        self.launcher = FakeLauncher(self)
+        self.data_handler = FakeDataHandler()
+        self.latency_recorder = FakeLatencyRecorder()
+        self.jobs_info_cache = JobsInfoCache()
+        self.detail_writer = JobStatusDetailWriter()
+
+        self.pass_latencies = []
+        self.status_latencies = []
+        self.decisions = 0
+        self.gpu_used_samples = []
+        self.queueing_delays = []
+
+    def set_status(self, job, status):
+        job.status = status
+        job.last_updated = self.now
+
+    def place(self, job):
+        for node in self.nodes:
+            if node.fits(job):
+                node.allocate(job)
+                job.node = node
+                job.start_time = self.now
+                self.queueing_delays.append(self.now - job.arrival)
+                self.set_status(job, "running")
+                return True
+        return False
+
+    def release(self, job):
+        if job.node is not None:
+            job.node.allocate(job, sign=-1)
+            job.remaining -= self.now - job.start_time
+            job.node = None
+
+    def submit(self, job_id):
+        job = self.jobs[job_id]
+        self.set_status(job, "scheduling")
+        self.place(job)
+
+    def kill(self, job_id, desired_state):
+        job = self.jobs[job_id]
+        self.release(job)
+        self.set_status(job, desired_state)
+
+    def active_jobs(self):
+        return [
+            job for job in self.jobs.values()
+            if job.status in ["queued", "scheduling", "running"]
+        ]
+
+    def advance(self):
+        while len(self.pending_arrivals) > 0 and \
+                self.pending_arrivals[0].arrival <= self.now:
+            job = self.pending_arrivals.pop(0)
+            self.jobs[job.job_id] = job
+
+        for job in self.active_jobs():
+            if job.status == "running" and \
+                    job.start_time + job.remaining <= self.now:
+                self.release(job)
+                self.set_status(job, "finished")
+
+        # pending pods get scheduled by k8s as room frees up
+        for job in sorted(self.active_jobs(), key=lambda job: job.arrival):
+            if job.status == "scheduling" and job.node is None:
+                self.place(job)
+
+    def get_cluster_status(self):
+        active_jobs = self.active_jobs()
+        k8s_nodes = [node.to_k8s() for node in self.nodes]
+        k8s_pods = [
+            job.to_k8s()
+            for job in active_jobs
+            if job.status in ["scheduling", "running"]
+        ]
+        # like GetActiveJobList, ClusterStatus decodes jobParams in place
+        status_jobs = [{
+            "jobId": job.job_id,
+            "userName": job.user_name,
+            "vcName": job.vc_name,
+            "jobParams": job.job_params,
+            "jobStatus": job.status,
+        } for job in active_jobs if job.status in ["scheduling", "running"]]
+
+        # no prometheus in simulation, None makes gpu usage lookups fail fast
+        cs = ClusterStatusFactory(None, k8s_nodes, k8s_pods,
+                                  status_jobs).make()
+        cluster_status = cs.to_dict()
+        vc_statuses = VirtualClusterStatusesFactory(cs, self.vc_list).make()
+        cluster_status["vc_statuses"] = {
+            vc_name: vc_status.to_dict()
+            for vc_name, vc_status in vc_statuses.items()
+        }
+        return cluster_status
+
+    def run_pass(self):
+        self.advance()
+
+        start = time.time()
+        cluster_status = self.get_cluster_status()
+        self.status_latencies.append(time.time() - start)
+
+        jobs = [job.to_row() for job in self.active_jobs()]
+
+        start = time.time()
+        cluster_schedulable = get_cluster_schedulable(cluster_status)
+        vc_schedulables = get_vc_schedulables(cluster_status)
+        if self.incremental:
+            jobs_info = self.jobs_info_cache.update(jobs, {})
+        else:
+            jobs_info = get_jobs_info(jobs, {})
+        node_frees = None
+        if self.policy == "backfill":
+            node_frees = get_node_frees(cluster_status)
+        mark_schedulable_non_preemptable_jobs(jobs_info, cluster_schedulable,
+                                              vc_schedulables, node_frees)
+        mark_schedulable_preemptable_jobs(jobs_info, cluster_schedulable)
+        schedule_jobs(jobs_info, self.data_handler, self.latency_recorder,
+                      self.launcher, cluster_schedulable, vc_schedulables,
+                      self.detail_writer)
+        self.pass_latencies.append(time.time() - start)
+        self.decisions += len(jobs_info)
+
+        self.gpu_used_samples.append(
+            sum([node.gpu - node.gpu_free for node in self.nodes]))
+
+    def run(self, max_passes=None):
+        passes = 0
+        while len(self.pending_arrivals) > 0 or len(self.active_jobs()) > 0:
+            if max_passes is not None and passes >= max_passes:
+                break
+            self.run_pass()
+            passes += 1
+            self.now += self.interval
+        return self.report()
+
+    def report(self):
+        gpu_total = sum([node.gpu for node in self.nodes])
+        scheduling_time = sum(self.pass_latencies)
+        unfinished = len(self.pending_arrivals) + len(self.active_jobs())
+        gpu_utilization = None
+        if gpu_total > 0 and len(self.gpu_used_samples) > 0:
+            gpu_utilization = sum(self.gpu_used_samples) / \
+                float(gpu_total * len(self.gpu_used_samples))
+
+        return {
+            "passes": len(self.pass_latencies),
+            "simulated_seconds": self.now,
+            "jobs_submitted": self.launcher.submitted,
+            "jobs_preempted": self.launcher.killed,
+            "jobs_unfinished": unfinished,
+            "decisions": self.decisions,
+            "decisions_per_second": self.decisions / scheduling_time
+                                    if scheduling_time > 0 else None,
+            "pass_latency_p50": percentile(self.pass_latencies, 50),
+            "pass_latency_p90": percentile(self.pass_latencies, 90),
+            "pass_latency_p99": percentile(self.pass_latencies, 99),
+            "pass_latency_max": max(self.pass_latencies or [0]),
+            "cluster_status_latency_p50": percentile(self.status_latencies,
+                                                     50),
+            "gpu_utilization": gpu_utilization,
+            "queueing_delay_mean":
+                sum(self.queueing_delays) / float(len(self.queueing_delays))
+                if len(self.queueing_delays) > 0 else None,
+            "queueing_delay_p50": percentile(self.queueing_delays, 50),
+            "queueing_delay_p90": percentile(self.queueing_delays, 90),
+            "queueing_delay_p99": percentile(self.queueing_delays, 99),
+            "detail_rows_written": self.data_handler.rows_written,
+        }
+
+
+def make_vc_list(vc_names, nodes):
+    """Splits capacity of nodes evenly among vc_names"""
+    totals = {}
+    for node in nodes:
+        total = totals.setdefault(node.sku, {"gpu": 0, "cpu": 0, "memory": 0})
+        total["gpu"] += node.gpu
+        total["cpu"] += node.cpu
+        total["memory"] += node.memory
+
+    n = len(vc_names)
+    quota = {
+        "gpu": {sku: total["gpu"] // n for sku, total in totals.items()},
+        "cpu": {sku: total["cpu"] // n for sku, total in totals.items()},
+        "memory": {
+            sku: "%dMi" % (total["memory"] // n)
+            for sku, total in totals.items()
+        },
+    }
+    return [{
+        "vcName": vc_name,
+        "resourceQuota": json.dumps(quota)
+    } for vc_name in vc_names]
+
+
+def make_synthetic_cluster(num_nodes, num_vcs, sku="sim_sku"):
+    nodes = [
+        SimNode("node%d" % i, sku, gpu=8, cpu=48, memory=400 * 1024)
+        for i in range(num_nodes)
+    ]
+    vc_list = make_vc_list(["vc%d" % i for i in range(num_vcs)], nodes)
+    return nodes, vc_list
+
+
+def make_synthetic_trace(num_jobs, vc_list, sku, arrival_rate,
+                         mean_duration, preemptible_ratio, seed):
+    rand = random.Random(seed)
+    jobs = []
+    arrival = 0
+    for i in range(num_jobs):
+        arrival += rand.expovariate(arrival_rate)
+        gpu = rand.choice([0, 1, 1, 1, 2, 4, 8])
+        jobs.append(
+            SimJob("job%d" % i,
+                   arrival=int(arrival),
+                   duration=max(1, int(rand.expovariate(1.0 / mean_duration))),
+                   vc_name=rand.choice(vc_list)["vcName"],
+                   user_name="user%d" % rand.randint(0, 19),
+                   sku=sku,
+                   gpu=gpu,
+                   cpu=max(1, gpu * 4),
+                   memory=max(1024, gpu * 40 * 1024),
+                   preemption_allowed=rand.random() < preemptible_ratio))
+    return jobs
+
+
+def load_cluster(path):
+    with open(path) as f:
+        cluster = json.load(f)
+    nodes = [
+        SimNode(node["name"], node["sku"], int(node["gpu"]), int(node["cpu"]),
+                int(node["memory"]), node.get("gpuType", "P40"))
+        for node in cluster["nodes"]
+    ]
+    vc_list = []
+    for vc in cluster["vcs"]:
+        quota = vc["resourceQuota"]
+        if not isinstance(quota, str):
+            quota = json.dumps(quota)
+        vc_list.append({"vcName": vc["vcName"], "resourceQuota": quota})
+    return nodes, vc_list
+
+
+def load_trace(path, default_sku):
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            entry = json.loads(line)
+            jobs.append(
+                SimJob(entry["jobId"],
+                       arrival=int(entry["arrival"]),
+                       duration=int(entry["duration"]),
+                       vc_name=entry["vcName"],
+                       user_name=entry.get("userName", "user"),
+                       sku=entry.get("sku", default_sku),
+                       gpu=int(entry.get("gpu", 0)),
+                       cpu=int(entry.get("cpu", 1)),
+                       memory=int(entry.get("memory", 0)),
+                       preemption_allowed=entry.get("preemptionAllowed",
+                                                    False)))
+    return jobs
+
+
+def main(args):
+    if args.cluster is not None:
+        nodes, vc_list = load_cluster(args.cluster)
+    else:
+        nodes, vc_list = make_synthetic_cluster(args.nodes, args.vcs)
+
+    if args.trace is not None:
+        jobs = load_trace(args.trace, nodes[0].sku)
+    else:
+        jobs = make_synthetic_trace(args.jobs, vc_list, nodes[0].sku,
+                                    args.arrival_rate, args.mean_duration,
+                                    args.preemptible_ratio, args.seed)
+
+    simulator = Simulator(nodes,
+                          vc_list,
+                          jobs,
+                          interval=args.interval,
+                          incremental=not args.no_cache,
+                          policy=args.policy)
+    report = simulator.run(max_passes=args.max_passes)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cluster", help="cluster json file")
+    parser.add_argument("--trace", help="job arrival trace jsonl file")
+    parser.add_argument("--nodes",
+                        help="number of nodes in synthetic cluster",
+                        type=int,
+                        default=50)
+    parser.add_argument("--vcs",
+                        help="number of vcs in synthetic cluster",
+                        type=int,
+                        default=4)
+    parser.add_argument("--jobs",
+                        help="number of jobs in synthetic trace",
+                        type=int,
+                        default=1000)
+    parser.add_argument("--arrival_rate",
+                        help="jobs arriving per second in synthetic trace",
+                        type=float,
+                        default=0.05)
+    parser.add_argument("--mean_duration",
+                        help="mean job duration in seconds in synthetic trace",
+                        type=float,
+                        default=3600)
+    parser.add_argument("--preemptible_ratio",
+                        help="ratio of preemptible jobs in synthetic trace",
+                        type=float,
+                        default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--interval",
+                        help="simulated seconds between scheduling passes",
+                        type=int,
+                        default=10)
+    parser.add_argument("--max_passes", type=int, default=None)
+    parser.add_argument("--no_cache",
+                        help="parse all jobs every pass as get_jobs_info does",
+                        action="store_true")
+    parser.add_argument("--policy",
+                        help="scheduling policy of non-preemptable jobs",
+                        choices=["fifo", "backfill"],
+                        default="fifo")
+    parser.add_argument("--log_level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format=
+        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)s - %(message)s",
+        level=args.log_level)
+    main(args)
@@ -2,15 +2,31 @@
 
 import os
 import sys
+import copy
+import json
+import re
+import socketserver
+import threading
+import time
 
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import TestCase
-from cluster_status import str2bool, ClusterStatus, ClusterStatusFactory
+from urllib.parse import parse_qs, urlparse
+from kubernetes.client import V1ListMeta
+from cluster_status import str2bool, ClusterStatus, ClusterStatusFactory, \
+    ClusterStatusModel, GpuUsageClient, pod_key
 from cluster_test_utils import BaseTestClusterSetup
+from informer import Informer
 
 sys.path.append(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
 
 
+# http.server.ThreadingHTTPServer is only in python 3.7+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
 class TestUtils(TestCase):
     def test_str2bool(self):
         self.assertTrue(str2bool("True"))
@@ -80,3 +96,218 @@ class TestClusterStatus(TestCase):
 
         t_cluster_status = test_cluster.cluster_status
         self.assertEqual(t_cluster_status, cs)
+
+    def test_digest(self):
+        test_cluster = BaseTestClusterSetup()
+        nodes = test_cluster.nodes
+        pods = test_cluster.pods
+        jobs = test_cluster.jobs
+
+        cs = ClusterStatusFactory("", nodes, pods, copy.deepcopy(jobs)).make()
+        cs_reversed = ClusterStatusFactory("", nodes[::-1], pods[::-1],
+                                           copy.deepcopy(jobs)[::-1]).make()
+        self.assertEqual(cs.digest, cs_reversed.digest)
+        self.assertEqual([], cs.changed_sections(cs_reversed.digests))
+
+        pods = copy.deepcopy(pods)
+        changed = pods[0]
+        changed.metadata.labels["userName"] = "another_user"
+        cs_changed = ClusterStatusFactory("", nodes, pods,
+                                          copy.deepcopy(jobs)).make()
+        self.assertNotEqual(cs, cs_changed)
+        self.assertIn("pod_status", cs_changed.changed_sections(cs.digests))
+        self.assertNotIn("gpu_capacity",
+                         cs_changed.changed_sections(cs.digests))
+        self.assertEqual([changed.metadata.name],
+                         cs_changed.changed_items(cs, "pod_status"))
+
+
+class StubPrometheusHandler(BaseHTTPRequestHandler):
+    # pod name -> [(instance, gpu usage)]
+    series = {}
+    slow_pods = set()
+    queries = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["query"][0]
+        self.queries.append(query)
+        op, value = re.search(r'pod_name(=~?)"([^"]*)"', query).groups()
+        if op == "=":
+            matched = [value]
+        else:
+            regex = value.replace("\\\\", "\\")
+            matched = [p for p in self.series if re.fullmatch(regex, p)]
+
+        if len(matched) > 1 and self.slow_pods.intersection(matched):
+            time.sleep(0.5)
+
+        result = []
+        for pod_name in matched:
+            for instance, usage in self.series.get(pod_name, []):
+                result.append({
+                    "metric": {
+                        "pod_name": pod_name,
+                        "instance": instance,
+                        "username": "user",
+                    },
+                    "value": [0, str(usage)],
+                })
+        body = json.dumps({"status": "success", "data": {"result": result}})
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGpuUsage(TestCase):
+    def setUp(self):
+        StubPrometheusHandler.series = {
+            "job1-master": [("10.0.0.1:9102", 12.5)],
+            "job1.worker-0": [("10.0.0.2:9102", 80), ("10.0.0.3:9102", 10)],
+            "job1-worker-0": [("10.0.0.4:9102", 55)],
+            "job2-master": [("10.0.0.1:9102", 100)],
+        }
+        StubPrometheusHandler.slow_pods = set()
+        StubPrometheusHandler.queries = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                          StubPrometheusHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+        self.pod_names = sorted(StubPrometheusHandler.series) + ["no-usage"]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_client(self, **kwargs):
+        return GpuUsageClient("127.0.0.1",
+                              port=self.server.server_port,
+                              **kwargs)
+
+    def per_pod_usages(self, client):
+        usages = {}
+        for pod_name in self.pod_names:
+            usage = client.job_gpu_usage(pod_name)
+            if usage is not None:
+                usages[pod_name] = usage
+        return usages
+
+    def test_batch_matches_per_pod(self):
+        client = self.make_client(chunk_size=2)
+        expected = self.per_pod_usages(client)
+        self.assertEqual(4, len(expected))
+
+        del StubPrometheusHandler.queries[:]
+        usages = client.jobs_gpu_usage(self.pod_names)
+        self.assertEqual(expected, usages)
+        self.assertEqual(3, len(StubPrometheusHandler.queries))
+
+    def test_fallback_bounded(self):
+        StubPrometheusHandler.slow_pods = {"job1-master"}
+        client = self.make_client(timeout=0.2, fallback_limit=1)
+        usages = client.jobs_gpu_usage(self.pod_names)
+
+        # the only chunk timed out, only first pod queried again on its own
+        self.assertEqual({"job1-master": 12}, usages)
+        self.assertEqual(2, len(StubPrometheusHandler.queries))
+
+    def test_no_prometheus(self):
+        client = GpuUsageClient(None)
+        self.assertEqual({}, client.jobs_gpu_usage(self.pod_names))
+
+
+class MockList(object):
+    def __init__(self, items):
+        self.items = items
+        self.metadata = V1ListMeta(resource_version="1")
+
+
+class TestClusterStatusModel(TestCase):
+    def setUp(self):
+        self.test_cluster = BaseTestClusterSetup()
+        self.nodes = list(self.test_cluster.nodes)
+        self.pods = list(self.test_cluster.pods)
+        self.node_informer = Informer(lambda: MockList(self.nodes), name="n")
+        self.pod_informer = Informer(lambda: MockList(self.pods),
+                                     key_fn=pod_key,
+                                     name="p")
+        self.model = ClusterStatusModel(self.node_informer,
+                                        self.pod_informer,
+                                        GpuUsageClient(None),
+                                        resync_period=3600,
+                                        gpu_usage_period=3600)
+        # incremental only, no resync on make
+        self.model.last_resync = self.model.last_gpu_usage_refresh = \
+            time.time()
+
+    def expected(self):
+        test_cluster = BaseTestClusterSetup()
+        return ClusterStatusFactory("", self.nodes, self.pods,
+                                    test_cluster.jobs).make()
+
+    def test_events_match_full_computation(self):
+        # pods may come before their nodes
+        self.pod_informer.relist()
+        self.node_informer.relist()
+
+        cs = self.model.make(BaseTestClusterSetup().jobs)
+        self.assertEqual(self.test_cluster.cluster_status, cs)
+
+        # nothing changed
+        self.assertIsNone(self.model.make(BaseTestClusterSetup().jobs))
+
+        version = self.model.version
+        deleted = self.pods.pop(0)
+        with self.pod_informer.lock:
+            self.pod_informer.delete(pod_key(deleted))
+        self.assertTrue(self.model.version > version)
+
+        cs = self.model.make(BaseTestClusterSetup().jobs)
+        self.assertEqual(self.expected(), cs)
+        self.assertEqual(0, self.model.resync())
+
+    def test_node_heartbeat_keeps_version(self):
+        self.node_informer.relist()
+        self.pod_informer.relist()
+        version = self.model.version
+
+        node = copy.deepcopy(self.nodes[0])
+        node.metadata.resource_version = "2"
+        with self.node_informer.lock:
+            self.node_informer.upsert(node)
+        self.assertEqual(version, self.model.version)
+
+        node = copy.deepcopy(node)
+        node.metadata.resource_version = "3"
+        node.spec.unschedulable = True
+        with self.node_informer.lock:
+            self.node_informer.upsert(node)
+        self.assertEqual(version + 1, self.model.version)
+        self.assertTrue(
+            self.model.node_statuses[node.metadata.name]["unschedulable"])
+        self.nodes[0] = node
+        self.assertEqual(0, self.model.resync())
+
+    def test_same_pod_name_in_other_namespace(self):
+        self.node_informer.relist()
+        self.pod_informer.relist()
+        num_pods = len(self.model.pod_statuses)
+
+        pod = next(pod for pod in self.pods
+                   if pod_key(pod) in self.model.pods)
+        other = copy.deepcopy(pod)
+        other.metadata.namespace = "other"
+        with self.pod_informer.lock:
+            self.pod_informer.upsert(other)
+        self.assertEqual(num_pods + 1, len(self.model.pod_statuses))
+        self.assertIn(pod_key(pod), self.model.pods)
+
+        with self.pod_informer.lock:
+            self.pod_informer.delete(pod_key(other))
+        self.assertEqual(num_pods, len(self.model.pod_statuses))
+        self.assertIn(pod_key(pod), self.model.pods)
+        self.assertEqual(0, self.model.resync())
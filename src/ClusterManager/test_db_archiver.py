@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from db_archiver import Archiver, RateLimiter
+
+
+class MockDataHandler(object):
+    """Rows of a table kept in memory, rows with old True are the ones older
+    than days_ago"""
+    def __init__(self, rows):
+        self.rows = {row["id"]: row for row in rows}
+        self.archive = {}
+        self.deletes = []
+        self.dependents = []
+        self.fail_delete = False
+
+    def get_rows_older_than_days(self, table, days_ago, col, cond, after_id,
+                                 limit, fields):
+        ret = []
+        for id in sorted(self.rows):
+            row = self.rows[id]
+            if id > after_id and row["old"]:
+                ret.append(dict(row) if fields == "*" else {"id": id})
+            if len(ret) == limit:
+                break
+        return ret
+
+    def delete_rows_by_ids(self, table, ids, dependents=()):
+        if self.fail_delete:
+            raise RuntimeError("delete failed")
+        self.deletes.append(list(ids))
+        self.dependents.extend(dependents)
+        for id in ids:
+            self.rows.pop(id, None)
+        return len(ids)
+
+    def create_archive_table(self, table, archive_table):
+        pass
+
+    def move_rows_by_ids(self, table, archive_table, ids, dependents=()):
+        for id in ids:
+            self.archive[id] = self.rows[id]
+        return self.delete_rows_by_ids(table, ids, dependents)
+
+
+def make_rows(num, new_ids=()):
+    return [{
+        "id": id,
+        "old": id not in new_ids
+    } for id in range(1, num + 1)]
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_acquire(self):
+        now = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        limiter = RateLimiter(10, clock=lambda: now[0], sleep=sleep)
+        limiter.acquire(20)
+        limiter.acquire(20)
+        limiter.acquire(5)
+        self.assertEqual([2.0, 2.0], sleeps)
+
+        # idle time is not saved up
+        now[0] += 100
+        limiter.acquire(20)
+        self.assertEqual([2.0, 2.0], sleeps)
+
+
+class TestArchiver(unittest.TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir)
+
+    def make_archiver(self, mode="delete", chunk_size=2):
+        return Archiver("test",
+                        "jobs",
+                        180,
+                        mode=mode,
+                        chunk_size=chunk_size,
+                        archive_dir=self.archive_dir)
+
+    def test_delete_in_chunks(self):
+        data_handler = MockDataHandler(make_rows(5, new_ids=[3]))
+        self.assertEqual(4, self.make_archiver().run(data_handler))
+        self.assertEqual([[1, 2], [4, 5]], data_handler.deletes)
+        self.assertEqual([3], list(data_handler.rows))
+
+    def test_resume_from_checkpoint(self):
+        data_handler = MockDataHandler(make_rows(5, new_ids=[1]))
+        self.assertEqual(2, self.make_archiver().run(data_handler,
+                                                     max_chunks=1))
+
+        # a new archiver, e.g. after restart, starts after id 3. Row 1
+        # becomes old meanwhile and is left to the next pass
+        data_handler.rows[1]["old"] = True
+        archiver = self.make_archiver()
+        self.assertEqual(3, archiver.checkpoint.last_id)
+        self.assertEqual(2, archiver.run(data_handler))
+        self.assertEqual([[2, 3], [4, 5]], data_handler.deletes)
+        self.assertEqual(0, archiver.checkpoint.last_id)
+
+        self.assertEqual(1, archiver.run(data_handler))
+        self.assertEqual({}, data_handler.rows)
+
+    def test_move_to_table(self):
+        data_handler = MockDataHandler(make_rows(3))
+        self.make_archiver(mode="table").run(data_handler)
+        self.assertEqual([1, 2, 3], sorted(data_handler.archive))
+        self.assertEqual({}, data_handler.rows)
+
+    def test_export_to_file(self):
+        data_handler = MockDataHandler(make_rows(3))
+        data_handler.fail_delete = True
+        archiver = self.make_archiver(mode="file")
+        with self.assertRaises(RuntimeError):
+            archiver.run(data_handler)
+        self.assertEqual([1, 2], archiver.checkpoint.pending)
+
+        # exported rows are deleted without exporting them again
+        data_handler.fail_delete = False
+        archiver = self.make_archiver(mode="file")
+        self.assertEqual(1, archiver.run(data_handler))
+        self.assertEqual([[1, 2], [3]], data_handler.deletes)
+        self.assertEqual({}, data_handler.rows)
+
+        with gzip.open(archiver.archive_file_path(), "rt") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([1, 2, 3], [row["id"] for row in rows])
+
+    def test_dependents_deleted_with_rows(self):
+        data_handler = MockDataHandler(make_rows(2))
+        dependents = [("endpoints", "jobId", "jobId")]
+        Archiver("test",
+                 "jobs",
+                 180,
+                 mode="table",
+                 chunk_size=2,
+                 dependents=dependents).run(data_handler)
+        self.assertEqual(dependents, data_handler.dependents)
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            self.make_archiver(mode="truncate")
+        with self.assertRaises(ValueError):
+            Archiver("test", "jobs", 180, mode="file")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+from unittest import TestCase
+from kubernetes.client import V1ObjectMeta, V1Pod, V1PodList, V1ListMeta
+
+from informer import Informer, label_of
+
+
+def make_pod(name, job_id, resource_version):
+    return V1Pod(metadata=V1ObjectMeta(name=name,
+                                       labels={"run": job_id},
+                                       resource_version=resource_version))
+
+
+class TestInformer(TestCase):
+    def setUp(self):
+        self.pods = []
+        self.informer = Informer(self.list_pods,
+                                 indexers={"run": label_of("run")},
+                                 name="test")
+        self.events = []
+        self.informer.add_event_handler(
+            lambda t, old, new: self.events.append(t))
+
+    def list_pods(self, **kwargs):
+        return V1PodList(items=list(self.pods),
+                         metadata=V1ListMeta(resource_version="10"))
+
+    def test_relist_builds_index(self):
+        self.pods = [
+            make_pod("job1-master", "job1", "1"),
+            make_pod("job1-worker", "job1", "2"),
+            make_pod("job2-master", "job2", "3"),
+        ]
+        self.assertEqual("10", self.informer.relist())
+
+        self.assertEqual(3, len(self.informer.list()))
+        self.assertEqual(
+            ["job1-master", "job1-worker"],
+            sorted(p.metadata.name
+                   for p in self.informer.by_index("run", "job1")))
+        self.assertEqual([], self.informer.by_index("run", "job3"))
+        self.assertEqual("job2-master",
+                         self.informer.get("job2-master").metadata.name)
+        self.assertEqual(["ADDED"] * 3, self.events)
+
+    def test_relist_removes_stale_objects(self):
+        self.pods = [
+            make_pod("job1-master", "job1", "1"),
+            make_pod("job2-master", "job2", "2"),
+        ]
+        self.informer.relist()
+
+        self.pods = [
+            make_pod("job1-master", "job1", "1"),
+            make_pod("job2-master", "job2", "4"),
+        ]
+        self.informer.relist()
+
+        self.assertEqual(["ADDED", "ADDED", "MODIFIED"], self.events)
+
+        self.pods = [make_pod("job1-master", "job1", "1")]
+        self.informer.relist()
+
+        self.assertIsNone(self.informer.get("job2-master"))
+        self.assertEqual([], self.informer.by_index("run", "job2"))
+        self.assertEqual("DELETED", self.events[-1])
+
+    def test_not_synced_before_start(self):
+        self.informer.relist()
+        # relist alone does not make the cache usable without watch thread
+        self.assertFalse(self.informer.has_synced())
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+import sys
+import os
+import threading
+import queue
+
+import unittest
+from unittest import mock
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
+
+from config import config
+config["datasource"] = "MySQL"
+from kubernetes.client import V1Container, V1ContainerStatus, V1ObjectMeta, \
+    V1Pod, V1PodSpec, V1PodStatus, V1Service, V1ServiceList
+from kubernetes.client.rest import ApiException
+from job_launcher import JobRole, PythonLauncher, RoleReadinessTracker
+
+
+def make_pod(name, uid="uid", restart_count=0, phase="Running", job_id="job"):
+    return V1Pod(metadata=V1ObjectMeta(name=name,
+                                       uid=uid,
+                                       labels={"run": job_id}),
+                 spec=V1PodSpec(containers=[V1Container(name=name)]),
+                 status=V1PodStatus(phase=phase,
+                                    container_statuses=[
+                                        V1ContainerStatus(
+                                            name=name,
+                                            image="image",
+                                            image_id="image_id",
+                                            ready=True,
+                                            restart_count=restart_count)
+                                    ]))
+
+
+class MockLauncher(object):
+    def __init__(self, ready_pods):
+        self.ready_pods = ready_pods
+        self.execs = []
+        self.lock = threading.Lock()
+        self.readiness_tracker = RoleReadinessTracker(pool_size=4)
+
+    def pod_exec(self, pod_name, exec_command, timeout=60):
+        with self.lock:
+            self.execs.append(pod_name)
+        if pod_name in self.ready_pods:
+            return [0, ""]
+        return [1, "not found"]
+
+
+class TestRoleReadinessTracker(unittest.TestCase):
+    def test_ready_pod_checked_once(self):
+        launcher = MockLauncher({"pod1"})
+        role = JobRole(launcher, "master", "pod1", make_pod("pod1"))
+
+        self.assertEqual("Running", role.status())
+        self.assertEqual("Running", role.status())
+        self.assertEqual(["pod1"], launcher.execs)
+
+    def test_not_ready_pod_checked_again(self):
+        launcher = MockLauncher(set())
+        role = JobRole(launcher, "master", "pod1", make_pod("pod1"))
+
+        self.assertEqual("Pending", role.status())
+        self.assertEqual("Pending", role.status())
+        self.assertEqual(["pod1", "pod1"], launcher.execs)
+
+    def test_restarted_pod_checked_again(self):
+        launcher = MockLauncher({"pod1"})
+        role = JobRole(launcher, "master", "pod1", make_pod("pod1"))
+        self.assertEqual("Running", role.status())
+
+        role.pod = make_pod("pod1", restart_count=1)
+        self.assertEqual("Running", role.status())
+        self.assertEqual(["pod1", "pod1"], launcher.execs)
+
+    def test_check_roles_in_batch(self):
+        launcher = MockLauncher({"pod1", "pod2"})
+        tracker = launcher.readiness_tracker
+        roles = [
+            JobRole(launcher, "master", "pod1", make_pod("pod1")),
+            JobRole(launcher, "worker", "pod2", make_pod("pod2")),
+            JobRole(launcher, "worker", "pod3", make_pod("pod3")),
+            JobRole(launcher, "worker", "pod4",
+                    make_pod("pod4", phase="Pending")),
+        ]
+
+        self.assertEqual(3, tracker.check_roles(roles))
+        self.assertEqual(["pod1", "pod2", "pod3"], sorted(launcher.execs))
+
+        # status in the same pass reuses results, even of not ready pod
+        self.assertEqual(["Running", "Running", "Pending", "Pending"],
+                         [role.status() for role in roles])
+        self.assertEqual(3, len(launcher.execs))
+
+        # only the pod not ready yet needs checking again in next pass
+        tracker.start_pass(["job"])
+        self.assertEqual(1, tracker.check_roles(roles))
+        self.assertEqual(["Running", "Running", "Pending", "Pending"],
+                         [role.status() for role in roles])
+        self.assertEqual(4, len(launcher.execs))
+
+        tracker.on_pod_event("DELETED", roles[0].pod, None)
+        self.assertFalse(tracker.is_known_ready(roles[0].pod))
+        self.assertTrue(tracker.is_known_ready(roles[1].pod))
+
+    def test_pods_of_jobs_not_listed_forgotten(self):
+        launcher = MockLauncher({"pod1", "pod2"})
+        tracker = launcher.readiness_tracker
+        roles = [
+            JobRole(launcher, "master", "pod1", make_pod("pod1",
+                                                         job_id="job1")),
+            JobRole(launcher, "master", "pod2", make_pod("pod2",
+                                                         job_id="job2")),
+        ]
+        tracker.start_pass(["job1", "job2"])
+        self.assertEqual(2, tracker.check_roles(roles))
+
+        tracker.start_pass(["job2"])
+        self.assertEqual(["pod2"], list(tracker.ready.keys()))
+
+
+class MockProcess(object):
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.name = "worker"
+        self.exitcode = None if alive else 1
+
+    def is_alive(self):
+        return self.alive
+
+
+def make_python_launcher():
+    # skip __init__, which loads kube config
+    launcher = PythonLauncher.__new__(PythonLauncher)
+    launcher.concurrency = 1
+    launcher.executor = None
+    launcher.executor_pid = None
+    launcher.namespace = "default"
+    launcher.pretty = ""
+    launcher.pod_informer = None
+    launcher.queue = queue.Queue()
+    launcher.done_queue = queue.Queue()
+    launcher.in_flight = {}
+    launcher.deferred = {}
+    launcher.worker_tasks = {}
+    launcher.task_timeout = 600
+    launcher.processes = [MockProcess()]
+    return launcher
+
+
+class TestPythonLauncher(unittest.TestCase):
+    def get_queued(self, launcher):
+        func_names = []
+        while not launcher.queue.empty():
+            func_name, job_id, args, kwargs = launcher.queue.get()
+            func_names.append((func_name, job_id))
+        return func_names
+
+    def test_task_of_job_in_flight_not_enqueued(self):
+        launcher = make_python_launcher()
+        self.assertTrue(launcher.submit_job({"jobId": "job1"}))
+        self.assertFalse(launcher.submit_job({"jobId": "job1"}))
+        self.assertTrue(launcher.submit_job({"jobId": "job2"}))
+        self.assertEqual(2, launcher.queue.qsize())
+
+        # job1 done, job2 still running
+        launcher.done_queue.put((0, "job1", True))
+        launcher.collect_done_tasks()
+        self.assertEqual(["job2"], list(launcher.in_flight.keys()))
+
+        launcher.kill_job("job1", "paused")
+        self.assertFalse(launcher.kill_job("job1"))
+        self.assertEqual([("submit_job", "job1"), ("submit_job", "job2"),
+                          ("kill_job", "job1")], self.get_queued(launcher))
+
+    def test_kill_deferred_behind_submit(self):
+        launcher = make_python_launcher()
+        launcher.submit_job({"jobId": "job1"})
+        self.assertTrue(launcher.kill_job("job1", "paused"))
+        self.assertFalse(launcher.submit_job({"jobId": "job1"}))
+        self.assertEqual([("submit_job", "job1")], self.get_queued(launcher))
+
+        launcher.done_queue.put((0, "job1", True))
+        launcher.collect_done_tasks()
+        self.assertEqual([("kill_job", "job1")], self.get_queued(launcher))
+        self.assertEqual(["job1"], list(launcher.in_flight.keys()))
+        self.assertEqual({}, launcher.deferred)
+
+    def test_timed_out_task_forgotten(self):
+        launcher = make_python_launcher()
+        launcher.submit_job({"jobId": "job1"})
+        enqueue_time, func_name = launcher.in_flight["job1"]
+        launcher.in_flight["job1"] = (enqueue_time - launcher.task_timeout -
+                                      1, func_name)
+        launcher.collect_done_tasks()
+        self.assertEqual({}, launcher.in_flight)
+
+    def test_dead_worker_restarted(self):
+        launcher = make_python_launcher()
+        launcher.processes = [MockProcess(), MockProcess(alive=False)]
+        started = []
+        launcher._start_worker = started.append
+        launcher.collect_done_tasks()
+        self.assertEqual([1], started)
+
+    def test_task_of_dead_worker_done(self):
+        launcher = make_python_launcher()
+        launcher.submit_job({"jobId": "job1"})
+        launcher.submit_job({"jobId": "job2"})
+        launcher.done_queue.put((0, "job1", False))
+        launcher.done_queue.put((1, "job2", False))
+        launcher.processes = [MockProcess(), MockProcess(alive=False)]
+        launcher._start_worker = lambda i: None
+        launcher.collect_done_tasks()
+        self.assertEqual(["job1"], list(launcher.in_flight.keys()))
+        self.assertEqual({0: "job1"}, launcher.worker_tasks)
+
+    def test_map_keeps_order(self):
+        launcher = make_python_launcher()
+        self.assertEqual([1, 4, 9], launcher._map(lambda x: x * x, [1, 2, 3]))
+
+        launcher.concurrency = 4
+        try:
+            self.assertEqual(list(range(0, 20, 2)),
+                             launcher._map(lambda x: x * 2, list(range(10))))
+            with self.assertRaises(ZeroDivisionError):
+                launcher._map(lambda x: 1 / x, [1, 0, 2])
+        finally:
+            launcher.executor.shutdown()
+
+    def test_delete_job_reports_errors_per_resource(self):
+        launcher = make_python_launcher()
+        launcher.concurrency = 4
+        calls = []
+        lock = threading.Lock()
+
+        def call(name, fail=False):
+            def fn(*args, **kwargs):
+                with lock:
+                    calls.append((name, kwargs.get("name")))
+                if fail:
+                    raise ApiException(status=500)
+                if name == "list_service":
+                    return V1ServiceList(items=[
+                        V1Service(metadata=V1ObjectMeta(name="svc%d" % i))
+                        for i in range(3)
+                    ])
+
+            return fn
+
+        launcher.k8s_CoreAPI = mock.Mock(
+            delete_collection_namespaced_pod=call("pods"),
+            delete_collection_namespaced_config_map=call("configmaps"),
+            delete_collection_namespaced_secret=call("secrets", fail=True),
+            list_namespaced_service=call("list_service"),
+            delete_namespaced_service=call("service"))
+        launcher.k8s_AppsAPI = mock.Mock(
+            delete_collection_namespaced_deployment=call("deployments"))
+
+        try:
+            errors = launcher.delete_job("job1", force=True)
+        finally:
+            launcher.executor.shutdown()
+
+        self.assertEqual(["Delete secrets failed: run=job1"],
+                         [e["message"] for e in errors])
+        self.assertEqual([("configmaps", None), ("deployments", None),
+                          ("list_service", None), ("pods", None),
+                          ("secrets", None), ("service", "svc0"),
+                          ("service", "svc1"), ("service", "svc2")],
+                         sorted(calls))
+
+    def test_forced_delete_job_skips_grace_period(self):
+        for force, grace_period_seconds in [(False, None), (True, 0)]:
+            launcher = make_python_launcher()
+            launcher.k8s_CoreAPI = mock.Mock()
+            launcher.k8s_CoreAPI.list_namespaced_service.return_value = \
+                V1ServiceList(items=[])
+            launcher.k8s_AppsAPI = mock.Mock()
+            self.assertEqual([], launcher.delete_job("job1", force=force))
+
+            for fn in [
+                    launcher.k8s_CoreAPI.delete_collection_namespaced_pod,
+                    launcher.k8s_AppsAPI.
+                    delete_collection_namespaced_deployment
+            ]:
+                self.assertEqual(grace_period_seconds,
+                                 fn.call_args[1]["grace_period_seconds"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,9 @@
 import sys
 import os
 import copy
+import datetime
+import json
+import sqlite3
 
 import unittest
 
@@ -13,8 +16,14 @@ config["datasource"] = "MySQL"
 from cluster_resource import ClusterResource
 from job_manager import discount_cluster_resource, \
     get_cluster_schedulable as get_cluster_schedulable_from_reserved, \
-    mark_schedulable_non_preemptable_jobs, \
-    is_version_satisified
+    mark_schedulable_non_preemptable_jobs, get_node_frees, \
+    is_version_satisified, JobsInfoCache, JobStatusDetailWriter, \
+    JobChangeFeed, JobStateLatencyRecorder, job_state_change_histogram, \
+    ClusterStatusReader, make_job_info, get_jobs_priority_dict, JobTimeRecord
+from job_params_util import get_job_resource_columns
+from common import base64encode
+from SQLiteDataHandler import DataHandler as SQLiteDataHandler, \
+    MIN_SQLITE_VERSION
 
 
 def get_cluster_schedulable_from_unschedulable(cluster_status):
@@ -237,5 +246,500 @@ class TestJobManager(unittest.TestCase):
         self.assertFalse(is_version_satisified("0", "1"))
 
 
+def make_node_status(name, gpu_used, sku="sku"):
+    return {
+        "name": name,
+        "unschedulable": False,
+        "gpu_allocatable": {sku: 4},
+        "gpu_used": {sku: gpu_used},
+        "cpu_allocatable": {sku: 24},
+        "cpu_used": {sku: gpu_used},
+        "memory_allocatable": {sku: 100 * 2**30},
+        "memory_used": {sku: gpu_used * 2**30},
+    }
+
+
+def make_backfill_job_info(job_id, gpu, status="queued", sku="sku"):
+    return {
+        "job": {
+            "vcName": "platform",
+            "jobId": job_id,
+            "jobStatus": status,
+        },
+        "jobId": job_id,
+        "job_resource": ClusterResource(params={
+            "cpu": {sku: gpu},
+            "memory": {sku: gpu * 2**30},
+            "gpu": {sku: gpu},
+        }),
+        "preemptionAllowed": False,
+        "allowed": False,
+        "sort_key": job_id,
+    }
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        # 11 of 16 gpus are free
+        self.cluster_status = {
+            "node_status": [
+                make_node_status("node1", 3),
+                make_node_status("node2", 1),
+                make_node_status("node3", 1),
+                make_node_status("node4", 0),
+            ]
+        }
+        self.schedulable = ClusterResource(params={
+            "cpu": {"sku": 96 - 5},
+            "memory": {"sku": (400 - 5) * 2**30},
+            "gpu": {"sku": 11},
+        })
+        self.jobs_info = [
+            make_backfill_job_info("big", 12),
+            make_backfill_job_info("small1", 1),
+            make_backfill_job_info("small2", 1),
+        ]
+
+    def mark(self, node_frees):
+        cluster_schedulable = copy.deepcopy(self.schedulable)
+        vc_schedulables = {"platform": copy.deepcopy(self.schedulable)}
+        mark_schedulable_non_preemptable_jobs(self.jobs_info,
+                                              cluster_schedulable,
+                                              vc_schedulables, node_frees)
+        return [job_info["allowed"] for job_info in self.jobs_info]
+
+    def test_fifo_starves_head_job(self):
+        self.assertEqual([False, True, True], self.mark(None))
+
+    def test_backfill_only_unreserved(self):
+        node_frees = get_node_frees(self.cluster_status)
+        # node4, node3 and node2 hold 10 gpus for big, only 1 gpu left
+        self.assertEqual([False, True, False], self.mark(node_frees))
+        self.assertEqual({"sku": 10}, self.jobs_info[0]["reserved"].gpu.res)
+
+    def test_no_reservation_for_job_never_fitting(self):
+        self.jobs_info[0] = make_backfill_job_info("big", 20)
+        node_frees = get_node_frees(self.cluster_status)
+        self.assertEqual([False, True, True], self.mark(node_frees))
+        self.assertIsNone(self.jobs_info[0].get("reserved"))
+
+    def test_unschedulable_node_not_reserved(self):
+        self.cluster_status["node_status"][3]["unschedulable"] = True
+        node_frees = get_node_frees(self.cluster_status)
+        self.assertEqual(["node1", "node2", "node3"], sorted(node_frees))
+        # the 3 remaining nodes are all reserved, holding 7 free gpus
+        self.assertEqual([False, True, True], self.mark(node_frees))
+        self.assertEqual({"sku": 7}, self.jobs_info[0]["reserved"].gpu.res)
+
+
+def make_job(job_id, status, last_updated, gpu=1, preemption_allowed=False):
+    job_params = {
+        "jobId": job_id,
+        "resourcegpu": gpu,
+        "preemptionAllowed": preemption_allowed,
+    }
+    return {
+        "jobId": job_id,
+        "vcName": "platform",
+        "jobStatus": status,
+        "jobParams": base64encode(json.dumps(job_params)),
+        "lastUpdated": datetime.datetime.fromtimestamp(last_updated),
+    }
+
+
+class TestJobsInfoCache(unittest.TestCase):
+    def test_update(self):
+        cache = JobsInfoCache()
+        jobs = [
+            make_job("job1", "queued", 1000),
+            make_job("job2", "running", 1001),
+            make_job("job3", "queued", 999, preemption_allowed=True),
+            make_job("job4", "finished", 998),
+        ]
+        jobs_info = cache.update(jobs, {})
+        self.assertEqual(["job2", "job1", "job3"],
+                         [job_info["jobId"] for job_info in jobs_info])
+        resource = jobs_info[0]["job_resource"]
+
+        # unchanged job keeps parsed resource, but sees the latest job dict
+        jobs[1] = dict(jobs[1])
+        jobs[1]["jobStatusDetail"] = "detail"
+        jobs_info[0]["allowed"] = True
+        jobs_info = cache.update(jobs, {})
+        self.assertIs(resource, jobs_info[0]["job_resource"])
+        self.assertEqual("detail", jobs_info[0]["job"]["jobStatusDetail"])
+        self.assertFalse(jobs_info[0]["allowed"])
+
+        # priority change reorders without reparsing
+        jobs_info = cache.update(jobs, {"job3": 200})
+        self.assertEqual(["job2", "job1", "job3"],
+                         [job_info["jobId"] for job_info in jobs_info])
+        jobs[0] = make_job("job1", "queued", 1000, gpu=2)
+        jobs[2] = make_job("job3", "queued", 1002, preemption_allowed=False)
+        jobs_info = cache.update(jobs, {"job3": 200})
+        self.assertEqual(["job2", "job3", "job1"],
+                         [job_info["jobId"] for job_info in jobs_info])
+        # job1 is reparsed though its lastUpdated and status did not change,
+        # e.g. scaled
+        self.assertEqual(2, jobs_info[2]["job_resource"].gpu.to_dict()[""])
+
+        # so are resource columns
+        jobs[0] = dict(jobs[0], **get_job_resource_columns({
+            "jobId": "job1",
+            "resourcegpu": 3
+        }))
+        jobs_info = cache.update(jobs, {"job3": 200})
+        self.assertEqual(3, jobs_info[2]["job_resource"].gpu.to_dict()[""])
+
+        # finished jobs drop out
+        jobs = jobs[:2]
+        jobs[1] = make_job("job2", "finished", 1003)
+        jobs_info = cache.update(jobs, {})
+        self.assertEqual(["job1"],
+                         [job_info["jobId"] for job_info in jobs_info])
+        self.assertEqual(1, len(cache.sorted_keys))
+
+
+class TestJobResourceColumns(unittest.TestCase):
+    def test_make_job_info(self):
+        for preemption_allowed in [False, True]:
+            job = make_job("job1", "queued", 1000, 2, preemption_allowed)
+            job_params = {
+                "jobId": "job1",
+                "resourcegpu": 2,
+                "preemptionAllowed": preemption_allowed,
+            }
+            job_with_columns = dict(job,
+                                    jobParams=None,
+                                    **get_job_resource_columns(job_params))
+            expected = make_job_info(job, {})
+            actual = make_job_info(job_with_columns, {})
+            self.assertEqual(expected["job_resource"], actual["job_resource"])
+            self.assertEqual(expected["sort_key"], actual["sort_key"])
+            self.assertEqual(preemption_allowed, actual["preemptionAllowed"])
+
+    def test_jobs_priority_dict(self):
+        jobs = [make_job("job1", "queued", 1000)]
+        jobs[0]["priority"] = 200
+        self.assertEqual({"job1": 200}, get_jobs_priority_dict(jobs))
+
+
+class MockDataHandler(object):
+    def __init__(self):
+        self.batches = []
+
+    def batch_update_text_fields_for_jobs(self, fields_by_job):
+        self.batches.append(fields_by_job)
+        return True
+
+
+class TestJobStatusDetailWriter(unittest.TestCase):
+    def test_flush_only_changed(self):
+        writer = JobStatusDetailWriter()
+        data_handler = MockDataHandler()
+        job1 = make_job("job1", "queued", 1000)
+        job2 = make_job("job2", "queued", 1000)
+
+        writer.set_detail(job1, [{"message": "a"}])
+        writer.set_detail(job2, [{"message": "b"}])
+        self.assertEqual(2, writer.flush(data_handler))
+        self.assertEqual(["job1", "job2"], sorted(data_handler.batches[0]))
+
+        writer.set_detail(job1, [{"message": "a"}])
+        writer.set_detail(job2, [{"message": "c"}])
+        self.assertEqual(1, writer.flush(data_handler))
+        self.assertEqual(["job2"], list(data_handler.batches[1]))
+
+        # job requeued after a status change needs the detail rewritten
+        job1 = make_job("job1", "queued", 1001)
+        writer.set_detail(job1, [{"message": "a"}])
+        self.assertEqual(1, writer.flush(data_handler,
+                                         active_job_ids={"job1"}))
+        self.assertEqual(["job1"], list(writer.last_written))
+
+
+class MockJobTable(object):
+    def __init__(self):
+        self.jobs = {}
+        self.now = datetime.datetime(2020, 1, 1)
+        self.full_listings = 0
+        self.modified_time_exists = True
+        self.fail = False
+
+    def set_job(self, job_id, status):
+        self.now += datetime.timedelta(seconds=10)
+        job = make_job(job_id, status, 1000)
+        job["jobTime"] = job["lastUpdated"]
+        job["jobDescription"] = "large k8s spec"
+        job["modifiedTime"] = self.now
+        self.jobs[job_id] = job
+
+    def has_job_modified_time(self):
+        return self.modified_time_exists
+
+    def get_job_modified_watermark(self):
+        return self.now
+
+    def GetJobList(self,
+                   user_name,
+                   vc_name,
+                   num=None,
+                   status=None,
+                   fields=None,
+                   none_on_failure=False):
+        self.full_listings += 1
+        if self.fail:
+            return None if none_on_failure else []
+        statuses = status.split(",")
+        return [
+            self.project(job, fields)
+            for job in self.jobs.values()
+            if job["jobStatus"] in statuses
+        ]
+
+    def get_jobs_modified_since(self, since, fields=None):
+        return [
+            self.project(job, fields + ["jobStatus", "modifiedTime"])
+            for job in self.jobs.values()
+            if job["modifiedTime"] >= since
+        ]
+
+    @staticmethod
+    def project(job, fields):
+        return {field: job[field] for field in fields if field in job}
+
+
+class TestJobChangeFeed(unittest.TestCase):
+    def test_get_jobs(self):
+        table = MockJobTable()
+        table.set_job("job1", "running")
+        table.set_job("job2", "queued")
+        feed = JobChangeFeed(["running", "scheduling"])
+
+        self.assertEqual(["job1"],
+                         [job["jobId"] for job in feed.get_jobs(table)])
+        self.assertEqual(1, table.full_listings)
+
+        table.set_job("job2", "scheduling")
+        table.set_job("job1", "finished")
+        table.set_job("job3", "running")
+        self.assertEqual(["job2", "job3"],
+                         sorted(job["jobId"] for job in feed.get_jobs(table)))
+        self.assertEqual(1, table.full_listings)
+        self.assertEqual(table.now, feed.watermark)
+
+        # only fields used by job manager are read
+        self.assertTrue(
+            all("jobDescription" not in job for job in feed.jobs.values()))
+
+        # resync when change feed is not available
+        table.get_jobs_modified_since = lambda since, fields: None
+        self.assertEqual(2, len(feed.get_jobs(table)))
+        self.assertEqual(2, table.full_listings)
+
+    def test_failed_resync_keeps_jobs(self):
+        table = MockJobTable()
+        table.set_job("job1", "running")
+        feed = JobChangeFeed(["running"], resync_period=0)
+        self.assertEqual(1, len(feed.get_jobs(table)))
+        watermark = feed.watermark
+
+        table.fail = True
+        table.set_job("job2", "running")
+        self.assertEqual(["job1"],
+                         [job["jobId"] for job in feed.get_jobs(table)])
+        self.assertEqual(watermark, feed.watermark)
+
+        table.fail = False
+        self.assertEqual(2, len(feed.get_jobs(table)))
+        self.assertEqual(table.now, feed.watermark)
+
+    def test_no_modified_time(self):
+        table = MockJobTable()
+        table.modified_time_exists = False
+        table.set_job("job1", "running")
+        feed = JobChangeFeed(["running"])
+
+        self.assertEqual(1, len(feed.get_jobs(table)))
+        table.set_job("job2", "running")
+        self.assertEqual(2, len(feed.get_jobs(table)))
+        self.assertEqual(2, table.full_listings)
+        self.assertIsNone(feed.watermark)
+
+    @unittest.skipIf(sqlite3.sqlite_version_info < MIN_SQLITE_VERSION,
+                     "sqlite is too old")
+    def test_watermark_of_data_handler(self):
+        config.setdefault("clusterId", "test")
+        config.setdefault("defalt_virtual_cluster_name", "platform")
+        with SQLiteDataHandler(database=":memory:") as data_handler:
+            # no job yet, MAX(modifiedTime) is NULL
+            feed = JobChangeFeed(["unapproved"])
+            self.assertEqual([], feed.get_jobs(data_handler))
+            self.assertIsInstance(feed.watermark, datetime.datetime)
+
+            self.assertTrue(
+                data_handler.AddJob({
+                    "jobId": "job1",
+                    "familyToken": "job1",
+                    "isParent": 1,
+                    "jobName": "job1",
+                    "userName": "user",
+                    "vcName": "vc",
+                    "jobType": "training",
+                    "jobtrainingtype": "RegularJob",
+                    "resourcegpu": 1,
+                }))
+            self.assertTrue(feed.apply_changes(data_handler))
+            self.assertEqual(["job1"], list(feed.jobs))
+            self.assertIsInstance(feed.watermark, datetime.datetime)
+
+
+class MockRedis(object):
+    def __init__(self):
+        self.hashes = {}
+        self.values = {}
+        self.ttls = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return MockRedisPipeline(self)
+
+    def hgetall(self, key):
+        self.round_trips += 1
+        return self._hgetall(key)
+
+    def get(self, key):
+        self.round_trips += 1
+        return self.values.get(key)
+
+    def _hgetall(self, key):
+        return {
+            k.encode("utf-8"): v.encode("utf-8")
+            for k, v in self.hashes.get(key, {}).items()
+        }
+
+
+class MockRedisPipeline(object):
+    def __init__(self, redis_conn):
+        self.redis_conn = redis_conn
+        self.commands = []
+
+    def hgetall(self, key):
+        self.commands.append(lambda: self.redis_conn._hgetall(key))
+
+    def get(self, key):
+        self.commands.append(lambda: self.redis_conn.values.get(key))
+
+    def hset(self, key, field, val):
+        self.commands.append(lambda: self.redis_conn.hashes.setdefault(
+            key, {}).update({field: val}))
+
+    def expire(self, key, ttl):
+        self.commands.append(lambda: self.redis_conn.ttls.update({key: ttl}))
+
+    def execute(self):
+        self.redis_conn.round_trips += 1
+        return [command() for command in self.commands]
+
+
+def get_histogram_count(state):
+    for metric in job_state_change_histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") and \
+                    sample.labels["current_state"] == state:
+                return sample.value
+    return 0
+
+
+class TestJobStateLatencyRecorder(unittest.TestCase):
+    def test_batched_round_trips(self):
+        redis_conn = MockRedis()
+        recorder = JobStateLatencyRecorder(redis_conn, ttl=100)
+        t0 = datetime.datetime(2020, 1, 1)
+
+        recorder.load(["job1", "job2"])
+        recorder.update("job1", "created", t0)
+        recorder.update("job2", "created", t0)
+        recorder.flush()
+        self.assertEqual(2, redis_conn.round_trips)
+        self.assertEqual({"job_time_job1": 100, "job_time_job2": 100},
+                         redis_conn.ttls)
+
+        count = get_histogram_count("approved")
+        recorder.load(["job1", "job2"])
+        recorder.update("job1", "approved",
+                        t0 + datetime.timedelta(seconds=30))
+        recorder.update("job1", "approved",
+                        t0 + datetime.timedelta(seconds=60))
+        recorder.flush()
+        self.assertEqual(4, redis_conn.round_trips)
+        self.assertEqual(count + 1, get_histogram_count("approved"))
+        self.assertEqual(["a", "c"], sorted(redis_conn.hashes["job_time_job1"]))
+
+        # nothing changed, nothing written
+        recorder.load(["job1"])
+        recorder.update("job1", "approved")
+        recorder.flush()
+        self.assertEqual(5, redis_conn.round_trips)
+
+        # job not loaded in batch is read on demand
+        recorder.update("job3", "created", t0)
+        self.assertEqual(7, redis_conn.round_trips)
+
+    def test_legacy_record(self):
+        redis_conn = MockRedis()
+        recorder = JobStateLatencyRecorder(redis_conn, ttl=100)
+        t0 = datetime.datetime(2020, 1, 1)
+        redis_conn.values["job_status_job1"] = json.dumps(
+            JobTimeRecord(create_time=t0).to_map()).encode("utf-8")
+
+        count = get_histogram_count("approved")
+        recorder.load(["job1"])
+        recorder.update("job1", "approved",
+                        t0 + datetime.timedelta(seconds=30))
+        recorder.flush()
+        self.assertEqual(count + 1, get_histogram_count("approved"))
+        self.assertEqual(["a", "c"], sorted(redis_conn.hashes["job_time_job1"]))
+
+        # read on demand falls back too
+        redis_conn.values["job_status_job2"] = \
+            redis_conn.values["job_status_job1"]
+        self.assertEqual(t0, recorder.get("job2").create_time)
+
+
+class MockClusterStatusStore(object):
+    def __init__(self):
+        self.version = 1
+        self.status = {"node_status": []}
+        self.fetches = 0
+
+    def GetLatestClusterStatus(self, known_version=None):
+        if known_version is not None and known_version == self.version:
+            return None, None, self.version
+        self.fetches += 1
+        return copy.deepcopy(self.status), None, self.version
+
+
+class TestClusterStatusReader(unittest.TestCase):
+    def test_get(self):
+        store = MockClusterStatusStore()
+        reader = ClusterStatusReader()
+
+        self.assertEqual({"node_status": []}, reader.get(store))
+        self.assertEqual({"node_status": []}, reader.get(store))
+        self.assertEqual(1, store.fetches)
+
+        store.version = 2
+        store.status = {"node_status": [{"name": "node1"}]}
+        self.assertEqual(store.status, reader.get(store))
+        self.assertEqual(2, store.fetches)
+
+        # status only in legacy table has no version, always fetched
+        store.version = None
+        reader.get(store)
+        reader.get(store)
+        self.assertEqual(4, store.fetches)
+
+
 if __name__ == '__main__':
     unittest.main()
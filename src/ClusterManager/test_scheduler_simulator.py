@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+from unittest import TestCase
+
+from scheduler_simulator import Simulator, SimJob, make_synthetic_cluster, \
+    percentile
+
+
+class TestSchedulerSimulator(TestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(5, percentile(list(range(1, 11)), 50))
+        self.assertEqual(10, percentile(list(range(1, 11)), 99))
+
+    def run_jobs(self, policy):
+        nodes, vc_list = make_synthetic_cluster(num_nodes=2, num_vcs=2)
+        jobs = [
+            SimJob("job%d" % i,
+                   arrival=i * 10,
+                   duration=30,
+                   vc_name=vc_list[i % 2]["vcName"],
+                   user_name="user",
+                   sku=nodes[0].sku,
+                   gpu=4,
+                   cpu=4,
+                   memory=1024,
+                   preemption_allowed=False) for i in range(6)
+        ]
+        simulator = Simulator(nodes, vc_list, jobs, interval=10, policy=policy)
+        report = simulator.run(max_passes=100)
+
+        self.assertEqual(0, report["jobs_unfinished"])
+        self.assertEqual(6, report["jobs_submitted"])
+        self.assertEqual(0, report["jobs_preempted"])
+        self.assertEqual(6, len(simulator.queueing_delays))
+        self.assertTrue(0 < report["gpu_utilization"] <= 1)
+        self.assertTrue(report["decisions"] >= 6)
+        for job in simulator.jobs.values():
+            self.assertEqual("finished", job.status)
+        for node in nodes:
+            self.assertEqual(node.gpu, node.gpu_free)
+
+    def test_run(self):
+        self.run_jobs("fifo")
+
+    def test_run_backfill(self):
+        self.run_jobs("backfill")
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import copy
 import os
 import sys
 
@@ -7,6 +8,7 @@ from unittest import TestCase
 from cluster_status import ClusterStatus, ClusterStatusFactory
 from virtual_cluster_status import VirtualClusterStatus, \
     VirtualClusterStatusesFactory
+from resource_stat import Gpu
 from cluster_test_utils import BaseTestClusterSetup
 
 sys.path.append(
@@ -80,3 +82,24 @@ class TestVirtualClusterStatus(TestCase):
 
         t_vc_statuses = test_cluster.vc_statuses
         self.assertEqual(t_vc_statuses, vc_statuses)
+
+    def test_preemptable_pods(self):
+        test_cluster = BaseTestClusterSetup()
+        pods = copy.deepcopy(test_cluster.pods)
+        for pod in pods:
+            if pod.metadata.name == "pod1":
+                pod.metadata.labels["preemptionAllowed"] = "True"
+
+        cs = ClusterStatusFactory("", test_cluster.nodes, pods,
+                                  test_cluster.jobs).make()
+        vc_statuses = VirtualClusterStatusesFactory(
+            cs, test_cluster.vc_list).make()
+
+        # all vc statuses share one index of pods and jobs by vc
+        vc_index = vc_statuses["vc1"].vc_index
+        for vc_status in vc_statuses.values():
+            self.assertIs(vc_index, vc_status.vc_index)
+
+        self.assertEqual(Gpu({"m_type1": 1}),
+                         vc_statuses["vc1"].gpu_preemptable_used)
+        self.assertEqual(Gpu(), vc_statuses["vc2"].gpu_preemptable_used)
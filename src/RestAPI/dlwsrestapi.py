@@ -3,6 +3,7 @@ import sys
 import json
 import os
 import base64
+import hashlib
 import yaml
 import logging
 from logging.config import dictConfig
@@ -19,7 +20,9 @@ import JobRestAPIUtils
 from authorization import ResourceType, Permission, AuthorizationManager, ACLManager
 from config import config, global_vars
 import authorization
+import MySQLDataHandler
 from DataHandler import DataHandler
+from common import decode_job_cursor
 
 CONTENT_TYPE_LATEST = str("text/plain; version=0.0.4; charset=utf-8")
 
@@ -43,6 +46,20 @@ api = Api(app)
 verbose = True
 logger.info("Restful API started with config %s", config)
 
+# reads without writes go to read replicas configured, if any
+MySQLDataHandler.enable_replica_reads()
+
+
+@app.before_request
+def set_data_handler_session():
+    """Reads of a user go to primary for a while after the user writes"""
+    user_name = request.args.get("userName")
+    if user_name is None and request.method in ["POST", "PUT"]:
+        params = request.get_json(force=True, silent=True)
+        if isinstance(params, dict):
+            user_name = params.get("userName")
+    MySQLDataHandler.set_session(user_name)
+
 if "initAdminAccess" not in global_vars or not global_vars["initAdminAccess"]:
     logger.info("===========Init Admin Access===============")
     global_vars["initAdminAccess"] = True
@@ -102,6 +119,42 @@ def generate_response(result):
     return resp
 
 
+def get_etag_suffix(args):
+    """Digest of request args, so that different slices of the same cluster
+    status version have different ETags"""
+    key = json.dumps([request.path, args], sort_keys=True)
+    return hashlib.md5(key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_known_version(etag_suffix):
+    """Returns cluster status version in If-None-Match of the request if it
+    was issued for the same args, None otherwise"""
+    for etag in request.if_none_match.as_set(include_weak=True):
+        version, _, suffix = etag.partition("-")
+        if suffix == etag_suffix and version.isdigit():
+            return int(version)
+    return None
+
+
+def generate_versioned_response(result, version, etag_suffix):
+    # result is None only if version is still the one client knows
+    if result is None:
+        resp = Response(status=304)
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+    else:
+        resp = generate_response(result)
+    if version is not None:
+        resp.set_etag("%s-%s" % (version, etag_suffix))
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def get_fields(value):
+    if value is None or value == "":
+        return None
+    return set([field.strip() for field in value.split(",")])
+
+
 @api.resource("/PostJob")
 class PostJob(Resource):
     def post(self):
@@ -203,6 +256,8 @@ class ListJobsV2(Resource):
         self.get_parser.add_argument("vcName", required=True)
         self.get_parser.add_argument("jobOwner", required=True)
         self.get_parser.add_argument("num", type=int, default=20)
+        # meta.nextCursor of previous page, to get older finished jobs
+        self.get_parser.add_argument("cursor")
 
     def get(self):
         args = self.get_parser.parse_args()
@@ -210,9 +265,19 @@ class ListJobsV2(Resource):
         vc_name = args["vcName"]
         job_owner = args["jobOwner"]
         num = args["num"]
+        cursor = args["cursor"]
 
-        jobs = JobRestAPIUtils.get_job_list_v2(username, vc_name, job_owner,
-                                               num)
+        if cursor is not None:
+            try:
+                decode_job_cursor(cursor)
+            except ValueError:
+                return "Bad request, invalid cursor %s" % cursor, 400
+
+        jobs = JobRestAPIUtils.get_job_list_v2(username,
+                                               vc_name,
+                                               job_owner,
+                                               num,
+                                               cursor=cursor)
 
         for _, job_list in jobs.items():
             if isinstance(job_list, list):
@@ -517,6 +582,47 @@ class GetClusterStatus(Resource):
         return generate_response(cluster_status)
 
 
+class ClusterStatusSlice(Resource):
+    """Cluster status, or a vc's status if vcName is given. Supports field
+    selection by comma separated fields, and node_status pagination by
+    nodeOffset and nodeLimit. Responses carry an ETag of the cluster status
+    version, 304 is returned if it has not changed since If-None-Match."""
+    def __init__(self):
+        self.get_parser = reqparse.RequestParser()
+        self.get_parser.add_argument("userName", required=True)
+        self.get_parser.add_argument("vcName")
+        self.get_parser.add_argument("fields")
+        self.get_parser.add_argument("nodeOffset", type=int, default=0)
+        self.get_parser.add_argument("nodeLimit", type=int)
+
+    def get(self):
+        args = self.get_parser.parse_args()
+        etag_suffix = get_etag_suffix(args)
+        known_version = get_known_version(etag_suffix)
+        ret, version, status_code = JobRestAPIUtils.get_cluster_status_slice(
+            args["userName"],
+            vc_name=args["vcName"],
+            fields=get_fields(args["fields"]),
+            node_offset=args["nodeOffset"],
+            node_limit=args["nodeLimit"],
+            known_version=known_version)
+        if status_code != 200:
+            return ret, status_code
+        return generate_versioned_response(ret, version, etag_suffix)
+
+
+@api.resource("/GetClusterStatusV2")
+class GetClusterStatusV2(ClusterStatusSlice):
+    pass
+
+
+@api.resource("/GetVCStatus")
+class GetVCStatus(ClusterStatusSlice):
+    def __init__(self):
+        super(GetVCStatus, self).__init__()
+        self.get_parser.replace_argument("vcName", required=True)
+
+
 @api.resource("/AddUser")
 class AddUser(Resource):
     def __init__(self):
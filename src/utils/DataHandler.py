@@ -5,12 +5,18 @@ import logging
 
 logger = logging.getLogger(__file__)
 
+# MySQLDataHandler pools connections itself, former pooled data handlers
+# are aliases of it
 if "datasource" in config and config["datasource"] == "MySQL":
     from MySQLDataHandler import DataHandler
-elif "datasource" in config and config["datasource"] == "MySQLPool":
-    from MySQLPoolDataHandler import DataHandler
-elif "datasource" in config and config["datasource"] == "MySQLDBUtilsPool":
-    from MySQLDBUtilsPoolDataHandler import DataHandler
+elif "datasource" in config and config["datasource"] in [
+        "MySQLPool", "MySQLDBUtilsPool"
+]:
+    logger.warning("datasource %s is deprecated, use MySQL",
+                   config["datasource"])
+    from MySQLDataHandler import DataHandler
+elif "datasource" in config and config["datasource"] == "SQLite":
+    from SQLiteDataHandler import DataHandler
 else:
     logger.error("configured database not supported")
 
@@ -46,6 +46,12 @@ ACTIVE_STATUS = {
     "pausing",
     "paused",
 }
+# columns shown by ListJobs, large jobDescription and jobMeta are not read
+LIST_JOB_FIELDS = [
+    "jobId", "jobName", "userName", "vcName", "jobStatus", "jobStatusDetail",
+    "jobType", "jobDescriptionPath", "jobTime", "endpoints", "jobParams",
+    "errorMsg"
+]
 has_access = AuthorizationManager.HasAccess
 VC = ResourceType.VC
 ADMIN = Permission.Admin
@@ -327,26 +333,25 @@ def SubmitJob(jobParamsJsonStr):
                 ret["error"] = "Cannot schedule tensorboard job."
 
     if "error" not in ret:
-        if dataHandler.AddJob(jobParams):
+        priority = None
+        if "jobPriority" in jobParams:
+            priority = DEFAULT_JOB_PRIORITY
+            try:
+                priority = int(jobParams["jobPriority"])
+            except Exception as e:
+                pass
+
+            permission = Permission.User
+            if AuthorizationManager.HasAccess(jobParams["userName"],
+                                              ResourceType.VC,
+                                              jobParams["vcName"].strip(),
+                                              Permission.Admin):
+                permission = Permission.Admin
+
+            priority = adjust_job_priority(priority, permission)
+
+        if dataHandler.AddJob(jobParams, priority=priority):
             ret["jobId"] = jobParams["jobId"]
-            if "jobPriority" in jobParams:
-                priority = DEFAULT_JOB_PRIORITY
-                try:
-                    priority = int(jobParams["jobPriority"])
-                except Exception as e:
-                    pass
-
-                permission = Permission.User
-                if AuthorizationManager.HasAccess(jobParams["userName"],
-                                                  ResourceType.VC,
-                                                  jobParams["vcName"].strip(),
-                                                  Permission.Admin):
-                    permission = Permission.Admin
-
-                priority = adjust_job_priority(priority, permission)
-
-                job_priorities = {jobParams["jobId"]: priority}
-                dataHandler.update_job_priority(job_priorities)
         else:
             ret["error"] = "Cannot schedule job. Cannot add job into database."
 
@@ -354,18 +359,31 @@ def SubmitJob(jobParamsJsonStr):
     return ret
 
 
+def merge_job_endpoints(data_handler, jobs):
+    """Sets endpoints of jobs to json of endpoints in endpoints table merged
+    into the legacy endpoints column"""
+    endpoints_by_job = data_handler.get_endpoints_for_jobs(
+        [job["jobId"] for job in jobs])
+    for job in jobs:
+        endpoints = endpoints_by_job.get(job["jobId"])
+        if endpoints is None:
+            continue
+        if job.get("endpoints"):
+            endpoints = dict(json.loads(job["endpoints"]), **endpoints)
+        job["endpoints"] = json.dumps(endpoints)
+
+
 def get_job_list(username, vc_name, job_owner, num=20):
     try:
         with DataHandler() as data_handler:
             if job_owner == "all" and \
                     has_access(username, VC, vc_name, COLLABORATOR):
-                jobs = data_handler.get_union_job_list("all", vc_name, num,
-                                                       ACTIVE_STATUS)
+                jobs = data_handler.get_union_job_list(
+                    "all", vc_name, num, ACTIVE_STATUS, LIST_JOB_FIELDS)
             else:
-                jobs = data_handler.get_union_job_list(username, vc_name, num,
-                                                       ACTIVE_STATUS)
-            for job in jobs:
-                job.pop('jobMeta', None)
+                jobs = data_handler.get_union_job_list(
+                    username, vc_name, num, ACTIVE_STATUS, LIST_JOB_FIELDS)
+            merge_job_endpoints(data_handler, jobs)
     except:
         logger.exception("Exception in getting job list for username %s",
                          username,
@@ -375,16 +393,22 @@ def get_job_list(username, vc_name, job_owner, num=20):
     return jobs
 
 
-def get_job_list_v2(username, vc_name, job_owner, num=None):
+def get_job_list_v2(username, vc_name, job_owner, num=None, cursor=None):
     try:
         with DataHandler() as data_handler:
             if job_owner == "all" and \
                     has_access(username, VC, vc_name, COLLABORATOR):
-                jobs = data_handler.get_union_job_list_v2(
-                    "all", vc_name, num, ACTIVE_STATUS)
+                jobs = data_handler.get_union_job_list_v2("all",
+                                                          vc_name,
+                                                          num,
+                                                          ACTIVE_STATUS,
+                                                          cursor=cursor)
             else:
-                jobs = data_handler.get_union_job_list_v2(
-                    username, vc_name, num, ACTIVE_STATUS)
+                jobs = data_handler.get_union_job_list_v2(username,
+                                                          vc_name,
+                                                          num,
+                                                          ACTIVE_STATUS,
+                                                          cursor=cursor)
     except:
         logger.exception("Exception in getting job list v2 for username %s",
                          username,
@@ -458,8 +482,10 @@ def op_job(username, job_id, op):
 
     ret = False
     with DataHandler() as data_handler:
+        # status is read from primary, the update depends on it
         job = data_handler.GetJobTextFields(job_id,
-                                            ["userName", "vcName", "jobStatus"])
+                                            ["userName", "vcName", "jobStatus"],
+                                            max_staleness=0)
 
         if job is None:
             return ret
@@ -508,7 +534,7 @@ def scale_inference_job(username, job_id, resourcegpu):
     dataHandler = DataHandler()
     try:
         job = dataHandler.GetJobTextFields(
-            job_id, ["userName", "vcName", "jobParams"])
+            job_id, ["userName", "vcName", "jobParams"], max_staleness=0)
 
         if job is None:
             msg = "Job %s cannot be found in database" % job_id
@@ -530,8 +556,7 @@ def scale_inference_job(username, job_id, resourcegpu):
             return msg, 403
 
         job_params["resourcegpu"] = resourcegpu
-        dataHandler.UpdateJobTextFields({"jobId": job_id},
-                                        {"jobParams": base64encode(json.dumps(job_params))})
+        dataHandler.update_job_params(job_id, job_params)
         return "Success", 200
     except Exception as e:
         logger.exception("Scale inference job exception")
@@ -552,7 +577,7 @@ def _op_jobs_in_one_batch(username, job_ids, op, data_handler):
         "vcName",
         "jobStatus",
     ]
-    jobs = data_handler.get_fields_for_jobs(job_ids, fields)
+    jobs = data_handler.get_fields_for_jobs(job_ids, fields, max_staleness=0)
 
     result = {}
 
@@ -673,6 +698,8 @@ def GetJobDetail(userName, jobId):
                 userName, ResourceType.VC, jobs[0]["vcName"],
                 Permission.Collaborator):
             job = jobs[0]
+            endpoints = dataHandler.GetJobEndpoints(jobId)
+            job["endpoints"] = json.dumps(endpoints) if endpoints else None
             job["log"] = ""
             if "jobDescription" in job:
                 job.pop("jobDescription", None)
@@ -960,6 +987,84 @@ def get_vc(username, vc_name):
     return ret
 
 
+def get_status_slice(status, fields=None, node_offset=0, node_limit=None):
+    """Keeps only fields of status if fields is not None, and a page of
+    node_status from node_offset of at most node_limit nodes"""
+    if fields is not None:
+        status = {k: v for k, v in status.items() if k in fields}
+
+    node_status = status.get("node_status")
+    if isinstance(node_status, list):
+        node_offset = max(0, node_offset or 0)
+        if node_limit is None:
+            node_page = node_status[node_offset:]
+        else:
+            node_page = node_status[node_offset:node_offset + node_limit]
+        status["node_status"] = node_page
+        status["node_total"] = len(node_status)
+        status["node_offset"] = node_offset
+    return status
+
+
+def get_cluster_status_slice(username,
+                             vc_name=None,
+                             fields=None,
+                             node_offset=0,
+                             node_limit=None,
+                             known_version=None):
+    """Returns (status, version, status code) of the whole cluster if vc_name
+    is None, or of one vc otherwise, with node_status of the whole cluster.
+
+    Status is None if known_version is still the latest version, in which
+    case latest status is not read or decoded from DB at all. Version is None
+    if it is unknown, e.g. status is only in the legacy history table. Status
+    is an error message if status code is not 200: 404 if the vc does not
+    exist, 403 if it is not accessible to username, 503 if cluster status can
+    not be read or there is none yet.
+    """
+    vc = None
+    if vc_name is not None:
+        for item in getClusterVCs():
+            if item["vcName"] == vc_name:
+                vc = item
+                break
+        if vc is None:
+            return "VC %s not found" % vc_name, None, 404
+        if not has_access(username, VC, vc_name, USER):
+            msg = "Unauthorized access to VC %s by user %s" % \
+                (vc_name, username)
+            logger.error(msg)
+            return msg, None, 403
+
+    try:
+        with DataHandler() as data_handler:
+            cluster_status, last_updated_time, version = \
+                data_handler.GetLatestClusterStatus(known_version)
+    except:
+        logger.exception("Exception in getting cluster status for user %s",
+                         username)
+        cluster_status = version = None
+
+    if cluster_status is None:
+        if version is None:
+            return "Cluster status is not available", None, 503
+        return None, version, 200
+
+    if vc is None:
+        status = cluster_status
+        status.pop("vc_statuses", None)
+    else:
+        status = copy.deepcopy(vc)
+        status.update(cluster_status.get("vc_statuses", {}).get(vc_name, {}))
+        status["vc_name"] = vc_name
+        status["node_status"] = cluster_status.get("node_status")
+    status["last_updated_time"] = last_updated_time
+    status["version"] = version
+
+    return get_status_slice(status, fields, node_offset, node_limit), \
+        version, 200
+
+
 def get_node_status_simplified(node_status):
     if node_status is None:
         return None
@@ -1137,203 +1242,11 @@ def GetEndpoints(userName, jobId):
     dataHandler = DataHandler()
     ret = []
     try:
-        job = dataHandler.GetJobTextFields(jobId, ["userName", "vcName", "endpoints"])
-        if job is not None:
-            if job["userName"] == userName or AuthorizationManager.HasAccess(userName, ResourceType.VC, job["vcName"], Permission.Admin):
-                endpoints = {}
-                if job["endpoints"] is not None:
-                    endpoints = json.loads(job["endpoints"])
-                for [_, endpoint] in endpoints.items():
-                    epItem = {
-                        "id": endpoint["id"],
-                        "name": endpoint["name"],
-                        "username": endpoint["username"],
-                        "status": endpoint["status"],
-                        "hostNetwork": endpoint["hostNetwork"],
-                        "podName": endpoint["podName"],
-                        "domain": config["domain"],
-                    }
-                    if "podPort" in endpoint:
-                        epItem["podPort"] = endpoint["podPort"]
-                    if endpoint["status"] == "running":
-                        if endpoint["hostNetwork"]:
-                            port = int(endpoint["endpointDescription"]["spec"]["ports"][0]["port"])
-                        else:
-                            port = int(endpoint["endpointDescription"]["spec"]["ports"][0]["nodePort"])
-                        epItem["port"] = port
-                        if "nodeName" in endpoint:
-                            epItem["nodeName"] = endpoint["nodeName"]
-                    ret.append(epItem)
-    except Exception as e:
-        logger.error("Get endpoint exception, ex: %s", str(e))
-    finally:
-        dataHandler.Close()
-    return ret
-
-def UpdateEndpoints(userName, jobId, requested_endpoints, interactive_ports):
-    dataHandler = DataHandler()
-    try:
-        job = dataHandler.GetJobTextFields(jobId, ["userName", "vcName", "jobParams", "endpoints"])
-        if job is None:
-            msg = "Job %s cannot be found in database" % jobId
-            logger.error(msg)
-            return msg, 404
-        if job["userName"] != userName and (not AuthorizationManager.HasAccess(userName, ResourceType.VC, job["vcName"], Permission.Admin)):
-            msg = "You are not authorized to enable endpoint for job %s" % jobId
-            logger.error(msg)
-            return msg, 403
-
-        job_params = json.loads(base64.b64decode(job["jobParams"]))
-        job_type = job_params["jobtrainingtype"]
-        job_endpoints = {}
-        if job["endpoints"] is not None:
-            job_endpoints = json.loads(job["endpoints"])
-
-        # get pods
-        pod_names = []
-        if job_type == "RegularJob":
-            pod_names.append(jobId)
-        else:
-            nums = {"ps": int(job_params["numps"]), "worker": int(job_params["numpsworker"])}
-            for role in ["ps", "worker"]:
-                for i in range(nums[role]):
-                    pod_names.append(jobId + "-" + role + str(i))
-
-        # HostNetwork
-        if "hostNetwork" in job_params and job_params["hostNetwork"] == True:
-            host_network = True
-        else:
-            host_network = False
-
-        # username
-        username = getAlias(job["userName"])
-
-        endpoints = job_endpoints
-
-        if "ssh" in requested_endpoints:
-            # setup ssh for each pod
-            for pod_name in pod_names:
-                endpoint_id = "e-" + pod_name + "-ssh"
-
-                if endpoint_id in job_endpoints:
-                    logger.info("Endpoint %s exists. Skip.", endpoint_id)
-                    continue
-                logger.info("Endpoint %s does not exist. Add.", endpoint_id)
-
-                endpoint = {
-                    "id": endpoint_id,
-                    "jobId": jobId,
-                    "podName": pod_name,
-                    "username": username,
-                    "name": "ssh",
-                    "status": "pending",
-                    "hostNetwork": host_network
-                }
-                endpoints[endpoint_id] = endpoint
-
-        # Only open Jupyter on the master
-        if 'ipython' in requested_endpoints:
-            if job_type == "RegularJob":
-                pod_name = pod_names[0]
-            else:
-                # For a distributed job, we set up jupyter on first worker node.
-                # PS node does not have GPU access.
-                # TODO: Simplify code logic after removing PS
-                pod_name = pod_names[1]
-
-            endpoint_id = "e-" + jobId + "-ipython"
-
-            if endpoint_id not in job_endpoints:
-                logger.info("Endpoint %s does not exist. Add.", endpoint_id)
-                endpoint = {
-                    "id": endpoint_id,
-                    "jobId": jobId,
-                    "podName": pod_name,
-                    "username": username,
-                    "name": "ipython",
-                    "status": "pending",
-                    "hostNetwork": host_network
-                }
-                endpoints[endpoint_id] = endpoint
-            else:
-                logger.info("Endpoint %s exists. Skip.", endpoint_id)
-
-        # Only open tensorboard on the master
-        if 'tensorboard' in requested_endpoints:
-            if job_type == "RegularJob":
-                pod_name = pod_names[0]
-            else:
-                # For a distributed job, we set up jupyter on first worker node.
-                # PS node does not have GPU access.
-                # TODO: Simplify code logic after removing PS
-                pod_name = pod_names[1]
-
-            endpoint_id = "e-" + jobId + "-tensorboard"
-
-            if endpoint_id not in job_endpoints:
-                logger.info("Endpoint %s does not exist. Add.", endpoint_id)
-                endpoint = {
-                    "id": endpoint_id,
-                    "jobId": jobId,
-                    "podName": pod_name,
-                    "username": username,
-                    "name": "tensorboard",
-                    "status": "pending",
-                    "hostNetwork": host_network
-                }
-                endpoints[endpoint_id] = endpoint
-            else:
-                logger.info("Endpoint %s exists. Skip.", endpoint_id)
-
-        # interactive port
-        for interactive_port in interactive_ports:
-            if job_type == "RegularJob":
-                pod_name = pod_names[0]
-            else:
-                # For a distributed job, we set up jupyter on first worker node.
-                # PS node does not have GPU access.
-                # TODO: Simplify code logic after removing PS
-                pod_name = pod_names[1]
-
-            endpoint_id = "e-" + jobId + "-port-" + str(interactive_port["podPort"])
-            if endpoint_id not in job_endpoints:
-                logger.info("Endpoint %s does not exist. Add.", endpoint_id)
-                endpoint = {
-                    "id": endpoint_id,
-                    "jobId": jobId,
-                    "podName": pod_name,
-                    "username": username,
-                    "name": interactive_port["name"],
-                    "podPort": interactive_port["podPort"],
-                    "status": "pending",
-                    "hostNetwork": host_network
-                }
-                endpoints[endpoint_id] = endpoint
-            else:
-                logger.info("Endpoint %s exists. Skip.", endpoint_id)
-
-        dataHandler.UpdateJobTextField(jobId, "endpoints", json.dumps(endpoints))
-        return endpoints, 200
-    except Exception as e:
-        logger.error("Get endpoint exception, ex: %s", str(e))
-    finally:
-        dataHandler.Close()
-    return "server error", 500
-
-
-
-def GetEndpoints(userName, jobId):
-    dataHandler = DataHandler()
-    ret = []
-    try:
-        job = dataHandler.GetJobTextFields(jobId,
-                                           ["userName", "vcName", "endpoints"])
+        job = dataHandler.GetJobTextFields(jobId, ["userName", "vcName"])
         if job is not None:
             if job["userName"] == userName or AuthorizationManager.HasAccess(
                     userName, ResourceType.VC, job["vcName"], Permission.Admin):
-                endpoints = {}
-                if job["endpoints"] is not None:
-                    endpoints = json.loads(job["endpoints"])
+                endpoints = dataHandler.GetJobEndpoints(jobId)
                 for [_, endpoint] in list(endpoints.items()):
                     epItem = {
                         "id": endpoint["id"],
@@ -1371,8 +1284,9 @@ def GetEndpoints(userName, jobId):
 def UpdateEndpoints(userName, jobId, requested_endpoints, interactive_ports):
     dataHandler = DataHandler()
     try:
-        job = dataHandler.GetJobTextFields(
-            jobId, ["userName", "vcName", "jobParams", "endpoints"])
+        job = dataHandler.GetJobTextFields(jobId,
+                                           ["userName", "vcName", "jobParams"],
+                                           max_staleness=0)
         if job is None:
             msg = "Job %s cannot be found in database" % jobId
             logger.error(msg)
@@ -1385,9 +1299,7 @@ def UpdateEndpoints(userName, jobId, requested_endpoints, interactive_ports):
 
         job_params = json.loads(base64decode(job["jobParams"]))
         job_type = job_params["jobtrainingtype"]
-        job_endpoints = {}
-        if job["endpoints"] is not None:
-            job_endpoints = json.loads(job["endpoints"])
+        job_endpoints = dataHandler.GetJobEndpoints(jobId, max_staleness=0)
 
         # get pods
         pod_names = []
@@ -1411,7 +1323,7 @@ def UpdateEndpoints(userName, jobId, requested_endpoints, interactive_ports):
         # username
         username = getAlias(job["userName"])
 
-        endpoints = job_endpoints
+        endpoints = dict(job_endpoints)
 
         if "ssh" in requested_endpoints:
             # setup ssh for each pod
@@ -1516,8 +1428,13 @@ def UpdateEndpoints(userName, jobId, requested_endpoints, interactive_ports):
             else:
                 logger.debug("Endpoint %s exists. Skip.", endpoint_id)
 
-        dataHandler.UpdateJobTextFields({"jobId": jobId},
-                                        {"endpoints": json.dumps(endpoints)})
+        new_endpoints = [
+            endpoint for endpoint_id, endpoint in endpoints.items()
+            if endpoint_id not in job_endpoints
+        ]
+        if len(new_endpoints) > 0 and \
+                not dataHandler.update_endpoints(new_endpoints):
+            return "server error", 500
         return endpoints, 200
     except Exception as e:
         logger.error("Get endpoint exception, ex: %s", str(e))
@@ -1562,7 +1479,7 @@ def update_job_priorites(username, job_priorities):
         for job_id in job_priorities:
             priority = job_priorities[job_id]
             job = data_handler.GetJobTextFields(
-                job_id, ["userName", "vcName", "jobStatus"])
+                job_id, ["userName", "vcName", "jobStatus"], max_staleness=0)
             if job is None:
                 continue
 
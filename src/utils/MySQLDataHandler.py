@@ -2,13 +2,23 @@
 
 import json
 import base64
+import collections
+import datetime
+import contextlib
 import logging
 import functools
+import os
+import random
+import threading
+import time
 import timeit
+import zlib
 
 import mysql.connector
-from prometheus_client import Histogram
+from prometheus_client import Counter, Histogram
 from vc_quota import vc_value_str
+from job_params_util import get_job_resource_columns
+from common import encode_job_cursor, decode_job_cursor
 
 from config import config, global_vars
 
@@ -26,6 +36,24 @@ db_connect_histogram = Histogram("db_connect_latency_seconds",
                                  buckets=(.05, .075, .1, .25, .5, .75, 1.0, 2.5,
                                           5.0, 7.5, float("inf")))
 
+db_pool_checkout_wait_histogram = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "time waiting for a free connection in db connection pool (seconds)",
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0,
+             float("inf")))
+
+db_query_histogram = Histogram(
+    "db_query_latency_seconds",
+    "latency for executing a prepared statement (seconds)",
+    buckets=(.001, .005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5,
+             5.0, 10.0, float("inf")),
+    labelnames=("op",))
+
+db_read_route_counter = Counter(
+    "db_read_route_total",
+    "calls of read only data handler functions by db they read from",
+    labelnames=("fn_name", "target"))
+
 
 def record(fn):
     @functools.wraps(fn)
@@ -40,6 +68,36 @@ def record(fn):
     return wrapped
 
 
+def read_only(fn):
+    """Runs data handler function fn, which only reads, on a replica if
+    DataHandler.get_replica_conn returns one. fn takes keyword argument
+    max_staleness, seconds of replica lag acceptable for the call, 0 to read
+    from primary. Functions called by fn read from the same db as fn."""
+    @functools.wraps(fn)
+    def wrapped(self, *args, **kwargs):
+        max_staleness = kwargs.pop("max_staleness", None)
+        if self.routing_read:
+            return fn(self, *args, **kwargs)
+
+        self.routing_read = True
+        try:
+            conn = self.get_replica_conn(max_staleness)
+            if conn is None:
+                db_read_route_counter.labels(fn.__name__, "primary").inc()
+                return fn(self, *args, **kwargs)
+
+            db_read_route_counter.labels(fn.__name__, "replica").inc()
+            primary, self.conn = self.conn, conn
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                self.conn = primary
+        finally:
+            self.routing_read = False
+
+    return wrapped
+
+
 def base64encode(str_val):
     return base64.b64encode(str_val.encode("utf-8")).decode("utf-8")
 
@@ -48,6 +106,458 @@ def base64decode(str_val):
     return base64.b64decode(str_val.encode("utf-8")).decode("utf-8")
 
 
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PooledConnection(object):
+    """A db connection owned by ConnectionPool. Server side prepared
+    statements are cached per connection, keyed by sql text.
+    """
+    def __init__(self, conn, statement_cache_size=64):
+        self.conn = conn
+        self.statement_cache_size = statement_cache_size
+        self.created = time.time()
+        self.last_used = self.created
+        # sql -> (prepared cursor, sql)
+        self.statements = collections.OrderedDict()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def prepared(self, sql):
+        """Returns (cursor, sql) for sql prepared on this connection. The
+        returned sql is the object the cursor was prepared with, connector
+        only skips re-preparing if the same object is executed again."""
+        entry = self.statements.get(sql)
+        if entry is not None:
+            self.statements.move_to_end(sql)
+            return entry
+
+        entry = (self.conn.cursor(prepared=True), sql)
+        self.statements[sql] = entry
+        while len(self.statements) > self.statement_cache_size:
+            _, (cursor, _) = self.statements.popitem(last=False)
+            self._close_cursor(cursor)
+        return entry
+
+    def discard(self, sql):
+        entry = self.statements.pop(sql, None)
+        if entry is not None:
+            self._close_cursor(entry[0])
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    def is_alive(self):
+        try:
+            return self.conn.is_connected()
+        except Exception:
+            return False
+
+    def close(self):
+        for cursor, _ in self.statements.values():
+            self._close_cursor(cursor)
+        self.statements.clear()
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool(object):
+    """Bounded pool of PooledConnection shared by all DataHandler in the
+    process.
+
+    Args:
+        connect: Function returning a new db connection.
+        size: Max number of connections checked out at the same time.
+        timeout: Seconds to wait for a free connection before raising
+            PoolTimeoutError.
+        recycle: Connections older than this many seconds are reopened.
+        ping_interval: Connections idle for longer than this many seconds
+            are pinged before being handed out.
+        statement_cache_size: Max prepared statements per connection.
+    """
+    def __init__(self,
+                 connect,
+                 size=32,
+                 timeout=30,
+                 recycle=3600,
+                 ping_interval=10,
+                 statement_cache_size=64):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.statement_cache_size = statement_cache_size
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def get(self):
+        start = timeit.default_timer()
+        acquired = self.slots.acquire(timeout=self.timeout)
+        db_pool_checkout_wait_histogram.observe(timeit.default_timer() -
+                                                start)
+        if not acquired:
+            raise PoolTimeoutError(
+                "no free db connection in %s seconds, pool size %s" %
+                (self.timeout, self.size))
+        try:
+            return self._checkout()
+        except:
+            self.slots.release()
+            raise
+
+    def _checkout(self):
+        while True:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                with db_connect_histogram.time():
+                    return PooledConnection(self.connect(),
+                                            self.statement_cache_size)
+
+            now = time.time()
+            if now - conn.created > self.recycle:
+                conn.close()
+            elif now - conn.last_used > self.ping_interval and \
+                    not conn.is_alive():
+                logger.info("dropping dead db connection")
+                conn.close()
+            else:
+                return conn
+
+    def put(self, conn):
+        try:
+            if getattr(conn.conn, "in_transaction", False):
+                conn.rollback()
+            conn.last_used = time.time()
+            with self.lock:
+                self.idle.append(conn)
+        except Exception:
+            logger.warning("dropping db connection failed to reset",
+                           exc_info=True)
+            conn.close()
+        finally:
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+def make_pool(mysql_config, database, port=None):
+    """Returns ConnectionPool to database on the server of mysql_config"""
+    connect_args = {
+        "user": mysql_config["username"],
+        "password": mysql_config["password"],
+        "host": mysql_config["hostname"],
+        "database": database,
+    }
+    if port is not None:
+        connect_args["port"] = port
+
+    def connect():
+        return mysql.connector.connect(**connect_args)
+
+    return ConnectionPool(
+        connect,
+        size=mysql_config.get("pool_size", 32),
+        timeout=mysql_config.get("pool_timeout", 30),
+        recycle=mysql_config.get("pool_recycle", 3600),
+        ping_interval=mysql_config.get("pool_ping_interval", 10),
+        statement_cache_size=mysql_config.get("statement_cache_size", 64))
+
+
+pool = None
+pool_pid = None
+pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns connection pool of this process. A forked child gets its own
+    pool, connections inherited from parent are left alone."""
+    global pool, pool_pid
+    pid = os.getpid()
+    if pool is not None and pool_pid == pid:
+        return pool
+    with pool_lock:
+        if pool is None or pool_pid != pid:
+            pool = make_pool(config["mysql"],
+                             "DLWSCluster-%s" % config["clusterId"])
+            pool_pid = pid
+    return pool
+
+
+replica_pools = None
+replica_pools_pid = None
+
+
+def get_replica_pools():
+    """Returns connection pools of this process to read replicas in
+    config["mysql"]["replicas"], a list of dict of hostname and optional
+    port, username and password, which default to those of primary."""
+    global replica_pools, replica_pools_pid
+    pid = os.getpid()
+    if replica_pools is not None and replica_pools_pid == pid:
+        return replica_pools
+    with pool_lock:
+        if replica_pools is None or replica_pools_pid != pid:
+            mysql_config = config.get("mysql", {})
+            database = "DLWSCluster-%s" % config["clusterId"]
+            pools = []
+            for replica in mysql_config.get("replicas") or []:
+                replica_config = dict(mysql_config)
+                replica_config.update(replica)
+                pools.append(
+                    make_pool(replica_config, database, replica.get("port")))
+            replica_pools = pools
+            replica_pools_pid = pid
+    return replica_pools
+
+
+# read_only functions may read from replicas only in processes which enable
+# it, e.g. restfulapi. Managers act on what they read and read from primary.
+replica_reads_enabled = False
+
+# session -> time until which reads of the session go to primary
+primary_pins = {}
+primary_pins_lock = threading.Lock()
+session_local = threading.local()
+
+
+def enable_replica_reads(enabled=True):
+    global replica_reads_enabled
+    replica_reads_enabled = enabled
+
+
+def set_session(session):
+    """Sets session, e.g. user name of the request being served, of data
+    handlers used by current thread. Reads of a session go to primary for
+    primary_pin_seconds after it writes, so that it reads its own writes."""
+    session_local.session = session
+
+
+def get_session():
+    return getattr(session_local, "session", None)
+
+
+def pin_primary(session, seconds):
+    now = time.time()
+    with primary_pins_lock:
+        primary_pins[session] = now + seconds
+        if len(primary_pins) > 1024:
+            for key, until in list(primary_pins.items()):
+                if until <= now:
+                    del primary_pins[key]
+
+
+def is_pinned_to_primary(session):
+    until = primary_pins.get(session)
+    return until is not None and until > time.time()
+
+
+# all columns of jobs table
+JOB_FIELDS = [
+    "id", "jobId", "familyToken", "isParent", "jobName", "userName", "vcName",
+    "jobStatus", "jobStatusDetail", "jobType", "jobDescriptionPath",
+    "jobDescription", "jobTime", "endpoints", "errorMsg", "jobParams",
+    "jobMeta", "jobLog", "jobLogCursor", "retries", "lastUpdated", "priority",
+    "insight", "modifiedTime", "sku", "gpuRequest", "cpuRequest",
+    "memoryRequest", "preemptible"
+]
+
+# typed columns extracted from jobParams by get_job_resource_columns. They
+# are NULL for jobs added before they existed and not backfilled yet, see
+# ClusterBootstrap/scripts/add_job_resource_columns.py
+JOB_RESOURCE_FIELDS = [
+    "sku", "gpuRequest", "cpuRequest", "memoryRequest", "preemptible"
+]
+
+# default projection of GetJobList and get_jobs_modified_since
+JOB_LIST_FIELDS = [
+    "jobId", "jobName", "userName", "vcName", "jobStatus", "jobStatusDetail",
+    "jobType", "jobDescriptionPath", "jobDescription", "jobTime", "endpoints",
+    "jobParams", "errorMsg", "jobMeta", "lastUpdated"
+]
+
+# default projection of GetJobListV2 and get_union_job_list_v2
+JOB_LIST_V2_FIELDS = [
+    "jobId", "jobName", "userName", "vcName", "jobStatus", "jobStatusDetail",
+    "jobType", "jobTime", "jobParams", "priority"
+]
+
+
+def job_fields_sql(fields, required=()):
+    """Returns sql selecting fields and required fields of jobs table.
+    Raises ValueError on unknown fields."""
+    fields = list(fields)
+    fields.extend([field for field in required if field not in fields])
+    unknown = [field for field in fields if field not in JOB_FIELDS]
+    if unknown:
+        raise ValueError("unknown job fields %s" % unknown)
+    return ",".join(["`%s`" % field for field in fields])
+
+
+def older_than_days_conditions(days_ago, col="time", cond=None):
+    """Returns (sql, params) of where conditions selecting rows with col
+    older than days_ago and matching cond, e.g.
+    {"jobStatus": ("IN", ["finished", "failed"])}"""
+    conditions = "`%s` < NOW() - INTERVAL %%s DAY" % col
+    params = [days_ago]
+    if isinstance(cond, dict):
+        for field, op_and_value in cond.items():
+            op, value = op_and_value
+            if isinstance(value, list):
+                conditions += " AND `%s` %s (%s)" % (field, op, ",".join(
+                    ["%s"] * len(value)))
+                params.extend(value)
+            else:
+                conditions += " AND `%s` %s %%s" % (field, op)
+                params.append(value)
+    return conditions, params
+
+
+def decode_job_field(value):
+    """Decodes a base64 encoded json column, {} if it is not valid json"""
+    if value is None:
+        return None
+    try:
+        return json.loads(base64decode(value))
+    except Exception:
+        return {}
+
+
+class JobRecord(dict):
+    """A job row whose base64 encoded json columns, e.g. jobParams, are
+    decoded on first access. Bulk accessors used by json, copy and pickle
+    decode all of them first, so a record is seen as a plain dict of
+    decoded values.
+
+    Only the V2 job lists return it. GetJobList, get_union_job_list and the
+    other job readers return rows as read, whose callers decode the columns
+    themselves.
+    """
+    encoded_fields = ("jobParams", "jobStatusDetail", "insight")
+
+    def __init__(self, row):
+        super(JobRecord, self).__init__(row)
+        self.encoded = set(
+            [field for field in self.encoded_fields if field in row])
+
+    def _decode(self, key):
+        if key in self.encoded:
+            self.encoded.discard(key)
+            dict.__setitem__(self, key,
+                             decode_job_field(dict.__getitem__(self, key)))
+
+    def _decode_all(self):
+        for key in list(self.encoded):
+            self._decode(key)
+
+    def __getitem__(self, key):
+        self._decode(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._decode(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        self.encoded.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.encoded.discard(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *args):
+        self._decode(key)
+        self.encoded.discard(key)
+        return dict.pop(self, key, *args)
+
+    # overriding __iter__ also stops dict(record) from copying raw values
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def items(self):
+        self._decode_all()
+        return dict.items(self)
+
+    def values(self):
+        self._decode_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._decode_all()
+        return dict(self)
+
+    def __eq__(self, other):
+        self._decode_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        self._decode_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+
+def job_list_conditions(userName, vcName, status, op):
+    """Returns (sql, params) of conditions on jobs table to append to
+    "WHERE 1". status is a comma separated list of status joined by op."""
+    sql = ""
+    params = []
+    if userName != "all":
+        sql += " and `userName` = %s"
+        params.append(userName)
+
+    if vcName != "all":
+        sql += " and `vcName` = %s"
+        params.append(vcName)
+
+    if status is not None:
+        status_list = status.split(",")
+        status_statement = (" " + op[1] + " ").join(
+            [" `jobStatus` %s %%s " % op[0]] * len(status_list))
+        sql += " and ( %s ) " % status_statement
+        params.extend(status_list)
+    return sql, params
+
+
+# whether jobs table has JOB_RESOURCE_FIELDS, checked once per process
+job_resource_columns_exist = None
+# whether jobs table has modifiedTime, checked once per process
+job_modified_time_exists = None
+# whether legacy endpoints column of jobs table may have endpoints, False
+# once found empty, it is not written any more
+legacy_job_endpoints_exist = None
+
+# (version, time, json text) of latest cluster status read in this process
+cluster_status_cache = None
+# time latest cluster status was appended to history by this process
+cluster_status_history_time = 0
+
+
+# first word of statements which do not write
+READ_OPS = ("select", "show")
+
+
 class DataHandler(object):
     def __init__(self):
         self.database = "DLWSCluster-%s" % config["clusterId"]
@@ -57,18 +567,19 @@ class DataHandler(object):
         self.vctablename = "vc"
         self.storagetablename = "storage"
         self.clusterstatustablename = "clusterstatus"
+        self.clusterstatuslatesttablename = "clusterstatuslatest"
         self.templatetablename = "templates"
-        server = config["mysql"]["hostname"]
-        username = config["mysql"]["username"]
-        password = config["mysql"]["password"]
+        self.endpointtablename = "endpoints"
+        self.conn = None
+        self.in_transaction = False
+        self.replica_pool = None
+        self.replica_conn = None
+        self.routing_read = False
 
         self.CreateDatabase()
 
-        with db_connect_histogram.time():
-            self.conn = mysql.connector.connect(user=username,
-                                                password=password,
-                                                host=server,
-                                                database=self.database)
+        self.pool = self.connection_pool()
+        self.conn = self.pool.get()
 
         self.CreateTable()
 
@@ -78,6 +589,168 @@ class DataHandler(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.Close()
 
+    def connection_pool(self):
+        """Returns the ConnectionPool to check out connection from"""
+        return get_pool()
+
+    def datasource_config(self):
+        return config.get("mysql", {})
+
+    def replica_pools(self):
+        """Returns ConnectionPool of every read replica"""
+        return get_replica_pools()
+
+    def replica_lag(self, conn):
+        """Returns seconds the replica of conn is behind primary, None if
+        replication is broken"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SHOW SLAVE STATUS")
+            row = cursor.fetchone()
+            if row is None:
+                # not replicating, e.g. a proxy to primary
+                return 0
+            columns = [column[0] for column in cursor.description]
+            return row[columns.index("Seconds_Behind_Master")]
+        finally:
+            cursor.close()
+
+    def get_replica_conn(self, max_staleness=None):
+        """Returns connection to a replica lagging at most max_staleness
+        seconds, replica_max_staleness of config by default. Returns None if
+        the read should go to primary: replica reads are not enabled, no
+        replica is fresh enough, in a transaction, or current session is
+        pinned to primary."""
+        if not replica_reads_enabled or self.in_transaction:
+            return None
+        db_config = self.datasource_config()
+        if max_staleness is None:
+            max_staleness = db_config.get("replica_max_staleness", 10)
+        if max_staleness <= 0:
+            return None
+        session = get_session()
+        if session is not None and is_pinned_to_primary(session):
+            return None
+
+        if self.replica_conn is None:
+            pools = self.replica_pools()
+            if len(pools) == 0:
+                return None
+            pool = random.choice(pools)
+            try:
+                self.replica_conn = pool.get()
+                self.replica_pool = pool
+            except Exception:
+                logger.warning("failed to connect to replica, read primary",
+                               exc_info=True)
+                return None
+
+        # lag is checked at most every replica_lag_check_interval seconds
+        # for all data handlers of the replica
+        pool = self.replica_pool
+        now = time.time()
+        if now - getattr(pool, "lag_checked", 0) >= db_config.get(
+                "replica_lag_check_interval", 5):
+            try:
+                pool.lag = self.replica_lag(self.replica_conn)
+            except Exception:
+                logger.warning("failed to get replica lag", exc_info=True)
+                pool.lag = None
+            pool.lag_checked = now
+        if pool.lag is None or pool.lag > max_staleness:
+            return None
+        return self.replica_conn
+
+    def on_write(self):
+        """Pins reads of current session to primary for
+        primary_pin_seconds, which should be longer than replica lag"""
+        session = get_session()
+        if replica_reads_enabled and session is not None:
+            pin_primary(session,
+                        self.datasource_config().get("primary_pin_seconds", 10))
+
+    def _run(self, sql, params, prepared):
+        """Returns (columns, rows, rowcount) of sql"""
+        if prepared:
+            cursor, sql = self.conn.prepared(sql)
+        else:
+            cursor = self.conn.cursor()
+        op = sql.lstrip().split(None, 1)[0].lower()
+        try:
+            with db_query_histogram.labels(op).time():
+                cursor.execute(sql, params)
+                if cursor.description:
+                    columns = [column[0] for column in cursor.description]
+                    rows = cursor.fetchall()
+                else:
+                    columns, rows = [], []
+            ret = columns, rows, cursor.rowcount
+            if op not in READ_OPS:
+                self.on_write()
+        except:
+            # statement may be invalid or connection broken
+            if prepared:
+                self.conn.discard(sql)
+            raise
+        finally:
+            if not prepared:
+                cursor.close()
+        if not self.in_transaction:
+            self.conn.commit()
+        return ret
+
+    def query(self, sql, params=(), prepared=True):
+        """Runs sql with params bound to its %s placeholders. Returns a list
+        of dict of column to value.
+
+        sql is run as a server side prepared statement cached on the
+        connection, unless prepared is False, e.g. for sql built for a
+        variable number of values which is unlikely to be run again.
+        """
+        columns, rows, _ = self._run(sql, params, prepared)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def execute(self, sql, params=(), prepared=True):
+        """Runs sql like query. Returns number of affected rows."""
+        _, _, rowcount = self._run(sql, params, prepared)
+        return rowcount
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Statements run by query and execute in the block are committed
+        together, or rolled back if the block raises. Nested blocks join
+        the outermost one."""
+        if self.in_transaction:
+            yield self
+            return
+        self.in_transaction = True
+        try:
+            yield self
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+
+    def execute_batch(self, sql, seq_params):
+        """Runs prepared sql once for every params in seq_params in one
+        transaction. Returns total number of affected rows."""
+        affected = 0
+        with self.transaction():
+            for params in seq_params:
+                affected += self.execute(sql, params)
+        return affected
+
+    def execute_statements(self, statements, prepared=False):
+        """Runs every (sql, params) in statements in one transaction.
+        Returns total number of affected rows."""
+        affected = 0
+        with self.transaction():
+            for sql, params in statements:
+                affected += self.execute(sql, params, prepared=prepared)
+        return affected
+
     def CreateDatabase(self):
         if "initSQLDB" not in global_vars or not global_vars["initSQLDB"]:
             logger.info("===========init SQL database===============")
@@ -128,13 +801,26 @@ class DataHandler(object):
                     `lastUpdated` DATETIME     DEFAULT CURRENT_TIMESTAMP NOT NULL,
                     `priority` INT   DEFAULT 100 NOT NULL,
                     `insight` LONGTEXT  NULL,
+                    `modifiedTime` DATETIME(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3) NOT NULL,
+                    `sku` varchar(255) NULL,
+                    `gpuRequest` INT NULL,
+                    `cpuRequest` DOUBLE NULL,
+                    `memoryRequest` BIGINT NULL,
+                    `preemptible` TINYINT NULL,
                     PRIMARY KEY (`id`),
                     UNIQUE(`jobId`),
                     INDEX (`userName`),
                     INDEX (`vcName`),
                     INDEX (`jobTime`),
                     INDEX (`jobId`),
-                    INDEX (`jobStatus`)
+                    INDEX (`jobStatus`),
+                    INDEX (`modifiedTime`),
+                    INDEX `vc_user_status` (`vcName`, `userName`, `jobStatus`, `preemptible`),
+                    INDEX `status_vc_sku` (`jobStatus`, `vcName`, `sku`),
+                    INDEX `user_status_time` (`userName`, `jobStatus`, `jobTime`),
+                    INDEX `vc_status_time` (`vcName`, `jobStatus`, `jobTime`),
+                    INDEX `vc_user_time` (`vcName`, `userName`, `jobTime`),
+                    INDEX `vc_time` (`vcName`, `jobTime`)
                 );
                 """ % (self.jobtablename)
 
@@ -159,6 +845,24 @@ class DataHandler(object):
             self.conn.commit()
             cursor.close()
 
+            # single row with id 1, version is bumped on every update
+            sql = """
+                CREATE TABLE IF NOT EXISTS `%s`
+                (
+                    `id`        INT   NOT NULL,
+                    `version`   BIGINT NOT NULL,
+                    `encoding`  varchar(16) NOT NULL,
+                    `status`    LONGBLOB NOT NULL,
+                    `time` DATETIME     DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                    PRIMARY KEY (`id`)
+                )
+                """ % (self.clusterstatuslatesttablename)
+
+            cursor = self.conn.cursor()
+            cursor.execute(sql)
+            self.conn.commit()
+            cursor.close()
+
             sql = """
                 CREATE TABLE IF NOT EXISTS  `%s`
                 (
@@ -265,6 +969,29 @@ class DataHandler(object):
             self.conn.commit()
             cursor.close()
 
+            # one row per endpoint, endpoint is the json of the endpoint.
+            # Replaces endpoints column of jobs table, see
+            # ClusterBootstrap/scripts/migrate_job_endpoints.py
+            sql = """
+                CREATE TABLE IF NOT EXISTS `%s`
+                (
+                    `id`          INT          NOT NULL AUTO_INCREMENT,
+                    `jobId`       varchar(50)  NOT NULL,
+                    `endpointId`  varchar(255) NOT NULL,
+                    `status`      varchar(255) NOT NULL,
+                    `endpoint`    LONGTEXT     NOT NULL,
+                    `lastUpdated` DATETIME(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3) NOT NULL,
+                    PRIMARY KEY (`id`),
+                    CONSTRAINT job_endpoint UNIQUE(`jobId`, `endpointId`),
+                    INDEX `status_job` (`status`, `jobId`)
+                )
+                """ % (self.endpointtablename)
+
+            cursor = self.conn.cursor()
+            cursor.execute(sql)
+            self.conn.commit()
+            cursor.close()
+
     @record
     def column_exists(self, tablename, columnname):
         sql = "SHOW COLUMNS FROM `{}` LIKE '{}';".format(tablename, columnname)
@@ -290,6 +1017,7 @@ class DataHandler(object):
                 sql, (storageType, url, metadata, vcName, defaultMountPath))
             self.conn.commit()
             cursor.close()
+            self.on_write()
             return True
         except Exception as e:
             logger.exception('AddStorage Exception: %s', str(e))
@@ -298,52 +1026,34 @@ class DataHandler(object):
     @record
     def DeleteStorage(self, vcName, url):
         try:
-            sql = "DELETE FROM `%s` WHERE url = '%s' and vcName = '%s'" % (
-                self.storagetablename, url, vcName)
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            self.conn.commit()
-            cursor.close()
+            sql = "DELETE FROM `%s` WHERE url = %%s and vcName = %%s" % (
+                self.storagetablename)
+            self.execute(sql, (url, vcName))
             return True
         except Exception as e:
             logger.exception('DeleteStorage Exception: %s', str(e))
             return False
 
     @record
+    @read_only
     def ListStorages(self, vcName):
-        cursor = self.conn.cursor()
-        query = "SELECT `storageType`,`url`,`metadata`,`vcName`,`defaultMountPath` FROM `%s` WHERE vcName = '%s' " % (
-            self.storagetablename, vcName)
+        query = "SELECT `storageType`,`url`,`metadata`,`vcName`,`defaultMountPath` FROM `%s` WHERE vcName = %%s" % (
+            self.storagetablename)
         ret = []
         try:
-            cursor.execute(query)
-            for (storageType, url, metadata, vcName,
-                 defaultMountPath) in cursor:
-                record = {}
-                record["vcName"] = vcName
-                record["url"] = url
-                record["storageType"] = storageType
-                record["metadata"] = metadata
-                record["defaultMountPath"] = defaultMountPath
-                ret.append(record)
+            ret = self.query(query, (vcName,))
         except Exception as e:
             logger.exception('ListStorages Exception: %s', str(e))
-            pass
-        self.conn.commit()
-        cursor.close()
         return ret
 
     @record
     def UpdateStorage(self, vcName, url, storageType, metadata,
                       defaultMountPath):
         try:
-            sql = """update `%s` set storageType = '%s', metadata = '%s', defaultMountPath = '%s' where vcName = '%s' and url = '%s' """ % (
-                self.storagetablename, storageType, metadata, defaultMountPath,
-                vcName, url)
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            self.conn.commit()
-            cursor.close()
+            sql = """update `%s` set storageType = %%s, metadata = %%s, defaultMountPath = %%s where vcName = %%s and url = %%s """ % (
+                self.storagetablename)
+            self.execute(
+                sql, (storageType, metadata, defaultMountPath, vcName, url))
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
@@ -357,7 +1067,7 @@ class DataHandler(object):
         if quota == "":
             return
 
-        if len(self.ListVCs()) != 0:
+        if len(self.ListVCs(max_staleness=0)) != 0:
             return
 
         for vc, vc_res_quota in res_quota.items():
@@ -366,18 +1076,16 @@ class DataHandler(object):
     @record
     def AddVC(self, vcName, quota, metadata, res_quota, res_meta):
         try:
-            sql = "INSERT INTO `{}` (vcName, quota, metadata, resourceQuota, resourceMetadata) VALUES ('{}', '{}', '{}', '{}', '{}')".format(
-                self.vctablename, vcName, quota, metadata, res_quota, res_meta)
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            self.conn.commit()
-            cursor.close()
+            sql = "INSERT INTO `{}` (vcName, quota, metadata, resourceQuota, resourceMetadata) VALUES (%s, %s, %s, %s, %s)".format(
+                self.vctablename)
+            self.execute(sql, (vcName, quota, metadata, res_quota, res_meta))
             return True
         except Exception as e:
             logger.exception('AddVC Exception: %s', str(e))
             return False
 
     @record
+    @read_only
     def ListVCs(self):
         cursor = self.conn.cursor()
         query = "SELECT `vcName`,`quota`,`metadata`, `resourceQuota`, `resourceMetadata` FROM `%s`" % self.vctablename
@@ -403,12 +1111,8 @@ class DataHandler(object):
     @record
     def DeleteVC(self, vcName):
         try:
-            sql = "DELETE FROM `%s` WHERE vcName = '%s'" % (self.vctablename,
-                                                            vcName)
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            self.conn.commit()
-            cursor.close()
+            sql = "DELETE FROM `%s` WHERE vcName = %%s" % (self.vctablename)
+            self.execute(sql, (vcName,))
             return True
         except Exception as e:
             logger.exception('DeleteVC Exception: %s', str(e))
@@ -417,42 +1121,27 @@ class DataHandler(object):
     @record
     def UpdateVC(self, vcName, quota, metadata):
         try:
-            sql = """update `%s` set quota = '%s', metadata = '%s' where vcName = '%s' """ % (
-                self.vctablename, quota, metadata, vcName)
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            self.conn.commit()
-            cursor.close()
+            sql = """update `%s` set quota = %%s, metadata = %%s where vcName = %%s """ % (
+                self.vctablename)
+            self.execute(sql, (quota, metadata, vcName))
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
             return False
 
     @record
+    @read_only
     def GetIdentityInfo(self, identityName):
-        cursor = self.conn.cursor()
         query = """SELECT `identityName`,`uid`,`gid`,`groups`,`public_key`,`private_key`
-        FROM `%s` WHERE `identityName` = '%s'""" % (self.identitytablename,
-                                                    identityName)
+        FROM `%s` WHERE `identityName` = %%s""" % (self.identitytablename)
         ret = []
 
         try:
-            cursor.execute(query)
-            for (identity_name, uid, gid, groups, public_key,
-                 private_key) in cursor:
-                record = {}
-                record["identityName"] = identity_name
-                record["uid"] = uid
-                record["gid"] = gid
-                record["groups"] = json.loads(groups)
-                record["public_key"] = public_key
-                record["private_key"] = private_key
+            for record in self.query(query, (identityName,)):
+                record["groups"] = json.loads(record["groups"])
                 ret.append(record)
         except Exception as e:
             logger.exception("failed to get identity of %s", identityName)
-
-        self.conn.commit()
-        cursor.close()
         return ret
 
     @record
@@ -483,6 +1172,7 @@ class DataHandler(object):
             cursor.execute(sql, (public_key, private_key, identityName))
             self.conn.commit()
             cursor.close()
+            self.on_write()
             return True
         except Exception as e:
             logger.exception('UpdateIdentityInfo Exception %s', identityName)
@@ -492,14 +1182,10 @@ class DataHandler(object):
     def UpdateAce(self, identityName, identityId, resource, permissions,
                   isDeny):
         try:
-            cursor = self.conn.cursor()
-            sql = "insert into {0} (identityName, identityId, resource, permissions, isDeny) values ('{1}', '{2}', '{3}', '{4}', '{5}') on duplicate key update permissions='{4}'".format(
-                self.acltablename, identityName, identityId, resource,
-                permissions, isDeny)
-            cursor.execute(sql)
-
-            self.conn.commit()
-            cursor.close()
+            sql = "insert into {0} (identityName, identityId, resource, permissions, isDeny) values (%s, %s, %s, %s, %s) on duplicate key update permissions=%s".format(
+                self.acltablename)
+            self.execute(sql, (identityName, identityId, resource, permissions,
+                               isDeny, permissions))
             return True
         except Exception as e:
             logger.exception('UpdateAce Exception: %s', str(e))
@@ -508,13 +1194,9 @@ class DataHandler(object):
     @record
     def UpdateAclIdentityId(self, identityName, identityId):
         try:
-            cursor = self.conn.cursor()
-            sql = """update `%s` set identityId = '%s' where `identityName` = '%s' """ % (
-                self.acltablename, identityId, identityName)
-            cursor.execute(sql)
-
-            self.conn.commit()
-            cursor.close()
+            sql = """update `%s` set identityId = %%s where `identityName` = %%s """ % (
+                self.acltablename)
+            self.execute(sql, (identityId, identityName))
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
@@ -523,14 +1205,9 @@ class DataHandler(object):
     @record
     def DeleteResourceAcl(self, resource):
         try:
-            cursor = self.conn.cursor()
-
-            sql = "DELETE FROM `%s` WHERE `resource` = '%s'" % (
-                self.acltablename, resource)
-            cursor.execute(sql)
-
-            self.conn.commit()
-            cursor.close()
+            sql = "DELETE FROM `%s` WHERE `resource` = %%s" % (
+                self.acltablename)
+            self.execute(sql, (resource,))
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
@@ -539,20 +1216,16 @@ class DataHandler(object):
     @record
     def DeleteAce(self, identityName, resource):
         try:
-            cursor = self.conn.cursor()
-
-            sql = "DELETE FROM `%s` WHERE `identityName` = '%s' and `resource` = '%s'" % (
-                self.acltablename, identityName, resource)
-            cursor.execute(sql)
-
-            self.conn.commit()
-            cursor.close()
+            sql = "DELETE FROM `%s` WHERE `identityName` = %%s and `resource` = %%s" % (
+                self.acltablename)
+            self.execute(sql, (identityName, resource))
             return True
         except Exception as e:
             logger.exception('DeleteAce Exception: %s', str(e))
             return False
 
     @record
+    @read_only
     def GetAcl(self):
         cursor = self.conn.cursor()
         query = "SELECT `identityName`,`identityId`,`resource`,`permissions`,`isDeny` FROM `%s`" % (
@@ -577,160 +1250,255 @@ class DataHandler(object):
         return ret
 
     @record
+    @read_only
     def GetResourceAcl(self, resource):
-        cursor = self.conn.cursor()
-        query = "SELECT `identityName`,`identityId`,`resource`,`permissions`,`isDeny` FROM `%s` where `resource` = '%s'" % (
-            self.acltablename, resource)
+        query = "SELECT `identityName`,`identityId`,`resource`,`permissions`,`isDeny` FROM `%s` where `resource` = %%s" % (
+            self.acltablename)
         ret = []
         try:
-            cursor.execute(query)
-            for (identityName, identityId, resource, permissions,
-                 isDeny) in cursor:
-                record = {}
-                record["identityName"] = identityName
-                record["identityId"] = identityId
-                record["resource"] = resource
-                record["permissions"] = permissions
-                record["isDeny"] = isDeny
-                ret.append(record)
+            ret = self.query(query, (resource,))
         except Exception as e:
             logger.exception('Exception: %s', str(e))
-        self.conn.commit()
-        cursor.close()
         return ret
 
+    def has_job_resource_columns(self):
+        global job_resource_columns_exist
+        if job_resource_columns_exist is None:
+            job_resource_columns_exist = self.column_exists(
+                self.jobtablename, "gpuRequest")
+        return job_resource_columns_exist
+
+    def has_job_modified_time(self):
+        global job_modified_time_exists
+        if job_modified_time_exists is None:
+            job_modified_time_exists = self.column_exists(
+                self.jobtablename, "modifiedTime")
+        return job_modified_time_exists
+
+    def available_job_fields(self, fields):
+        """Returns fields without JOB_RESOURCE_FIELDS if jobs table does not
+        have them yet"""
+        if self.has_job_resource_columns():
+            return fields
+        return [field for field in fields if field not in JOB_RESOURCE_FIELDS]
+
+    def get_job_columns(self, jobParams):
+        """Returns typed columns of jobs table to write for jobParams"""
+        if not self.has_job_resource_columns():
+            return {}
+        try:
+            return get_job_resource_columns(jobParams)
+        except Exception:
+            logger.exception("failed to get resource columns of job %s",
+                             jobParams.get("jobId"))
+            return {}
+
     @record
-    def AddJob(self, jobParams):
+    def AddJob(self, jobParams, priority=None):
         try:
-            sql = "INSERT INTO `" + self.jobtablename + "` (jobId, familyToken, isParent, jobName, userName, vcName, jobType,jobParams ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)"
-            cursor = self.conn.cursor()
-            jobParam = base64encode(json.dumps(jobParams))
-            cursor.execute(sql, (jobParams["jobId"], jobParams["familyToken"],
-                                 jobParams["isParent"], jobParams["jobName"],
-                                 jobParams["userName"], jobParams["vcName"],
-                                 jobParams["jobType"], jobParam))
-            self.conn.commit()
-            cursor.close()
+            columns = {
+                "jobId": jobParams["jobId"],
+                "familyToken": jobParams["familyToken"],
+                "isParent": jobParams["isParent"],
+                "jobName": jobParams["jobName"],
+                "userName": jobParams["userName"],
+                "vcName": jobParams["vcName"],
+                "jobType": jobParams["jobType"],
+                "jobParams": base64encode(json.dumps(jobParams)),
+            }
+            if priority is not None:
+                columns["priority"] = int(priority)
+            columns.update(self.get_job_columns(jobParams))
+
+            sql = "INSERT INTO `%s` (%s) VALUES (%s)" % (
+                self.jobtablename, ",".join(
+                    ["`%s`" % column for column in columns]), ",".join(
+                        ["%s"] * len(columns)))
+            self.execute(sql, list(columns.values()))
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
             return False
 
     @record
+    def update_job_params(self, jobId, jobParams):
+        """Overwrites jobParams of job and columns extracted from it"""
+        dataFields = {"jobParams": base64encode(json.dumps(jobParams))}
+        dataFields.update(self.get_job_columns(jobParams))
+        return self.UpdateJobTextFields({"jobId": jobId}, dataFields)
+
+    @record
+    def get_job_resource_usage(self, statuses, vcName=None, userName=None):
+        """Sums resource requests of jobs in statuses in one query.
+
+        Args:
+            statuses: List of job statuses.
+            vcName: Only jobs in this vc if not None.
+            userName: Only jobs of this user if not None.
+
+        Returns:
+            A list of dict with vcName, userName, sku, preemptible, jobs,
+            gpu, cpu and memory, one for each group of jobs. None on failure
+            or if some of the jobs do not have resource columns yet.
+        """
+        if not self.has_job_resource_columns():
+            return None
+
+        statuses = list(statuses)
+        query = """SELECT `vcName`, `userName`, `sku`, `preemptible`,
+            COUNT(*) AS jobs, SUM(`gpuRequest`) AS gpu,
+            SUM(`cpuRequest`) AS cpu, SUM(`memoryRequest`) AS memory,
+            SUM(`gpuRequest` IS NULL) AS unknown
+            FROM `%s` WHERE `jobStatus` IN (%s)""" % (
+            self.jobtablename, ",".join(["%s"] * len(statuses)))
+        params = statuses
+        if vcName is not None:
+            query += " AND `vcName` = %s"
+            params.append(vcName)
+        if userName is not None:
+            query += " AND `userName` = %s"
+            params.append(userName)
+        query += " GROUP BY `vcName`, `userName`, `sku`, `preemptible`"
+
+        try:
+            ret = []
+            for row in self.query(query, params):
+                if row["unknown"]:
+                    return None
+                ret.append({
+                    "vcName": row["vcName"],
+                    "userName": row["userName"],
+                    "sku": row["sku"],
+                    "preemptible": bool(row["preemptible"]),
+                    "jobs": int(row["jobs"]),
+                    "gpu": int(row["gpu"]),
+                    "cpu": float(row["cpu"]),
+                    "memory": int(row["memory"]),
+                })
+            return ret
+        except Exception:
+            logger.exception("Exception in getting job resource usage")
+            return None
+
+    @record
+    @read_only
     def GetJobList(self,
                    userName,
                    vcName,
                    num=None,
                    status=None,
-                   op=("=", "or")):
-        ret = []
-        cursor = self.conn.cursor()
+                   op=("=", "or"),
+                   fields=None,
+                   none_on_failure=False):
+        """Returns jobs ordered by jobTime desc. fields are the columns to
+        read, JOB_LIST_FIELDS by default. jobParams and the other encoded
+        columns are returned as read, unlike GetJobListV2. Returns [] on
+        failure, or None if none_on_failure, for callers which must not take
+        it as no job."""
+        ret = None if none_on_failure else []
+        if fields is None:
+            fields = JOB_LIST_FIELDS
         try:
-            query = "SELECT `jobId`,`jobName`,`userName`, `vcName`, `jobStatus`, `jobStatusDetail`, `jobType`, `jobDescriptionPath`, `jobDescription`, `jobTime`, `endpoints`, `jobParams`,`errorMsg` ,`jobMeta`, `lastUpdated` FROM `%s` where 1" % (
-                self.jobtablename)
-            if userName != "all":
-                query += " and `userName` = '%s'" % userName
-
-            if vcName != "all":
-                query += " and `vcName` = '%s'" % vcName
-
-            if status is not None:
-                if "," not in status:
-                    query += " and `jobStatus` %s '%s'" % (op[0], status)
-                else:
-                    status_list = [
-                        " `jobStatus` %s '%s' " % (op[0], s)
-                        for s in status.split(',')
-                    ]
-                    status_statement = (" " + op[1] + " ").join(status_list)
-                    query += " and ( %s ) " % status_statement
+            query = "SELECT %s FROM `%s` where 1" % (job_fields_sql(
+                self.available_job_fields(fields)), self.jobtablename)
+            conditions, params = job_list_conditions(userName, vcName, status,
+                                                     op)
+            query += conditions
 
             query += " order by `jobTime` Desc"
 
             if num is not None:
-                query += " limit %s " % str(num)
-
-            cursor.execute(query)
+                query += " limit %s "
+                params.append(int(num))
 
-            data = cursor.fetchall()
-            for (jobId, jobName, userName, vcName, jobStatus, jobStatusDetail,
-                 jobType, jobDescriptionPath, jobDescription, jobTime,
-                 endpoints, jobParams, errorMsg, jobMeta, lastUpdated) in data:
-                record = {}
-                record["jobId"] = jobId
-                record["jobName"] = jobName
-                record["userName"] = userName
-                record["vcName"] = vcName
-                record["jobStatus"] = jobStatus
-                record["jobStatusDetail"] = jobStatusDetail
-                record["jobType"] = jobType
-                record["jobDescriptionPath"] = jobDescriptionPath
-                record["jobDescription"] = jobDescription
-                record["jobTime"] = jobTime
-                record["endpoints"] = endpoints
-                record["jobParams"] = jobParams
-                record["errorMsg"] = errorMsg
-                record["jobMeta"] = jobMeta
-                record["lastUpdated"] = lastUpdated
-                ret.append(record)
+            ret = self.query(query, params)
         except Exception as e:
             logger.exception('Exception: %s', str(e))
-        self.conn.commit()
-        cursor.close()
         return ret
 
     @record
+    def get_job_modified_watermark(self):
+        """Returns the latest modifiedTime in jobs table as datetime, epoch if
+        there is no job, None on failure.
+
+        Take the watermark before a full listing of jobs, so that changes
+        racing with the listing are returned by get_jobs_modified_since.
+        """
+        cursor = None
+        ret = None
+        try:
+            # COALESCE with a string literal would return a string
+            query = "SELECT MAX(`modifiedTime`) AS `modifiedTime` " \
+                    "FROM `%s`" % self.jobtablename
+            cursor = self.conn.cursor()
+            cursor.execute(query)
+            for (watermark,) in cursor:
+                ret = watermark
+            if ret is None:
+                ret = datetime.datetime(1970, 1, 1)
+            self.conn.commit()
+        except Exception:
+            logger.exception("Exception in getting job modified watermark")
+        finally:
+            if cursor is not None:
+                cursor.close()
+        return ret
+
+    @record
+    def get_jobs_modified_since(self, since, fields=None):
+        """Returns jobs of all statuses with modifiedTime at or after since,
+        each with fields like GetJobList plus jobStatus and modifiedTime.
+        Returns None on failure, e.g. modifiedTime column does not exist yet.
+        """
+        ret = None
+        if fields is None:
+            fields = JOB_LIST_FIELDS
+        try:
+            query = "SELECT %s FROM `%s` WHERE `modifiedTime` >= %%s" % (
+                job_fields_sql(self.available_job_fields(fields),
+                               ["jobStatus", "modifiedTime"]),
+                self.jobtablename)
+            ret = self.query(query, (since,))
+        except Exception:
+            logger.exception("Exception in getting jobs modified since %s",
+                             since)
+        return ret
+
+    @record
+    @read_only
     def GetJobListV2(self,
                      userName,
                      vcName,
                      num=None,
                      status=None,
-                     op=("=", "or")):
+                     op=("=", "or"),
+                     fields=None):
+        """Returns jobs grouped by status. fields are the columns to read,
+        JOB_LIST_V2_FIELDS by default. jobParams and jobStatusDetail are
+        decoded on first access."""
         ret = {}
         ret["queuedJobs"] = []
         ret["runningJobs"] = []
         ret["finishedJobs"] = []
         ret["visualizationJobs"] = []
 
-        cursor = None
         try:
-            cursor = self.conn.cursor()
-
-            query = "SELECT jobId, jobName, userName, vcName, jobStatus, jobStatusDetail, jobType, jobTime, jobParams, priority FROM %s where 1" % self.jobtablename
-            if userName != "all":
-                query += " and userName = '%s'" % userName
-
-            if vcName != "all":
-                query += " and vcName = '%s'" % vcName
-
-            if status is not None:
-                if "," not in status:
-                    query += " and jobStatus %s '%s'" % (op[0], status)
-                else:
-                    status_list = [
-                        " jobStatus %s '%s' " % (op[0], s)
-                        for s in status.split(',')
-                    ]
-                    status_statement = (" " + op[1] + " ").join(status_list)
-                    query += " and ( %s ) " % status_statement
+            if fields is None:
+                fields = JOB_LIST_V2_FIELDS
+            query = "SELECT %s FROM %s where 1" % (job_fields_sql(
+                fields, ["jobStatus", "jobType"]), self.jobtablename)
+            conditions, params = job_list_conditions(userName, vcName, status,
+                                                     op)
+            query += conditions
 
             query += " order by jobTime Desc"
 
             if num is not None:
-                query += " limit %s " % str(num)
-
-            cursor.execute(query)
+                query += " limit %s "
+                params.append(int(num))
 
-            columns = [column[0] for column in cursor.description]
-            data = cursor.fetchall()
-            for item in data:
-                record = dict(list(zip(columns, item)))
-                if record["jobStatusDetail"] is not None:
-                    record["jobStatusDetail"] = self.load_json(
-                        base64decode(record["jobStatusDetail"]))
-                if record["jobParams"] is not None:
-                    record["jobParams"] = self.load_json(
-                        base64decode(record["jobParams"]))
+            for record in self.query(query, params):
+                record = JobRecord(record)
 
                 if record["jobStatus"] == "running":
                     if record["jobType"] == "training":
@@ -743,12 +1511,8 @@ class DataHandler(object):
                     ret["queuedJobs"].append(record)
                 else:
                     ret["finishedJobs"].append(record)
-            self.conn.commit()
         except Exception as e:
             logger.exception('GetJobListV2 Exception: %s', str(e))
-        finally:
-            if cursor is not None:
-                cursor.close()
 
         ret["meta"] = {
             "queuedJobs": len(ret["queuedJobs"]),
@@ -759,7 +1523,13 @@ class DataHandler(object):
         return ret
 
     @record
-    def get_union_job_list(self, username, vc_name, num, status):
+    @read_only
+    def get_union_job_list(self,
+                           username,
+                           vc_name,
+                           num,
+                           status,
+                           fields=None):
         """Get jobs in status and the latest num jobs that are not in status.
 
         Args:
@@ -767,6 +1537,9 @@ class DataHandler(object):
             vc_name: VC name for jobs
             num: Number of the latest jobs that are not in status
             status: Job status
+            fields: Columns to read, all but a few internal ones by default.
+                jobParams and the other encoded columns are returned as read,
+                unlike get_union_job_list_v2.
 
         Returns:
             A list of jobs including all jobs in status and the latest num
@@ -801,39 +1574,44 @@ class DataHandler(object):
             logger.error("status must contain at least one item")
             return ret
 
-        cursor = None
-
         try:
             jobs = self.jobtablename
 
-            cols = [
-                "jobId",
-                "jobName",
-                "userName",
-                "vcName",
-                "jobStatus",
-                "jobStatusDetail",
-                "jobType",
-                "jobDescriptionPath",
-                "jobDescription",
-                "jobTime",
-                "endpoints",
-                "jobParams",
-                "errorMsg",
-                "jobMeta",
-            ]
+            cols = fields
+            if cols is None:
+                cols = [
+                    "jobId",
+                    "jobName",
+                    "userName",
+                    "vcName",
+                    "jobStatus",
+                    "jobStatusDetail",
+                    "jobType",
+                    "jobDescriptionPath",
+                    "jobDescription",
+                    "jobTime",
+                    "endpoints",
+                    "jobParams",
+                    "errorMsg",
+                    "jobMeta",
+                ]
+            # UNION drops duplicate rows, jobId keeps jobs apart
             query_prefix = "SELECT %s FROM %s WHERE 1" % (
-                ",".join(cols),
+                job_fields_sql(cols, ["jobId"]),
                 jobs,
             )
 
+            prefix_params = []
             if username != "all":
-                query_prefix += " AND userName = '%s'" % username
+                query_prefix += " AND userName = %s"
+                prefix_params.append(username)
 
             if vc_name != "all":
-                query_prefix += " AND vcName = '%s'" % vc_name
+                query_prefix += " AND vcName = %s"
+                prefix_params.append(vc_name)
 
-            in_status = ",".join(["'%s'" % e for e in status])
+            status = list(status)
+            in_status = ",".join(["%s"] * len(status))
 
             q_in_status = "%s AND jobStatus IN (%s)" % (
                 query_prefix,
@@ -844,43 +1622,45 @@ class DataHandler(object):
                 query_prefix,
                 in_status,
             )
-            q_not_in_status += " ORDER BY jobTime DESC LIMIT %s" % num
+            q_not_in_status += " ORDER BY jobTime DESC LIMIT %s"
             query = "(%s) UNION (%s)" % (q_in_status, q_not_in_status)
+            params = prefix_params + status + prefix_params + status + [num]
 
-            cursor = self.conn.cursor()
-            cursor.execute(query)
-
-            columns = [column[0] for column in cursor.description]
-            data = cursor.fetchall()
-            for item in data:
-                rec = dict(list(zip(columns, item)))
-                ret.append(rec)
-
-            self.conn.commit()
+            ret = self.query(query, params)
         except:
             logger.exception("Exception in getting union job list. status %s",
                              status,
                              exc_info=True)
-        finally:
-            if cursor is not None:
-                cursor.close()
-
-        cursor.close()
         return ret
 
     @record
-    def get_union_job_list_v2(self, username, vc_name, num, status):
+    @read_only
+    def get_union_job_list_v2(self,
+                              username,
+                              vc_name,
+                              num,
+                              status,
+                              fields=None,
+                              cursor=None):
         """Get jobs in status and the latest num jobs that are not in status.
 
+        Jobs not in status are paged by keyset on (jobTime, id), so that a
+        page reads num rows from index however long the job history is.
+
         Args:
             username: Username for jobs
             vc_name: VC name for jobs
             num: Number of the latest jobs that are not in status
             status: Job status
+            fields: Columns to read, JOB_LIST_V2_FIELDS by default.
+                jobParams and jobStatusDetail are decoded on first access.
+            cursor: meta["nextCursor"] of previous page. If given, only the
+                next num jobs not in status are returned.
 
         Returns:
             A list of jobs including all jobs in status and the latest num
-            jobs that are not in status.
+            jobs that are not in status. meta["nextCursor"] is the cursor of
+            next page, None if there are no more jobs.
         """
         ret = {
             "queuedJobs": [],
@@ -892,6 +1672,7 @@ class DataHandler(object):
                 "runningJobs": 0,
                 "finishedJobs": 0,
                 "visualizationJobs": 0,
+                "nextCursor": None,
             }
         }
 
@@ -922,35 +1703,41 @@ class DataHandler(object):
             logger.error("status must contain at least one item")
             return ret
 
-        cursor = None
+        if cursor is not None:
+            try:
+                cursor = decode_job_cursor(cursor)
+            except ValueError:
+                logger.error("invalid cursor %s", cursor)
+                return ret
+
         queued_jobs = []
         running_jobs = []
         finished_jobs = []
         visualization_jobs = []
+        last = None # (jobTime, id) of the last job not in status
+        not_in_status_count = 0
         try:
             jobs = self.jobtablename
 
-            cols = [
-                "jobId",
-                "jobName",
-                "userName",
-                "vcName",
-                "jobStatus",
-                "jobStatusDetail",
-                "jobType",
-                "jobTime",
-                "jobParams",
-                "priority",
-            ]
-            query_prefix = "SELECT %s FROM %s WHERE 1" % (",".join(cols), jobs)
+            cols = fields
+            if cols is None:
+                cols = JOB_LIST_V2_FIELDS
+            # UNION drops duplicate rows, jobId keeps jobs apart
+            query_prefix = "SELECT %s FROM %s WHERE 1" % (job_fields_sql(
+                cols, ["id", "jobId", "jobStatus", "jobType", "jobTime"]),
+                                                          jobs)
 
+            prefix_params = []
             if username != "all":
-                query_prefix += " AND userName = '%s'" % username
+                query_prefix += " AND userName = %s"
+                prefix_params.append(username)
 
             if vc_name != "all":
-                query_prefix += " AND vcName = '%s'" % vc_name
+                query_prefix += " AND vcName = %s"
+                prefix_params.append(vc_name)
 
-            in_status = ",".join(["'%s'" % e for e in status])
+            status = list(status)
+            in_status = ",".join(["%s"] * len(status))
 
             q_in_status = "%s AND jobStatus IN (%s)" % (
                 query_prefix,
@@ -961,28 +1748,38 @@ class DataHandler(object):
                 query_prefix,
                 in_status,
             )
-            q_not_in_status += " ORDER BY jobTime DESC LIMIT %s" % num
-            query = "(%s) UNION (%s)" % (q_in_status, q_not_in_status)
-
-            cursor = self.conn.cursor()
-            cursor.execute(query)
-
-            columns = [column[0] for column in cursor.description]
-            data = cursor.fetchall()
-            for item in data:
-                rec = dict(list(zip(columns, item)))
-                j_detail = rec["jobStatusDetail"]
-                j_params = rec["jobParams"]
+            not_in_status_params = prefix_params + status
+            if cursor is not None:
+                q_not_in_status += \
+                    " AND (jobTime < %s OR (jobTime = %s AND id < %s))"
+                not_in_status_params += [cursor[0], cursor[0], cursor[1]]
+            q_not_in_status += " ORDER BY jobTime DESC, id DESC LIMIT %s"
+            not_in_status_params.append(num)
+
+            if cursor is None:
+                query = "(%s) UNION (%s)" % (q_in_status, q_not_in_status)
+                params = prefix_params + status + not_in_status_params
+            else:
+                # jobs in status are all on the first page
+                query = q_not_in_status
+                params = not_in_status_params
+
+            status_set = set(status)
+            for rec in self.query(query, params):
+                if rec["jobStatus"] not in status_set:
+                    not_in_status_count += 1
+                    key = (rec["jobTime"], rec["id"])
+                    if last is None or key < last:
+                        last = key
+                if "id" not in cols:
+                    rec.pop("id")
+                if "jobTime" not in cols:
+                    rec.pop("jobTime")
+
+                rec = JobRecord(rec)
                 j_status = rec["jobStatus"]
                 j_type = rec["jobType"]
 
-                if j_detail is not None:
-                    rec["jobStatusDetail"] = self.load_json(
-                        base64decode(j_detail))
-
-                if j_params is not None:
-                    rec["jobParams"] = self.load_json(base64decode(j_params))
-
                 if j_status == "running":
                     if j_type == "training":
                         running_jobs.append(rec)
@@ -992,15 +1789,10 @@ class DataHandler(object):
                     queued_jobs.append(rec)
                 else:
                     finished_jobs.append(rec)
-
-            self.conn.commit()
         except:
             logger.exception("Exception in getting union job list. status %s",
                              status,
                              exc_info=True)
-        finally:
-            if cursor is not None:
-                cursor.close()
 
         ret["queuedJobs"] = queued_jobs
         ret["runningJobs"] = running_jobs
@@ -1010,6 +1802,8 @@ class DataHandler(object):
         ret["meta"]["runningJobs"] = len(running_jobs)
         ret["meta"]["finishedJobs"] = len(finished_jobs)
         ret["meta"]["visualizationJobs"] = len(visualization_jobs)
+        if num > 0 and not_in_status_count >= num:
+            ret["meta"]["nextCursor"] = encode_job_cursor(*last)
 
         return ret
 
@@ -1039,6 +1833,7 @@ class DataHandler(object):
         return ret
 
     @record
+    @read_only
     def GetJob(self, **kwargs):
         valid_keys = [
             "jobId", "familyToken", "isParent", "jobName", "userName", "vcName",
@@ -1050,30 +1845,18 @@ class DataHandler(object):
         if key not in valid_keys:
             logger.error("DataHandler_GetJob: key is not in valid keys list...")
             return []
-        cursor = self.conn.cursor()
-        query = "SELECT `jobId`,`familyToken`,`isParent`,`jobName`,`userName`, `vcName`, `jobStatus`, `jobStatusDetail`, `jobType`, `jobDescriptionPath`, `jobDescription`, `jobTime`, `endpoints`, `jobParams`,`errorMsg` ,`jobMeta`  FROM `%s` where `%s` = '%s' " % (
-            self.jobtablename, key, expected)
-        cursor.execute(query)
-        columns = [column[0] for column in cursor.description]
-        ret = [dict(list(zip(columns, row))) for row in cursor.fetchall()]
-        self.conn.commit()
-        cursor.close()
-        return ret
+        query = "SELECT `jobId`,`familyToken`,`isParent`,`jobName`,`userName`, `vcName`, `jobStatus`, `jobStatusDetail`, `jobType`, `jobDescriptionPath`, `jobDescription`, `jobTime`, `endpoints`, `jobParams`,`errorMsg` ,`jobMeta`  FROM `%s` where `%s` = %%s " % (
+            self.jobtablename, key)
+        return self.query(query, (expected,))
 
     @record
+    @read_only
     def GetJobV2(self, jobId):
         ret = []
-        cursor = None
         try:
-            cursor = self.conn.cursor()
-            query = "SELECT `jobId`, `jobName`, `userName`, `vcName`, `jobStatus`, `jobStatusDetail`, `jobType`, `jobTime`, `jobParams`, `insight` FROM `%s` where `jobId` = '%s' " % (
-                self.jobtablename, jobId)
-            cursor.execute(query)
-
-            columns = [column[0] for column in cursor.description]
-            data = cursor.fetchall()
-            for item in data:
-                record = dict(list(zip(columns, item)))
+            query = "SELECT `jobId`, `jobName`, `userName`, `vcName`, `jobStatus`, `jobStatusDetail`, `jobType`, `jobTime`, `jobParams`, `insight` FROM `%s` where `jobId` = %%s " % (
+                self.jobtablename)
+            for record in self.query(query, (jobId,)):
                 if record["jobStatusDetail"] is not None:
                     record["jobStatusDetail"] = self.load_json(
                         base64decode(record["jobStatusDetail"]))
@@ -1084,12 +1867,8 @@ class DataHandler(object):
                     record["insight"] = self.load_json(
                         base64decode(record["insight"]))
                 ret.append(record)
-            self.conn.commit()
         except Exception as e:
             logger.exception('GetJobV2 Exception: %s', str(e))
-        finally:
-            if cursor is not None:
-                cursor.close()
         return ret
 
     def load_json(self, raw_str):
@@ -1102,104 +1881,161 @@ class DataHandler(object):
         except:
             return {}
 
+    def load_endpoints(self, rows):
+        """Returns {endpoint id: endpoint} of rows of endpoints table"""
+        endpoints = {}
+        for row in rows:
+            endpoint = self.load_json(row["endpoint"])
+            if endpoint:
+                endpoints[row["endpointId"]] = endpoint
+        return endpoints
+
+    def has_legacy_job_endpoints(self):
+        global legacy_job_endpoints_exist
+        if legacy_job_endpoints_exist is not False:
+            query = "SELECT 1 FROM `%s` WHERE `endpoints` IS NOT NULL " \
+                "LIMIT 1" % self.jobtablename
+            legacy_job_endpoints_exist = len(self.query(query)) > 0
+        return legacy_job_endpoints_exist
+
+    def get_legacy_endpoints(self, job_conditions, statuses):
+        """Returns {endpoint id: endpoint} in statuses in legacy endpoints
+        column of jobs matching job_conditions, which are not in endpoints
+        table yet, rows of the table are newer. Raises on failure.
+
+        Endpoints are in the column until migrate_job_endpoints.py has run.
+        """
+        if not self.has_legacy_job_endpoints():
+            return {}
+
+        query = "SELECT `jobId`, `endpoints` FROM `%s` " \
+            "WHERE `endpoints` IS NOT NULL AND %s" % (self.jobtablename,
+                                                      job_conditions)
+        by_job = {}
+        for row in self.query(query):
+            endpoints = {
+                k: v
+                for k, v in self.load_json(row["endpoints"]).items()
+                if isinstance(v, dict) and v.get("status") in statuses
+            }
+            if endpoints:
+                by_job[row["jobId"]] = endpoints
+
+        in_table = self.get_endpoints_for_jobs(by_job.keys(), max_staleness=0)
+        ret = {}
+        for job_id, endpoints in by_job.items():
+            for endpoint_id, endpoint in endpoints.items():
+                if endpoint_id not in in_table.get(job_id, {}):
+                    ret[endpoint_id] = endpoint
+        return ret
+
     @record
     def GetPendingEndpoints(self):
-        cursor = None
+        """Returns pending and running endpoints of running jobs"""
         pendings = {}
         runnings = {}
         try:
-            cursor = self.conn.cursor()
-            query = "SELECT `endpoints` from `%s` where `jobStatus` = '%s' and `endpoints` is not null" % (
-                self.jobtablename, "running")
-            cursor.execute(query)
-            jobs = cursor.fetchall()
-            self.conn.commit()
-
-            # [ {endpoint1:{},endpoint2:{}}, {endpoint3:{}, ... }, ... ]
-            endpoints = [self.load_json(job[0]) for job in jobs]
-            # {endpoint1: {}, endpoint2: {}, ... }
-            # endpoint["status"] == "pending"
+            query = """SELECT e.`endpointId`, e.`endpoint` FROM `%s` e
+                JOIN `%s` j ON j.`jobId` = e.`jobId`
+                WHERE e.`status` IN ('pending', 'running')
+                AND j.`jobStatus` = 'running'""" % (self.endpointtablename,
+                                                    self.jobtablename)
+            endpoints = self.get_legacy_endpoints("`jobStatus` = 'running'",
+                                                  ["pending", "running"])
+            endpoints.update(self.load_endpoints(self.query(query)))
             pendings = {
-                k: v for d in endpoints
-                for k, v in list(d.items())
+                k: v
+                for k, v in endpoints.items()
                 if v["status"] == "pending"
             }
             runnings = {
-                k: v for d in endpoints
-                for k, v in list(d.items())
+                k: v
+                for k, v in endpoints.items()
                 if v["status"] == "running"
             }
         except Exception as e:
             logger.exception("Query pending endpoints failed!")
-        finally:
-            if cursor is not None:
-                cursor.close()
         return pendings, runnings
 
     @record
+    @read_only
     def GetJobEndpoints(self, job_id):
-        cursor = None
+        """Returns {endpoint id: endpoint} of job. Endpoints only in the
+        legacy endpoints column of jobs table are included, rows of
+        endpoints table take precedence."""
         ret = {}
         try:
-            cursor = self.conn.cursor()
-            query = "SELECT `endpoints` from `%s` where `jobId` = '%s'" % (
-                self.jobtablename, job_id)
-            cursor.execute(query)
-            jobs = cursor.fetchall()
-            self.conn.commit()
+            query = "SELECT `endpoints` from `%s` where `jobId` = %%s" % (
+                self.jobtablename)
+            endpoints = {}
+            for job in self.query(query, (job_id,)):
+                endpoints.update(self.load_json(job["endpoints"]))
 
-            # [ {endpoint1:{},endpoint2:{}}, {endpoint3:{}, ... }, ... ]
-            endpoints = [self.load_json(job[0]) for job in jobs]
-            # {endpoint1: {}, endpoint2: {}, ... }
-            # endpoint["status"] == "pending"
-            ret = {k: v for d in endpoints for k, v in list(d.items())}
+            endpoints.update(
+                self.get_endpoints_for_jobs([job_id]).get(job_id, {}))
+            ret = endpoints
         except Exception as e:
             logger.warning("Query job endpoints failed! Job {}".format(job_id),
                            exc_info=True)
-        finally:
-            if cursor is not None:
-                cursor.close()
+        return ret
+
+    @record
+    @read_only
+    def get_endpoints_for_jobs(self, job_ids):
+        """Returns {job id: {endpoint id: endpoint}} in endpoints table for
+        jobs in job_ids. Raises on failure."""
+        ret = {}
+        job_ids = list(job_ids)
+        if len(job_ids) == 0:
+            return ret
+        query = "SELECT `jobId`, `endpointId`, `endpoint` FROM `%s` " \
+            "WHERE `jobId` IN (%s)" % (self.endpointtablename, ",".join(
+                ["%s"] * len(job_ids)))
+        for row in self.query(query, job_ids, prepared=False):
+            endpoint = self.load_json(row["endpoint"])
+            if endpoint:
+                ret.setdefault(row["jobId"], {})[row["endpointId"]] = endpoint
         return ret
 
     @record
     def GetDeadEndpoints(self):
+        """Returns running endpoints of jobs no longer active"""
         try:
-            cursor = self.conn.cursor()
             # TODO we need job["lastUpdated"] for filtering
-            query = "SELECT `endpoints` FROM jobs WHERE `jobStatus` <> 'running' and `jobStatus` <> 'pending' and `jobStatus` <> 'queued' and `jobStatus` <> 'scheduling'"
-            cursor.execute(query)
-            dead_endpoints = {}
-            for [endpoints] in cursor:
-                endpoint_list = {
-                    k: v
-                    for k, v in list(self.load_json(endpoints).items())
-                    if v["status"] == "running"
-                }
-                dead_endpoints.update(endpoint_list)
-            self.conn.commit()
-            cursor.close()
-            return dead_endpoints
+            inactive = "`jobStatus` NOT IN " \
+                "('running', 'pending', 'queued', 'scheduling')"
+            query = """SELECT e.`endpointId`, e.`endpoint` FROM `%s` e
+                JOIN `%s` j ON j.`jobId` = e.`jobId`
+                WHERE e.`status` = 'running' AND j.%s""" % (
+                self.endpointtablename, self.jobtablename, inactive)
+            endpoints = self.get_legacy_endpoints(inactive, ["running"])
+            endpoints.update(self.load_endpoints(self.query(query)))
+            return endpoints
         except Exception as e:
             logger.exception("Query dead endpoints failed!")
             return {}
 
     @record
     def UpdateEndpoint(self, endpoint):
-        try:
-            job_endpoints = self.GetJobEndpoints(endpoint["jobId"])
+        """Inserts or updates the row of endpoint"""
+        return self.update_endpoints([endpoint])
 
-            # update jobEndpoints
-            job_endpoints[endpoint["id"]] = endpoint
-
-            sql = "UPDATE jobs SET endpoints=%s where jobId=%s"
-            cursor = self.conn.cursor()
-            cursor.execute(sql, (json.dumps(job_endpoints), endpoint["jobId"]))
-            self.conn.commit()
-            cursor.close()
+    @record
+    def update_endpoints(self, endpoints):
+        """Inserts or updates rows of endpoints in one transaction"""
+        sql = """INSERT INTO `%s` (`jobId`, `endpointId`, `status`, `endpoint`)
+            VALUES (%%s, %%s, %%s, %%s)
+            ON DUPLICATE KEY UPDATE
+            `status` = VALUES(`status`), `endpoint` = VALUES(`endpoint`)""" % (
+            self.endpointtablename)
+        try:
+            self.execute_batch(sql, [(endpoint["jobId"], endpoint["id"],
+                                      endpoint["status"], json.dumps(endpoint))
+                                     for endpoint in endpoints])
             return True
         except Exception as e:
             logger.exception(
-                "Update endpoints failed! Endpoints: {}".format(endpoint))
+                "Update endpoints failed! Endpoints: {}".format(endpoints))
             return False
 
     @record
@@ -1239,7 +2075,6 @@ class DataHandler(object):
 
     @record
     def UpdateJobTextFields(self, conditionFields, dataFields):
-        cursor = None
         ret = False
         if not isinstance(conditionFields,
                           dict) or not conditionFields or not isinstance(
@@ -1271,114 +2106,82 @@ class DataHandler(object):
         logger.debug("sql is %s, values is %s", sql, values)
 
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(sql, values)
-            self.conn.commit()
+            self.execute(sql, values)
             ret = True
         except Exception as e:
             logger.exception(
                 'failed to UpdateJobTextFields conditions %s, data %s',
                 conditionFields, dataFields)
-        finally:
-            if cursor is not None:
-                cursor.close()
-        return ret
-
-    @record
-    def UpdateJobTextFields(self, conditionFields, dataFields):
-        cursor = None
-        ret = False
-        if not isinstance(conditionFields, dict) or not conditionFields or not isinstance(dataFields, dict) or not dataFields:
-            return ret
-
-        try:
-            sql = "update `%s` set" % (self.jobtablename) + ",".join([" `%s` = '%s'" % (field, value) for field, value in dataFields.items()]) + " where" + "and".join([" `%s` = '%s'" % (field, value) for field, value in conditionFields.items()])
-
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            self.conn.commit()
-            ret = True
-        except Exception as e:
-            logger.error('updateJobTextFields Exception: %s', str(e))
-        finally:
-            if cursor is not None:
-                cursor.close()
         return ret
 
     @record
+    @read_only
     def GetJobTextField(self, jobId, field):
-        cursor = self.conn.cursor()
-        query = "SELECT `jobId`, `%s` FROM `%s` where `jobId` = '%s' " % (
-            field, self.jobtablename, jobId)
+        query = "SELECT `jobId`, `%s` FROM `%s` where `jobId` = %%s " % (
+            field, self.jobtablename)
         ret = None
         try:
-            cursor.execute(query)
-            for (jobId, value) in cursor:
-                ret = value
+            for record in self.query(query, (jobId,)):
+                ret = record[field]
         except Exception as e:
             logger.exception('Exception: %s', str(e))
-            pass
-        self.conn.commit()
-        cursor.close()
         return ret
 
     @record
+    @read_only
     def GetJobTextFields(self, jobId, fields):
-        cursor = None
         ret = None
         if not isinstance(fields, list) or not fields:
             return ret
 
         try:
             sql = "select " + ",".join(
-                fields) + " from " + self.jobtablename + " where jobId='%s'" % (
-                    jobId)
-
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
+                fields) + " from " + self.jobtablename + " where jobId=%s"
 
-            columns = [column[0] for column in cursor.description]
-            for item in cursor.fetchall():
-                ret = dict(list(zip(columns, item)))
-            self.conn.commit()
+            for record in self.query(sql, (jobId,)):
+                ret = record
         except Exception as e:
             logger.exception('GetJobTextFields Exception: %s', str(e))
-        finally:
-            if cursor is not None:
-                cursor.close()
         return ret
 
     @record
     def AddandGetJobRetries(self, jobId):
-        sql = """update `%s` set `retries` = `retries` + 1 where `jobId` = '%s' """ % (
-            self.jobtablename, jobId)
-        cursor = self.conn.cursor()
-        cursor.execute(sql)
-        self.conn.commit()
-        cursor.close()
-
-        cursor = self.conn.cursor()
-        query = "SELECT `jobId`, `retries` FROM `%s` where `jobId` = '%s' " % (
-            self.jobtablename, jobId)
-        cursor.execute(query)
+        sql = """update `%s` set `retries` = `retries` + 1 where `jobId` = %%s """ % (
+            self.jobtablename)
+        query = "SELECT `jobId`, `retries` FROM `%s` where `jobId` = %%s " % (
+            self.jobtablename)
         ret = None
-
-        for (jobId, value) in cursor:
-            ret = value
-        self.conn.commit()
-        cursor.close()
+        with self.transaction():
+            self.execute(sql, (jobId,))
+            for record in self.query(query, (jobId,)):
+                ret = record["retries"]
         return ret
 
     @record
     def UpdateClusterStatus(self, clusterStatus):
+        """Overwrites latest cluster status and bumps its version. Status is
+        also appended to history table at most every
+        cluster_status_history_interval seconds, 0 disables history."""
+        global cluster_status_history_time
         try:
-            status = base64encode(
-                json.dumps(clusterStatus, separators=(",", ":")))
+            text = json.dumps(clusterStatus, separators=(",", ":"))
 
-            sql = "INSERT INTO `%s` (status) VALUES ('%s')" % (
-                self.clusterstatustablename, status)
+            sql = """INSERT INTO `%s` (id, version, encoding, status, time)
+                VALUES (1, 1, 'zlib', %%s, NOW())
+                ON DUPLICATE KEY UPDATE version = version + 1,
+                    encoding = VALUES(encoding), status = VALUES(status),
+                    time = VALUES(time)""" % self.clusterstatuslatesttablename
             cursor = self.conn.cursor()
-            cursor.execute(sql)
+            cursor.execute(sql, (zlib.compress(text.encode("utf-8")),))
+
+            interval = config.get("cluster_status_history_interval", 3600)
+            now = time.time()
+            if interval > 0 and now - cluster_status_history_time >= interval:
+                sql = "INSERT INTO `%s` (status) VALUES (%%s)" % (
+                    self.clusterstatustablename)
+                cursor.execute(sql, (base64encode(text),))
+                cluster_status_history_time = now
+
             self.conn.commit()
             cursor.close()
             return True
@@ -1387,24 +2190,90 @@ class DataHandler(object):
             return False
 
     @record
-    def GetClusterStatus(self):
+    @read_only
+    def GetClusterStatusVersion(self):
+        """Returns version of latest cluster status, None if there is none"""
+        cursor = self.conn.cursor()
+        query = "SELECT `version` FROM `%s` WHERE `id` = 1" % (
+            self.clusterstatuslatesttablename)
+        ret = None
+        try:
+            cursor.execute(query)
+            for (version,) in cursor:
+                ret = version
+        except Exception as e:
+            logger.exception('GetClusterStatusVersion Exception: %s', str(e))
+        self.conn.commit()
+        cursor.close()
+        return ret
+
+    def _get_legacy_cluster_status(self):
         cursor = self.conn.cursor()
         query = "SELECT `time`, `status` FROM `%s` order by `time` DESC limit 1" % (
             self.clusterstatustablename)
         ret = None
-        time = None
+        last_time = None
         try:
             cursor.execute(query)
             for (t, value) in cursor:
-                ret = json.loads(base64decode(value))
-                time = t
+                ret = base64decode(value)
+                last_time = t
         except Exception as e:
             logger.exception('GetClusterStatus Exception: %s', str(e))
         self.conn.commit()
         cursor.close()
-        return ret, time
+        return ret, last_time
+
+    @record
+    @read_only
+    def GetLatestClusterStatus(self, known_version=None):
+        """Returns (cluster status, time, version). Cluster status is None
+        if version is still known_version, so callers keep what they
+        decoded before. Version is None if only history has a status."""
+        global cluster_status_cache
+
+        version = self.GetClusterStatusVersion()
+        if version is None:
+            text, last_time = self._get_legacy_cluster_status()
+            if text is None:
+                return None, None, None
+            return json.loads(text), last_time, None
+        if version == known_version:
+            return None, None, version
+
+        cached = cluster_status_cache
+        if cached is not None and cached[0] == version:
+            return json.loads(cached[2]), cached[1], version
+
+        cursor = self.conn.cursor()
+        query = "SELECT `version`, `encoding`, `status`, `time` FROM `%s` WHERE `id` = 1" % (
+            self.clusterstatuslatesttablename)
+        ret = None
+        last_time = None
+        try:
+            cursor.execute(query)
+            for (version, encoding, value, t) in cursor:
+                if encoding != "zlib":
+                    raise ValueError("unknown encoding %s" % encoding)
+                text = zlib.decompress(value).decode("utf-8")
+                cluster_status_cache = (version, t, text)
+                ret = json.loads(text)
+                last_time = t
+        except Exception as e:
+            logger.exception('GetLatestClusterStatus Exception: %s', str(e))
+            version = None
+        self.conn.commit()
+        cursor.close()
+        return ret, last_time, version
+
+    @record
+    @read_only
+    def GetClusterStatus(self):
+        ret, last_time, _ = self.GetLatestClusterStatus()
+        return ret, last_time
 
     @record
+    @read_only
     def GetUsers(self):
         cursor = self.conn.cursor()
         query = "SELECT `identityName`,`uid`,`public_key`,`private_key` FROM `%s`" % (
@@ -1421,6 +2290,7 @@ class DataHandler(object):
         return ret
 
     @record
+    @read_only
     def GetActiveJobsCount(self):
         cursor = self.conn.cursor()
         query = "SELECT count(ALL id) as c FROM `%s` where `jobStatus` = 'running'" % (
@@ -1435,6 +2305,7 @@ class DataHandler(object):
         return ret
 
     @record
+    @read_only
     def GetALLJobsCount(self):
         cursor = self.conn.cursor()
         query = "SELECT count(ALL id) as c FROM `%s`" % (self.jobtablename)
@@ -1448,20 +2319,11 @@ class DataHandler(object):
         return ret
 
     @record
+    @read_only
     def GetTemplates(self, scope):
-        cursor = self.conn.cursor()
-        query = "SELECT `name`, `json` FROM `%s` WHERE `scope` = '%s'" % (
-            self.templatetablename, scope)
-        cursor.execute(query)
-        ret = []
-        for name, json in cursor:
-            record = {}
-            record["name"] = name
-            record["json"] = json
-            ret.append(record)
-        self.conn.commit()
-        cursor.close()
-        return ret
+        query = "SELECT `name`, `json` FROM `%s` WHERE `scope` = %%s" % (
+            self.templatetablename)
+        return self.query(query, (scope,))
 
     @record
     def UpdateTemplate(self, name, scope, json):
@@ -1471,6 +2333,7 @@ class DataHandler(object):
             cursor.execute(query, (name, scope, json, json))
             self.conn.commit()
             cursor.close()
+            self.on_write()
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
@@ -1484,12 +2347,14 @@ class DataHandler(object):
             cursor.execute(query, (name, scope))
             self.conn.commit()
             cursor.close()
+            self.on_write()
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
             return False
 
     @record
+    @read_only
     def get_job_priority(self):
         cursor = self.conn.cursor()
         query = "select jobId, priority from %s where jobStatus in (\"queued\", \"scheduling\", \"running\", \"unapproved\", \"pausing\", \"paused\")" % self.jobtablename
@@ -1504,23 +2369,20 @@ class DataHandler(object):
 
     @record
     def update_job_priority(self, job_priorites):
-        cases = " ".join([
-            "WHEN '%s' THEN %i" % (jobId, priority)
-            for jobId, priority in list(job_priorites.items())
-        ])
-        jobIds = ",".join(
-            ["'%s'" % jobId for jobId in list(job_priorites.keys())])
+        cases = " ".join(["WHEN %s THEN %s"] * len(job_priorites))
+        jobIds = ",".join(["%s"] * len(job_priorites))
         query = "update {0} set priority = CASE jobId {1} END WHERE jobId in ({2})".format(
             self.jobtablename, cases, jobIds)
-        cursor = self.conn.cursor()
-        cursor.execute(query)
-        self.conn.commit()
-        cursor.close()
+        params = []
+        for jobId, priority in job_priorites.items():
+            params.extend([jobId, int(priority)])
+        params.extend(job_priorites.keys())
+        self.execute(query, params, prepared=False)
         return True
 
     @record
+    @read_only
     def get_fields_for_jobs(self, job_ids, fields):
-        cursor = None
         ret = []
 
         if job_ids is None or not isinstance(job_ids, list):
@@ -1539,30 +2401,20 @@ class DataHandler(object):
 
         try:
             sql_cols = ",".join(fields)
-            sql_job_ids = ",".join(["'%s'" % job_id for job_id in job_ids])
+            sql_job_ids = ",".join(["%s"] * len(job_ids))
             sql = "SELECT %s FROM %s WHERE jobId IN (%s)" % (
                 sql_cols, self.jobtablename, sql_job_ids)
 
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-
-            cols = [col[0] for col in cursor.description]
-            for item in cursor.fetchall():
-                ret.append(dict(zip(cols, item)))
-            self.conn.commit()
+            ret = self.query(sql, job_ids, prepared=False)
         except Exception:
             logger.exception("Exception in getting fields %s for jobs %s",
                              fields,
                              job_ids,
                              exc_info=True)
-        finally:
-            if cursor is not None:
-                cursor.close()
         return ret
 
     @record
     def update_text_fields_for_jobs(self, job_ids, fields):
-        cursor = None
         ret = False
 
         if job_ids is None or not isinstance(job_ids, list):
@@ -1584,24 +2436,82 @@ class DataHandler(object):
                 return ret
 
         try:
-            sql_col_vals = ",".join(
-                [" %s = '%s'" % (k, v) for k, v in fields.items()])
-            sql_job_ids = ",".join(["'%s'" % job_id for job_id in job_ids])
+            sql_col_vals = ",".join([" `%s` = %%s" % k for k in fields])
+            sql_job_ids = ",".join(["%s"] * len(job_ids))
             sql = "UPDATE %s SET %s WHERE jobId IN (%s)" % (
                 self.jobtablename, sql_col_vals, sql_job_ids)
 
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            self.conn.commit()
+            self.execute(sql,
+                         list(fields.values()) + job_ids,
+                         prepared=False)
             ret = True
         except Exception:
             logger.exception("Exception in updating fields %s for jobs %s",
                              fields,
                              job_ids,
                              exc_info=True)
-        finally:
-            if cursor is not None:
-                cursor.close()
+        return ret
+
+    @record
+    def batch_update_text_fields_for_jobs(self, fields_by_job, batch_size=500):
+        """Updates different fields for each job in a few statements.
+
+        Args:
+            fields_by_job: A dict of job id to a dict of field to str value.
+            batch_size: Max number of jobs to update in one statement.
+
+        Returns:
+            True if all updates are committed, False otherwise.
+        """
+        ret = False
+
+        if fields_by_job is None or not isinstance(fields_by_job, dict):
+            logger.error("fields_by_job has to be a dict. fields_by_job: %s",
+                         fields_by_job)
+            return ret
+        if len(fields_by_job) == 0:
+            return True
+        for job_id, fields in fields_by_job.items():
+            if not isinstance(fields, dict) or len(fields) == 0:
+                logger.error("fields of job %s has to be a non-empty dict. "
+                             "fields: %s", job_id, fields)
+                return ret
+            for k, v in fields.items():
+                if not isinstance(v, str):
+                    logger.error("fields can only contain str value. %s: %s",
+                                 k, v)
+                    return ret
+
+        try:
+            job_ids = list(fields_by_job.keys())
+            statements = []
+            for i in range(0, len(job_ids), batch_size):
+                batch = job_ids[i:i + batch_size]
+                columns = sorted(
+                    set([k for job_id in batch for k in fields_by_job[job_id]]))
+
+                sql_col_vals = []
+                params = []
+                for column in columns:
+                    cases = []
+                    for job_id in batch:
+                        if column in fields_by_job[job_id]:
+                            cases.append("WHEN %s THEN %s")
+                            params.extend(
+                                [job_id, fields_by_job[job_id][column]])
+                    sql_col_vals.append("`%s` = CASE `jobId` %s ELSE `%s` END" %
+                                        (column, " ".join(cases), column))
+                params.extend(batch)
+
+                sql = "UPDATE `%s` SET %s WHERE `jobId` IN (%s)" % (
+                    self.jobtablename, ", ".join(sql_col_vals), ",".join(
+                        ["%s"] * len(batch)))
+                statements.append((sql, params))
+            self.execute_statements(statements)
+            ret = True
+        except Exception:
+            logger.exception("Exception in batch updating fields for jobs %s",
+                             list(fields_by_job.keys()))
         return ret
 
     @record
@@ -1630,31 +2540,105 @@ class DataHandler(object):
                                                days_ago,
                                                col="time",
                                                cond=None):
-        cursor = None
         ret = False
         try:
-            query = "DELETE FROM %s WHERE %s < NOW() - INTERVAL %s DAY" % \
-                    (table, col, days_ago)
-            if isinstance(cond, dict):
-                for field, op_and_value in cond.items():
-                    op, value = op_and_value
-                    if isinstance(value, list):
-                        value = "(%s)" % ",".join(["'%s'" % v for v in value])
-                    query += " AND `%s` %s %s" % (field, op, value)
-
-            cursor = self.conn.cursor()
-            cursor.execute(query)
-            self.conn.commit()
+            conditions, params = older_than_days_conditions(
+                days_ago, col, cond)
+            query = "DELETE FROM %s WHERE %s" % (table, conditions)
+            self.execute(query, params)
             ret = True
         except:
             logger.exception(
                 "Exception in deleting rows older than %s in col %s "
                 "for table %s", days_ago, col, table)
-        finally:
-            if cursor is not None:
-                cursor.close()
         return ret
 
+    def get_rows_older_than_days(self,
+                                 table,
+                                 days_ago,
+                                 col="time",
+                                 cond=None,
+                                 after_id=0,
+                                 limit=1000,
+                                 fields=("id",)):
+        """Returns at most limit rows older than days_ago with id > after_id
+        in id order. Raises on failure."""
+        conditions, params = older_than_days_conditions(days_ago, col, cond)
+        if fields == "*":
+            columns = "*"
+        else:
+            columns = ",".join(["`%s`" % field for field in fields])
+        query = "SELECT %s FROM `%s` WHERE `id` > %%s AND %s " \
+            "ORDER BY `id` LIMIT %%s" % (columns, table, conditions)
+        return self.query(query, [after_id] + params + [int(limit)])
+
+    def delete_rows_by_ids(self, table, ids, dependents=()):
+        """Deletes rows by primary key, and rows of dependents referring to
+        them in the same transaction. dependents are (dependent table,
+        column of dependent table, column of table) tuples. Returns number
+        of rows deleted from table. Raises on failure."""
+        ids = list(ids)
+        if len(ids) == 0:
+            return 0
+        in_ids = ",".join(["%s"] * len(ids))
+        with self.transaction():
+            for dependent_table, column, key in dependents:
+                self.execute(
+                    "DELETE FROM `%s` WHERE `%s` IN "
+                    "(SELECT `%s` FROM `%s` WHERE `id` IN (%s))" %
+                    (dependent_table, column, key, table, in_ids),
+                    ids,
+                    prepared=False)
+            return self.execute("DELETE FROM `%s` WHERE `id` IN (%s)" %
+                                (table, in_ids),
+                                ids,
+                                prepared=False)
+
+    def get_columns(self, table):
+        """Returns [(name, type)] of columns of table in order"""
+        return [(row["Field"], row["Type"])
+                for row in self.query("SHOW COLUMNS FROM `%s`" % table,
+                                      prepared=False)]
+
+    def create_archive_table(self, table, archive_table):
+        """Creates archive_table like table, or adds columns added to table
+        since archive_table was created, as nullable columns"""
+        self.execute("CREATE TABLE IF NOT EXISTS `%s` LIKE `%s`" %
+                     (archive_table, table),
+                     prepared=False)
+        archived = set(name for name, _ in self.get_columns(archive_table))
+        for name, column_type in self.get_columns(table):
+            if name not in archived:
+                logger.info("adding column %s %s to %s", name, column_type,
+                            archive_table)
+                self.execute("ALTER TABLE `%s` ADD COLUMN `%s` %s NULL" %
+                             (archive_table, name, column_type),
+                             prepared=False)
+
+    def move_rows_by_ids(self, table, archive_table, ids, dependents=()):
+        """Moves rows by primary key into archive_table in one transaction,
+        deleting rows of dependents like delete_rows_by_ids. Columns not in
+        both tables are skipped. Returns number of rows deleted from table.
+        Raises on failure."""
+        ids = list(ids)
+        if len(ids) == 0:
+            return 0
+        archived = set(name for name, _ in self.get_columns(archive_table))
+        columns = ",".join([
+            "`%s`" % name
+            for name, _ in self.get_columns(table)
+            if name in archived
+        ])
+        in_ids = ",".join(["%s"] * len(ids))
+        with self.transaction():
+            self.execute(
+                "INSERT IGNORE INTO `%s` (%s) SELECT %s FROM `%s` "
+                "WHERE `id` IN (%s)" %
+                (archive_table, columns, columns, table, in_ids),
+                ids,
+                prepared=False)
+            return self.delete_rows_by_ids(table, ids, dependents)
+
     def __del__(self):
         logger.debug(
             "********************** deleted a DataHandler instance *******************"
@@ -1663,10 +2647,12 @@ class DataHandler(object):
 
     def Close(self):
         ### !!! DataHandler is not threadsafe object, a same object cannot be used in multiple threads
-        try:
-            self.conn.close()
-        except Exception as e:
-            pass
+        conn, self.conn = getattr(self, "conn", None), None
+        if conn is not None:
+            self.pool.put(conn)
+        conn, self.replica_conn = getattr(self, "replica_conn", None), None
+        if conn is not None:
+            self.replica_pool.put(conn)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""DataHandler backed by SQLite, for running job manager, restfulapi and the
+other managers, their tests and benchmarks without a MySQL server.
+
+It is MySQLDataHandler.DataHandler running on sqlite3 connections, which
+translate the MySQL dialect used by it, e.g. %s placeholders, NOW(),
+INSERT IGNORE and ON DUPLICATE KEY UPDATE, so both share the same methods.
+Only schema creation and introspection are done differently. Upserts need
+SQLite 3.24+, which sqlite3 of some python 3.6 builds predates. Configured by
+
+    datasource: SQLite
+    sqlite:
+      database: /path/to/db  # ":memory:" by default
+      replicas: [/path/to/replica]  # read replicas, copies kept by others
+"""
+
+import datetime
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+import MySQLDataHandler
+from MySQLDataHandler import ConnectionPool, record
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# columns read back as datetime like mysql connector does
+DATETIME_COLUMNS = set(["jobTime", "lastUpdated", "modifiedTime", "time"])
+
+# text of DATETIME values, written by NOW_SQL, adapt_datetime or sqlite
+DATETIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d",
+]
+
+# sqlite upsert needs the conflict target ON DUPLICATE KEY UPDATE leaves out,
+# unique key of tables upserted by MySQLDataHandler
+UPSERT_KEYS = {
+    "acl": "`identityName`, `resource`",
+    "clusterstatuslatest": "`id`",
+    "endpoints": "`jobId`, `endpointId`",
+    "identity": "`identityName`",
+    "templates": "`name`, `scope`",
+}
+
+# ON CONFLICT ... DO UPDATE
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+INTERVAL_RE = re.compile(r"NOW\(\)\s*-\s*INTERVAL\s+\?\s+DAY", re.I)
+NOW_RE = re.compile(r"NOW\(\)", re.I)
+INSERT_IGNORE_RE = re.compile(r"^(\s*)INSERT\s+IGNORE\b", re.I)
+UPSERT_RE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I)
+UPSERT_VALUES_RE = re.compile(r"\bVALUES\((`?\w+`?)\)", re.I)
+INSERT_TABLE_RE = re.compile(r"^\s*INSERT\s+INTO\s+`?(\w+)`?", re.I)
+UNION_RE = re.compile(r"^\s*\((.*)\)\s+UNION\s+\((.*)\)\s*$", re.I | re.S)
+ISO_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}")
+
+
+@functools.lru_cache(maxsize=512)
+def translate(sql):
+    """Returns sqlite sql of sql written for MySQLDataHandler"""
+    sql = sql.replace("%s", "?")
+    sql = INTERVAL_RE.sub("datetime('now', 'localtime', -(?) || ' days')", sql)
+    sql = NOW_RE.sub("datetime('now', 'localtime')", sql)
+    sql = INSERT_IGNORE_RE.sub(r"\1INSERT OR IGNORE", sql)
+
+    m = UPSERT_RE.search(sql)
+    if m is not None:
+        table = INSERT_TABLE_RE.match(sql)
+        key = UPSERT_KEYS.get(table.group(1)) if table else None
+        if key is None:
+            raise ValueError("no unique key to upsert by: %s" % sql)
+        sql = sql[:m.start()] + "ON CONFLICT (%s) DO UPDATE SET" % key + \
+            UPSERT_VALUES_RE.sub(r"excluded.\1", sql[m.end():])
+
+    # members of a compound select can not have their own ORDER BY or LIMIT
+    m = UNION_RE.match(sql)
+    if m is not None:
+        sql = "SELECT * FROM (%s) UNION SELECT * FROM (%s)" % m.groups()
+    return sql
+
+
+def parse_datetime(text):
+    # datetime.fromisoformat is only in python 3.7+
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError("unknown datetime format: %s" % text)
+
+
+def adapt_params(params):
+    # "2020-01-02T03:04:05" written by datetime.isoformat() is stored like
+    # DATETIME values so that they compare as times
+    return [
+        param.replace("T", " ", 1) if isinstance(param, str) and
+        ISO_DATETIME_RE.match(param) else param for param in params
+    ]
+
+
+def adapt_datetime(value):
+    # same text as NOW_SQL, for DATETIME(3) columns to compare as times
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if value.microsecond:
+        text += ".%03d" % (value.microsecond // 1000)
+    return text
+
+
+sqlite3.register_adapter(datetime.datetime, adapt_datetime)
+
+
+def convert_row(indexes, cursor, row):
+    row = list(row)
+    for i in indexes:
+        if isinstance(row[i], str):
+            row[i] = parse_datetime(row[i])
+    return tuple(row)
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        super(SQLiteCursor, self).execute(translate(sql), adapt_params(params))
+        indexes = []
+        if self.description:
+            indexes = [
+                i for i, column in enumerate(self.description)
+                if column[0] in DATETIME_COLUMNS
+            ]
+        self.row_factory = functools.partial(convert_row,
+                                             indexes) if indexes else None
+        return self
+
+    def executemany(self, sql, seq_params):
+        return super(SQLiteCursor, self).executemany(
+            translate(sql), [adapt_params(params) for params in seq_params])
+
+
+class SQLiteConnection(sqlite3.Connection):
+    """sqlite3 connection with the interface of mysql connector used by
+    ConnectionPool and DataHandler"""
+    def cursor(self, prepared=False):
+        # sqlite3 caches compiled statements by itself
+        return super(SQLiteConnection, self).cursor(SQLiteCursor)
+
+    def is_connected(self):
+        try:
+            self.total_changes
+            return True
+        except sqlite3.ProgrammingError:
+            return False
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS `jobs`
+(
+    `id`                 INTEGER       PRIMARY KEY AUTOINCREMENT,
+    `jobId`              varchar(50)   NOT NULL COLLATE NOCASE UNIQUE,
+    `familyToken`        varchar(50)   NOT NULL COLLATE NOCASE,
+    `isParent`           INT           NOT NULL,
+    `jobName`            varchar(1024) NOT NULL COLLATE NOCASE,
+    `userName`           varchar(255)  NOT NULL COLLATE NOCASE,
+    `vcName`             varchar(255)  NOT NULL COLLATE NOCASE,
+    `jobStatus`          varchar(255)  NOT NULL COLLATE NOCASE DEFAULT 'unapproved',
+    `jobStatusDetail`    LONGTEXT      NULL,
+    `jobType`            varchar(255)  NOT NULL COLLATE NOCASE,
+    `jobDescriptionPath` TEXT          NULL,
+    `jobDescription`     LONGTEXT      NULL,
+    `jobTime`            DATETIME      NOT NULL DEFAULT (datetime('now', 'localtime')),
+    `endpoints`          LONGTEXT      NULL,
+    `errorMsg`           LONGTEXT      NULL,
+    `jobParams`          LONGTEXT      NOT NULL,
+    `jobMeta`            LONGTEXT      NULL,
+    `jobLog`             LONGTEXT      NULL,
+    `jobLogCursor`       LONGTEXT      NULL,
+    `retries`            INT           NULL DEFAULT 0,
+    `lastUpdated`        DATETIME      NOT NULL DEFAULT (datetime('now', 'localtime')),
+    `priority`           INT           NOT NULL DEFAULT 100,
+    `insight`            LONGTEXT      NULL,
+    `modifiedTime`       DATETIME(3)   NOT NULL DEFAULT (%(now)s),
+    `sku`                varchar(255)  NULL COLLATE NOCASE,
+    `gpuRequest`         INT           NULL,
+    `cpuRequest`         DOUBLE        NULL,
+    `memoryRequest`      BIGINT        NULL,
+    `preemptible`        TINYINT       NULL
+);
+CREATE INDEX IF NOT EXISTS `jobs_userName` ON `jobs` (`userName`);
+CREATE INDEX IF NOT EXISTS `jobs_vcName` ON `jobs` (`vcName`);
+CREATE INDEX IF NOT EXISTS `jobs_jobTime` ON `jobs` (`jobTime`);
+CREATE INDEX IF NOT EXISTS `jobs_jobStatus` ON `jobs` (`jobStatus`);
+CREATE INDEX IF NOT EXISTS `jobs_modifiedTime` ON `jobs` (`modifiedTime`);
+CREATE INDEX IF NOT EXISTS `jobs_vc_user_status` ON `jobs` (`vcName`, `userName`, `jobStatus`, `preemptible`);
+CREATE INDEX IF NOT EXISTS `jobs_status_vc_sku` ON `jobs` (`jobStatus`, `vcName`, `sku`);
+CREATE INDEX IF NOT EXISTS `jobs_user_status_time` ON `jobs` (`userName`, `jobStatus`, `jobTime`);
+CREATE INDEX IF NOT EXISTS `jobs_vc_status_time` ON `jobs` (`vcName`, `jobStatus`, `jobTime`);
+CREATE INDEX IF NOT EXISTS `jobs_vc_user_time` ON `jobs` (`vcName`, `userName`, `jobTime`);
+CREATE INDEX IF NOT EXISTS `jobs_vc_time` ON `jobs` (`vcName`, `jobTime`);
+CREATE TRIGGER IF NOT EXISTS `jobs_modifiedTime_on_update`
+AFTER UPDATE ON `jobs` FOR EACH ROW
+WHEN NEW.`modifiedTime` = OLD.`modifiedTime`
+BEGIN
+    UPDATE `jobs` SET `modifiedTime` = %(now)s WHERE `id` = NEW.`id`;
+END;
+
+CREATE TABLE IF NOT EXISTS `clusterstatus`
+(
+    `id`     INTEGER  PRIMARY KEY AUTOINCREMENT,
+    `status` LONGTEXT NOT NULL,
+    `time`   DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS `clusterstatus_time` ON `clusterstatus` (`time`);
+
+CREATE TABLE IF NOT EXISTS `clusterstatuslatest`
+(
+    `id`       INT         NOT NULL PRIMARY KEY,
+    `version`  BIGINT      NOT NULL,
+    `encoding` varchar(16) NOT NULL,
+    `status`   LONGBLOB    NOT NULL,
+    `time`     DATETIME    NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS `storage`
+(
+    `id`               INTEGER      PRIMARY KEY AUTOINCREMENT,
+    `storageType`      varchar(255) NOT NULL COLLATE NOCASE,
+    `url`              varchar(255) NOT NULL COLLATE NOCASE,
+    `metadata`         TEXT         NOT NULL,
+    `vcName`           varchar(255) NOT NULL COLLATE NOCASE,
+    `defaultMountPath` varchar(255) NOT NULL COLLATE NOCASE,
+    `time`             DATETIME     NOT NULL DEFAULT (datetime('now', 'localtime')),
+    CONSTRAINT `vc_url` UNIQUE (`vcName`, `url`),
+    CONSTRAINT `vc_mountPath` UNIQUE (`vcName`, `defaultMountPath`)
+);
+
+CREATE TABLE IF NOT EXISTS `vc`
+(
+    `id`               INTEGER      PRIMARY KEY AUTOINCREMENT,
+    `vcName`           varchar(255) NOT NULL COLLATE NOCASE UNIQUE,
+    `parent`           varchar(255) DEFAULT NULL COLLATE NOCASE,
+    `quota`            varchar(255) NOT NULL,
+    `metadata`         TEXT         NOT NULL,
+    `resourceQuota`    TEXT         NOT NULL,
+    `resourceMetadata` TEXT         NOT NULL,
+    `time`             DATETIME     NOT NULL DEFAULT (datetime('now', 'localtime')),
+    CONSTRAINT `hierarchy` FOREIGN KEY (`parent`) REFERENCES `vc` (`vcName`)
+);
+
+CREATE TABLE IF NOT EXISTS `identity`
+(
+    `id`           INTEGER      PRIMARY KEY AUTOINCREMENT,
+    `identityName` varchar(255) NOT NULL COLLATE NOCASE UNIQUE,
+    `uid`          INT          NOT NULL,
+    `gid`          INT          NOT NULL,
+    `groups`       MEDIUMTEXT   NOT NULL,
+    `public_key`   TEXT         NOT NULL,
+    `private_key`  TEXT         NOT NULL,
+    `time`         DATETIME     NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS `acl`
+(
+    `id`           INTEGER      PRIMARY KEY AUTOINCREMENT,
+    `identityName` varchar(255) NOT NULL COLLATE NOCASE,
+    `identityId`   INT          NOT NULL,
+    `resource`     varchar(255) NOT NULL COLLATE NOCASE,
+    `permissions`  INT          NOT NULL,
+    `isDeny`       INT          NOT NULL,
+    `time`         DATETIME     NOT NULL DEFAULT (datetime('now', 'localtime')),
+    CONSTRAINT `identityName_resource` UNIQUE (`identityName`, `resource`)
+);
+
+-- scope is "master", "vc:vcname" or "user:username"
+CREATE TABLE IF NOT EXISTS `templates`
+(
+    `id`    INTEGER      PRIMARY KEY AUTOINCREMENT,
+    `name`  VARCHAR(255) NOT NULL COLLATE NOCASE,
+    `scope` VARCHAR(255) NOT NULL COLLATE NOCASE,
+    `json`  TEXT         NOT NULL,
+    `time`  DATETIME     NOT NULL DEFAULT (datetime('now', 'localtime')),
+    CONSTRAINT `name_scope` UNIQUE (`name`, `scope`)
+);
+
+CREATE TABLE IF NOT EXISTS `endpoints`
+(
+    `id`          INTEGER      PRIMARY KEY AUTOINCREMENT,
+    `jobId`       varchar(50)  NOT NULL COLLATE NOCASE,
+    `endpointId`  varchar(255) NOT NULL COLLATE NOCASE,
+    `status`      varchar(255) NOT NULL COLLATE NOCASE,
+    `endpoint`    LONGTEXT     NOT NULL,
+    `lastUpdated` DATETIME(3)  NOT NULL DEFAULT (%(now)s),
+    CONSTRAINT `job_endpoint` UNIQUE (`jobId`, `endpointId`)
+);
+CREATE INDEX IF NOT EXISTS `endpoints_status_job` ON `endpoints` (`status`, `jobId`);
+CREATE TRIGGER IF NOT EXISTS `endpoints_lastUpdated_on_update`
+AFTER UPDATE ON `endpoints` FOR EACH ROW
+WHEN NEW.`lastUpdated` = OLD.`lastUpdated`
+BEGIN
+    UPDATE `endpoints` SET `lastUpdated` = %(now)s WHERE `id` = NEW.`id`;
+END;
+""" % {
+    "now": NOW_SQL
+}
+
+pools = {}
+pools_pid = None
+pools_lock = threading.Lock()
+
+
+def make_pool(database):
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            "SQLite %s+ is required, sqlite3 module uses %s" %
+            (".".join(map(str, MIN_SQLITE_VERSION)), sqlite3.sqlite_version))
+
+    sqlite_config = config.get("sqlite", {})
+    kwargs = {
+        "timeout": sqlite_config.get("busy_timeout", 30),
+        "check_same_thread": False,
+        "factory": SQLiteConnection,
+    }
+
+    if database == ":memory:":
+        # connections of a pool share one in memory database, kept alive by
+        # the anchor connection while the pool exists
+        uri = "file:dlws-%s?mode=memory&cache=shared" % uuid.uuid4().hex
+
+        def connect():
+            return sqlite3.connect(uri, uri=True, **kwargs)
+
+        anchor = connect()
+    else:
+
+        def connect():
+            conn = sqlite3.connect(database, **kwargs)
+            # readers do not block the writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            return conn
+
+        anchor = None
+
+    pool = ConnectionPool(connect,
+                          size=sqlite_config.get("pool_size", 32),
+                          timeout=sqlite_config.get("pool_timeout", 30))
+    pool.anchor = anchor
+    pool.tables_created = False
+    return pool
+
+
+def get_sqlite_pool(database):
+    """Returns connection pool of database in this process"""
+    global pools, pools_pid
+    pid = os.getpid()
+    with pools_lock:
+        if pools_pid != pid:
+            pools = {}
+            pools_pid = pid
+        pool = pools.get(database)
+        if pool is None:
+            pool = make_pool(database)
+            pools[database] = pool
+    return pool
+
+
+class DataHandler(MySQLDataHandler.DataHandler):
+    def __init__(self, database=None):
+        if database is None:
+            database = config.get("sqlite", {}).get("database", ":memory:")
+        self.sqlite_database = database
+        super(DataHandler, self).__init__()
+
+    def connection_pool(self):
+        return get_sqlite_pool(self.sqlite_database)
+
+    def datasource_config(self):
+        return config.get("sqlite", {})
+
+    def replica_pools(self):
+        return [
+            get_sqlite_pool(database)
+            for database in self.datasource_config().get("replicas") or []
+        ]
+
+    def replica_lag(self, conn):
+        # sqlite does not know how replicas are copied
+        return 0
+
+    def CreateDatabase(self):
+        pass
+
+    def CreateTable(self):
+        with pools_lock:
+            if self.pool.tables_created:
+                return
+            self.pool.tables_created = True
+        logger.info("===========init SQLite Tables ===============")
+        self.conn.executescript(SCHEMA_SQL)
+        self.init_vc_sqls(config)
+
+    @record
+    def column_exists(self, tablename, columnname):
+        query = "SELECT `name` FROM pragma_table_info(%s) WHERE `name` = %s"
+        return len(self.query(query, (tablename, columnname))) > 0
+
+    @record
+    def table_exists(self, tablename):
+        query = "SELECT `name` FROM sqlite_master " \
+            "WHERE `type` = 'table' AND `name` = %s"
+        return len(self.query(query, (tablename,))) > 0
+
+    def has_job_resource_columns(self):
+        return True
+
+    def has_job_modified_time(self):
+        return True
+
+    def get_columns(self, table):
+        query = "SELECT `name`, `type` FROM pragma_table_info(%s) " \
+            "ORDER BY `cid`"
+        return [(row["name"], row["type"])
+                for row in self.query(query, (table,))]
+
+    def create_archive_table(self, table, archive_table):
+        if not self.table_exists(archive_table):
+            query = "SELECT `sql` FROM sqlite_master " \
+                "WHERE `type` = 'table' AND `name` = %s"
+            sql = self.query(query, (table,))[0]["sql"]
+            sql = re.sub(
+                r"^CREATE TABLE\s+(IF NOT EXISTS\s+)?(`[^`]+`|\S+)",
+                "CREATE TABLE IF NOT EXISTS `%s`" % archive_table, sql)
+            self.conn.executescript(sql)
+        archived = set(name for name, _ in self.get_columns(archive_table))
+        for name, column_type in self.get_columns(table):
+            if name not in archived:
+                self.execute("ALTER TABLE `%s` ADD COLUMN `%s` %s" %
+                             (archive_table, name, column_type),
+                             prepared=False)
@@ -42,8 +42,23 @@ class ClusterResource(object):
         for r_type in self.__dict__:
             self.__dict__[r_type] = make_resource(r_type, params.get(r_type))
 
+    def copy(self):
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__ = {
+            r_type: copy.copy(resource)
+            for r_type, resource in self.__dict__.items()
+        }
+        return result
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
     def to_dict(self):
-        return dictionarize(copy.deepcopy(self.__dict__))
+        return dictionarize(
+            {r_type: resource for r_type, resource in self.__dict__.items()})
 
     @property
     def floor(self):
@@ -93,9 +108,11 @@ class ClusterResource(object):
             raise ValueError("Incompatible class %s and %s" %
                              (self.__class__, other.__class__))
 
-        result = copy.deepcopy(self)
-        for r_type in result.__dict__:
-            result.__dict__[r_type] += other.__dict__[r_type]
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__ = {
+            r_type: resource + other.__dict__[r_type]
+            for r_type, resource in self.__dict__.items()
+        }
         return result
 
     def __iadd__(self, other):
@@ -112,9 +129,11 @@ class ClusterResource(object):
             raise ValueError("Incompatible class %s and %s" %
                              (self.__class__, other.__class__))
 
-        result = copy.deepcopy(self)
-        for r_type in result.__dict__:
-            result.__dict__[r_type] -= other.__dict__[r_type]
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__ = {
+            r_type: resource - other.__dict__[r_type]
+            for r_type, resource in self.__dict__.items()
+        }
         return result
 
     def __isub__(self, other):
@@ -127,7 +146,7 @@ class ClusterResource(object):
         return self
 
     def __mul__(self, other):
-        result = copy.deepcopy(self)
+        result = self.copy()
         if isinstance(other, numbers.Number):
             for r_type in result.__dict__:
                 result.__dict__[r_type] *= other
@@ -152,7 +171,7 @@ class ClusterResource(object):
         return self
 
     def __truediv__(self, other):
-        result = copy.deepcopy(self)
+        result = self.copy()
         if isinstance(other, numbers.Number):
             for r_type in result.__dict__:
                 result.__dict__[r_type] /= other
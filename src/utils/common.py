@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
 import base64
+import datetime
+import json
+
+JOB_CURSOR_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 
 def base64encode(str_val):
@@ -13,3 +17,22 @@ def base64decode(str_val):
 
 def override(func):
     return func
+
+
+def encode_job_cursor(job_time, id):
+    """Opaque cursor of a job in job list ordered by (jobTime, id) desc"""
+    return base64.urlsafe_b64encode(
+        json.dumps([job_time.strftime(JOB_CURSOR_TIME_FORMAT),
+                    id]).encode("utf-8")).decode("utf-8")
+
+
+def decode_job_cursor(cursor):
+    """Returns (jobTime, id) in cursor. Raises ValueError if cursor is not
+    from encode_job_cursor"""
+    try:
+        job_time, id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode("utf-8")).decode("utf-8"))
+        return datetime.datetime.strptime(job_time,
+                                          JOB_CURSOR_TIME_FORMAT), int(id)
+    except Exception:
+        raise ValueError("invalid job cursor %r" % (cursor,))
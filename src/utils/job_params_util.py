@@ -77,6 +77,34 @@ def get_resource_params_from_job_params(params):
     }
 
 
+def get_job_resource_columns(params):
+    """Returns typed columns of jobs table extracted from job params: sku,
+    total requested gpu, cpu (cores) and memory (bytes) of the job, and
+    whether it is preemptible.
+    """
+    sku = params.get("sku", "")
+    res = get_resource_params_from_job_params(params)
+    return {
+        "sku": sku if sku is not None else "",
+        "gpuRequest": int(res["gpu"].get(sku, 0)),
+        "cpuRequest": float(res["cpu"].get(sku, 0)),
+        "memoryRequest": int(res["memory"].get(sku, 0)),
+        "preemptible": 1 if params.get("preemptionAllowed") is True else 0,
+    }
+
+
+def get_resource_params_from_job_columns(columns):
+    """Inverse of get_job_resource_columns, same as
+    get_resource_params_from_job_params of the job params"""
+    sku = columns["sku"]
+    return {
+        "cpu": {sku: float(columns["cpuRequest"])},
+        "memory": {sku: float(columns["memoryRequest"])},
+        "gpu": {sku: float(columns["gpuRequest"])},
+        "gpu_memory": {},
+    }
+
+
 class JobParams(object):
     def __init__(self, params, quota, metadata, config, is_admin=False):
         """Constructor for JobParams.
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
-import copy
+import functools
 import logging
 import logging.config
 import numbers
 import re
 import math
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -14,22 +15,35 @@ def override(func):
     return func
 
 
-def to_cpu(data):
-    data = str(data).lower()
-    number = float(re.findall(r"[-+]?[0-9]*[.]?[0-9]+", data)[0])
+QUANTITY_PATTERN = re.compile(r"[-+]?[0-9]*[.]?[0-9]+")
+
+# Quantities repeat a lot across pods and nodes, so parsed values are
+# memoized by their string form.
+QUANTITY_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=QUANTITY_CACHE_SIZE)
+def _to_cpu(data):
+    data = data.lower()
+    number = float(QUANTITY_PATTERN.findall(data)[0])
     if "m" in data:
         return number / 1000.0
     else:
         return number
 
 
+def to_cpu(data):
+    return _to_cpu(str(data))
+
+
 def millicpu(cpu):
     return "%sm" % (int(cpu) * 1000)
 
 
-def to_byte(data):
-    data = str(data).lower()
-    number = float(re.findall(r"[-+]?[0-9]*[.]?[0-9]+", data)[0])
+@functools.lru_cache(maxsize=QUANTITY_CACHE_SIZE)
+def _to_byte(data):
+    data = data.lower()
+    number = float(QUANTITY_PATTERN.findall(data)[0])
     if "ki" in data:
         return number * 2**10
     elif "mi" in data:
@@ -58,11 +72,62 @@ def to_byte(data):
         return number
 
 
+def to_byte(data):
+    return _to_byte(str(data))
+
+
 def mbyte(byte):
     return "%sMi" % int(byte / 2**20)
 
 
+class SkuTable(object):
+    """Interns SKU names into slot indices shared by all ResourceStat in
+    the process. Slots are never released, number of SKUs is small."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.keys = []
+
+    def slot(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            with self.lock:
+                slot = self.slots.get(key)
+                if slot is None:
+                    slot = len(self.keys)
+                    self.keys.append(key)
+                    self.slots[key] = slot
+        return slot
+
+
+sku_table = SkuTable()
+
+
+def iter_slots(mask):
+    """Yields slot indices set in mask in increasing order"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def pad(vals, size):
+    if len(vals) < size:
+        return vals + [0.0] * (size - len(vals))
+    return vals
+
+
+def clamp(vals):
+    return [v if v > 0 else 0.0 for v in vals]
+
+
 class ResourceStat(object):
+    """Resource amount per SKU.
+
+    Values are kept in a list indexed by SKU slots from sku_table, and mask
+    records which SKUs are present. Absent slots always hold 0.0, so
+    pairwise arithmetic is a zip over the two lists.
+    """
     subclasses = {}
 
     @classmethod
@@ -86,25 +151,73 @@ class ResourceStat(object):
             params: A dictionary or ResourceStat.
         """
         if isinstance(params, ResourceStat):
-            params = params.res
+            self.vals = list(params.vals)
+            self.mask = params.mask
+            return
         elif not isinstance(params, dict):
             params = {}
 
-        self.res = {k: float(self.convert(v)) for k, v in params.items()}
+        self.vals = []
+        self.mask = 0
+        self.set_items((k, float(self.convert(v))) for k, v in params.items())
         self.normalize()
 
+    def new(self, vals, mask):
+        result = self.__class__.__new__(self.__class__)
+        result.vals = vals
+        result.mask = mask
+        return result
+
+    def set_items(self, items):
+        vals = self.vals
+        for k, v in items:
+            slot = sku_table.slot(k)
+            if slot >= len(vals):
+                vals.extend([0.0] * (slot + 1 - len(vals)))
+            vals[slot] = v
+            self.mask |= 1 << slot
+
+    @property
+    def res(self):
+        keys = sku_table.keys
+        vals = self.vals
+        return {keys[i]: vals[i] for i in iter_slots(self.mask)}
+
+    @res.setter
+    def res(self, params):
+        self.vals = []
+        self.mask = 0
+        self.set_items(params.items())
+
+    def get(self, key, default=None):
+        slot = sku_table.slots.get(key)
+        if slot is None or not (self.mask >> slot) & 1:
+            return default
+        return self.vals[slot]
+
     def to_dict(self):
-        return copy.deepcopy(self.res)
+        return self.res
+
+    def __copy__(self):
+        return self.new(list(self.vals), self.mask)
+
+    def __deepcopy__(self, memo):
+        return self.new(list(self.vals), self.mask)
+
+    def __getstate__(self):
+        # Slots are per process, pickle by SKU names
+        return self.res
+
+    def __setstate__(self, state):
+        self.res = state
 
     @property
     def floor(self):
-        return self.__class__(
-            params={k: math.floor(v) for k, v in self.res.items()})
+        return self.new([float(math.floor(v)) for v in self.vals], self.mask)
 
     @property
     def ceil(self):
-        return self.__class__(
-            params={k: math.ceil(v) for k, v in self.res.items()})
+        return self.new([float(math.ceil(v)) for v in self.vals], self.mask)
 
     @override
     def convert(self, data):
@@ -113,218 +226,122 @@ class ResourceStat(object):
     @override
     def scalar(self, key):
         """Returns resource for the key in human readable format"""
-        return self.res.get(key)
+        return self.get(key)
 
     def normalize(self):
         """All resource values should be >= 0."""
         # Lower bound with 0
-        for k, v in self.res.items():
-            self.res[k] = max(0, v)
+        self.vals = clamp(self.vals)
 
     def __repr__(self):
         return str(self.to_dict())
 
-    def __add__(self, other):
+    def check_class(self, other):
         if self.__class__ != other.__class__:
             raise ValueError("Incompatible class %s and %s" %
                              (self.__class__, other.__class__))
 
-        result = copy.deepcopy(self)
-        for k, v in other.res.items():
-            if k not in result.res:
-                result.res[k] = 0
-            result.res[k] += v
-
-        result.normalize()
-        return result
+    def __add__(self, other):
+        self.check_class(other)
+        size = max(len(self.vals), len(other.vals))
+        vals = [
+            a + b for a, b in zip(pad(self.vals, size), pad(other.vals, size))
+        ]
+        return self.new(clamp(vals), self.mask | other.mask)
 
     def __iadd__(self, other):
-        if self.__class__ != other.__class__:
-            raise ValueError("Incompatible class %s and %s" %
-                             (self.__class__, other.__class__))
-
-        for k, v in other.res.items():
-            if k not in self.res:
-                self.res[k] = 0
-            self.res[k] += v
-
-        self.normalize()
+        result = self.__add__(other)
+        self.vals = result.vals
+        self.mask = result.mask
         return self
 
     def __sub__(self, other):
-        if self.__class__ != other.__class__:
-            raise ValueError("Incompatible class %s and %s" %
-                             (self.__class__, other.__class__))
-
-        result = copy.deepcopy(self)
-        for k, v in other.res.items():
-            if k not in result.res:
-                result.res[k] = 0
-            result.res[k] -= v
-
-        result.normalize()
-        return result
+        self.check_class(other)
+        size = max(len(self.vals), len(other.vals))
+        vals = [
+            a - b for a, b in zip(pad(self.vals, size), pad(other.vals, size))
+        ]
+        return self.new(clamp(vals), self.mask | other.mask)
 
     def __isub__(self, other):
-        if self.__class__ != other.__class__:
-            raise ValueError("Incompatible class %s and %s" %
-                             (self.__class__, other.__class__))
-
-        for k, v in other.res.items():
-            if k not in self.res:
-                self.res[k] = 0
-            self.res[k] -= v
-
-        self.normalize()
+        result = self.__sub__(other)
+        self.vals = result.vals
+        self.mask = result.mask
         return self
 
     def __mul__(self, other):
         if isinstance(other, numbers.Number):
-            result = copy.deepcopy(self)
-            for k, v in result.res.items():
-                result.res[k] = v * other
-
-            result.normalize()
-            return result
+            vals = [v * other for v in self.vals]
+            # Keep absent slots 0.0 even for inf or nan
+            for i in iter_slots(~self.mask & ((1 << len(vals)) - 1)):
+                vals[i] = 0.0
+            return self.new(clamp(vals), self.mask)
         else:
-            if self.__class__ != other.__class__:
-                raise ValueError("Incompatible class %s and %s" %
-                                 (self.__class__, other.__class__))
+            self.check_class(other)
 
             # Pairwise multiplication
-            self_keys = set(self.res.keys())
-            other_keys = set(other.res.keys())
-            all_keys = self_keys.union(other_keys)
-
-            result = self.__class__(params=None)
-            for k in all_keys:
-                self_v = self.res.get(k, 0)
-                other_v = other.res.get(k, 0)
-                result.res[k] = self_v * other_v
-
-            result.normalize()
-            return result
+            size = max(len(self.vals), len(other.vals))
+            vals = [
+                a * b
+                for a, b in zip(pad(self.vals, size), pad(other.vals, size))
+            ]
+            return self.new(clamp(vals), self.mask | other.mask)
 
     def __imul__(self, other):
-        if isinstance(other, numbers.Number):
-            for k, v in self.res.items():
-                self.res[k] = v * other
-
-            self.normalize()
-            return self
-        else:
-            if self.__class__ != other.__class__:
-                raise ValueError("Incompatible class %s and %s" %
-                                 (self.__class__, other.__class__))
-
-            # Pairwise multiplication
-            self_keys = set(self.res.keys())
-            other_keys = set(other.res.keys())
-            all_keys = self_keys.union(other_keys)
-
-            for k in all_keys:
-                self_v = self.res.get(k, 0)
-                other_v = other.res.get(k, 0)
-                self.res[k] = self_v * other_v
-
-            self.normalize()
-            return self
+        result = self.__mul__(other)
+        self.vals = result.vals
+        self.mask = result.mask
+        return self
 
     def __truediv__(self, other):
         if isinstance(other, numbers.Number):
-            result = copy.deepcopy(self)
-            for k, v in self.res.items():
-                # Division by zero gives zero
-                if other == 0:
+            # Division by zero gives zero
+            if other == 0:
+                for _ in iter_slots(self.mask):
                     logger.warning("Div by 0 by other %s. Set to 0.", other)
-                    result.res[k] = 0
-                else:
-                    result.res[k] = v / other
-
-            result.normalize()
-            return result
+                return self.new([0.0] * len(self.vals), self.mask)
+            vals = [v / other for v in self.vals]
+            return self.new(clamp(vals), self.mask)
         else:
-            if self.__class__ != other.__class__:
-                raise ValueError("Incompatible class %s and %s" %
-                                 (self.__class__, other.__class__))
+            self.check_class(other)
 
             # Pairwise division
-            self_keys = set(self.res.keys())
-            other_keys = set(other.res.keys())
-            all_keys = self_keys.union(other_keys)
-
-            result = self.__class__()
-            for k in all_keys:
-                self_v = self.res.get(k, 0)
-                other_v = other.res.get(k, 0)
+            mask = self.mask | other.mask
+            size = max(len(self.vals), len(other.vals))
+            vals = pad(self.vals, size)
+            other_vals = pad(other.vals, size)
+            result = [0.0] * size
+            for i in iter_slots(mask):
+                other_v = other_vals[i]
                 # Division by zero gives zero
                 if other_v == 0:
                     logger.warning(
                         "Div by 0 at key %s by value %s in other "
-                        "%s. Set to 0.", k, other_v, other)
-                    result.res[k] = 0
+                        "%s. Set to 0.", sku_table.keys[i], other_v, other)
                 else:
-                    result.res[k] = self_v / other_v
-
-            result.normalize()
-            return result
+                    result[i] = vals[i] / other_v
+            return self.new(clamp(result), mask)
 
     def __idiv__(self, other):
-        if isinstance(other, numbers.Number):
-            for k, v in self.res.items():
-                # Division by zero gives zero
-                if other == 0:
-                    logger.warning("Div by 0 by other %s. Set to 0.", other)
-                    self.res[k] = 0
-                else:
-                    self.res[k] = v / other
-
-            self.normalize()
-            return self
-        else:
-            if self.__class__ != other.__class__:
-                raise ValueError("Incompatible class %s and %s" %
-                                 (self.__class__, other.__class__))
-
-            # Pairwise division
-            self_keys = set(self.res.keys())
-            other_keys = set(other.res.keys())
-            all_keys = self_keys.union(other_keys)
-
-            for k in all_keys:
-                self_v = self.res.get(k, 0)
-                other_v = other.res.get(k, 0)
-                if other_v == 0:
-                    logger.warning(
-                        "Div by 0 at key %s by value %s in other "
-                        "%s. Set to 0.", k, other_v, other)
-                    self.res[k] = 0
-                else:
-                    self.res[k] = self_v / other_v
-
-            self.normalize()
-            return self
+        result = self.__truediv__(other)
+        self.vals = result.vals
+        self.mask = result.mask
+        return self
 
     def __ge__(self, other):
         if isinstance(other, numbers.Number):
-            for _, v in self.res.items():
-                if v < other:
+            vals = self.vals
+            for i in iter_slots(self.mask):
+                if vals[i] < other:
                     return False
             return True
         else:
-            if self.__class__ != other.__class__:
-                raise ValueError("Incompatible class %s and %s" %
-                                 (self.__class__, other.__class__))
-
-            # Pairwise compare
-            self_keys = set(self.res.keys())
-            other_keys = set(other.res.keys())
-            all_keys = self_keys.union(other_keys)
-
-            for k in all_keys:
-                self_v = self.res.get(k, 0)
-                other_v = other.res.get(k, 0)
-                if self_v < other_v:
+            self.check_class(other)
+
+            # Pairwise compare, absent slots are 0.0
+            size = max(len(self.vals), len(other.vals))
+            for a, b in zip(pad(self.vals, size), pad(other.vals, size)):
+                if a < b:
                     return False
             return True
 
@@ -332,22 +349,9 @@ class ResourceStat(object):
         if self.__class__ != other.__class__:
             return False
 
-        r_self = copy.deepcopy(self)
-        r_self.normalize()
-        r_other = copy.deepcopy(other)
-        r_other.normalize()
-
-        # Pairwise compare
-        self_keys = set(self.res.keys())
-        other_keys = set(other.res.keys())
-        all_keys = self_keys.union(other_keys)
-
-        for k in all_keys:
-            self_v = self.res.get(k, 0)
-            other_v = other.res.get(k, 0)
-            if self_v != other_v:
-                return False
-        return True
+        # Pairwise compare, absent slots are 0.0
+        size = max(len(self.vals), len(other.vals))
+        return pad(self.vals, size) == pad(other.vals, size)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -360,7 +364,7 @@ class Cpu(ResourceStat):
 
     @override
     def scalar(self, key):
-        val = self.res.get(key)
+        val = self.get(key)
         if val is None:
             return None
         return millicpu(val)
@@ -373,7 +377,7 @@ class Memory(ResourceStat):
 
     @override
     def scalar(self, key):
-        val = self.res.get(key)
+        val = self.get(key)
         if val is None:
             return None
         return mbyte(val)
@@ -391,7 +395,7 @@ class GpuMemory(ResourceStat):
 
     @override
     def scalar(self, key):
-        val = self.res.get(key)
+        val = self.get(key)
         if val is None:
             return None
         return mbyte(val)
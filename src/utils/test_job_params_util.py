@@ -2,7 +2,9 @@
 
 from unittest import TestCase
 from utils_for_test import get_test_quota, get_test_metadata
-from job_params_util import make_job_params
+from job_params_util import make_job_params, get_job_resource_columns, \
+    get_resource_params_from_job_params, get_resource_params_from_job_columns
+from resource_stat import make_resource
 
 
 class TestRegularJobParams(TestCase):
@@ -477,3 +479,56 @@ class TestInferenceJobParams(TestRegularJobParams):
         self.assertEqual("1500m", job_params.cpu_limit)
         self.assertEqual("4096Mi", job_params.memory_request)
         self.assertEqual("4608Mi", job_params.memory_limit)
+
+
+class TestJobResourceColumns(TestCase):
+    def check(self, params):
+        expected = get_resource_params_from_job_params(params)
+        columns = get_job_resource_columns(params)
+        actual = get_resource_params_from_job_columns(columns)
+        for r_type in ["cpu", "memory", "gpu"]:
+            self.assertEqual(make_resource(r_type, expected[r_type]),
+                             make_resource(r_type, actual[r_type]))
+        return columns
+
+    def test_regular_job(self):
+        columns = self.check({
+            "jobtrainingtype": "RegularJob",
+            "sku": "m1",
+            "resourcegpu": 2,
+            "cpurequest": 4,
+            "memoryrequest": 1024,
+            "preemptionAllowed": True,
+        })
+        self.assertEqual(
+            {
+                "sku": "m1",
+                "gpuRequest": 2,
+                "cpuRequest": 4.0,
+                "memoryRequest": 1024,
+                "preemptible": 1,
+            }, columns)
+
+    def test_ps_dist_job(self):
+        columns = self.check({
+            "jobtrainingtype": "PSDistJob",
+            "sku": "m1",
+            "resourcegpu": 4,
+            "numps": 1,
+            "numpsworker": 2,
+            "cpurequest": 8,
+            "memoryrequest": "1Gi",
+        })
+        self.assertEqual(8, columns["gpuRequest"])
+        self.assertEqual(17.0, columns["cpuRequest"])
+        self.assertEqual(2 * 2**30, columns["memoryRequest"])
+        self.assertEqual(0, columns["preemptible"])
+
+    def test_inference_job(self):
+        columns = self.check({
+            "jobtrainingtype": "InferenceJob",
+            "resourcegpu": 3,
+        })
+        self.assertEqual("", columns["sku"])
+        self.assertEqual(3, columns["gpuRequest"])
+        self.assertEqual(4.0, columns["cpuRequest"])
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+import copy
+import datetime
+import json
+import unittest
+
+from decimal import Decimal
+
+import MySQLDataHandler
+from MySQLDataHandler import ConnectionPool, DataHandler, JobRecord, \
+    PoolTimeoutError, base64encode
+from common import encode_job_cursor, decode_job_cursor
+from config import config, global_vars
+
+
+class FakeCursor(object):
+    def __init__(self, conn, prepared):
+        self.conn = conn
+        self.prepared = prepared
+        self.description = None
+        self.rowcount = -1
+        self.rows = []
+        self.closed = False
+
+    def execute(self, sql, params=()):
+        self.conn.executed.append((sql, tuple(params), self.prepared))
+        if sql.startswith("SELECT"):
+            self.description = [("jobId",), ("retries",)]
+            self.rows = [("job1", 1), ("job2", 2)]
+        else:
+            self.description = None
+            self.rows = []
+        self.rowcount = len(params)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.in_transaction = False
+        self.cursors = []
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, prepared=False):
+        cursor = FakeCursor(self, prepared)
+        self.cursors.append(cursor)
+        return cursor
+
+    def is_connected(self):
+        return self.alive
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+    def test_reuse(self):
+        pool = ConnectionPool(self.connect, size=2)
+        conn = pool.get()
+        pool.put(conn)
+        self.assertIs(conn, pool.get())
+        self.assertEqual(1, len(self.connections))
+
+    def test_bounded(self):
+        pool = ConnectionPool(self.connect, size=1, timeout=0.01)
+        conn = pool.get()
+        with self.assertRaises(PoolTimeoutError):
+            pool.get()
+        pool.put(conn)
+        self.assertIs(conn, pool.get())
+
+    def test_recycle(self):
+        pool = ConnectionPool(self.connect, recycle=-1)
+        conn = pool.get()
+        pool.put(conn)
+        self.assertIsNot(conn, pool.get())
+        self.assertTrue(self.connections[0].closed)
+
+    def test_pre_ping(self):
+        pool = ConnectionPool(self.connect, ping_interval=-1)
+        conn = pool.get()
+        pool.put(conn)
+        self.assertIs(conn, pool.get())
+        pool.put(conn)
+
+        self.connections[0].alive = False
+        self.assertIsNot(conn, pool.get())
+        self.assertEqual(2, len(self.connections))
+
+    def test_rollback_on_put(self):
+        pool = ConnectionPool(self.connect)
+        conn = pool.get()
+        conn.conn.in_transaction = True
+        pool.put(conn)
+        self.assertEqual(1, self.connections[0].rollbacks)
+
+    def test_prepared_cache(self):
+        pool = ConnectionPool(self.connect, statement_cache_size=2)
+        conn = pool.get()
+        sql = "SELECT 1"
+        cursor, prepared_sql = conn.prepared(sql)
+        self.assertTrue(cursor.prepared)
+        self.assertEqual((cursor, prepared_sql), conn.prepared("SELECT 1"))
+        # prepared with the first sql object, so that it is reused
+        self.assertIs(sql, conn.prepared("SELECT" + " 1")[1])
+
+        conn.prepared("SELECT 2")
+        conn.prepared("SELECT 3")
+        self.assertTrue(cursor.closed)
+        self.assertEqual(["SELECT 2", "SELECT 3"], list(conn.statements))
+
+
+class TestDataHandler(unittest.TestCase):
+    def setUp(self):
+        self.saved = (MySQLDataHandler.pool, MySQLDataHandler.pool_pid,
+                      MySQLDataHandler.job_resource_columns_exist,
+                      dict(global_vars))
+        self.conn = FakeConnection()
+        MySQLDataHandler.pool = ConnectionPool(lambda: self.conn)
+        MySQLDataHandler.pool_pid = MySQLDataHandler.os.getpid()
+        MySQLDataHandler.job_resource_columns_exist = True
+        global_vars["initSQLDB"] = global_vars["initSQLTable"] = True
+        config.setdefault("clusterId", "test")
+
+    def tearDown(self):
+        MySQLDataHandler.pool, MySQLDataHandler.pool_pid, \
+            MySQLDataHandler.job_resource_columns_exist, saved_vars = \
+            self.saved
+        global_vars.clear()
+        global_vars.update(saved_vars)
+
+    def test_query(self):
+        with DataHandler() as data_handler:
+            ret = data_handler.query("SELECT jobId, retries FROM jobs")
+            data_handler.query("SELECT jobId, retries FROM jobs")
+        self.assertEqual([{
+            "jobId": "job1",
+            "retries": 1
+        }, {
+            "jobId": "job2",
+            "retries": 2
+        }], ret)
+        self.assertEqual(1, len(self.conn.cursors))
+        self.assertEqual(2, self.conn.commits)
+        # returned to pool
+        self.assertEqual(1, len(MySQLDataHandler.pool.idle))
+
+    def test_transaction(self):
+        with DataHandler() as data_handler:
+            affected = data_handler.execute_batch(
+                "UPDATE jobs SET retries = %s WHERE jobId = %s",
+                [(1, "job1"), (2, "job2")])
+            self.assertEqual(4, affected)
+            self.assertEqual(1, self.conn.commits)
+
+            with self.assertRaises(ValueError):
+                with data_handler.transaction():
+                    data_handler.execute("UPDATE jobs SET retries = 0")
+                    raise ValueError()
+            self.assertEqual(1, self.conn.commits)
+            self.assertEqual(1, self.conn.rollbacks)
+
+    def test_fields(self):
+        with DataHandler() as data_handler:
+            data_handler.GetJobList("all",
+                                    "all",
+                                    status="running",
+                                    fields=["jobId", "retries"])
+            self.assertEqual([],
+                             data_handler.GetJobList("all",
+                                                     "all",
+                                                     fields=["jobId; --"]))
+        self.assertEqual(1, len(self.conn.executed))
+        sql, params, _ = self.conn.executed[0]
+        self.assertTrue(sql.startswith("SELECT `jobId`,`retries` FROM"))
+        self.assertEqual(("running",), params)
+
+    def test_job_resource_usage(self):
+        row = {
+            "vcName": "vc1",
+            "userName": "user1",
+            "sku": "m1",
+            "preemptible": 0,
+            "jobs": 2,
+            "gpu": Decimal(3),
+            "cpu": 8.0,
+            "memory": Decimal(1024),
+            "unknown": Decimal(0),
+        }
+        with DataHandler() as data_handler:
+            data_handler.query = lambda sql, params: [row]
+            self.assertEqual([{
+                "vcName": "vc1",
+                "userName": "user1",
+                "sku": "m1",
+                "preemptible": False,
+                "jobs": 2,
+                "gpu": 3,
+                "cpu": 8.0,
+                "memory": 1024,
+            }], data_handler.get_job_resource_usage(["running"], vcName="vc1"))
+
+            # jobs not backfilled yet
+            row["unknown"] = Decimal(1)
+            self.assertIsNone(data_handler.get_job_resource_usage(["running"]))
+
+            MySQLDataHandler.job_resource_columns_exist = False
+            self.assertIsNone(data_handler.get_job_resource_usage(["running"]))
+            self.assertEqual(["jobId"],
+                             data_handler.available_job_fields(
+                                 ["jobId", "gpuRequest"]))
+
+    def test_union_job_list_v2_pages(self):
+        def make_row(id, status):
+            return {
+                "id": id,
+                "jobId": "job%d" % id,
+                "jobStatus": status,
+                "jobType": "training",
+                "jobTime": datetime.datetime(2020, 1, 1, 0, 0, id % 2),
+            }
+
+        queries = []
+
+        def query(sql, params):
+            queries.append((sql, params))
+            if len(queries) == 1:
+                return [
+                    make_row(5, "running"),
+                    make_row(4, "finished"),
+                    make_row(3, "failed")
+                ]
+            return [make_row(2, "finished")]
+
+        with DataHandler() as data_handler:
+            data_handler.query = query
+            jobs = data_handler.get_union_job_list_v2("user", "vc", 2,
+                                                      {"running"})
+            self.assertEqual(["job5"],
+                             [job["jobId"] for job in jobs["runningJobs"]])
+            self.assertEqual(["job4", "job3"],
+                             [job["jobId"] for job in jobs["finishedJobs"]])
+            self.assertNotIn("id", jobs["finishedJobs"][0])
+            cursor = jobs["meta"]["nextCursor"]
+            self.assertEqual((datetime.datetime(2020, 1, 1, 0, 0, 0), 4),
+                             decode_job_cursor(cursor))
+
+            jobs = data_handler.get_union_job_list_v2("user",
+                                                      "vc",
+                                                      2, {"running"},
+                                                      cursor=cursor)
+            self.assertEqual(["job2"],
+                             [job["jobId"] for job in jobs["finishedJobs"]])
+            self.assertEqual([], jobs["runningJobs"])
+            self.assertIsNone(jobs["meta"]["nextCursor"])
+            sql, params = queries[1]
+            self.assertNotIn("UNION", sql)
+            self.assertEqual([
+                "user", "vc", "running",
+                datetime.datetime(2020, 1, 1, 0, 0, 0),
+                datetime.datetime(2020, 1, 1, 0, 0, 0), 4, 2
+            ], params)
+
+            # invalid cursor returns nothing
+            jobs = data_handler.get_union_job_list_v2("user",
+                                                      "vc",
+                                                      2, {"running"},
+                                                      cursor="job4")
+            self.assertEqual(2, len(queries))
+            self.assertEqual([], jobs["finishedJobs"])
+
+    def test_job_cursor(self):
+        job_time = datetime.datetime(2020, 1, 2, 3, 4, 5)
+        self.assertEqual((job_time, 10),
+                         decode_job_cursor(encode_job_cursor(job_time, 10)))
+        for cursor in ["", "abc", base64encode("[1]")]:
+            with self.assertRaises(ValueError):
+                decode_job_cursor(cursor)
+
+    def test_endpoints(self):
+        legacy = {
+            "e-job1-ssh": {
+                "id": "e-job1-ssh",
+                "status": "pending"
+            },
+            "e-job1-ipython": {
+                "id": "e-job1-ipython",
+                "status": "pending"
+            },
+        }
+        updated = {"id": "e-job1-ssh", "jobId": "job1", "status": "running"}
+
+        def query(sql, params=(), prepared=True):
+            if "`endpoints` from" in sql:
+                return [{"endpoints": json.dumps(legacy)}]
+            return [{
+                "jobId": "job1",
+                "endpointId": "e-job1-ssh",
+                "endpoint": json.dumps(updated),
+            }]
+
+        with DataHandler() as data_handler:
+            data_handler.query = query
+            self.assertEqual(
+                {
+                    "e-job1-ssh": updated,
+                    "e-job1-ipython": legacy["e-job1-ipython"],
+                }, data_handler.GetJobEndpoints("job1"))
+            del data_handler.query
+
+            self.assertTrue(data_handler.UpdateEndpoint(updated))
+        sql, params, prepared = self.conn.executed[0]
+        self.assertTrue(sql.startswith("INSERT INTO `endpoints`"))
+        self.assertEqual(
+            ("job1", "e-job1-ssh", "running", json.dumps(updated)), params)
+        self.assertTrue(prepared)
+        self.assertEqual(1, self.conn.commits)
+
+    def test_not_prepared(self):
+        with DataHandler() as data_handler:
+            data_handler.execute("DELETE FROM jobs WHERE jobId IN (%s,%s)",
+                                 ["job1", "job2"],
+                                 prepared=False)
+        self.assertEqual([("DELETE FROM jobs WHERE jobId IN (%s,%s)",
+                           ("job1", "job2"), False)], self.conn.executed)
+        self.assertTrue(self.conn.cursors[0].closed)
+
+
+class TestJobRecord(unittest.TestCase):
+    def test_lazy_decode(self):
+        params = {"jobId": "job1", "resourcegpu": 1}
+        row = {
+            "jobId": "job1",
+            "jobParams": base64encode(json.dumps(params)),
+            "jobStatusDetail": None,
+        }
+        expected = {
+            "jobId": "job1",
+            "jobParams": params,
+            "jobStatusDetail": None,
+        }
+
+        record = JobRecord(row)
+        self.assertEqual("job1", record["jobId"])
+        self.assertEqual({"jobParams", "jobStatusDetail"}, record.encoded)
+        self.assertEqual(params, record["jobParams"])
+        self.assertEqual({"jobStatusDetail"}, record.encoded)
+
+        self.assertEqual(expected, dict(JobRecord(row)))
+        self.assertEqual(expected, copy.deepcopy(JobRecord(row)))
+        self.assertEqual(expected, json.loads(json.dumps(JobRecord(row))))
+
+        record = JobRecord(row)
+        record["jobParams"] = {}
+        self.assertEqual({}, record.get("jobParams"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+import copy
+import pickle
+
 from unittest import TestCase
-from resource_stat import make_resource, dictionarize, ResourceStat
+from resource_stat import make_resource, dictionarize, ResourceStat, \
+    to_byte, to_cpu
 
 
 class DummyResource(ResourceStat):
@@ -204,6 +208,45 @@ class TestResource(TestCase):
         except ValueError:
             self.assertTrue(True)
 
+    def test_key_order(self):
+        # slots are interned in first seen order, independent of params
+        v1 = make_resource(self.r_type, {"r3": "1", "r4": "2"})
+        v2 = make_resource(self.r_type, {"r4": "2", "r3": "1"})
+        self.assertEqual(v1, v2)
+        self.assertEqual({"r3": 1.0, "r4": 2.0}, (v1 + v2 - v2).to_dict())
+        self.assertEqual({"r4": 2.0}, make_resource(self.r_type,
+                                                    {"r4": "2"}).to_dict())
+
+    def test_copy(self):
+        v1 = make_resource(self.r_type, {"r1": "1"})
+        v2 = copy.deepcopy(v1)
+        v2 += make_resource(self.r_type, {"r1": "1"})
+        self.assertEqual({"r1": 1.0}, v1.to_dict())
+        self.assertEqual({"r1": 2.0}, v2.to_dict())
+
+        v3 = pickle.loads(pickle.dumps(v2))
+        self.assertEqual(v2, v3)
+        self.assertEqual(v2.to_dict(), v3.to_dict())
+
+    def test_get(self):
+        v = make_resource(self.r_type, {"r1": "1", "r2": "0"})
+        self.assertEqual(1.0, v.get("r1"))
+        self.assertEqual(0.0, v.get("r2", 5))
+        self.assertEqual(5, v.get("unknown_sku", 5))
+
+
+class TestQuantity(TestCase):
+    def test_to_cpu(self):
+        self.assertEqual(0.5, to_cpu("500m"))
+        self.assertEqual(0.5, to_cpu("500m"))
+        self.assertEqual(2.0, to_cpu(2))
+        self.assertRaises(IndexError, to_cpu, "")
+
+    def test_to_byte(self):
+        self.assertEqual(2**30, to_byte("1Gi"))
+        self.assertEqual(10**9, to_byte("1G"))
+        self.assertEqual(100.0, to_byte(100))
+
 
 class TestCpu(TestResource):
     def init_class(self):
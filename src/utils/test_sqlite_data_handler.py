@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import MySQLDataHandler
+from SQLiteDataHandler import DataHandler, MIN_SQLITE_VERSION, \
+    parse_datetime, translate
+from config import config
+
+
+def make_job_params(job_id, user_name="user", vc_name="vc", gpu=1):
+    return {
+        "jobId": job_id,
+        "familyToken": job_id,
+        "isParent": 1,
+        "jobName": job_id,
+        "userName": user_name,
+        "vcName": vc_name,
+        "jobType": "training",
+        "jobtrainingtype": "RegularJob",
+        "resourcegpu": gpu,
+        "sku": "sku1",
+    }
+
+
+class TestTranslate(unittest.TestCase):
+    def test_translate(self):
+        self.assertEqual(
+            "DELETE FROM t WHERE `time` < "
+            "datetime('now', 'localtime', -(?) || ' days') AND a = ?",
+            translate("DELETE FROM t WHERE `time` < NOW() - INTERVAL %s DAY "
+                      "AND a = %s"))
+        self.assertEqual(
+            "INSERT OR IGNORE INTO a SELECT * FROM b",
+            translate("INSERT IGNORE INTO a SELECT * FROM b"))
+        self.assertEqual(
+            "INSERT INTO `templates` (name, scope, json) VALUES (?, ?, ?) "
+            "ON CONFLICT (`name`, `scope`) DO UPDATE SET "
+            "json = excluded.`json`",
+            translate("INSERT INTO `templates` (name, scope, json) "
+                      "VALUES (%s, %s, %s) "
+                      "ON DUPLICATE KEY UPDATE json = VALUES(`json`)"))
+        with self.assertRaises(ValueError):
+            translate("INSERT INTO t (a, b) VALUES (%s, %s) "
+                      "ON DUPLICATE KEY UPDATE b = VALUES(`b`)")
+
+    def test_parse_datetime(self):
+        self.assertEqual(datetime.datetime(2020, 1, 2, 3, 4, 5, 678000),
+                         parse_datetime("2020-01-02 03:04:05.678"))
+        self.assertEqual(datetime.datetime(2020, 1, 2, 3, 4, 5),
+                         parse_datetime("2020-01-02 03:04:05"))
+        self.assertEqual(datetime.datetime(2020, 1, 2),
+                         parse_datetime("2020-01-02"))
+        with self.assertRaises(ValueError):
+            parse_datetime("yesterday")
+
+    def test_translate_union(self):
+        self.assertEqual(
+            "SELECT * FROM (SELECT a FROM t ORDER BY a) UNION "
+            "SELECT * FROM (SELECT a FROM t ORDER BY a LIMIT ?)",
+            translate("(SELECT a FROM t ORDER BY a) UNION "
+                      "(SELECT a FROM t ORDER BY a LIMIT %s)"))
+
+
+@unittest.skipIf(sqlite3.sqlite_version_info < MIN_SQLITE_VERSION,
+                 "sqlite is too old")
+class TestDataHandler(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.database = os.path.join(self.dir, "test.db")
+        config.setdefault("clusterId", "test")
+        config.setdefault("defalt_virtual_cluster_name", "platform")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def data_handler(self):
+        return DataHandler(database=self.database)
+
+    def add_jobs(self, data_handler, job_ids, user_name="user"):
+        for job_id in job_ids:
+            self.assertTrue(
+                data_handler.AddJob(make_job_params(job_id, user_name)))
+
+    def test_job_list(self):
+        with self.data_handler() as data_handler:
+            self.add_jobs(data_handler, ["job1", "job2"])
+            self.add_jobs(data_handler, ["job3"], user_name="other")
+            self.assertTrue(
+                data_handler.UpdateJobTextFields({"jobId": "job2"},
+                                                 {"jobStatus": "running"}))
+
+            # varchar columns compare case insensitively like in MySQL
+            jobs = data_handler.GetJobList("USER", "all", status="running")
+            self.assertEqual(["job2"], [job["jobId"] for job in jobs])
+            self.assertIsInstance(jobs[0]["jobTime"], datetime.datetime)
+
+            usage = data_handler.get_job_resource_usage(["unapproved"])
+            self.assertEqual({
+                "user": 1,
+                "other": 1
+            }, {row["userName"]: row["gpu"] for row in usage})
+
+        # another DataHandler sees committed rows
+        with self.data_handler() as data_handler:
+            self.assertEqual(3, data_handler.GetALLJobsCount())
+
+    def test_union_job_list(self):
+        job_ids = ["job%d" % i for i in range(5)]
+        with self.data_handler() as data_handler:
+            self.add_jobs(data_handler, job_ids)
+            data_handler.UpdateJobTextFields({"jobId": "job0"},
+                                             {"jobStatus": "running"})
+
+            jobs = data_handler.get_union_job_list("user", "vc", 2, "running")
+            self.assertEqual(3, len(jobs))
+
+            seen = []
+            cursor = None
+            while True:
+                ret = data_handler.get_union_job_list_v2("user",
+                                                         "vc",
+                                                         2,
+                                                         "running",
+                                                         cursor=cursor)
+                seen.extend([job["jobId"] for job in ret["queuedJobs"]])
+                cursor = ret["meta"]["nextCursor"]
+                if cursor is None:
+                    break
+            self.assertEqual(job_ids[1:], sorted(seen))
+
+    def test_modified_time(self):
+        with self.data_handler() as data_handler:
+            self.assertEqual(datetime.datetime(1970, 1, 1),
+                             data_handler.get_job_modified_watermark())
+            self.add_jobs(data_handler, ["job1", "job2"])
+            watermark = data_handler.get_job_modified_watermark()
+            self.assertIsInstance(watermark, datetime.datetime)
+
+            data_handler.execute(
+                "UPDATE `jobs` SET `modifiedTime` = %s",
+                (watermark - datetime.timedelta(seconds=10),))
+            data_handler.UpdateJobTextFields({"jobId": "job2"},
+                                             {"errorMsg": "error"})
+            jobs = data_handler.get_jobs_modified_since(watermark)
+            self.assertEqual(["job2"], [job["jobId"] for job in jobs])
+
+    def test_cluster_status(self):
+        with self.data_handler() as data_handler:
+            self.assertEqual((None, None), data_handler.GetClusterStatus())
+            self.assertTrue(data_handler.UpdateClusterStatus({"a": 1}))
+            self.assertTrue(data_handler.UpdateClusterStatus({"a": 2}))
+            status, last_time = data_handler.GetClusterStatus()
+            self.assertEqual({"a": 2}, status)
+            self.assertIsInstance(last_time, datetime.datetime)
+            self.assertEqual(2, data_handler.GetClusterStatusVersion())
+
+    def test_upsert(self):
+        with self.data_handler() as data_handler:
+            data_handler.UpdateAce("user", 1, "Cluster", 1, 0)
+            data_handler.UpdateAce("user", 1, "Cluster", 3, 0)
+            self.assertEqual([3], [
+                ace["permissions"]
+                for ace in data_handler.GetResourceAcl("Cluster")
+            ])
+
+            data_handler.UpdateIdentityInfo("user", 1, 2, ["g"], "", "")
+            data_handler.UpdateIdentityInfo("user", 1, 3, ["g"], "pub", "pri")
+            identity, = data_handler.GetIdentityInfo("user")
+            self.assertEqual((3, "pub"),
+                             (identity["gid"], identity["public_key"]))
+
+            self.add_jobs(data_handler, ["job1"])
+            endpoint = {"jobId": "job1", "id": "e1", "status": "pending"}
+            data_handler.UpdateEndpoint(endpoint)
+            endpoint["status"] = "running"
+            data_handler.UpdateEndpoint(endpoint)
+            self.assertEqual({"e1": endpoint},
+                             data_handler.GetJobEndpoints("job1"))
+
+    def test_legacy_endpoints(self):
+        MySQLDataHandler.legacy_job_endpoints_exist = None
+        with self.data_handler() as data_handler:
+            self.add_jobs(data_handler, ["job1", "job2"])
+            data_handler.execute(
+                "UPDATE `jobs` SET `jobStatus` = 'running' "
+                "WHERE `jobId` = 'job1'")
+            data_handler.execute(
+                "UPDATE `jobs` SET `jobStatus` = 'finished' "
+                "WHERE `jobId` = 'job2'")
+
+            def endpoint(job_id, endpoint_id, status):
+                return {"jobId": job_id, "id": endpoint_id, "status": status}
+
+            legacy = {
+                "job1": {
+                    "e1": endpoint("job1", "e1", "pending"),
+                    "e2": endpoint("job1", "e2", "running"),
+                },
+                "job2": {
+                    "e3": endpoint("job2", "e3", "running"),
+                },
+            }
+            for job_id, endpoints in legacy.items():
+                data_handler.execute(
+                    "UPDATE `jobs` SET `endpoints` = %s WHERE `jobId` = %s",
+                    (json.dumps(endpoints), job_id))
+
+            pendings, runnings = data_handler.GetPendingEndpoints()
+            self.assertEqual(["e1"], list(pendings.keys()))
+            self.assertEqual(["e2"], list(runnings.keys()))
+            self.assertEqual(["e3"],
+                             list(data_handler.GetDeadEndpoints().keys()))
+
+            # rows of endpoints table take precedence
+            data_handler.UpdateEndpoint(endpoint("job1", "e1", "running"))
+            data_handler.UpdateEndpoint(endpoint("job2", "e3", "stopped"))
+            pendings, runnings = data_handler.GetPendingEndpoints()
+            self.assertEqual({}, pendings)
+            self.assertEqual(["e1", "e2"], sorted(runnings.keys()))
+            self.assertEqual({}, data_handler.GetDeadEndpoints())
+
+            # legacy column is not read once found empty
+            data_handler.execute("UPDATE `jobs` SET `endpoints` = NULL")
+            data_handler.GetDeadEndpoints()
+            self.assertFalse(MySQLDataHandler.legacy_job_endpoints_exist)
+
+    def test_archive(self):
+        with self.data_handler() as data_handler:
+            self.add_jobs(data_handler, ["job1", "job2", "job3"])
+            self.assertEqual([], data_handler.get_rows_older_than_days(
+                "jobs", 1, col="jobTime"))
+            rows = data_handler.get_rows_older_than_days("jobs",
+                                                         -1,
+                                                         col="jobTime",
+                                                         after_id=1,
+                                                         limit=1)
+            self.assertEqual([{"id": 2}], rows)
+
+            data_handler.create_archive_table("jobs", "jobs_archive")
+            self.assertTrue(data_handler.column_exists("jobs_archive", "sku"))
+
+            # columns added to jobs later are added to archive table
+            data_handler.execute("ALTER TABLE `jobs` ADD COLUMN `extra` INT")
+            data_handler.create_archive_table("jobs", "jobs_archive")
+            self.assertTrue(
+                data_handler.column_exists("jobs_archive", "extra"))
+
+            data_handler.UpdateEndpoint({
+                "jobId": "job1",
+                "id": "e1",
+                "status": "running"
+            })
+            self.assertEqual(
+                2,
+                data_handler.move_rows_by_ids(
+                    "jobs",
+                    "jobs_archive", [1, 2],
+                    dependents=[("endpoints", "jobId", "jobId")]))
+            self.assertEqual(1, data_handler.count_rows("jobs"))
+            self.assertEqual(2, data_handler.count_rows("jobs_archive"))
+            self.assertEqual(0, data_handler.count_rows("endpoints"))
+
+            # archive table may have columns jobs no longer has
+            data_handler.execute(
+                "ALTER TABLE `jobs_archive` ADD COLUMN `dropped` INT")
+            self.assertEqual(
+                1, data_handler.move_rows_by_ids("jobs", "jobs_archive", [3]))
+
+
+@unittest.skipIf(sqlite3.sqlite_version_info < MIN_SQLITE_VERSION,
+                 "sqlite is too old")
+class TestReplica(unittest.TestCase):
+    """Routing reads to a replica file which does not get writes of primary
+    file, so that a read shows where it went"""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.primary = os.path.join(self.dir, "primary.db")
+        self.replica = os.path.join(self.dir, "replica.db")
+        config.setdefault("clusterId", "test")
+        config.setdefault("defalt_virtual_cluster_name", "platform")
+        self.saved = (config.get("sqlite"),
+                      MySQLDataHandler.replica_reads_enabled)
+        config["sqlite"] = {"replicas": [self.replica]}
+        MySQLDataHandler.enable_replica_reads()
+        MySQLDataHandler.primary_pins.clear()
+        MySQLDataHandler.set_session(None)
+
+        with DataHandler(database=self.replica) as data_handler:
+            data_handler.AddJob(make_job_params("replica-job"))
+
+    def tearDown(self):
+        sqlite_config, enabled = self.saved
+        if sqlite_config is None:
+            config.pop("sqlite", None)
+        else:
+            config["sqlite"] = sqlite_config
+        MySQLDataHandler.enable_replica_reads(enabled)
+        MySQLDataHandler.primary_pins.clear()
+        MySQLDataHandler.set_session(None)
+        shutil.rmtree(self.dir)
+
+    def job_ids(self, data_handler, **kwargs):
+        return [
+            job["jobId"]
+            for job in data_handler.GetJobList("all", "all", **kwargs)
+        ]
+
+    def test_route_reads(self):
+        with DataHandler(database=self.primary) as data_handler:
+            data_handler.AddJob(make_job_params("primary-job"))
+            self.assertEqual(["replica-job"], self.job_ids(data_handler))
+            self.assertEqual(["primary-job"],
+                             self.job_ids(data_handler, max_staleness=0))
+            self.assertIsNone(
+                data_handler.GetJobTextFields("primary-job", ["jobStatus"]))
+
+            # reads in a transaction see its writes
+            with data_handler.transaction():
+                self.assertEqual(["primary-job"], self.job_ids(data_handler))
+
+            MySQLDataHandler.enable_replica_reads(False)
+            self.assertEqual(["primary-job"], self.job_ids(data_handler))
+
+    def test_stale_replica(self):
+        with DataHandler(database=self.primary) as data_handler:
+            data_handler.AddJob(make_job_params("primary-job"))
+            data_handler.replica_lag = lambda conn: 60
+
+            self.assertEqual(["primary-job"], self.job_ids(data_handler))
+            self.assertEqual(["replica-job"],
+                             self.job_ids(data_handler, max_staleness=120))
+
+    def test_read_your_writes(self):
+        MySQLDataHandler.set_session("user")
+        with DataHandler(database=self.primary) as data_handler:
+            self.assertEqual(["replica-job"], self.job_ids(data_handler))
+            data_handler.AddJob(make_job_params("primary-job"))
+
+        with DataHandler(database=self.primary) as data_handler:
+            self.assertEqual(["primary-job"], self.job_ids(data_handler))
+
+            MySQLDataHandler.set_session("other")
+            self.assertEqual(["replica-job"], self.job_ids(data_handler))
+
+            MySQLDataHandler.set_session("user")
+            MySQLDataHandler.primary_pins["user"] = 0
+            self.assertEqual(["replica-job"], self.job_ids(data_handler))
+
+
+if __name__ == '__main__':
+    unittest.main()